@@ -0,0 +1,231 @@
+"""
+Semantic answer cache in front of the RAG graph.
+
+Students ask the same platform questions in slightly different words. The
+normalized question is embedded with the index's FastEmbed model and compared
+(one matrix-vector product) with the questions answered before in the same
+scope; above RAG_ANSWER_CACHE_THRESHOLD cosine similarity the stored answer and
+sources are returned without running the graph.
+
+Scope = (lesson_id, enrolled course ids): retrieval is filtered by both, so an
+answer built from gated lesson content is only served to users with the same
+permissions. Entries are dropped whenever the index changes (ingestion index
+listeners). Follow-up questions (non-empty chat history) and web search answers
+are neither served from nor stored in the cache.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+
+from enrollment_cache import get_user_enrollments
+from ingestion import add_index_listener, get_vectorstore, index_version
+from tracing import span
+
+ANSWER_CACHE_ENABLED = os.getenv("RAG_ANSWER_CACHE", "true").lower() in ("1", "true", "yes")
+# Cosine similarity of the question embeddings above which a cached answer is served
+ANSWER_CACHE_THRESHOLD = float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_TTL = float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600"))
+# Entries per scope; the oldest are dropped first
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ANSWER_CACHE_MAX_ENTRIES", "1000"))
+
+# (lesson_id, enrolled course ids or None for anonymous requests)
+Scope = Tuple[str, Optional[FrozenSet[str]]]
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = re.compile(r"[\s?!.。,;:]+$")
+
+
+def normalize_question(question: str) -> str:
+    return _TRAILING_PUNCTUATION.sub("", _WHITESPACE.sub(" ", (question or "").strip().lower()))
+
+
+@dataclass
+class _CachedAnswer:
+    question: str
+    answer: str
+    sources: List[dict]
+    created: float
+
+
+@dataclass
+class _ScopeEntries:
+    # Unit-norm question embeddings, one row per entry
+    vectors: np.ndarray
+    entries: List[_CachedAnswer] = field(default_factory=list)
+
+
+class SemanticAnswerCache:
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._scopes: Dict[Scope, _ScopeEntries] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(scope.entries) for scope in self._scopes.values())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._scopes.clear()
+
+    @staticmethod
+    def embed(question: str) -> np.ndarray:
+        vector = np.asarray(get_vectorstore().embeddings.embed_query(normalize_question(question)), dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def lookup(self, scope: Scope, vector: np.ndarray) -> Optional[Tuple[_CachedAnswer, float]]:
+        """Most similar cached answer in the scope, if above the threshold and not expired."""
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is None or not entries.entries:
+                self.misses += 1
+                return None
+            similarities = entries.vectors @ vector
+            best = int(np.argmax(similarities))
+            entry = entries.entries[best]
+            if similarities[best] < self.threshold or time.time() - entry.created > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry, float(similarities[best])
+
+    def store(self, scope: Scope, vector: np.ndarray, entry: _CachedAnswer) -> None:
+        with self._lock:
+            entries = self._scopes.get(scope)
+            if entries is None:
+                self._scopes[scope] = _ScopeEntries(vectors=vector[np.newaxis, :], entries=[entry])
+                return
+            now = time.time()
+            keep = [i for i, cached in enumerate(entries.entries) if now - cached.created <= self.ttl]
+            keep = keep[-(self.max_entries - 1):] if self.max_entries > 1 else []
+            entries.vectors = np.vstack([entries.vectors[keep], vector[np.newaxis, :]])
+            entries.entries = [entries.entries[i] for i in keep] + [entry]
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self)}
+
+
+_answer_cache = SemanticAnswerCache()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    return _answer_cache
+
+
+def _on_index_changed(_document_ids) -> None:
+    # Any reindex may change what an answer should say or cite
+    _answer_cache.clear()
+
+
+add_index_listener(_on_index_changed)
+
+
+def answer_scope(payload: Dict[str, Any]) -> Scope:
+    """Permission scope of a graph payload (see module doc)."""
+    user_id = payload.get("user_id")
+    enrolled = get_user_enrollments(user_id) if user_id else None
+    return payload.get("lesson_id") or "", enrolled
+
+
+def _lookup(payload: Dict[str, Any]) -> Tuple[int, Scope, np.ndarray, Optional[Tuple[_CachedAnswer, float]]]:
+    with span("answer_cache", "lookup") as lookup_span:
+        version = index_version()
+        scope = answer_scope(payload)
+        vector = _answer_cache.embed(payload["question"])
+        cached = _answer_cache.lookup(scope, vector)
+        lookup_span.set(hit=cached is not None)
+    return version, scope, vector, cached
+
+
+def _cached_result(question: str, cached: Tuple[_CachedAnswer, float]) -> Dict[str, Any]:
+    entry, similarity = cached
+    print(f"[ANSWER CACHE] Hit (similarity {similarity:.3f}) for: {entry.question}")
+    return {
+        "question": question,
+        "generation": entry.answer,
+        "sources": [dict(source) for source in entry.sources],
+        "chat_history": [(question, entry.answer)],
+    }
+
+
+def _store_result(version: int, scope: Scope, vector: np.ndarray, question: str, result: Dict[str, Any]) -> None:
+    generation = result.get("generation")
+    # Web search answers are not derived from the index (and go stale on their own)
+    if generation and not result.get("web_search_count") and not result.get("use_web_search"):
+        if index_version() == version:  # Not rebuilt while the graph ran
+            _answer_cache.store(
+                scope,
+                vector,
+                _CachedAnswer(
+                    question=question,
+                    answer=generation,
+                    sources=[dict(source) for source in result.get("sources", []) if isinstance(source, dict)],
+                    created=time.time(),
+                ),
+            )
+
+
+def invoke_with_answer_cache(
+    invoke: Callable[[Dict[str, Any]], Dict[str, Any]],
+    payload: Dict[str, Any],
+) -> Dict[str, Any]:
+    """
+    Run `invoke(payload)` (the graph) unless a semantically equivalent question was
+    already answered in the same scope. Returns the graph result, or on a hit a
+    result with the cached generation, sources and the updated chat history.
+    """
+    if not ANSWER_CACHE_ENABLED or payload.get("chat_history"):
+        return invoke(payload)
+
+    try:
+        version, scope, vector, cached = _lookup(payload)
+    except Exception as e:
+        print(f"[ANSWER CACHE] Lookup failed: {e}")
+        return invoke(payload)
+
+    if cached is not None:
+        return _cached_result(payload["question"], cached)
+
+    result = invoke(payload)
+    _store_result(version, scope, vector, payload["question"], result)
+    return result
+
+
+async def ainvoke_with_answer_cache(
+    ainvoke: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    payload: Dict[str, Any],
+) -> Dict[str, Any]:
+    """Async invoke_with_answer_cache; the embedding and enrollment lookup run in a worker thread."""
+    if not ANSWER_CACHE_ENABLED or payload.get("chat_history"):
+        return await ainvoke(payload)
+
+    try:
+        version, scope, vector, cached = await asyncio.to_thread(_lookup, payload)
+    except Exception as e:
+        print(f"[ANSWER CACHE] Lookup failed: {e}")
+        return await ainvoke(payload)
+
+    if cached is not None:
+        return _cached_result(payload["question"], cached)
+
+    result = await ainvoke(payload)
+    _store_result(version, scope, vector, payload["question"], result)
+    return result
@@ -3,14 +3,19 @@ FastAPI server for Agentic RAG API.
 Provides REST API endpoints for the frontend to interact with the RAG system.
 """
 
-import io
+import asyncio
+import json
+import os
 import sys
-from contextlib import redirect_stdout
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
 
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, ConfigDict
 
@@ -19,7 +24,7 @@ from pydantic import BaseModel, Field, ConfigDict
 # When running directly, add path to sys.path
 try:
     from .graph.graph import app
-    from .database import fetch_courses_slugs
+    from .database import close_pool, get_pool
 except ImportError:
     # Fallback: add agentic_rag to path if running directly
     current_file = Path(__file__).resolve()
@@ -27,17 +32,119 @@ except ImportError:
     if str(agentic_rag_dir) not in sys.path:
         sys.path.insert(0, str(agentic_rag_dir))
     from graph.graph import app
-    from database import fetch_courses_slugs
+    from database import close_pool, get_pool
+
+# Use the same top-level module the retrieve node imports, so readiness
+# reflects the index the graph actually queries
+from ingestion import CHROMA_PERSIST_DIR, get_vectorstore, index_error, is_index_ready
+from index_sync import INDEX_SYNC_ENABLED, IndexVersionWatcher
+from process_lock import LeaderElection
+from retrieval import HYBRID_SEARCH
+from bm25_index import get_bm25_index
+from reranker import get_reranker
+from source_watcher import WATCH_SOURCES, SourceWatcher
+from change_feed import CHANGE_FEED_ENABLED, ContentChangeFeed
+from enrollment_cache import (
+    ENROLLMENT_CACHE_ENABLED,
+    ENROLLMENT_LISTEN,
+    EnrollmentChangeListener,
+    notify_enrollment_changed,
+)
+from course_catalog import COURSE_CATALOG_ENABLED, courses_slugs, get_course_catalog
+from answer_cache import ainvoke_with_answer_cache
+from graph.streaming import astream_events
+from tracing import start_trace
+from metrics import render_metrics, track_request
+from graph.chains.llm_config import aclose_http_clients
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 # In Docker, environment variables are set by docker-compose.yml
 load_dotenv(override=False)
 
+# Worker threads for the blocking parts of a graph run (Postgres, Chroma, FastEmbed,
+# cross-encoder), which the async nodes hand off with asyncio.to_thread
+BLOCKING_THREADS = int(os.getenv("RAG_BLOCKING_THREADS", "64"))
+# The source watcher and change feed write the index; with several uvicorn workers
+# only the process holding this lock runs them, the others retry to take over
+LEADER_LOCK_PATH = os.getenv("RAG_LEADER_LOCK", os.path.join(CHROMA_PERSIST_DIR, "leader.lock"))
+LEADER_RETRY_INTERVAL = float(os.getenv("RAG_LEADER_RETRY_INTERVAL", "10"))
+
+
+def _warm_db_pool() -> None:
+    try:
+        get_pool().warm()
+    except Exception as e:
+        print(f"[DB POOL] Could not open database connections: {e}")
+
+
+def _load_course_catalog() -> None:
+    try:
+        get_course_catalog().refresh()
+    except Exception as e:
+        print(f"[CATALOG] Could not load the course catalog: {e}")
+
+
+def _open_index() -> None:
+    """Open the persisted vector index in the background (see /ready)."""
+    try:
+        get_vectorstore()
+        if HYBRID_SEARCH:
+            # Build the BM25 index now rather than on the first question
+            get_bm25_index()
+        # Load the cross-encoder (ONNX model) before the first question needs it
+        get_reranker()
+    except Exception as e:
+        print(f"[INDEX] Failed to open vector index: {e}")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # The default executor (min(32, cpus + 4) threads) would cap concurrent
+    # requests well below what the LLM rate limit allows
+    executor = ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix="rag-blocking")
+    asyncio.get_running_loop().set_default_executor(executor)
+    # Don't block startup: the index is opened in the background and /ready
+    # reports 503 until it is available (retrieval also opens it lazily)
+    threading.Thread(target=_open_index, name="index-open", daemon=True).start()
+    threading.Thread(target=_warm_db_pool, name="db-pool-warm", daemon=True).start()
+    if COURSE_CATALOG_ENABLED:
+        threading.Thread(target=_load_course_catalog, name="course-catalog-load", daemon=True).start()
+    # Leader only: hot-reindex knowledge base / transcript files edited while the
+    # API is running, and courses / lessons edited in the backend database
+    writers = []
+    if WATCH_SOURCES:
+        writers.append(SourceWatcher())
+    if CHANGE_FEED_ENABLED:
+        writers.append(ContentChangeFeed())
+    leader = LeaderElection(LEADER_LOCK_PATH, writers, LEADER_RETRY_INTERVAL) if writers else None
+    if leader is not None:
+        leader.start()
+    # Every worker: reload the collection and its caches after writes by the leader or ingest.py
+    index_watcher = IndexVersionWatcher() if INDEX_SYNC_ENABLED else None
+    if index_watcher is not None:
+        index_watcher.start()
+    # Every worker: each one caches enrollments, so each one listens for changes (LISTEN/NOTIFY)
+    enrollment_listener = EnrollmentChangeListener() if ENROLLMENT_CACHE_ENABLED and ENROLLMENT_LISTEN else None
+    if enrollment_listener is not None:
+        enrollment_listener.start()
+    yield
+    if leader is not None:
+        leader.stop()
+    if index_watcher is not None:
+        index_watcher.stop()
+    if enrollment_listener is not None:
+        enrollment_listener.stop()
+    await aclose_http_clients()
+    close_pool()
+    executor.shutdown(wait=False)
+
+
 # Initialize FastAPI app
 api_app = FastAPI(
     title="Agentic RAG API",
     description="API for querying the Agentic RAG system",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
@@ -93,14 +200,40 @@ class Source(BaseModel):
     chapter_summary: Optional[str] = None
     last_modified: Optional[str] = None
     distance: Optional[float] = Field(None, description="Similarity distance score")
+    relevance_score: Optional[float] = Field(None, description="Vector relevance score (0-1, higher is better)")
+    rerank_score: Optional[float] = Field(None, description="Cross-encoder relevance score (0-1), if reranked")
     metadata: Optional[dict] = Field(None, description="Additional metadata")
 
 
+class TraceSpan(BaseModel):
+    """A timed step of the request (see tracing.py)"""
+
+    id: int
+    parent_id: Optional[int] = Field(None, description="Enclosing span, if any")
+    kind: str = Field(..., description="node, edge, llm, llm_cache, answer_cache, retrieval, rerank or db")
+    name: str
+    start_ms: float = Field(..., description="Start, in milliseconds since the request started")
+    duration_ms: Optional[float] = None
+    attributes: Dict[str, Any] = Field(
+        default_factory=dict, description="Token counts, decisions, result sizes, cache hits"
+    )
+    error: Optional[str] = None
+
+
+class RequestTrace(BaseModel):
+    """Structured trace of one request"""
+
+    duration_ms: float
+    spans: List[TraceSpan] = Field(default_factory=list)
+
+
 class AskResponse(BaseModel):
     """Response model for ask endpoint"""
 
     answer: str = Field(..., description="The generated answer")
-    trace: str = Field(..., description="Debug trace output from the RAG pipeline")
+    trace: Optional[RequestTrace] = Field(
+        None, description="Spans of the RAG pipeline run (null when RAG_TRACING=false)"
+    )
     sources: List[Source] = Field(default_factory=list, description="Source documents metadata")
     chat_history: List[ChatMessage] = Field(
         default_factory=list, description="Updated conversation history"
@@ -119,6 +252,59 @@ async def health():
     return {"status": "healthy"}
 
 
+@api_app.get("/ready")
+async def ready():
+    """Readiness endpoint: 200 once the vector index is open, 503 otherwise"""
+    if is_index_ready():
+        return {"status": "ready"}
+    error = index_error()
+    return JSONResponse(
+        status_code=503,
+        content={"status": "error" if error else "loading", "detail": error},
+    )
+
+
+@api_app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics of this worker process (text exposition format)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _rag_payload(request: AskRequest) -> dict:
+    """Graph input for an AskRequest"""
+    payload = {"question": request.question.strip()}
+    
+    if request.user_id and request.user_id.strip():
+        payload["user_id"] = request.user_id.strip()
+    
+    if request.lesson_id and request.lesson_id.strip():
+        payload["lesson_id"] = request.lesson_id.strip()
+    
+    # Convert chat_history from Pydantic models to tuples
+    if request.chat_history:
+        payload["chat_history"] = [
+            (msg.question, msg.answer) for msg in request.chat_history
+        ]
+    return payload
+
+
+def _to_sources(sources_raw: list) -> List[Source]:
+    """Convert sources to Pydantic models"""
+    sources = []
+    for source_raw in sources_raw:
+        if isinstance(source_raw, dict):
+            sources.append(Source(**source_raw))
+        else:
+            # Fallback for string sources
+            sources.append(Source(metadata={"raw": str(source_raw)}))
+    return sources
+
+
+def _to_chat_history(history_raw: list) -> List[ChatMessage]:
+    """Convert chat_history from tuples to Pydantic models"""
+    return [ChatMessage(question=q, answer=a) for q, a in history_raw]
+
+
 @api_app.post("/api/v1/rag/ask", response_model=AskResponse)
 async def ask_question(request: AskRequest) -> AskResponse:
     """
@@ -128,7 +314,7 @@ async def ask_question(request: AskRequest) -> AskResponse:
     - The generated answer
     - Source documents metadata
     - Updated conversation history
-    - Debug trace information
+    - A structured trace (timed spans with token counts and decisions)
     
     Args:
         request: AskRequest containing question, optional user_id and chat_history
@@ -144,52 +330,31 @@ async def ask_question(request: AskRequest) -> AskResponse:
 
     try:
         # Prepare payload for the graph
-        payload = {"question": request.question.strip()}
-        
-        if request.user_id and request.user_id.strip():
-            payload["user_id"] = request.user_id.strip()
-        
-        if request.lesson_id and request.lesson_id.strip():
-            payload["lesson_id"] = request.lesson_id.strip()
-        
-        # Convert chat_history from Pydantic models to tuples
-        if request.chat_history:
-            payload["chat_history"] = [
-                (msg.question, msg.answer) for msg in request.chat_history
-            ]
+        payload = _rag_payload(request)
 
-        # Capture stdout for trace output
-        buf = io.StringIO()
-        with redirect_stdout(buf):
+        # Trace this request's nodes, LLM calls, retrieval and DB queries
+        with track_request("ask"), start_trace() as trace:
             # Increase recursion limit to handle complex flows
             # Also add config to prevent infinite loops
-            result = app.invoke(
-                input=payload,
-                config={"recursion_limit": 30}  # Increased from default 25
+            # Near-duplicate questions are answered from the semantic answer cache
+            result = await ainvoke_with_answer_cache(
+                lambda graph_input: app.ainvoke(
+                    input=graph_input,
+                    config={"recursion_limit": 30}  # Increased from default 25
+                ),
+                payload,
             )
 
-        trace = buf.getvalue()
         answer = result.get("generation", str(result))
         sources_raw = result.get("sources", [])
         updated_history_raw = result.get("chat_history", [])
 
-        # Convert sources to Pydantic models
-        sources = []
-        for source_raw in sources_raw:
-            if isinstance(source_raw, dict):
-                sources.append(Source(**source_raw))
-            else:
-                # Fallback for string sources
-                sources.append(Source(metadata={"raw": str(source_raw)}))
-
-        # Convert chat_history from tuples to Pydantic models
-        chat_history = []
-        for q, a in updated_history_raw:
-            chat_history.append(ChatMessage(question=q, answer=a))
+        sources = _to_sources(sources_raw)
+        chat_history = _to_chat_history(updated_history_raw)
 
         return AskResponse(
             answer=answer,
-            trace=trace,
+            trace=trace.to_dict() if trace is not None else None,
             sources=sources,
             chat_history=chat_history,
         )
@@ -201,6 +366,57 @@ async def ask_question(request: AskRequest) -> AskResponse:
         )
 
 
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _run_graph(payload: dict) -> dict:
+    """Graph result, with the request trace under "trace"."""
+    with track_request("ask_stream"), start_trace() as trace:
+        result = await ainvoke_with_answer_cache(
+            lambda graph_input: app.ainvoke(input=graph_input, config={"recursion_limit": 30}),
+            payload,
+        )
+    return {**result, "trace": trace.to_dict() if trace is not None else None}
+
+
+async def _sse_stream(payload: dict) -> AsyncIterator[str]:
+    """Graph events (see graph/streaming.py) as server-sent events, ending with sources and done."""
+    async for event, data in astream_events(_run_graph, payload):
+        if event == "result":
+            yield _sse("sources", [source.model_dump(exclude_none=True) for source in _to_sources(data.get("sources", []))])
+            yield _sse("done", {
+                "answer": data.get("generation", ""),
+                "chat_history": [message.model_dump() for message in _to_chat_history(data.get("chat_history", []))],
+                "trace": data.get("trace"),
+            })
+        else:
+            yield _sse(event, data)
+
+
+@api_app.post("/api/v1/rag/ask/stream")
+async def ask_question_stream(request: AskRequest) -> StreamingResponse:
+    """
+    Streaming variant of /api/v1/rag/ask (server-sent events).
+
+    Events:
+    - generation_start / token: the answer as it is generated
+    - grade / decision: answer grading
+    - discard: drop the tokens received so far, a regenerated answer follows
+    - sources: source documents metadata
+    - done: the final answer, updated conversation history and request trace
+    - error: processing failed
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    return StreamingResponse(
+        _sse_stream(_rag_payload(request)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # New endpoint models for /api/v1/ask
 class AskV1Request(BaseModel):
     """Request model for /api/v1/ask endpoint"""
@@ -272,12 +488,13 @@ async def ask_v1(request: AskV1Request) -> AskV1Response:
                 if msg.question and msg.answer  # Skip null/empty messages
             ]
 
-        # Capture stdout for trace output (but don't include in response)
-        buf = io.StringIO()
-        with redirect_stdout(buf):
-            result = app.invoke(
-                input=payload,
-                config={"recursion_limit": 30}
+        with track_request("ask_v1"):
+            result = await ainvoke_with_answer_cache(
+                lambda graph_input: app.ainvoke(
+                    input=graph_input,
+                    config={"recursion_limit": 30}
+                ),
+                payload,
             )
 
         answer = result.get("generation", str(result))
@@ -306,7 +523,7 @@ async def ask_v1(request: AskV1Request) -> AskV1Response:
                             }
         
         # Fetch slugs for all course_ids
-        course_slugs = fetch_courses_slugs(list(course_ids))
+        course_slugs = await asyncio.to_thread(courses_slugs, list(course_ids))
         
         # Build sources list with title and slug
         sources = []
@@ -330,6 +547,31 @@ async def ask_v1(request: AskV1Request) -> AskV1Response:
         )
 
 
+class EnrollmentChangedRequest(BaseModel):
+    """Request model for /api/v1/enrollments/changed"""
+
+    model_config = ConfigDict(populate_by_name=True)
+
+    user_id: Optional[str] = Field(
+        default=None, alias="userId", description="Member whose enrollments changed (omit for all members)"
+    )
+
+
+@api_app.post("/api/v1/enrollments/changed")
+async def enrollments_changed(request: EnrollmentChangedRequest):
+    """
+    Tell every API worker that a member's enrollments changed, for backends that
+    can't install the `enrollments` NOTIFY trigger (see enrollment_cache.py).
+    """
+    user_id = request.user_id.strip() if request.user_id and request.user_id.strip() else None
+    try:
+        await asyncio.to_thread(notify_enrollment_changed, user_id)
+    except Exception as e:
+        # This worker's entry is already dropped; the others expire with the TTL
+        raise HTTPException(status_code=503, detail=f"Could not notify other workers: {str(e)}")
+    return {"status": "invalidated", "user_id": user_id}
+
+
 if __name__ == "__main__":
     import uvicorn
 
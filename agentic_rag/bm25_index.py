@@ -0,0 +1,270 @@
+"""
+In-memory BM25 inverted index over the chunks of the vector collection.
+
+Dense FastEmbed vectors rank exact identifiers (SQL keywords, function names,
+course titles) poorly; this sparse index is searched next to the vector index
+and both rankings are fused in retrieval.hybrid_search.
+
+The index is loaded from the Chroma collection itself, so it always covers the
+same chunks, and stays in sync with hot reindexes through ingestion's index
+listeners. Only term postings, the terms, length and filter metadata of each
+chunk are kept in memory; chunk text is fetched from Chroma for the hits.
+"""
+
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from ingestion import add_index_listener, get_vectorstore
+
+BM25_K1 = float(os.getenv("RAG_BM25_K1", "1.2"))
+BM25_B = float(os.getenv("RAG_BM25_B", "0.75"))
+BM25_LOAD_BATCH_SIZE = int(os.getenv("RAG_BM25_LOAD_BATCH_SIZE", "2000"))
+
+# Metadata kept per chunk for filtering (see retrieval.build_filter)
+_FILTER_KEYS = ("document_id", "doc_type", "lesson_id", "course_id", "requires_enrollment")
+
+# Words, including identifiers such as snake_case names; \w also matches Vietnamese letters
+_TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall((text or "").lower())
+
+
+def matches_filter(metadata: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Evaluate a Chroma `where` filter ($and/$or/$eq/$ne/$in/$nin) against metadata."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+
+class BM25Index:
+    """
+    Okapi BM25 over chunks, keyed by chunk id. Updates replace every chunk of a
+    document at once (chunk ids are `<document_id>::<n>`, see ingestion).
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B) -> None:
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        # term -> {slot: term frequency}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._ids: List[Optional[str]] = []
+        self._lengths: List[int] = []
+        # Terms of each slot, to drop its postings when the chunk goes
+        self._terms: List[Tuple[str, ...]] = []
+        self._metadata: List[Optional[Dict[str, Any]]] = []
+        self._slots: Dict[str, int] = {}
+        self._document_slots: Dict[str, Set[int]] = {}
+        self._free: List[int] = []
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def add(self, chunk_id: str, text: str, metadata: Optional[Dict[str, Any]] = None) -> None:
+        metadata = metadata or {}
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self.remove(chunk_id)
+            if self._free:
+                slot = self._free.pop()
+            else:
+                slot = len(self._ids)
+                self._ids.append(None)
+                self._lengths.append(0)
+                self._terms.append(())
+                self._metadata.append(None)
+            length = sum(terms.values())
+            self._ids[slot] = chunk_id
+            self._lengths[slot] = length
+            self._terms[slot] = tuple(terms)
+            self._metadata[slot] = {key: metadata[key] for key in _FILTER_KEYS if key in metadata}
+            self._slots[chunk_id] = slot
+            document_id = metadata.get("document_id") or chunk_id.rsplit("::", 1)[0]
+            self._document_slots.setdefault(document_id, set()).add(slot)
+            self._total_length += length
+            for term, frequency in terms.items():
+                self._postings.setdefault(term, {})[slot] = frequency
+
+    def remove(self, chunk_id: str) -> None:
+        with self._lock:
+            slot = self._slots.pop(chunk_id, None)
+            if slot is None:
+                return
+            document_id = (self._metadata[slot] or {}).get("document_id") or chunk_id.rsplit("::", 1)[0]
+            slots = self._document_slots.get(document_id)
+            if slots is not None:
+                slots.discard(slot)
+                if not slots:
+                    del self._document_slots[document_id]
+            # Drop the postings before the slot is reused by another chunk
+            for term in self._terms[slot]:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    postings.pop(slot, None)
+                    if not postings:
+                        del self._postings[term]
+            self._total_length -= self._lengths[slot]
+            self._ids[slot] = None
+            self._lengths[slot] = 0
+            self._terms[slot] = ()
+            self._metadata[slot] = None
+            self._free.append(slot)
+
+    def remove_documents(self, document_ids: Iterable[str]) -> None:
+        with self._lock:
+            for document_id in document_ids:
+                for slot in list(self._document_slots.get(document_id, ())):
+                    chunk_id = self._ids[slot]
+                    if chunk_id is not None:
+                        self.remove(chunk_id)
+
+    def search(
+        self, query: str, k: int, where: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[str, float]]:
+        """Top-k (chunk_id, score) among chunks matching the filter."""
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._slots)
+            if not terms or count == 0:
+                return []
+            average_length = self._total_length / count or 1.0
+            scores: Dict[int, float] = {}
+            allowed: Dict[int, bool] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                document_frequency = len(postings)
+                idf = math.log(1 + (count - document_frequency + 0.5) / (document_frequency + 0.5))
+                for slot, frequency in postings.items():
+                    if slot not in allowed:
+                        allowed[slot] = matches_filter(self._metadata[slot], where)
+                    if not allowed[slot]:
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[slot] / average_length)
+                    scores[slot] = scores.get(slot, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(self._ids[slot], score) for slot, score in best]
+
+    def load_collection(self, collection, document_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        (Re)load chunks from a Chroma collection, all of them or only those of
+        `document_ids`. Returns the number of chunks loaded.
+        """
+        where = None
+        if document_ids is not None:
+            document_ids = sorted(set(document_ids))
+            if not document_ids:
+                return 0
+            where = {"document_id": {"$in": document_ids}}
+        loaded = 0
+        offset = 0
+        while True:
+            batch = collection.get(
+                where=where,
+                include=["documents", "metadatas"],
+                limit=BM25_LOAD_BATCH_SIZE,
+                offset=offset,
+            )
+            ids = batch["ids"]
+            if not ids:
+                break
+            for chunk_id, text, metadata in zip(ids, batch["documents"], batch["metadatas"]):
+                self.add(chunk_id, text, metadata)
+            loaded += len(ids)
+            offset += len(ids)
+            if len(ids) < BM25_LOAD_BATCH_SIZE:
+                break
+        return loaded
+
+
+_bm25_index: Optional[BM25Index] = None
+_bm25_lock = threading.Lock()  # guards the globals below
+_bm25_load_lock = threading.Lock()  # one loader at a time
+# While a load runs (_bm25_changes is not None) the listener records writes here
+# instead of dropping them; the loader replays them before publishing the index
+_bm25_changes: Optional[Set[str]] = None
+_bm25_stale = False
+
+
+def _on_index_changed(document_ids: Optional[Set[str]]) -> None:
+    """Keep the BM25 index in sync with writes to the collection."""
+    global _bm25_index, _bm25_stale
+    with _bm25_lock:
+        index = _bm25_index
+        if index is None:
+            if _bm25_changes is not None:
+                if document_ids is None:
+                    _bm25_stale = True
+                else:
+                    _bm25_changes.update(document_ids)
+            return
+        if document_ids is None:
+            # Whole collection rebuilt: reload on next use
+            _bm25_index = None
+            return
+    collection = get_vectorstore()._collection
+    with index._lock:
+        index.remove_documents(document_ids)
+        index.load_collection(collection, document_ids)
+
+
+def get_bm25_index() -> BM25Index:
+    """Lazily build the BM25 index from the opened collection (thread-safe)."""
+    global _bm25_index, _bm25_changes, _bm25_stale
+    index = _bm25_index
+    if index is not None:
+        return index
+    with _bm25_load_lock:
+        with _bm25_lock:
+            if _bm25_index is not None:
+                return _bm25_index
+            _bm25_changes, _bm25_stale = set(), True
+        while True:
+            with _bm25_lock:
+                changes, stale = _bm25_changes, _bm25_stale
+                if not changes and not stale:
+                    _bm25_index, _bm25_changes = index, None
+                    return index
+                _bm25_changes, _bm25_stale = set(), False
+            collection = get_vectorstore()._collection
+            if stale:
+                index = BM25Index()
+                loaded = index.load_collection(collection)
+                print(f"[BM25] Indexed {loaded} chunks ({len(index._postings)} terms)")
+            else:
+                index.remove_documents(changes)
+                index.load_collection(collection, changes)
+
+
+add_index_listener(_on_index_changed)
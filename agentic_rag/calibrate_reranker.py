@@ -0,0 +1,95 @@
+"""
+Command-line tool to calibrate RAG_RERANK_THRESHOLD for the configured cross-encoder.
+
+Input is a JSONL file of labelled pairs, one per line:
+    {"question": "...", "document": "...", "relevant": true}
+Pairs without "relevant" are labelled by the LLM retrieval grader when
+--label-with-llm is given (useful to bootstrap from real questions and retrieved
+chunks), otherwise they are skipped.
+
+Usage:
+    cd agentic_rag
+    poetry run python calibrate_reranker.py pairs.jsonl
+    poetry run python calibrate_reranker.py pairs.jsonl --min-precision 0.9
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Only load .env file if not in Docker (override=False prevents overriding existing env vars)
+load_dotenv(override=False)
+
+from langchain_core.documents import Document
+
+from reranker import RERANKER_MODEL, RERANK_THRESHOLD, calibrate_threshold, rerank
+
+
+def _load_pairs(path: str, label_with_llm: bool) -> List[Tuple[str, str, bool]]:
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            relevant = record.get("relevant")
+            if relevant is None:
+                if not label_with_llm:
+                    continue
+                from graph.chains.retrieval_grader import retrieval_grader
+
+                result = retrieval_grader.invoke({"question": record["question"], "document": record["document"]})
+                relevant = result.binary_score.lower() == "yes"
+            pairs.append((record["question"], record["document"], bool(relevant)))
+    return pairs
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibrate the cross-encoder relevance threshold.")
+    parser.add_argument("pairs", help="JSONL file of question/document pairs.")
+    parser.add_argument(
+        "--min-precision",
+        type=float,
+        default=0.0,
+        help="Only consider thresholds with at least this precision.",
+    )
+    parser.add_argument(
+        "--label-with-llm",
+        action="store_true",
+        help="Label pairs without a 'relevant' field with the LLM retrieval grader.",
+    )
+    args = parser.parse_args(argv)
+
+    pairs = _load_pairs(args.pairs, args.label_with_llm)
+    by_question: Dict[str, List[Tuple[str, bool]]] = defaultdict(list)
+    for question, document, relevant in pairs:
+        by_question[question].append((document, relevant))
+
+    labelled = []
+    for question, documents in by_question.items():
+        scored = rerank(question, [Document(page_content=doc, metadata={"relevant": rel}) for doc, rel in documents])
+        if scored is None:
+            print("[RERANK] No cross-encoder available, nothing to calibrate")
+            return 1
+        labelled.extend((score, doc.metadata["relevant"]) for doc, score in scored)
+
+    try:
+        threshold, quality = calibrate_threshold(labelled, args.min_precision)
+    except ValueError as e:
+        print(f"[RERANK] Calibration failed: {e}")
+        return 1
+    print(
+        f"[RERANK] {RERANKER_MODEL}: {len(labelled)} pairs, current threshold {RERANK_THRESHOLD}, "
+        f"calibrated threshold {threshold:.4f} (precision={quality['precision']:.3f}, "
+        f"recall={quality['recall']:.3f}, f1={quality['f1']:.3f})"
+    )
+    print(f"Set RAG_RERANK_THRESHOLD={threshold:.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
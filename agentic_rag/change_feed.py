@@ -0,0 +1,365 @@
+"""
+Change feed from Postgres driving incremental reindexing of courses and lessons.
+
+ContentChangeFeed polls the RAG_CDC_TABLES (courses, chapters and lessons by
+default; tags and labels can be added if they have a `modified` column) every
+RAG_CDC_INTERVAL seconds for rows modified at or after each table's watermark,
+and maps them to the documents built from them:
+    course          its overview document and all its lesson documents (they
+                    embed the course title, level, language and taxonomy)
+    chapter         the documents of its lessons
+    lesson          its document
+    tag / label     the documents of the course, chapter or lesson it is on
+A table whose query fails is skipped (and retried) without holding up the
+others. Only those documents are rebuilt (ingestion.reindex_content), along
+with lessons that left a changed chapter or course; unchanged documents are
+skipped by their content hash and changed ones have their chunks replaced in
+place, so edits reach retrieval within seconds without a full ingestion.
+
+With RAG_CDC_LISTEN the feed also LISTENs on RAG_CDC_CHANNEL. The triggers in
+the README notify every insert, update and delete, which wakes the feed at once
+and reports deletions (which leave no `modified` behind). Without the triggers,
+documents of other deleted courses and lessons are found by comparing ids with
+the index every RAG_CDC_RECONCILE_INTERVAL seconds.
+
+With several API workers, only the leader runs the feed (see process_lock.py).
+
+Watermarks are saved to RAG_CDC_STATE after every successful batch, so changes
+made while the API was down are caught up on start. Without saved state, a
+table starts from its current latest `modified` (the index is assumed to be as
+fresh as the last ingestion run).
+
+Transcript documents also carry lesson context; they are refreshed when their
+file changes (source watcher) or by the next ingestion run.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import select
+import threading
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from psycopg2 import sql
+
+from course_catalog import COURSE_CATALOG_ENABLED, get_course_catalog
+from database import CHANGE_TABLES, fetch_changed_rows, fetch_content_ids, fetch_max_modified, open_connection
+from ingestion import (
+    CHROMA_PERSIST_DIR,
+    IngestSummary,
+    indexed_document_ids,
+    is_index_ready,
+    reindex_content,
+    reindex_documents,
+)
+from tracing import span
+
+CHANGE_FEED_ENABLED = os.getenv("RAG_CDC", "true").lower() in ("1", "true", "yes")
+CHANGE_FEED_INTERVAL = float(os.getenv("RAG_CDC_INTERVAL", "5"))
+CHANGE_FEED_TABLES = tuple(
+    table.strip() for table in os.getenv("RAG_CDC_TABLES", "courses,chapters,lessons").split(",") if table.strip()
+)
+CHANGE_FEED_LISTEN = os.getenv("RAG_CDC_LISTEN", "true").lower() in ("1", "true", "yes")
+CHANGE_FEED_CHANNEL = os.getenv("RAG_CDC_CHANNEL", "content_changed")
+CHANGE_FEED_RECONCILE_INTERVAL = float(os.getenv("RAG_CDC_RECONCILE_INTERVAL", "600"))
+CHANGE_FEED_STATE_PATH = os.getenv("RAG_CDC_STATE", os.path.join(CHROMA_PERSIST_DIR, "cdc_state.json"))
+
+# (table, id, entity_type) of a changed row; tags and labels carry the entity they are on
+_Change = Tuple[str, str, str]
+_ENTITY_TYPES = {"courses": "Course", "chapters": "Chapter", "lessons": "Lesson"}
+
+
+@dataclass
+class ChangeFeedStats:
+    polls: int = 0
+    notifications: int = 0
+    changed_rows: int = 0
+    reindexed_documents: int = 0
+    reconciled_documents: int = 0
+    failures: int = 0
+    # Seconds from the oldest `modified` of the last batch to its chunks being written
+    last_freshness_seconds: float = 0.0
+
+
+_stats = ChangeFeedStats()
+
+
+def change_feed_stats() -> Dict[str, float]:
+    return asdict(_stats)
+
+
+def _age_seconds(modified: Any) -> Optional[float]:
+    if not isinstance(modified, datetime):
+        return None
+    # Naive timestamps are taken to be in the server's local time
+    now = datetime.now(timezone.utc) if modified.tzinfo is not None else datetime.now()
+    return max(0.0, (now - modified).total_seconds())
+
+
+class ContentChangeFeed:
+    """Background poller (and optional listener) reindexing the documents of changed rows."""
+
+    def __init__(
+        self,
+        interval: float = CHANGE_FEED_INTERVAL,
+        tables: Tuple[str, ...] = CHANGE_FEED_TABLES,
+        listen: bool = CHANGE_FEED_LISTEN,
+        channel: str = CHANGE_FEED_CHANNEL,
+        reconcile_interval: float = CHANGE_FEED_RECONCILE_INTERVAL,
+        state_path: str = CHANGE_FEED_STATE_PATH,
+    ) -> None:
+        unknown = set(tables) - set(CHANGE_TABLES)
+        if unknown:
+            raise ValueError(f"RAG_CDC_TABLES: unknown tables {sorted(unknown)}, expected some of {CHANGE_TABLES}")
+        self.interval = interval
+        self.tables = tables
+        self.listen = listen
+        self.channel = channel
+        self.reconcile_interval = reconcile_interval
+        self.state_path = Path(state_path)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # table -> latest `modified` applied, and the rows at exactly that time
+        # (fetched again by `modified >=`, which also catches rows committed late)
+        self._watermarks: Dict[str, Any] = {}
+        self._seen: Dict[str, Set[str]] = {}
+        # Changes reported by notifications, applied with the next poll
+        self._notified: Set[_Change] = set()
+        # Reconciled on the first poll, for deletions made while the API was down
+        self._reconciled_at = 0.0
+        # Saved per-table state (None until read), kept for tables not initialized yet
+        self._state: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 2)
+            self._thread = None
+
+    # State
+
+    def _load_state(self) -> None:
+        self._state = {}
+        if self.state_path.exists():
+            try:
+                with open(self.state_path, "r", encoding="utf-8") as f:
+                    self._state = json.load(f).get("tables", {})
+            except Exception as e:
+                print(f"[CDC] Failed to read state {self.state_path}: {e}")
+        print(f"[CDC] Watching {', '.join(self.tables)} (every {self.interval:g}s) from {self.state_path}")
+
+    def _init_table(self, table: str) -> None:
+        entry = self._state.get(table)
+        if entry and entry.get("watermark"):
+            self._watermarks[table] = datetime.fromisoformat(entry["watermark"])
+            self._seen[table] = set(entry.get("seen", []))
+            return
+        watermark = fetch_max_modified(table)
+        # Assumed indexed already: not reapplied by the first poll
+        self._seen[table] = {_key(row) for row in fetch_changed_rows(table, watermark)} if watermark else set()
+        self._watermarks[table] = watermark
+
+    def _save_state(self) -> None:
+        for table, watermark in self._watermarks.items():
+            self._state[table] = {
+                "watermark": watermark.isoformat() if watermark is not None else None,
+                "seen": sorted(self._seen.get(table, ())),
+            }
+        state = {"tables": self._state}
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(self.state_path.suffix + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    # Loop
+
+    def _run(self) -> None:
+        conn = None
+        listen_retry_at = 0.0
+        next_poll = 0.0
+        while not self._stop.is_set():
+            if self.listen and conn is None and time.monotonic() >= listen_retry_at:
+                try:
+                    conn = self._open_listener()
+                except Exception as e:
+                    print(f"[CDC] Could not LISTEN on '{self.channel}', polling only for now: {e}")
+                    listen_retry_at = time.monotonic() + max(self.interval, 30.0)
+            # Wake up at least every second to notice stop()
+            timeout = min(max(0.0, next_poll - time.monotonic()), 1.0)
+            notified = False
+            if conn is not None:
+                try:
+                    notified = self._wait_for_notifications(conn, timeout)
+                except Exception as e:
+                    print(f"[CDC] Listener disconnected: {e}")
+                    conn.close()
+                    conn = None
+                    # Deletions notified meanwhile were missed
+                    self._reconciled_at = 0.0
+            else:
+                self._stop.wait(timeout)
+            if self._stop.is_set() or not (notified or time.monotonic() >= next_poll):
+                continue
+            try:
+                self.poll()
+            except Exception as e:
+                _stats.failures += 1
+                print(f"[CDC] Reindex failed, will retry: {e}")
+            next_poll = time.monotonic() + self.interval
+        if conn is not None:
+            conn.close()
+
+    def _open_listener(self):
+        # A dedicated connection: LISTEN holds it for the lifetime of the feed
+        conn = open_connection()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+        print(f"[CDC] Listening for changes on '{self.channel}'")
+        return conn
+
+    def _wait_for_notifications(self, conn, timeout: float) -> bool:
+        if select.select([conn], [], [], timeout) == ([], [], []):
+            return False
+        conn.poll()
+        received = False
+        while conn.notifies:
+            received = True
+            _stats.notifications += 1
+            change = self._parse_notification(conn.notifies.pop(0).payload)
+            if change is not None:
+                self._notified.add(change)
+        return received
+
+    @staticmethod
+    def _parse_notification(payload: str) -> Optional[_Change]:
+        """(table, id, entity_type) from a trigger payload (see README); None if it names no row."""
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        table = data.get("table")
+        if table in ("tags", "labels"):
+            row_id, entity_type = data.get("entity_id"), data.get("entity_type")
+        else:
+            row_id, entity_type = data.get("id"), _ENTITY_TYPES.get(table)
+        if table not in CHANGE_TABLES or not row_id or not entity_type:
+            return None
+        return table, str(row_id), str(entity_type)
+
+    # Applying changes
+
+    def poll(self) -> bool:
+        """Reindex the documents of rows changed since the last poll; returns True if a reindex ran."""
+        if not is_index_ready():
+            # Nothing to update yet; changes are picked up once the index is open
+            return False
+        if self._state is None:
+            self._load_state()
+        _stats.polls += 1
+
+        changes: Set[_Change] = set(self._notified)
+        notified = set(self._notified)
+        advanced: Dict[str, Tuple[Any, Set[str]]] = {}
+        oldest: Optional[Any] = None
+        initialized = False
+        for table in self.tables:
+            try:
+                if table not in self._watermarks:
+                    self._init_table(table)
+                    initialized = True
+                watermark, seen = self._watermarks[table], self._seen[table]
+                rows = fetch_changed_rows(table, watermark)
+            except Exception as e:
+                # Its watermark stays put, so the rows are picked up once the query works
+                _stats.failures += 1
+                print(f"[CDC] Polling {table} failed, skipping it: {e}")
+                continue
+            new_rows = [row for row in rows if not (row["modified"] == watermark and _key(row) in seen)]
+            if not new_rows:
+                continue
+            latest = rows[-1]["modified"]
+            at_latest = {_key(row) for row in rows if row["modified"] == latest}
+            advanced[table] = (latest, at_latest | seen if latest == watermark else at_latest)
+            changes.update((table, row["id"], str(row["entity_type"])) for row in new_rows)
+            if oldest is None or new_rows[0]["modified"] < oldest:
+                oldest = new_rows[0]["modified"]
+
+        reconcile = time.monotonic() - self._reconciled_at >= self.reconcile_interval
+        removed_ids = self._deleted_document_ids() if reconcile else []
+        if not changes and not removed_ids:
+            if reconcile:
+                self._reconciled_at = time.monotonic()
+            if initialized:
+                # Edits made before a restart are then caught up from here
+                self._save_state()
+            return False
+
+        course_ids: Set[str] = set()
+        chapter_ids: Set[str] = set()
+        lesson_ids: Set[str] = set()
+        targets = {"Course": course_ids, "Chapter": chapter_ids, "Lesson": lesson_ids}
+        for _, row_id, entity_type in changes:
+            if entity_type in targets:
+                targets[entity_type].add(row_id)
+        print(
+            f"[CDC] Reindexing courses={len(course_ids)} chapters={len(chapter_ids)} "
+            f"lessons={len(lesson_ids)} deleted={len(removed_ids)}"
+        )
+        with span("cdc", "reindex") as span_:
+            summary = reindex_content(course_ids, chapter_ids, lesson_ids) if changes else IngestSummary()
+            if removed_ids:
+                summary.updated |= reindex_documents((), removed_ids).updated
+                _stats.reconciled_documents += len(removed_ids)
+            freshness = _age_seconds(oldest)
+            span_.set(changed_rows=len(changes), documents=len(summary.updated))
+            if freshness is not None:
+                span_.set(freshness_s=round(freshness, 3))
+                _stats.last_freshness_seconds = round(freshness, 3)
+                print(f"[CDC] Changes indexed {freshness:.1f}s after the oldest edit")
+
+        # Only advance once the reindex succeeded
+        self._notified -= notified
+        for table, (watermark, seen) in advanced.items():
+            self._watermarks[table] = watermark
+            self._seen[table] = seen
+        self._save_state()
+        if reconcile:
+            self._reconciled_at = time.monotonic()
+        _stats.changed_rows += len(changes)
+        _stats.reindexed_documents += len(summary.updated)
+
+        if COURSE_CATALOG_ENABLED and any(table in ("courses", "chapters", "lessons") for table, _, _ in changes):
+            try:
+                get_course_catalog().refresh()
+            except Exception as e:
+                print(f"[CDC] Course catalog refresh failed: {e}")
+        return True
+
+    def _deleted_document_ids(self) -> List[str]:
+        """Indexed course / lesson documents whose row no longer exists."""
+        course_ids, lesson_ids = fetch_content_ids()
+        removed = []
+        for document_id in indexed_document_ids():
+            kind, _, row_id = document_id.partition(":")
+            if (kind == "course" and row_id not in course_ids) or (kind == "lesson" and row_id not in lesson_ids):
+                removed.append(document_id)
+        return removed
+
+
+def _key(row: Dict[str, Any]) -> str:
+    return f"{row['id']}|{row['entity_type']}"
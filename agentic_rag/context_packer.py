@@ -0,0 +1,201 @@
+"""
+Token-budgeted context packing for the generation and grading prompts.
+
+Tokens are counted with the tiktoken encoding used to chunk documents at
+ingestion (RecursiveCharacterTextSplitter.from_tiktoken_encoder, "gpt2"), so
+budgets and RAG_CHUNK_SIZE are in the same unit. Each chain has its own budget
+(RAG_CONTEXT_BUDGET_<CHAIN>); pack() fills it with sections in relevance order,
+skips sections that mostly repeat one already packed, and trims the section that
+would overflow the budget at a sentence boundary.
+"""
+
+from __future__ import annotations
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+from langchain_core.documents import Document
+
+TOKEN_ENCODING = os.getenv("RAG_TOKEN_ENCODING", "gpt2")
+
+# Context tokens per chain
+CONTEXT_BUDGETS: Dict[str, int] = {
+    name: int(os.getenv(f"RAG_CONTEXT_BUDGET_{name.upper()}", str(default)))
+    for name, default in (
+        ("generate", 3000),
+        ("generate_platform", 1500),
+        ("history", 800),
+        ("roadmap", 1500),
+        ("combined_grader", 3000),
+        ("batch_retrieval_grader", 3000),
+    )
+}
+# Sections whose word-trigram overlap with a packed section is at least this are dropped
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("RAG_CONTEXT_DEDUP_THRESHOLD", "0.8"))
+# Don't start a trimmed section with less room than this
+CONTEXT_MIN_SECTION_TOKENS = int(os.getenv("RAG_CONTEXT_MIN_SECTION_TOKENS", "64"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s+|\n+")
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        with _encoding_lock:
+            if _encoding is None and not _encoding_failed:
+                try:
+                    import tiktoken
+
+                    _encoding = tiktoken.get_encoding(TOKEN_ENCODING)
+                except Exception as e:
+                    print(f"[CONTEXT] tiktoken encoding '{TOKEN_ENCODING}' unavailable, estimating tokens: {e}")
+                    _encoding_failed = True
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of whole sentences within `max_tokens` (a hard cut if the first sentence is longer)."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept: List[str] = []
+    used = 0
+    position = 0
+    for match in _SENTENCE_END.finditer(text):
+        sentence = text[position:match.end()]
+        tokens = count_tokens(sentence)
+        if used + tokens > max_tokens:
+            break
+        kept.append(sentence)
+        used += tokens
+        position = match.end()
+    if kept:
+        return "".join(kept).rstrip()
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4].rstrip()
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens]).rstrip()
+
+
+def _shingles(text: str) -> Set[tuple]:
+    words = _WORD.findall(text.lower())
+    return {tuple(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def _is_redundant(shingles: Set[tuple], packed: Iterable[Set[tuple]]) -> bool:
+    if not shingles:
+        return False
+    for other in packed:
+        if other and len(shingles & other) / min(len(shingles), len(other)) >= CONTEXT_DEDUP_THRESHOLD:
+            return True
+    return False
+
+
+@dataclass
+class PackResult:
+    text: str
+    sections: List[str]
+    # Indices (into the input) of the packed sections, in packing order
+    indices: List[int]
+    tokens_in: int
+    tokens_out: int
+    budget: int
+
+    def log(self, chain: str, total: int) -> None:
+        print(
+            f"[CONTEXT] {chain}: {len(self.indices)}/{total} sections, "
+            f"{self.tokens_out}/{self.tokens_in} tokens (budget {self.budget})"
+        )
+
+
+def pack(
+    sections: Sequence[str],
+    budget: int,
+    separator: str = "\n\n-----\n\n",
+    dedupe: bool = True,
+) -> PackResult:
+    """Fill `budget` tokens with `sections`, taken in the given (relevance) order."""
+    separator_tokens = count_tokens(separator)
+    packed: List[str] = []
+    indices: List[int] = []
+    packed_shingles: List[Set[tuple]] = []
+    tokens_in = 0
+    used = 0
+    for index, section in enumerate(sections):
+        section = (section or "").strip()
+        tokens = count_tokens(section)
+        tokens_in += tokens
+        if not section:
+            continue
+        room = budget - used - (separator_tokens if packed else 0)
+        if room < min(tokens, CONTEXT_MIN_SECTION_TOKENS):
+            continue
+        shingles = _shingles(section) if dedupe else set()
+        if dedupe and _is_redundant(shingles, packed_shingles):
+            continue
+        if tokens > room:
+            section = trim_to_tokens(section, room)
+            tokens = count_tokens(section)
+            if not section:
+                continue
+        packed.append(section)
+        indices.append(index)
+        packed_shingles.append(shingles)
+        used += tokens + (separator_tokens if len(packed) > 1 else 0)
+    return PackResult(
+        text=separator.join(packed),
+        sections=packed,
+        indices=indices,
+        tokens_in=tokens_in,
+        tokens_out=used,
+        budget=budget,
+    )
+
+
+def by_relevance(documents: Sequence[Document]) -> List[Document]:
+    """Documents by rerank score, else vector relevance; unscored ones (web results) keep their place after them."""
+
+    def score(document: Document) -> Optional[float]:
+        metadata = document.metadata or {}
+        value = metadata.get("rerank_score", metadata.get("relevance_score"))
+        return None if value is None else float(value)
+
+    scored = [document for document in documents if score(document) is not None]
+    unscored = [document for document in documents if score(document) is None]
+    return sorted(scored, key=lambda document: score(document), reverse=True) + unscored
+
+
+def pack_documents(
+    documents: Sequence[Document],
+    chain: str,
+    render=lambda document: document.page_content,
+    budget: Optional[int] = None,
+) -> str:
+    """Render documents in relevance order and pack them into the chain's budget."""
+    ordered = by_relevance(documents)
+    result = pack([render(document) for document in ordered], CONTEXT_BUDGETS[chain] if budget is None else budget)
+    result.log(chain, len(ordered))
+    return result.text
+
+
+def log_token_usage(chain: str, prompt: str, output: str) -> None:
+    """Log the (approximate) prompt and completion tokens of an LLM call."""
+    print(f"[TOKENS] {chain}: in={count_tokens(prompt)} out={count_tokens(output)}")
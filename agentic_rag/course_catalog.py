@@ -0,0 +1,444 @@
+"""
+In-memory catalog of course structures (course -> chapters -> lessons).
+
+Roadmap questions and the v1 sources (slugs) used to hit the database on every
+request with a three-way join over all courses. The catalog loads the three
+tables once into compact frozen structures, keeps every course's roadmap text
+pre-rendered, and serves course_structures() / course_roadmaps() /
+courses_slugs() from memory.
+
+Refreshes are incremental: only rows whose `modified` is at or after the
+highest `modified` seen so far are fetched, and only the courses they touch
+(including the course a chapter or lesson moved away from) are rebuilt and
+re-rendered. Deleted rows leave no `modified` trace, so a refresh whose table
+counts differ from the catalog's falls back to a full reload, as does every
+refresh after RAG_CATALOG_FULL_REFRESH seconds (which also picks up rows
+committed late with a `modified` older than the watermark).
+
+The first lookup waits for the initial load. After that, once the catalog is
+RAG_CATALOG_REFRESH_INTERVAL seconds old, a lookup starts a background refresh
+and keeps answering from the current snapshot meanwhile.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from database import fetch_catalog_counts, fetch_catalog_rows, fetch_course_structure, fetch_courses_slugs
+
+COURSE_CATALOG_ENABLED = os.getenv("RAG_COURSE_CATALOG", "true").lower() in ("1", "true", "yes")
+CATALOG_REFRESH_INTERVAL = float(os.getenv("RAG_CATALOG_REFRESH_INTERVAL", "60"))
+CATALOG_FULL_REFRESH = float(os.getenv("RAG_CATALOG_FULL_REFRESH", "3600"))
+
+Row = Dict[str, Any]
+
+
+def format_roadmap(course_structure: Dict[str, object]) -> str:
+    """Format course structure into a well-formatted roadmap text"""
+    lines = []
+
+    course_title = course_structure.get("course_title", "Unknown Course")
+    course_description = course_structure.get("course_description", "")
+    skill_level = course_structure.get("course_skill_level", "")
+    target_audience = course_structure.get("course_target_audience", "")
+
+    lines.append(f"# 📚 {course_title}")
+    if course_description:
+        lines.append(f"\n{course_description}")
+    if skill_level:
+        lines.append(f"\n**Skill Level:** {skill_level}")
+    if target_audience:
+        lines.append(f"**Target Audience:** {target_audience}")
+
+    chapters = course_structure.get("chapters", [])
+    if not chapters:
+        lines.append("\n\n⚠️ No chapters found in this course.")
+        return "\n".join(lines)
+
+    lines.append("\n\n## 📖 Course Structure\n")
+
+    for chapter_idx, chapter in enumerate(chapters, start=1):
+        chapter_title = chapter.get("chapter_title", "Untitled Chapter")
+        chapter_summary = chapter.get("chapter_summary", "")
+        position = chapter.get("position")
+
+        chapter_header = f"### Chapter {chapter_idx}"
+        if position is not None:
+            chapter_header += f" (Position: {position})"
+        chapter_header += f": {chapter_title}"
+        lines.append(chapter_header)
+
+        if chapter_summary:
+            lines.append(f"\n{chapter_summary}\n")
+
+        lessons = chapter.get("lessons", [])
+        if lessons:
+            lines.append("**Lessons:**")
+            for lesson_idx, lesson in enumerate(lessons, start=1):
+                lesson_title = lesson.get("lesson_title", "Untitled Lesson")
+                lesson_position = lesson.get("position")
+                has_video = lesson.get("has_video", False)
+                has_file = lesson.get("has_file", False)
+
+                lesson_line = f"  {chapter_idx}.{lesson_idx}. {lesson_title}"
+                if lesson_position is not None:
+                    lesson_line += f" (Position: {lesson_position})"
+
+                badges = []
+                if has_video:
+                    badges.append("🎥 Video")
+                if has_file:
+                    badges.append("📎 File")
+                if badges:
+                    lesson_line += f" [{', '.join(badges)}]"
+
+                lines.append(lesson_line)
+        else:
+            lines.append("  *No lessons in this chapter*")
+
+        lines.append("")  # Empty line between chapters
+
+    return "\n".join(lines)
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogLesson:
+    lesson_id: str
+    lesson_title: Optional[str]
+    position: Optional[int]
+    has_video: bool
+    has_file: bool
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogChapter:
+    chapter_id: str
+    chapter_title: Optional[str]
+    chapter_summary: Optional[str]
+    position: Optional[int]
+    lessons: Tuple[CatalogLesson, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogCourse:
+    course_id: str
+    course_title: Optional[str]
+    course_description: Optional[str]
+    course_skill_level: Optional[str]
+    course_target_audience: Optional[str]
+    course_language: Optional[str]
+    slug: Optional[str]
+    chapters: Tuple[CatalogChapter, ...]
+    roadmap: str
+
+    def to_structure(self) -> Dict[str, object]:
+        """The dict returned by database.fetch_course_structure()."""
+        return {
+            "course_id": self.course_id,
+            "course_title": self.course_title,
+            "course_description": self.course_description,
+            "course_skill_level": self.course_skill_level,
+            "course_target_audience": self.course_target_audience,
+            "course_language": self.course_language,
+            "chapters": [
+                {
+                    "chapter_id": chapter.chapter_id,
+                    "chapter_title": chapter.chapter_title,
+                    "chapter_summary": chapter.chapter_summary,
+                    "position": chapter.position,
+                    "lessons": [
+                        {
+                            "lesson_id": lesson.lesson_id,
+                            "lesson_title": lesson.lesson_title,
+                            "position": lesson.position,
+                            "has_video": lesson.has_video,
+                            "has_file": lesson.has_file,
+                        }
+                        for lesson in chapter.lessons
+                    ],
+                }
+                for chapter in self.chapters
+            ],
+        }
+
+
+def _by_position(row: Row, id_key: str) -> Tuple[bool, int, str]:
+    # ORDER BY position NULLS LAST, ties in a stable order
+    position = row.get("position")
+    return (position is None, position or 0, row[id_key])
+
+
+def _by_title(course: CatalogCourse) -> Tuple[bool, str]:
+    return (course.course_title is None, course.course_title or "")
+
+
+class CourseCatalog:
+    def __init__(
+        self,
+        loader: Callable[[Optional[Any]], Tuple[List[Row], List[Row], List[Row]]] = fetch_catalog_rows,
+        counter: Callable[[], Tuple[int, int, int]] = fetch_catalog_counts,
+        refresh_interval: float = CATALOG_REFRESH_INTERVAL,
+        full_refresh_interval: float = CATALOG_FULL_REFRESH,
+    ) -> None:
+        self._loader = loader
+        self._counter = counter
+        self.refresh_interval = refresh_interval
+        self.full_refresh_interval = full_refresh_interval
+        # Held for the whole of a refresh: one at a time, readers never take it
+        self._refresh_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._background: Optional[threading.Thread] = None
+        # Raw rows by id and the parent -> children indices (touched by refreshes only)
+        self._course_rows: Dict[str, Row] = {}
+        self._chapter_rows: Dict[str, Row] = {}
+        self._lesson_rows: Dict[str, Row] = {}
+        self._course_chapters: Dict[str, Set[str]] = {}
+        self._chapter_lessons: Dict[str, Set[str]] = {}
+        self._watermark: Optional[Any] = None
+        # Published snapshot, replaced as a whole so readers need no lock
+        self._courses: Dict[str, CatalogCourse] = {}
+        self._ordered: Tuple[CatalogCourse, ...] = ()
+        self._loaded = False
+        self._refreshed_at = 0.0
+        self._full_at = 0.0
+        self.full_loads = 0
+        self.incremental_refreshes = 0
+        self.rebuilt_courses = 0
+        self.refresh_errors = 0
+
+    # Lookups
+
+    def course(self, course_id: str) -> Optional[CatalogCourse]:
+        self._ensure_fresh()
+        return self._courses.get(str(course_id))
+
+    def courses(self) -> Tuple[CatalogCourse, ...]:
+        """All courses ordered by title."""
+        self._ensure_fresh()
+        return self._ordered
+
+    def slugs(self, course_ids: Iterable[str]) -> Dict[str, str]:
+        self._ensure_fresh()
+        courses = self._courses
+        slugs = {}
+        for course_id in course_ids:
+            course = courses.get(str(course_id))
+            if course is not None and course.slug:
+                slugs[course.course_id] = course.slug
+        return slugs
+
+    # Refreshing
+
+    def _ensure_fresh(self) -> None:
+        if not self._loaded:
+            with self._refresh_lock:
+                if not self._loaded:
+                    self._refresh_locked(full=True)
+            return
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        with self._state_lock:
+            if self._background is not None and self._background.is_alive():
+                return
+            self._background = threading.Thread(target=self._refresh_in_background, name="course-catalog-refresh",
+                                                daemon=True)
+            self._background.start()
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"[CATALOG] Refresh failed, serving the previous catalog: {e}")
+
+    def refresh(self, full: bool = False) -> None:
+        """Bring the catalog up to date (incrementally unless `full` or a full reload is due)."""
+        with self._refresh_lock:
+            self._refresh_locked(full)
+
+    def _refresh_locked(self, full: bool) -> None:
+        try:
+            if not full and self._loaded and time.monotonic() - self._full_at < self.full_refresh_interval:
+                if self._refresh_incremental():
+                    return
+                print("[CATALOG] Rows were deleted, reloading the catalog")
+            self._load_full()
+        except Exception:
+            self.refresh_errors += 1
+            # Don't retry on every lookup while the database is down
+            if self._loaded:
+                self._refreshed_at = time.monotonic()
+            raise
+
+    def _load_full(self) -> None:
+        started = time.perf_counter()
+        course_rows, chapter_rows, lesson_rows = self._loader(None)
+        self._course_rows, self._chapter_rows, self._lesson_rows = {}, {}, {}
+        self._course_chapters, self._chapter_lessons = {}, {}
+        self._watermark = None
+        self._apply(course_rows, chapter_rows, lesson_rows)
+        courses = {course_id: self._build_course(course_id) for course_id in self._course_rows}
+        self._publish(courses)
+        self._full_at = self._refreshed_at
+        self.full_loads += 1
+        self.rebuilt_courses += len(courses)
+        print(
+            f"[CATALOG] Loaded {len(courses)} courses, {len(self._chapter_rows)} chapters, "
+            f"{len(self._lesson_rows)} lessons in {time.perf_counter() - started:.2f}s"
+        )
+
+    def _refresh_incremental(self) -> bool:
+        """Apply the rows modified since the watermark; False if rows were deleted (full reload needed)."""
+        # Counted first: rows inserted in between only cause a needless full reload
+        counts = self._counter()
+        course_rows, chapter_rows, lesson_rows = self._loader(self._watermark)
+        affected = self._apply(course_rows, chapter_rows, lesson_rows)
+        if counts != (len(self._course_rows), len(self._chapter_rows), len(self._lesson_rows)):
+            return False
+        courses = dict(self._courses)
+        for course_id in affected:
+            if course_id in self._course_rows:
+                courses[course_id] = self._build_course(course_id)
+            else:
+                # Children of a course not seen (yet): nothing to show
+                courses.pop(course_id, None)
+        self._publish(courses if affected else None)
+        self.incremental_refreshes += 1
+        self.rebuilt_courses += len(affected)
+        if affected:
+            print(f"[CATALOG] Rebuilt {len(affected)} changed course(s)")
+        return True
+
+    def _apply(self, course_rows: List[Row], chapter_rows: List[Row], lesson_rows: List[Row]) -> Set[str]:
+        """Store changed rows and re-link them; returns the ids of the courses to rebuild."""
+        affected: Set[str] = set()
+        for row in course_rows:
+            # Rows at the watermark itself are fetched again by the next refresh
+            if self._course_rows.get(row["course_id"]) == row:
+                continue
+            self._course_rows[row["course_id"]] = row
+            affected.add(row["course_id"])
+        for row in chapter_rows:
+            old = self._chapter_rows.get(row["chapter_id"])
+            if old == row:
+                continue
+            if old is not None:
+                self._course_chapters.get(old["course_id"], set()).discard(row["chapter_id"])
+                affected.add(old["course_id"])
+            self._chapter_rows[row["chapter_id"]] = row
+            self._course_chapters.setdefault(row["course_id"], set()).add(row["chapter_id"])
+            affected.add(row["course_id"])
+        for row in lesson_rows:
+            old = self._lesson_rows.get(row["lesson_id"])
+            if old == row:
+                continue
+            if old is not None:
+                self._chapter_lessons.get(old["chapter_id"], set()).discard(row["lesson_id"])
+                affected.add(old["course_id"])
+            self._lesson_rows[row["lesson_id"]] = row
+            self._chapter_lessons.setdefault(row["chapter_id"], set()).add(row["lesson_id"])
+            affected.add(row["course_id"])
+        for row in (*course_rows, *chapter_rows, *lesson_rows):
+            modified = row.get("modified")
+            if modified is not None and (self._watermark is None or modified > self._watermark):
+                self._watermark = modified
+        return affected
+
+    def _build_course(self, course_id: str) -> CatalogCourse:
+        row = self._course_rows[course_id]
+        chapters = []
+        chapter_rows = [self._chapter_rows[chapter_id] for chapter_id in self._course_chapters.get(course_id, ())]
+        for chapter_row in sorted(chapter_rows, key=lambda r: _by_position(r, "chapter_id")):
+            lesson_rows = [
+                self._lesson_rows[lesson_id]
+                for lesson_id in self._chapter_lessons.get(chapter_row["chapter_id"], ())
+                # Same condition as the join in fetch_course_structure
+                if self._lesson_rows[lesson_id]["course_id"] == course_id
+            ]
+            lessons = tuple(
+                CatalogLesson(
+                    lesson_id=lesson_row["lesson_id"],
+                    lesson_title=lesson_row.get("lesson_title"),
+                    position=lesson_row.get("position"),
+                    has_video=bool(lesson_row.get("has_video")),
+                    has_file=bool(lesson_row.get("has_file")),
+                )
+                for lesson_row in sorted(lesson_rows, key=lambda r: _by_position(r, "lesson_id"))
+            )
+            chapters.append(
+                CatalogChapter(
+                    chapter_id=chapter_row["chapter_id"],
+                    chapter_title=chapter_row.get("chapter_title"),
+                    chapter_summary=chapter_row.get("chapter_summary"),
+                    position=chapter_row.get("position"),
+                    lessons=lessons,
+                )
+            )
+        course = CatalogCourse(
+            course_id=course_id,
+            course_title=row.get("course_title"),
+            course_description=row.get("course_description"),
+            course_skill_level=row.get("course_skill_level"),
+            course_target_audience=row.get("course_target_audience"),
+            course_language=row.get("course_language"),
+            slug=row.get("course_slug"),
+            chapters=tuple(chapters),
+            roadmap="",
+        )
+        # Rendered once here instead of on every roadmap question
+        return replace(course, roadmap=format_roadmap(course.to_structure()))
+
+    def _publish(self, courses: Optional[Dict[str, CatalogCourse]]) -> None:
+        if courses is not None:
+            ordered = tuple(sorted(courses.values(), key=_by_title))
+            self._courses, self._ordered = courses, ordered
+        self._refreshed_at = time.monotonic()
+        self._loaded = True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "courses": len(self._courses),
+            "chapters": len(self._chapter_rows),
+            "lessons": len(self._lesson_rows),
+            "full_loads": self.full_loads,
+            "incremental_refreshes": self.incremental_refreshes,
+            "rebuilt_courses": self.rebuilt_courses,
+            "refresh_errors": self.refresh_errors,
+        }
+
+
+_course_catalog = CourseCatalog()
+
+
+def get_course_catalog() -> CourseCatalog:
+    return _course_catalog
+
+
+def course_structures(course_id: Optional[str] = None) -> List[Dict[str, object]]:
+    """Same result as database.fetch_course_structure(), from the catalog when enabled."""
+    if not COURSE_CATALOG_ENABLED:
+        return fetch_course_structure(course_id=course_id)
+    if course_id:
+        course = _course_catalog.course(course_id)
+        return [course.to_structure()] if course is not None else []
+    return [course.to_structure() for course in _course_catalog.courses()]
+
+
+def course_roadmaps(course_id: Optional[str] = None, limit: Optional[int] = None) -> List[str]:
+    """Roadmap texts of one course, or of all courses ordered by title (at most `limit`)."""
+    if not COURSE_CATALOG_ENABLED:
+        return [format_roadmap(course) for course in fetch_course_structure(course_id=course_id)[:limit]]
+    if course_id:
+        course = _course_catalog.course(course_id)
+        return [course.roadmap] if course is not None else []
+    return [course.roadmap for course in _course_catalog.courses()[:limit]]
+
+
+def courses_slugs(course_ids: List[str]) -> Dict[str, str]:
+    """Same result as database.fetch_courses_slugs(), from the catalog when enabled."""
+    if not COURSE_CATALOG_ENABLED:
+        return fetch_courses_slugs(course_ids)
+    return _course_catalog.slugs(course_ids)
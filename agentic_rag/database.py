@@ -1,13 +1,20 @@
 from __future__ import annotations
 
 import os
-import time
+import threading
+import uuid
 from contextlib import contextmanager
-from typing import Dict, List, Set, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
 import psycopg2
+from psycopg2 import sql
 from psycopg2.extras import RealDictCursor
-from psycopg2 import OperationalError
+
+from db_pool import ConnectionPool
+from tracing import span, traced
+
+# Rows fetched per round trip by server-side (named) cursors used for streaming
+DB_ITERSIZE = int(os.getenv("RAG_DB_ITERSIZE", "500"))
 
 
 def _db_config() -> Dict[str, str]:
@@ -21,103 +28,208 @@ def _db_config() -> Dict[str, str]:
     }
 
 
+# Server-side limit per statement, so a stuck query can't hold a pooled connection forever
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("RAG_DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+_pool: Optional[ConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def open_connection():
+    """A new, unpooled connection (for sessions that hold it, like LISTEN); prefer get_connection()."""
+    return psycopg2.connect(**_db_config(), options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}")
+
+
+def get_pool() -> ConnectionPool:
+    """Connection pool of this process (see db_pool.py)."""
+    global _pool, _pool_pid
+    # A forked child (ingestion process pool) must not share the parent's sockets
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(open_connection)
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def pool_stats() -> Dict[str, float]:
+    return get_pool().stats()
+
+
+def close_pool() -> None:
+    if _pool is not None and _pool_pid == os.getpid():
+        _pool.close()
+
+
 @contextmanager
-def get_connection(max_retries: int = 3, retry_delay: float = 2.0):
+def get_connection():
     """
-    Get a database connection with retry logic.
-    
-    Args:
-        max_retries: Maximum number of connection retry attempts
-        retry_delay: Delay in seconds between retry attempts
+    Borrow a pooled connection for the block. It goes back to the pool afterwards
+    (rolled back), or is closed if it broke. Raises PoolTimeout when every
+    connection stays busy, DatabaseUnavailable while a failed connect is backing off.
     """
-    config = _db_config()
-    last_error = None
-    
-    for attempt in range(max_retries):
-        try:
-            conn = psycopg2.connect(**config)
-            try:
-                yield conn
-            finally:
-                conn.close()
-            return
-        except OperationalError as e:
-            last_error = e
-            if attempt < max_retries - 1:
-                print(f"Database connection failed (attempt {attempt + 1}/{max_retries}): {e}")
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                print(f"Database connection failed after {max_retries} attempts")
-                raise
-    
-    # If we get here, all retries failed
-    if last_error:
-        raise last_error
+    pool = get_pool()
+    with span("db_connect", "postgres"):
+        conn = pool.getconn()
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
 
 
-def fetch_lessons_with_context() -> List[Dict[str, object]]:
-    query = """
-        SELECT
-            lessons.id AS lesson_id,
-            lessons.title AS lesson_title,
-            lessons.content AS lesson_content,
-            lessons.video_url AS lesson_video_url,
-            lessons.file_url AS lesson_file_url,
-            lessons.modified AS lesson_modified,
-            lessons.course_id AS course_id,
-            lessons.chapter_id AS chapter_id,
-            chapters.title AS chapter_title,
-            chapters.summary AS chapter_summary,
-            chapters.modified AS chapter_modified,
-            courses.title AS course_title,
-            courses.short_introduction AS course_short_intro,
-            courses.description AS course_description,
-            courses.skill_level AS course_skill_level,
-            courses.target_audience AS course_target_audience,
-            courses.language AS course_language,
-            courses.status AS course_status,
-            courses.modified AS course_modified
-        FROM lessons
-        LEFT JOIN chapters ON chapters.id = lessons.chapter_id
-        LEFT JOIN courses ON courses.id = lessons.course_id
-        ORDER BY courses.title, chapters.position, lessons.position;
+_LESSONS_WITH_CONTEXT_SELECT = """
+    SELECT
+        lessons.id AS lesson_id,
+        lessons.title AS lesson_title,
+        lessons.content AS lesson_content,
+        lessons.video_url AS lesson_video_url,
+        lessons.file_url AS lesson_file_url,
+        lessons.modified AS lesson_modified,
+        lessons.course_id AS course_id,
+        lessons.chapter_id AS chapter_id,
+        chapters.title AS chapter_title,
+        chapters.summary AS chapter_summary,
+        chapters.modified AS chapter_modified,
+        courses.title AS course_title,
+        courses.short_introduction AS course_short_intro,
+        courses.description AS course_description,
+        courses.skill_level AS course_skill_level,
+        courses.target_audience AS course_target_audience,
+        courses.language AS course_language,
+        courses.status AS course_status,
+        courses.modified AS course_modified
+    FROM lessons
+    LEFT JOIN chapters ON chapters.id = lessons.chapter_id
+    LEFT JOIN courses ON courses.id = lessons.course_id
+"""
+
+_LESSONS_WITH_CONTEXT_QUERY = (
+    _LESSONS_WITH_CONTEXT_SELECT + "    ORDER BY courses.title, chapters.position, lessons.position;\n"
+)
+
+_LESSONS_WITH_CONTEXT_BY_IDS_QUERY = _LESSONS_WITH_CONTEXT_SELECT + "    WHERE lessons.id::text = ANY(%s);\n"
+
+_LESSONS_WITH_CONTEXT_FOR_QUERY = _LESSONS_WITH_CONTEXT_SELECT + """\
+    WHERE lessons.id::text = ANY(%s)
+       OR lessons.chapter_id::text = ANY(%s)
+       OR lessons.course_id::text = ANY(%s);
+"""
+
+_COURSES_SELECT = """
+    SELECT
+        id AS course_id,
+        title AS course_title,
+        short_introduction AS course_short_intro,
+        description AS course_description,
+        target_audience AS course_target_audience,
+        skill_level AS course_skill_level,
+        language AS course_language,
+        status AS course_status,
+        modified AS course_modified
+    FROM courses
+"""
+
+_COURSES_QUERY = _COURSES_SELECT.rstrip() + ";\n"
+
+_COURSES_BY_IDS_QUERY = _COURSES_SELECT + "    WHERE id::text = ANY(%s);\n"
+
+
+def _iter_query(
+    query: str,
+    params: Optional[Sequence[Any]] = None,
+    itersize: Optional[int] = None,
+) -> Iterator[Dict[str, object]]:
     """
+    Stream rows through a named (server-side) cursor.
+    Only `itersize` rows are held client-side at a time, instead of the full result set.
+    The connection stays open until the generator is exhausted or closed.
+    """
+    with get_connection() as conn:
+        cursor_name = f"rag_stream_{uuid.uuid4().hex[:12]}"
+        with conn.cursor(name=cursor_name, cursor_factory=RealDictCursor) as cur:
+            cur.itersize = itersize or DB_ITERSIZE
+            cur.execute(query, params)
+            for row in cur:
+                yield row
+
+
+@traced("db")
+def fetch_lessons_with_context() -> List[Dict[str, object]]:
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(_LESSONS_WITH_CONTEXT_QUERY)
+            return list(cur.fetchall())
+
+
+def iter_lessons_with_context(itersize: Optional[int] = None) -> Iterator[Dict[str, object]]:
+    """Streaming variant of fetch_lessons_with_context (server-side cursor)."""
+    return _iter_query(_LESSONS_WITH_CONTEXT_QUERY, itersize=itersize)
+
+
+@traced("db")
+def fetch_lessons_with_context_by_ids(lesson_ids: List[str]) -> List[Dict[str, object]]:
+    """Same rows as fetch_lessons_with_context, restricted to the given lesson ids."""
+    if not lesson_ids:
+        return []
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
+            cur.execute(_LESSONS_WITH_CONTEXT_BY_IDS_QUERY, (lesson_ids,))
             return list(cur.fetchall())
 
 
+@traced("db")
+def fetch_lessons_with_context_for(
+    lesson_ids: List[str],
+    chapter_ids: List[str],
+    course_ids: List[str],
+) -> List[Dict[str, object]]:
+    """Same rows as fetch_lessons_with_context, for the given lessons and all lessons of the given chapters/courses."""
+    if not (lesson_ids or chapter_ids or course_ids):
+        return []
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(_LESSONS_WITH_CONTEXT_FOR_QUERY, (lesson_ids, chapter_ids, course_ids))
+            return list(cur.fetchall())
+
+
+@traced("db")
+def fetch_courses_by_ids(course_ids: List[str]) -> List[Dict[str, object]]:
+    """Same rows as fetch_courses, restricted to the given course ids."""
+    if not course_ids:
+        return []
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(_COURSES_BY_IDS_QUERY, (course_ids,))
+            return list(cur.fetchall())
+
+
+@traced("db")
 def fetch_courses() -> List[Dict[str, object]]:
-    query = """
-        SELECT
-            id AS course_id,
-            title AS course_title,
-            short_introduction AS course_short_intro,
-            description AS course_description,
-            target_audience AS course_target_audience,
-            skill_level AS course_skill_level,
-            language AS course_language,
-            status AS course_status,
-            modified AS course_modified
-        FROM courses;
-    """
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
+            cur.execute(_COURSES_QUERY)
             return list(cur.fetchall())
 
 
-def fetch_tags() -> Dict[Tuple[str, str], List[str]]:
-    query = """
+def iter_courses(itersize: Optional[int] = None) -> Iterator[Dict[str, object]]:
+    """Streaming variant of fetch_courses (server-side cursor)."""
+    return _iter_query(_COURSES_QUERY, itersize=itersize)
+
+
+@traced("db")
+def fetch_tags(entity_ids: Optional[List[str]] = None) -> Dict[Tuple[str, str], List[str]]:
+    """Tags per (entity_id, entity_type), of every entity or only of `entity_ids`."""
+    where = "WHERE entity_id::text = ANY(%s)" if entity_ids is not None else ""
+    query = f"""
         SELECT entity_id, entity_type, array_agg(name ORDER BY name) AS names
         FROM tags
+        {where}
         GROUP BY entity_id, entity_type;
     """
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
+            cur.execute(query, (entity_ids,) if entity_ids is not None else None)
             rows = cur.fetchall()
     tags: Dict[Tuple[str, str], List[str]] = {}
     for row in rows:
@@ -128,15 +240,19 @@ def fetch_tags() -> Dict[Tuple[str, str], List[str]]:
     return tags
 
 
-def fetch_labels() -> Dict[Tuple[str, str], List[str]]:
-    query = """
+@traced("db")
+def fetch_labels(entity_ids: Optional[List[str]] = None) -> Dict[Tuple[str, str], List[str]]:
+    """Labels per (entity_id, entity_type), of every entity or only of `entity_ids`."""
+    where = "WHERE entity_id::text = ANY(%s)" if entity_ids is not None else ""
+    query = f"""
         SELECT entity_id, entity_type, array_agg(name ORDER BY name) AS names
         FROM labels
+        {where}
         GROUP BY entity_id, entity_type;
     """
     with get_connection() as conn:
         with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
+            cur.execute(query, (entity_ids,) if entity_ids is not None else None)
             rows = cur.fetchall()
     labels: Dict[Tuple[str, str], List[str]] = {}
     for row in rows:
@@ -147,6 +263,7 @@ def fetch_labels() -> Dict[Tuple[str, str], List[str]]:
     return labels
 
 
+@traced("db")
 def fetch_user_enrollments(user_id: str) -> Set[str]:
     query = """
         SELECT course_id
@@ -160,6 +277,7 @@ def fetch_user_enrollments(user_id: str) -> Set[str]:
     return {str(row[0]) for row in rows}
 
 
+@traced("db")
 def fetch_course_structure(course_id: str | None = None) -> List[Dict[str, object]]:
     """
     Fetch course structure with chapters and lessons sorted by position.
@@ -277,6 +395,119 @@ def fetch_course_structure(course_id: str | None = None) -> List[Dict[str, objec
     return list(courses_dict.values())
 
 
+# Rows of the tables feeding the index, as (id, entity_type, modified) for the change feed;
+# tags and labels report the entity they are attached to
+_CHANGE_QUERIES = {
+    "courses": "SELECT id::text AS id, 'Course' AS entity_type, modified FROM courses",
+    "chapters": "SELECT id::text AS id, 'Chapter' AS entity_type, modified FROM chapters",
+    "lessons": "SELECT id::text AS id, 'Lesson' AS entity_type, modified FROM lessons",
+    "tags": "SELECT entity_id::text AS id, entity_type, modified FROM tags",
+    "labels": "SELECT entity_id::text AS id, entity_type, modified FROM labels",
+}
+CHANGE_TABLES = tuple(_CHANGE_QUERIES)
+
+
+@traced("db")
+def fetch_changed_rows(table: str, since: Optional[Any]) -> List[Dict[str, object]]:
+    """Rows of a CHANGE_TABLES table modified at or after `since` (None: all of them), oldest first."""
+    where, params = ("modified >= %s", (since,)) if since is not None else ("modified IS NOT NULL", None)
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(f"{_CHANGE_QUERIES[table]} WHERE {where} ORDER BY modified;", params)
+            return [dict(row) for row in cur.fetchall()]
+
+
+@traced("db")
+def fetch_max_modified(table: str) -> Optional[Any]:
+    """Latest `modified` of a CHANGE_TABLES table (None if it is empty)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("SELECT max(modified) FROM {}").format(sql.Identifier(table)))
+            return cur.fetchone()[0]
+
+
+@traced("db")
+def fetch_content_ids() -> Tuple[Set[str], Set[str]]:
+    """Ids of all courses and of all lessons (to find documents of deleted rows)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id::text FROM courses;")
+            course_ids = {row[0] for row in cur.fetchall()}
+            cur.execute("SELECT id::text FROM lessons;")
+            lesson_ids = {row[0] for row in cur.fetchall()}
+    return course_ids, lesson_ids
+
+
+_CATALOG_COURSES_QUERY = """
+    SELECT
+        id::text AS course_id,
+        title AS course_title,
+        description AS course_description,
+        skill_level AS course_skill_level,
+        target_audience AS course_target_audience,
+        language AS course_language,
+        slug AS course_slug,
+        modified
+    FROM courses
+"""
+
+_CATALOG_CHAPTERS_QUERY = """
+    SELECT
+        id::text AS chapter_id,
+        course_id::text AS course_id,
+        title AS chapter_title,
+        summary AS chapter_summary,
+        position,
+        modified
+    FROM chapters
+"""
+
+_CATALOG_LESSONS_QUERY = """
+    SELECT
+        id::text AS lesson_id,
+        course_id::text AS course_id,
+        chapter_id::text AS chapter_id,
+        title AS lesson_title,
+        position,
+        video_url IS NOT NULL AS has_video,
+        file_url IS NOT NULL AS has_file,
+        modified
+    FROM lessons
+"""
+
+
+@traced("db")
+def fetch_catalog_rows(
+    since: Optional[Any] = None,
+) -> Tuple[List[Dict[str, object]], List[Dict[str, object]], List[Dict[str, object]]]:
+    """
+    Course, chapter and lesson rows for the course catalog (one query per table,
+    no join), all of them or only those modified at or after `since`.
+    """
+    where, params = ("    WHERE modified >= %s;\n", (since,)) if since is not None else (";\n", None)
+    with get_connection() as conn:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            results = []
+            for query in (_CATALOG_COURSES_QUERY, _CATALOG_CHAPTERS_QUERY, _CATALOG_LESSONS_QUERY):
+                cur.execute(query + where, params)
+                results.append([dict(row) for row in cur.fetchall()])
+    return results[0], results[1], results[2]
+
+
+@traced("db")
+def fetch_catalog_counts() -> Tuple[int, int, int]:
+    """Number of courses, chapters and lessons (detects deletions between catalog refreshes)."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT (SELECT count(*) FROM courses), (SELECT count(*) FROM chapters), "
+                "(SELECT count(*) FROM lessons);"
+            )
+            courses, chapters, lessons = cur.fetchone()
+    return int(courses), int(chapters), int(lessons)
+
+
+@traced("db")
 def fetch_course_slug(course_id: str) -> str | None:
     """
     Fetch course slug from course_id.
@@ -299,6 +530,7 @@ def fetch_course_slug(course_id: str) -> str | None:
             return row[0] if row else None
 
 
+@traced("db")
 def fetch_courses_slugs(course_ids: List[str]) -> Dict[str, str]:
     """
     Fetch course slugs for multiple course IDs.
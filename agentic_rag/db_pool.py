@@ -0,0 +1,249 @@
+"""
+Thread-safe pool of Postgres connections.
+
+psycopg2's own pools keep at most `minconn` connections and close any other
+connection as soon as it is returned, and raise instead of waiting when all are
+in use. This pool keeps up to `max_size` connections open, hands out the most
+recently used idle one, and makes callers wait up to `timeout` seconds when all
+of them are busy.
+
+Before reuse a connection is checked: closed or broken connections are
+replaced, and one idle for more than `healthcheck_after` seconds must answer
+`SELECT 1`. Connections idle for more than `max_idle` seconds are closed, down
+to `min_size`. Returned connections are rolled back to a clean state.
+
+A failed connect is not retried in a sleep loop on the calling thread. Instead,
+callers fail fast (DatabaseUnavailable) for a backoff period that doubles after
+each failure, up to `max_backoff`, and the first caller after it tries again.
+
+The async API path reaches the pool through asyncio.to_thread, since psycopg2
+has no asyncio interface.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from psycopg2 import OperationalError, extensions
+
+DB_POOL_MIN = int(os.getenv("RAG_DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("RAG_DB_POOL_MAX", "10"))
+# Seconds to wait for a free connection when all are in use
+DB_POOL_TIMEOUT = float(os.getenv("RAG_DB_POOL_TIMEOUT", "5"))
+# Idle connections beyond RAG_DB_POOL_MIN are closed after this many seconds
+DB_POOL_MAX_IDLE = float(os.getenv("RAG_DB_POOL_MAX_IDLE", "300"))
+# Connections idle longer than this are checked with SELECT 1 before reuse
+DB_POOL_HEALTHCHECK_AFTER = float(os.getenv("RAG_DB_POOL_HEALTHCHECK_AFTER", "30"))
+# Fail-fast period after a failed connect, doubled after each further failure
+DB_RETRY_BACKOFF = float(os.getenv("RAG_DB_RETRY_BACKOFF", "2"))
+DB_RETRY_MAX_BACKOFF = float(os.getenv("RAG_DB_RETRY_MAX_BACKOFF", "30"))
+
+
+class PoolTimeout(OperationalError):
+    """No connection became free within the pool timeout."""
+
+
+class DatabaseUnavailable(OperationalError):
+    """The database could not be reached recently; not retried until the backoff expires."""
+
+
+@dataclass
+class PoolStats:
+    opened: int = 0
+    closed: int = 0
+    checkouts: int = 0
+    waits: int = 0
+    wait_seconds: float = 0.0
+    timeouts: int = 0
+    failed_health_checks: int = 0
+    connect_failures: int = 0
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        connect: Callable[[], Any],
+        min_size: int = DB_POOL_MIN,
+        max_size: int = DB_POOL_MAX,
+        timeout: float = DB_POOL_TIMEOUT,
+        max_idle: float = DB_POOL_MAX_IDLE,
+        healthcheck_after: float = DB_POOL_HEALTHCHECK_AFTER,
+        retry_backoff: float = DB_RETRY_BACKOFF,
+        max_backoff: float = DB_RETRY_MAX_BACKOFF,
+    ) -> None:
+        self._connect = connect
+        self.max_size = max(1, max_size)
+        self.min_size = min(max(0, min_size), self.max_size)
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.healthcheck_after = healthcheck_after
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self._cond = threading.Condition()
+        # (connection, monotonic time it was returned); most recently returned last
+        self._idle: Deque[Tuple[Any, float]] = deque()
+        # Open connections, idle or in use (including ones being opened)
+        self._size = 0
+        self._closed = False
+        self._retry_at = 0.0
+        self._backoff = retry_backoff
+        self._stats = PoolStats()
+
+    def _open(self) -> Any:
+        now = time.monotonic()
+        if now < self._retry_at:
+            raise DatabaseUnavailable(
+                f"database unavailable, next connection attempt in {self._retry_at - now:.1f}s"
+            )
+        try:
+            conn = self._connect()
+        except OperationalError as e:
+            with self._cond:
+                self._stats.connect_failures += 1
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+            print(f"[DB POOL] Connection failed, failing fast for {self._retry_at - time.monotonic():.1f}s: {e}")
+            raise
+        with self._cond:
+            self._stats.opened += 1
+            self._backoff = self.retry_backoff
+        return conn
+
+    def _close(self, conn: Any) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats.closed += 1
+            self._cond.notify()
+
+    def _healthy(self, conn: Any, idle_seconds: float) -> bool:
+        if conn.closed or conn.info.transaction_status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if idle_seconds < self.healthcheck_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _prune_idle(self, now: float) -> List[Any]:
+        """Idle connections to close (caller holds the lock): the oldest, beyond min_size, idle too long."""
+        expired = []
+        while len(self._idle) > self.min_size and now - self._idle[0][1] > self.max_idle:
+            expired.append(self._idle.popleft()[0])
+        return expired
+
+    def getconn(self) -> Any:
+        """A healthy connection; return it with putconn()."""
+        deadline = time.monotonic() + self.timeout
+        waited_since: Optional[float] = None
+        while True:
+            conn = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise OperationalError("connection pool is closed")
+                    now = time.monotonic()
+                    if self._idle:
+                        conn, returned = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        self._size += 1
+                        break
+                    if now >= deadline:
+                        self._stats.timeouts += 1
+                        raise PoolTimeout(f"no database connection free within {self.timeout}s")
+                    if waited_since is None:
+                        waited_since = now
+                        self._stats.waits += 1
+                    self._cond.wait(deadline - now)
+                self._stats.checkouts += 1
+                if waited_since is not None:
+                    self._stats.wait_seconds += time.monotonic() - waited_since
+                    waited_since = None
+
+            if conn is None:
+                try:
+                    return self._open()
+                except BaseException:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            if self._healthy(conn, time.monotonic() - returned):
+                return conn
+            with self._cond:
+                self._stats.failed_health_checks += 1
+            self._close(conn)
+
+    def putconn(self, conn: Any) -> None:
+        """Give a connection back; rolled back if needed, closed if broken."""
+        reusable = not conn.closed and not self._closed
+        if reusable:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                reusable = False
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except Exception:
+                    reusable = False
+        if not reusable:
+            self._close(conn)
+            return
+        with self._cond:
+            now = time.monotonic()
+            self._idle.append((conn, now))
+            expired = self._prune_idle(now)
+            self._cond.notify()
+        for idle_conn in expired:
+            self._close(idle_conn)
+
+    def warm(self) -> None:
+        """Open connections up to min_size."""
+        while True:
+            with self._cond:
+                if self._closed or self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._open()
+            except BaseException:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.appendleft((conn, time.monotonic()))
+                self._cond.notify()
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._cond.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> Dict[str, float]:
+        with self._cond:
+            stats = asdict(self._stats)
+            stats.update(
+                size=self._size,
+                idle=len(self._idle),
+                in_use=self._size - len(self._idle),
+                max_size=self.max_size,
+            )
+        return stats
@@ -0,0 +1,160 @@
+"""
+Persistent, content-addressed embedding cache for ingestion.
+
+Vectors are keyed by sha256(embedding model + chunk text), so any ingestion run
+(incremental update, full rebuild, chunk-size experiment) only pays FastEmbed
+inference for text it has never seen. Storage per model:
+    vectors.f32  - raw float32 rows, read through a numpy memmap
+    index.json   - {"model", "dim", "keys": [key of row 0, key of row 1, ...]}
+New vectors are appended to vectors.f32; index.json is rewritten on flush().
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+
+def content_key(model_name: str, text: str) -> str:
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str, model_name: str) -> None:
+        self.model_name = model_name
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name)
+        self.directory = Path(directory) / slug
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.directory / "vectors.f32"
+        self.index_path = self.directory / "index.json"
+
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._memmap: Optional[np.memmap] = None
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self) -> None:
+        if self.index_path.exists():
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    index = json.load(f)
+                self._dim = index.get("dim")
+                self._keys = list(index.get("keys", []))
+            except Exception as e:
+                print(f"[EMBED CACHE] Unreadable index {self.index_path}, starting empty: {e}")
+                self._dim, self._keys = None, []
+
+        # Rows appended after the last flush (e.g. crash mid-run) have no key: drop them
+        expected_bytes = len(self._keys) * (self._dim or 0) * 4
+        actual_bytes = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        if actual_bytes < expected_bytes:
+            print("[EMBED CACHE] Vector file shorter than index, starting empty")
+            self._dim, self._keys, expected_bytes = None, [], 0
+        if actual_bytes != expected_bytes:
+            with open(self.vectors_path, "ab") as f:
+                f.truncate(expected_bytes)
+        self._rows = {key: row for row, key in enumerate(self._keys)}
+        if self._keys:
+            print(f"[EMBED CACHE] Loaded {len(self._keys)} cached vectors ({self.model_name})")
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def key(self, text: str) -> str:
+        return content_key(self.model_name, text)
+
+    def _vectors(self) -> Optional[np.memmap]:
+        if not self._keys or self._dim is None:
+            return None
+        if self._memmap is None or self._memmap.shape[0] != len(self._keys):
+            self._memmap = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(len(self._keys), self._dim)
+            )
+        return self._memmap
+
+    def get_many(self, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Cached vector for each text, or None on a miss."""
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            vectors = self._vectors()
+            results: List[Optional[List[float]]] = []
+            for key in keys:
+                row = self._rows.get(key)
+                results.append(vectors[row].tolist() if row is not None and vectors is not None else None)
+        hits = sum(1 for vector in results if vector is not None)
+        self.hits += hits
+        self.misses += len(results) - hits
+        return results
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        if not texts:
+            return
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self._dim is None:
+                self._dim = int(array.shape[1])
+            elif array.shape[1] != self._dim:
+                raise ValueError(f"Embedding dim {array.shape[1]} != cached dim {self._dim}")
+            new_rows = []
+            for text, vector in zip(texts, array):
+                key = self.key(text)
+                if key in self._rows:
+                    continue
+                self._rows[key] = len(self._keys)
+                self._keys.append(key)
+                new_rows.append(vector)
+            if new_rows:
+                with open(self.vectors_path, "ab") as f:
+                    f.write(np.stack(new_rows).tobytes())
+                self._dirty = True
+
+    def flush(self) -> None:
+        """Persist the key index (vectors are already on disk)."""
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = self.index_path.with_suffix(".json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self._dim, "keys": self._keys}, f)
+            os.replace(tmp_path, self.index_path)
+            self._dirty = False
+
+    def evict(self, keep_keys: Iterable[str]) -> int:
+        """
+        Drop every vector whose key is not in `keep_keys` (e.g. chunks no longer in
+        the index) and compact the vector file. Returns the number of evicted entries.
+        """
+        keep: Set[str] = set(keep_keys)
+        with self._lock:
+            vectors = self._vectors()
+            kept_rows = [row for row, key in enumerate(self._keys) if key in keep]
+            evicted = len(self._keys) - len(kept_rows)
+            if evicted == 0:
+                return 0
+
+            tmp_vectors = self.vectors_path.with_suffix(".f32.tmp")
+            with open(tmp_vectors, "wb") as f:
+                # Copy in slices to keep memory flat
+                for start in range(0, len(kept_rows), 4096):
+                    rows = kept_rows[start:start + 4096]
+                    f.write(np.asarray(vectors[rows], dtype=np.float32).tobytes())
+            self._memmap = None
+            self._keys = [self._keys[row] for row in kept_rows]
+            self._rows = {key: row for row, key in enumerate(self._keys)}
+            os.replace(tmp_vectors, self.vectors_path)
+            self._dirty = True
+        self.flush()
+        print(f"[EMBED CACHE] Evicted {evicted} unreferenced vectors, {len(self._keys)} kept")
+        return evicted
@@ -0,0 +1,226 @@
+"""
+Batched, parallel embedding pipeline for ingestion.
+
+Chunks are pulled lazily from an iterator, grouped into fixed-size batches,
+embedded over a process pool (one FastEmbed model per worker) and each embedded
+batch is upserted into the Chroma collection as soon as it finishes. At most
+`max_in_flight` batches exist at any time, so peak memory is bounded by
+batch size x in-flight batches instead of the size of the corpus.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import time
+from itertools import chain
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from langchain_chroma import Chroma
+from langchain_community.embeddings import FastEmbedEmbeddings
+from langchain_core.documents import Document
+
+from embedding_cache import EmbeddingCache
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+EMBED_BATCH_SIZE = int(os.getenv("RAG_EMBED_BATCH_SIZE", "256"))
+EMBED_WORKERS = int(os.getenv("RAG_EMBED_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Batches queued or running at once (bounds memory); defaults to 2 per worker
+EMBED_MAX_IN_FLIGHT = int(os.getenv("RAG_EMBED_MAX_IN_FLIGHT", "0")) or EMBED_WORKERS * 2
+EMBED_PROGRESS_EVERY = int(os.getenv("RAG_EMBED_PROGRESS_EVERY", "10"))
+
+# Per-process model, created once by the pool initializer
+_worker_embedding: Optional[FastEmbedEmbeddings] = None
+
+
+def _init_worker(model_name: str, threads: Optional[int]) -> None:
+    global _worker_embedding
+    _worker_embedding = FastEmbedEmbeddings(model_name=model_name, threads=threads)
+
+
+def _embed_batch(texts: List[str]) -> List[List[float]]:
+    return _worker_embedding.embed_documents(texts)
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class EmbeddingStats:
+    chunks: int = 0
+    batches: int = 0
+    cached: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+
+def _batched(
+    chunks: Iterable[Tuple[str, Document]], batch_size: int
+) -> Iterator[List[Tuple[str, Document]]]:
+    batch: List[Tuple[str, Document]] = []
+    for item in chunks:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class EmbeddingPipeline:
+    """
+    Embed (chunk_id, Document) pairs in batches and stream them into a collection.
+
+    With workers <= 1, or when everything fits in a single batch (typical for small
+    incremental updates), batches are embedded in-process with `embedding`, which
+    avoids the process start-up and per-worker model load cost.
+
+    If an EmbeddingCache is given, only texts missing from it are embedded and the
+    new vectors are added to it.
+    """
+
+    def __init__(
+        self,
+        vector_store: Chroma,
+        embedding: FastEmbedEmbeddings,
+        batch_size: int = EMBED_BATCH_SIZE,
+        workers: int = EMBED_WORKERS,
+        max_in_flight: int = EMBED_MAX_IN_FLIGHT,
+        cache: Optional[EmbeddingCache] = None,
+    ) -> None:
+        self.vector_store = vector_store
+        self.embedding = embedding
+        self.cache = cache
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.max_in_flight = max(1, max_in_flight)
+
+    def _write(self, batch: List[Tuple[str, Document]], vectors: List[List[float]]) -> None:
+        self.vector_store._collection.upsert(
+            ids=[chunk_id for chunk_id, _ in batch],
+            embeddings=vectors,
+            metadatas=[doc.metadata for _, doc in batch],
+            documents=[doc.page_content for _, doc in batch],
+        )
+
+    def _lookup(
+        self, batch: List[Tuple[str, Document]]
+    ) -> Tuple[List[Optional[List[float]]], List[str]]:
+        """Cached vectors for the batch (None where missing) and the texts to embed."""
+        texts = [doc.page_content for _, doc in batch]
+        if self.cache is None:
+            return [None] * len(batch), texts
+        vectors = self.cache.get_many(texts)
+        return vectors, [text for text, vector in zip(texts, vectors) if vector is None]
+
+    def _complete(
+        self,
+        batch: List[Tuple[str, Document]],
+        vectors: List[Optional[List[float]]],
+        missing_texts: List[str],
+        new_vectors: List[List[float]],
+        stats: EmbeddingStats,
+    ) -> None:
+        if self.cache is not None and missing_texts:
+            self.cache.put_many(missing_texts, new_vectors)
+        stats.cached += len(batch) - len(missing_texts)
+        fresh = iter(new_vectors)
+        self._write(batch, [vector if vector is not None else next(fresh) for vector in vectors])
+
+    def _report(self, stats: EmbeddingStats, final: bool = False) -> None:
+        peak = _peak_rss_mb()
+        print(
+            f"[INGEST] Embedded {'total ' if final else ''}chunks={stats.chunks} | "
+            f"batches={stats.batches} | cache_hits={stats.cached} | "
+            f"{stats.chunks_per_second:.1f} chunks/sec"
+            + (f" | peak_rss={peak:.0f}MB" if peak is not None else "")
+        )
+
+    def _record(self, stats: EmbeddingStats, batch_len: int, start_time: float) -> None:
+        stats.chunks += batch_len
+        stats.batches += 1
+        stats.seconds = time.perf_counter() - start_time
+        if EMBED_PROGRESS_EVERY and stats.batches % EMBED_PROGRESS_EVERY == 0:
+            self._report(stats)
+
+    def run(self, chunks: Iterable[Tuple[str, Document]]) -> EmbeddingStats:
+        stats = EmbeddingStats()
+        start_time = time.perf_counter()
+
+        batches = _batched(chunks, self.batch_size)
+        first = next(batches, None)
+        second = next(batches, None)
+        batches = chain(
+            [batch for batch in (first, second) if batch is not None], batches
+        )
+
+        try:
+            if self.workers <= 1 or second is None:
+                self._run_in_process(batches, stats, start_time)
+            else:
+                self._run_in_pool(batches, stats, start_time)
+        finally:
+            if self.cache is not None:
+                self.cache.flush()
+
+        stats.seconds = time.perf_counter() - start_time
+        self._report(stats, final=True)
+        return stats
+
+    def _run_in_process(
+        self, batches: Iterable[List[Tuple[str, Document]]], stats: EmbeddingStats, start_time: float
+    ) -> None:
+        for batch in batches:
+            vectors, missing_texts = self._lookup(batch)
+            new_vectors = self.embedding.embed_documents(missing_texts) if missing_texts else []
+            self._complete(batch, vectors, missing_texts, new_vectors, stats)
+            self._record(stats, len(batch), start_time)
+
+    def _run_in_pool(
+        self, batches: Iterable[List[Tuple[str, Document]]], stats: EmbeddingStats, start_time: float
+    ) -> None:
+        # Split the CPU between worker processes instead of oversubscribing onnxruntime
+        threads = max(1, (os.cpu_count() or self.workers) // self.workers)
+        # "spawn": onnxruntime is not fork-safe once the parent has loaded a model
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.embedding.model_name, threads),
+        ) as executor:
+            in_flight: Dict[Future, Tuple[List[Tuple[str, Document]], List, List[str]]] = {}
+
+            def drain(return_when: str) -> None:
+                done, _ = wait(in_flight, return_when=return_when)
+                for future in done:
+                    batch, vectors, missing_texts = in_flight.pop(future)
+                    self._complete(batch, vectors, missing_texts, future.result(), stats)
+                    self._record(stats, len(batch), start_time)
+
+            for batch in batches:
+                vectors, missing_texts = self._lookup(batch)
+                if not missing_texts:
+                    # Fully cached: no inference needed
+                    self._complete(batch, vectors, missing_texts, [], stats)
+                    self._record(stats, len(batch), start_time)
+                    continue
+                if len(in_flight) >= self.max_in_flight:
+                    drain(FIRST_COMPLETED)
+                future = executor.submit(_embed_batch, missing_texts)
+                in_flight[future] = (batch, vectors, missing_texts)
+            if in_flight:
+                drain(ALL_COMPLETED)
@@ -0,0 +1,177 @@
+"""
+In-process cache of user enrollments.
+
+Every question of a logged-in user needs their enrolled course ids (retrieval
+filter, answer cache scope), and enrollments rarely change. They are cached per
+user_id for RAG_ENROLLMENT_CACHE_TTL seconds in a bounded LRU map.
+
+Changes are pushed rather than waited out: EnrollmentChangeListener LISTENs on the
+RAG_ENROLLMENT_CHANNEL Postgres channel (payload: the member id, or empty for
+everyone) in every worker process. The channel is fed by a trigger on
+`enrollments` (see README), or, as a stand-in, by the backend calling
+POST /api/v1/enrollments/changed, which NOTIFYs through the same channel.
+While the listener is disconnected notifications may be lost, so the cache is
+cleared whenever it (re)connects; the TTL bounds staleness otherwise.
+"""
+
+from __future__ import annotations
+
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from psycopg2 import sql
+
+from database import fetch_user_enrollments, get_connection, open_connection
+
+ENROLLMENT_CACHE_ENABLED = os.getenv("RAG_ENROLLMENT_CACHE", "true").lower() in ("1", "true", "yes")
+ENROLLMENT_CACHE_TTL = float(os.getenv("RAG_ENROLLMENT_CACHE_TTL", "300"))
+ENROLLMENT_CACHE_MAX_ENTRIES = int(os.getenv("RAG_ENROLLMENT_CACHE_MAX_ENTRIES", "10000"))
+ENROLLMENT_CHANNEL = os.getenv("RAG_ENROLLMENT_CHANNEL", "enrollment_changed")
+ENROLLMENT_LISTEN = os.getenv("RAG_ENROLLMENT_LISTEN", "true").lower() in ("1", "true", "yes")
+
+
+class EnrollmentCache:
+    def __init__(
+        self,
+        loader: Callable[[str], Iterable[str]] = fetch_user_enrollments,
+        ttl: float = ENROLLMENT_CACHE_TTL,
+        max_entries: int = ENROLLMENT_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self._loader = loader
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        # user_id -> (course ids, monotonic expiry); least recently used first
+        self._entries: "OrderedDict[str, Tuple[FrozenSet[str], float]]" = OrderedDict()
+        # Bumped by every invalidation, so a load that raced with one is not stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> FrozenSet[str]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            generation = self._generation
+
+        courses = frozenset(self._loader(user_id))
+        with self._lock:
+            if generation == self._generation:
+                self._entries[user_id] = (courses, time.monotonic() + self.ttl)
+                self._entries.move_to_end(user_id)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return courses
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drop one user's entry, or every entry when user_id is None."""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+            }
+
+
+_enrollment_cache = EnrollmentCache()
+
+
+def get_enrollment_cache() -> EnrollmentCache:
+    return _enrollment_cache
+
+
+def get_user_enrollments(user_id: str) -> FrozenSet[str]:
+    """Course ids the user is enrolled in (cached, see module doc)."""
+    if not ENROLLMENT_CACHE_ENABLED:
+        return frozenset(fetch_user_enrollments(user_id))
+    return _enrollment_cache.get(user_id)
+
+
+def notify_enrollment_changed(user_id: Optional[str] = None) -> None:
+    """
+    Invalidate this process's entry now and NOTIFY the channel, so every worker
+    listening on it (this one included) drops it as well.
+    """
+    _enrollment_cache.invalidate(user_id)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, %s)", (ENROLLMENT_CHANNEL, user_id or ""))
+        conn.commit()
+
+
+class EnrollmentChangeListener:
+    """Background LISTEN on the enrollment channel, invalidating the cache on each notification."""
+
+    def __init__(
+        self,
+        cache: EnrollmentCache = _enrollment_cache,
+        channel: str = ENROLLMENT_CHANNEL,
+        reconnect_delay: float = 5.0,
+    ) -> None:
+        self.cache = cache
+        self.channel = channel
+        self.reconnect_delay = reconnect_delay
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="enrollment-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            conn = None
+            try:
+                # A dedicated connection: LISTEN holds it for the lifetime of the process
+                conn = open_connection()
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+                # Changes made while not listening were missed
+                self.cache.invalidate()
+                print(f"[ENROLLMENTS] Listening for changes on '{self.channel}'")
+                self._listen(conn)
+            except Exception as e:
+                print(f"[ENROLLMENTS] Change listener disconnected, retrying in {self.reconnect_delay:g}s: {e}")
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen(self, conn) -> None:
+        while not self._stop.is_set():
+            # Wake up at least every second to notice stop()
+            if select.select([conn], [], [], 1.0) == ([], [], []):
+                continue
+            conn.poll()
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                self.cache.invalidate(notify.payload or None)
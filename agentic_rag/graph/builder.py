@@ -0,0 +1,71 @@
+"""
+Wiring of the RAG flow: which node follows which, and on which decision.
+
+Kept apart from the node implementations (graph/graph.py) so the flow is
+declared once, whatever the callables are. Nodes and conditional edges may be
+RunnableLambda(func, afunc=...) pairs: app.invoke then runs the sync
+implementations and app.ainvoke / app.astream the async ones, along the same
+edges.
+"""
+
+from typing import Any, Mapping
+
+from langgraph.graph import END, StateGraph
+
+from graph.consts import GENERATE, GRADE_DOCUMENTS, GREETING, REJECT, RETRIEVE, WEBSEARCH
+from graph.state import GraphState
+
+NODES = (RETRIEVE, GRADE_DOCUMENTS, GENERATE, WEBSEARCH, GREETING, REJECT)
+
+
+def build_graph(
+    nodes: Mapping[str, Any],
+    route_question: Any,
+    decide_after_retrieval: Any,
+    decide_to_generate: Any,
+    grade_generation: Any,
+):
+    """
+    Compile the flow.
+
+    Args:
+        nodes: Callable (or runnable) for each name in NODES.
+        route_question: Entry point, returns RETRIEVE, WEBSEARCH, GREETING or REJECT.
+        decide_after_retrieval: Returns GRADE_DOCUMENTS, GENERATE or WEBSEARCH.
+        decide_to_generate: Returns WEBSEARCH or GENERATE.
+        grade_generation: Returns "useful", "not_useful" (web search) or
+            "not_supported" (regenerate).
+    """
+    missing = set(NODES) - set(nodes)
+    if missing:
+        raise ValueError(f"No implementation for nodes {sorted(missing)}")
+
+    flow = StateGraph(state_schema=GraphState)
+    for name in NODES:
+        flow.add_node(name, nodes[name])
+
+    flow.set_conditional_entry_point(
+        route_question,
+        path_map={RETRIEVE: RETRIEVE, WEBSEARCH: WEBSEARCH, GREETING: GREETING, REJECT: REJECT},
+    )
+    flow.add_conditional_edges(
+        RETRIEVE,
+        decide_after_retrieval,
+        path_map={GRADE_DOCUMENTS: GRADE_DOCUMENTS, GENERATE: GENERATE, WEBSEARCH: WEBSEARCH},
+    )
+    flow.add_conditional_edges(
+        GRADE_DOCUMENTS,
+        decide_to_generate,
+        path_map={WEBSEARCH: WEBSEARCH, GENERATE: GENERATE},
+    )
+    flow.add_conditional_edges(
+        GENERATE,
+        grade_generation,
+        path_map={"useful": END, "not_useful": WEBSEARCH, "not_supported": GENERATE},
+    )
+
+    flow.add_edge(WEBSEARCH, GENERATE)
+    # Greeting and reject nodes answer directly
+    flow.add_edge(GREETING, END)
+    flow.add_edge(REJECT, END)
+    return flow.compile()
@@ -8,14 +8,13 @@ from dotenv import load_dotenv
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnableLambda
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import cached_structured_chain, get_llm
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
 
-llm = create_llm(model="deepseek-chat", temperature=0)
+llm = get_llm(model="deepseek-chat", temperature=0)
 
 
 class BatchGradeDocuments(BaseModel):
@@ -31,8 +30,6 @@ class BatchGradeDocuments(BaseModel):
     )
 
 
-structured_llm_grader = llm.with_structured_output(BatchGradeDocuments)
-
 message = """You are a grader assessing relevance of retrieved documents to a user question.
 
 You will receive multiple documents numbered from 0. For each document, determine if it is relevant to the question.
@@ -63,13 +60,7 @@ Return the indices of relevant documents (0-based). If none are relevant, return
     ]
 )
 
-base_grader = grade_prompt | structured_llm_grader
-
-
-def _rate_limited_invoke(input_dict: dict):
-    """Wrapper to add rate limiting to batch retrieval grader chain"""
-    rate_limit_delay()
-    return base_grader.invoke(input_dict)
 
-
-batch_retrieval_grader = RunnableLambda(_rate_limited_invoke)
+batch_retrieval_grader = cached_structured_chain(
+    "batch_retrieval_grader", grade_prompt, llm, BatchGradeDocuments
+)
@@ -7,14 +7,13 @@ from dotenv import load_dotenv
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnableLambda
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import cached_structured_chain, get_llm
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
 
-llm = create_llm(model="deepseek-chat", temperature=0)
+llm = get_llm(model="deepseek-chat", temperature=0)
 
 
 class CombinedGrade(BaseModel):
@@ -34,8 +33,6 @@ class CombinedGrade(BaseModel):
     )
 
 
-structured_llm_grader = llm.with_structured_output(CombinedGrade)
-
 message = """You are a grader assessing an LLM-generated answer on two criteria:
 
 1. **Grounding**: Is the answer grounded in/supported by the provided documents?
@@ -74,13 +71,5 @@ Assess both:
     ]
 )
 
-base_grader = combined_prompt | structured_llm_grader
-
-
-def _rate_limited_invoke(input_dict: dict):
-    """Wrapper to add rate limiting to combined grader chain"""
-    rate_limit_delay()
-    return base_grader.invoke(input_dict)
-
 
-combined_grader = RunnableLambda(_rate_limited_invoke)
+combined_grader = cached_structured_chain("combined_grader", combined_prompt, llm, CombinedGrade)
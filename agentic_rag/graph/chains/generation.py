@@ -2,14 +2,13 @@ from dotenv import load_dotenv
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableLambda
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import get_llm, rate_limited
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
 
-llm = create_llm(model="deepseek-chat", temperature=0)
+llm = get_llm(model="deepseek-chat", temperature=0)
 
 # Custom prompt template for balanced, comprehensive answers
 system_message = """You are an expert AI assistant for EdTech. Provide clear, helpful answers to students' questions about course content, technical topics, and platform usage.
@@ -75,17 +74,6 @@ base_chain = prompt | llm | StrOutputParser()
 base_chain_platform = prompt_platform | llm | StrOutputParser()
 
 
-def _rate_limited_invoke(input_dict: dict):
-    """Wrapper to add rate limiting to generation chain"""
-    rate_limit_delay()
-    return base_chain.invoke(input_dict)
-
-
-def _rate_limited_invoke_platform(input_dict: dict):
-    """Wrapper to add rate limiting to platform generation chain"""
-    rate_limit_delay()
-    return base_chain_platform.invoke(input_dict)
-
-
-generation_chain = RunnableLambda(_rate_limited_invoke)
-generation_chain_platform = RunnableLambda(_rate_limited_invoke_platform)
+# Text chains: streamable token by token (see graph/streaming.py)
+generation_chain = rate_limited(base_chain, streaming=True, name="generation")
+generation_chain_platform = rate_limited(base_chain_platform, streaming=True, name="generation_platform")
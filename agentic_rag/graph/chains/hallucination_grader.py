@@ -2,9 +2,9 @@ from dotenv import load_dotenv
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnableLambda, RunnableSequence
+from langchain_core.runnables import RunnableSequence
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import get_llm, rate_limited
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
@@ -18,7 +18,7 @@ class GradeHallucinations(BaseModel):
     )
 
 
-llm = create_llm(model="deepseek-chat", temperature=0)
+llm = get_llm(model="deepseek-chat", temperature=0)
 
 structured_llm_grader = llm.with_structured_output(GradeHallucinations)
 
@@ -34,10 +34,4 @@ hallucination_prompt = ChatPromptTemplate.from_messages(
 base_grader: RunnableSequence = hallucination_prompt | structured_llm_grader
 
 
-def _rate_limited_invoke(input_dict: dict):
-    """Wrapper to add rate limiting to hallucination grader chain"""
-    rate_limit_delay()
-    return base_grader.invoke(input_dict)
-
-
-hallucination_grader = RunnableLambda(_rate_limited_invoke)
+hallucination_grader = rate_limited(base_grader, name="hallucination_grader")
@@ -0,0 +1,145 @@
+"""
+Exact-match on-disk cache for structured LLM calls.
+
+Classification chains (router, validators, graders) run at temperature 0 with a
+fixed output schema, so the same rendered prompt always deserves the same
+answer. Responses are stored in a local SQLite file keyed by a hash of
+(model, rendered prompt, output schema): editing a prompt or a schema changes
+the key, so stale entries are simply never hit again.
+
+Entries expire after RAG_LLM_CACHE_TTL seconds, and the least recently used
+ones are evicted beyond RAG_LLM_CACHE_MAX_ENTRIES. The SQLite file is shared by
+every worker process on the host; hit/miss counters are per process and per chain.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+LLM_CACHE_ENABLED = os.getenv("RAG_LLM_CACHE", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_DB = os.getenv(
+    "RAG_LLM_CACHE_DB", os.path.join(tempfile.gettempdir(), "agentic-rag-llm-cache.sqlite")
+)
+LLM_CACHE_TTL = float(os.getenv("RAG_LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("RAG_LLM_CACHE_MAX_ENTRIES", "50000"))
+
+
+def cache_key(model: str, prompt: str, schema: Dict[str, Any]) -> str:
+    """Hash of (model, rendered prompt, JSON schema of the structured output)."""
+    payload = json.dumps([model, prompt, schema], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class LLMCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+
+class LLMResponseCache:
+    """
+    JSON responses in a SQLite table with TTL expiry and LRU eviction.
+    Connections are per thread; WAL lets readers run next to a writer.
+    """
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_DB,
+        ttl: float = LLM_CACHE_TTL,
+        max_entries: int = LLM_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, LLMCacheStats] = {}
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, chain TEXT NOT NULL, value TEXT NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads: one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, chain: str, hit: bool) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(chain, LLMCacheStats())
+            if hit:
+                stats.hits += 1
+            else:
+                stats.misses += 1
+
+    def get(self, chain: str, key: str) -> Optional[Any]:
+        """Cached response, or None on a miss or an expired entry."""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] > self.ttl:
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            row = None
+        if row is None:
+            self._count(chain, hit=False)
+            return None
+        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+        self._count(chain, hit=True)
+        return json.loads(row[0])
+
+    def put(self, chain: str, key: str, value: Any) -> None:
+        conn = self._connect()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, chain, value, created, accessed) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, chain, json.dumps(value, ensure_ascii=False), now, now),
+            )
+            # Expired entries first, then the least recently used beyond the size bound
+            conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            conn.execute(
+                "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def clear(self) -> None:
+        self._connect().execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Hit/miss counters of this process, per chain."""
+        with self._lock:
+            return {chain: asdict(stats) for chain, stats in self._stats.items()}
+
+
+def create_llm_cache() -> Optional[LLMResponseCache]:
+    """The cache from RAG_LLM_CACHE* settings, or None when disabled or unavailable."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        return LLMResponseCache()
+    except Exception as e:
+        print(f"[LLM CACHE] SQLite cache unavailable ({LLM_CACHE_DB}: {e}), caching disabled")
+        return None
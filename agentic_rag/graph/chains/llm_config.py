@@ -4,13 +4,25 @@ DeepSeek API is compatible with OpenAI API format.
 Handles rate limits and provides better error messages.
 """
 
+import asyncio
+import json
 import os
-import time
-from typing import Any, Optional
+import threading
+from typing import Any, Dict, Optional, Tuple, Type
 
+import httpx
 from dotenv import load_dotenv
+from langchain_core.prompt_values import PromptValue
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_openai import ChatOpenAI
 
+from graph.chains.llm_cache import cache_key, create_llm_cache
+from graph.chains.rate_limiter import TokenBucketRateLimiter, create_backend
+from context_packer import count_tokens
+from tracing import end_span, is_tracing, span, start_span
+
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
 
@@ -20,49 +32,212 @@ load_dotenv(override=False)
 DEEPSEEK_RATE_LIMIT_PER_MINUTE = int(os.getenv("DEEPSEEK_RATE_LIMIT_PER_MINUTE", "100"))
 # Add buffer: use 80% of limit to be safe
 DEEPSEEK_SAFE_LIMIT = int(DEEPSEEK_RATE_LIMIT_PER_MINUTE * 0.8)
-DEEPSEEK_MIN_DELAY_SECONDS = 60.0 / DEEPSEEK_SAFE_LIMIT  # Minimum delay between requests
+# Requests that may go out back-to-back before the sustained rate applies
+DEEPSEEK_RATE_LIMIT_BURST = int(os.getenv("DEEPSEEK_RATE_LIMIT_BURST", str(max(1, DEEPSEEK_SAFE_LIMIT // 6))))
 
-# Track last request time for rate limiting (shared across all LLM instances)
-_last_request_time: Optional[float] = None
-_request_count = 0
-_window_start_time: Optional[float] = None
+# Shared by all chains; with the default SQLite backend the bucket is also
+# shared by every worker process on the host (RAG_RATE_LIMIT_BACKEND)
+rate_limiter = TokenBucketRateLimiter(
+    DEEPSEEK_SAFE_LIMIT, DEEPSEEK_RATE_LIMIT_BURST, name="deepseek", backend=create_backend()
+)
 
 
-def rate_limit_delay():
+def rate_limit_delay() -> float:
     """
-    Add delay to respect rate limits with sliding window.
-    Call this before each LLM invocation.
+    Wait for a request slot (token bucket, see rate_limiter.py).
+    Call this before each LLM invocation. Returns the seconds waited.
     """
-    global _last_request_time, _request_count, _window_start_time
-    
-    current_time = time.time()
-    
-    # Reset window if 1 minute has passed
-    if _window_start_time is None or (current_time - _window_start_time) >= 60:
-        _window_start_time = current_time
-        _request_count = 0
-        print(f"[RATE LIMIT] New rate limit window started (limit: {DEEPSEEK_SAFE_LIMIT}/minute)")
-    
-    # Check if we're approaching the limit
-    if _request_count >= DEEPSEEK_SAFE_LIMIT:
-        wait_time = 60 - (current_time - _window_start_time)
-        if wait_time > 0:
-            print(f"[RATE LIMIT] Approaching limit ({_request_count}/{DEEPSEEK_SAFE_LIMIT}). Waiting {wait_time:.1f}s...")
-            time.sleep(wait_time)
-            _window_start_time = time.time()
-            _request_count = 0
-    
-    # Add minimum delay between requests
-    if _last_request_time is not None:
-        elapsed = current_time - _last_request_time
-        if elapsed < DEEPSEEK_MIN_DELAY_SECONDS:
-            delay = DEEPSEEK_MIN_DELAY_SECONDS - elapsed
-            if delay > 0.1:  # Only print if delay is significant
-                print(f"[RATE LIMIT] Waiting {delay:.2f}s between requests...")
-            time.sleep(delay)
-    
-    _last_request_time = time.time()
-    _request_count += 1
+    return rate_limiter.acquire()
+
+
+async def arate_limit_delay() -> float:
+    """Async rate_limit_delay: waits without blocking the event loop."""
+    return await rate_limiter.acquire_async()
+
+
+def _as_text(value: Any) -> str:
+    """Prompt input or output of a chain as text, for token counting."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, PromptValue):
+        return value.to_string()
+    if isinstance(value, dict):
+        return "\n".join(_as_text(item) for item in value.values())
+    if isinstance(value, BaseModel):
+        return json.dumps(value.dict(), ensure_ascii=False, default=str)
+    return "" if value is None else str(value)
+
+
+def _record_llm_call(llm_span: Any, waited: float, input_dict: Any, output: Any) -> None:
+    llm_span.set(rate_limit_wait_s=round(waited, 3))
+    # Token counts are estimated with the ingestion tokenizer (context_packer), for traces only
+    if is_tracing():
+        llm_span.set(
+            prompt_tokens=count_tokens(_as_text(input_dict)),
+            completion_tokens=count_tokens(_as_text(output)),
+        )
+
+
+def rate_limited(runnable: Runnable, streaming: bool = False, name: str = "llm") -> RunnableLambda:
+    """
+    Wrap a chain so every sync or async invocation first takes a rate limit slot.
+    With streaming=True the wrapper passes the chain's chunks through on
+    .stream()/.astream() (invoke then concatenates them, e.g. text chains).
+    Each call is an "llm" span named `name` in the request trace (tracing.py).
+    """
+    if streaming:
+
+        def _stream(input_dict: dict):
+            llm_span = start_span("llm", name)
+            chunks = []
+            try:
+                waited = rate_limit_delay()
+                for chunk in runnable.stream(input_dict):
+                    chunks.append(chunk)
+                    yield chunk
+            except BaseException as e:
+                end_span(llm_span, e)
+                raise
+            _record_llm_call(llm_span, waited, input_dict, "".join(map(str, chunks)))
+            end_span(llm_span)
+
+        async def _astream(input_dict: dict):
+            llm_span = start_span("llm", name)
+            chunks = []
+            try:
+                waited = await arate_limit_delay()
+                async for chunk in runnable.astream(input_dict):
+                    chunks.append(chunk)
+                    yield chunk
+            except BaseException as e:
+                end_span(llm_span, e)
+                raise
+            _record_llm_call(llm_span, waited, input_dict, "".join(map(str, chunks)))
+            end_span(llm_span)
+
+        return RunnableLambda(_stream, afunc=_astream, name=name)
+
+    def _invoke(input_dict: dict):
+        with span("llm", name) as llm_span:
+            waited = rate_limit_delay()
+            result = runnable.invoke(input_dict)
+            _record_llm_call(llm_span, waited, input_dict, result)
+            return result
+
+    async def _ainvoke(input_dict: dict):
+        with span("llm", name) as llm_span:
+            waited = await arate_limit_delay()
+            result = await runnable.ainvoke(input_dict)
+            _record_llm_call(llm_span, waited, input_dict, result)
+            return result
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=name)
+
+
+# Exact-match response cache of the deterministic structured chains (llm_cache.py)
+llm_cache = create_llm_cache()
+
+
+def cached_structured_chain(
+    name: str,
+    prompt: ChatPromptTemplate,
+    llm: ChatOpenAI,
+    schema: Type[BaseModel],
+) -> Runnable:
+    """
+    `rate_limited(prompt | llm.with_structured_output(schema))`, answered from the
+    LLM cache when the same model already saw the same rendered prompt and schema.
+    Only cache misses take a rate limit slot. Hit/miss counters are kept under `name`.
+    """
+    if llm_cache is None:
+        return rate_limited(prompt | llm.with_structured_output(schema), name=name)
+    structured_chain = rate_limited(llm.with_structured_output(schema), name=name)
+    schema_json = schema.schema()
+
+    def _lookup(input_dict: dict):
+        with span("llm_cache", name) as cache_span:
+            prompt_value = prompt.invoke(input_dict)
+            key = cache_key(llm.model_name, prompt_value.to_string(), schema_json)
+            try:
+                cached = llm_cache.get(name, key)
+            except Exception as e:
+                print(f"[LLM CACHE] Lookup failed for {name}: {e}")
+                cached = None
+            cache_span.set(hit=cached is not None)
+        return prompt_value, key, cached
+
+    def _store(key: str, result: BaseModel) -> None:
+        try:
+            llm_cache.put(name, key, result.dict())
+        except Exception as e:
+            print(f"[LLM CACHE] Store failed for {name}: {e}")
+
+    def _invoke(input_dict: dict):
+        prompt_value, key, cached = _lookup(input_dict)
+        if cached is not None:
+            return schema.parse_obj(cached)
+        result = structured_chain.invoke(prompt_value)
+        if result is not None:
+            _store(key, result)
+        return result
+
+    async def _ainvoke(input_dict: dict):
+        prompt_value, key, cached = await asyncio.to_thread(_lookup, input_dict)
+        if cached is not None:
+            return schema.parse_obj(cached)
+        result = await structured_chain.ainvoke(prompt_value)
+        if result is not None:
+            await asyncio.to_thread(_store, key, result)
+        return result
+
+    return RunnableLambda(_invoke, afunc=_ainvoke, name=name)
+
+
+def llm_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Per-chain hit/miss counters of the LLM cache in this process."""
+    return llm_cache.stats() if llm_cache is not None else {}
+
+
+# Shared HTTP connection pool for every LLM client (keep-alive, bounded connections)
+LLM_MAX_CONNECTIONS = int(os.getenv("RAG_LLM_MAX_CONNECTIONS", "20"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("RAG_LLM_MAX_KEEPALIVE_CONNECTIONS", "10"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("RAG_LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("RAG_LLM_CONNECT_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("RAG_LLM_TIMEOUT", "60"))
+
+_http_client: Optional[httpx.Client] = None
+_http_async_client: Optional[httpx.AsyncClient] = None
+_llms: Dict[Tuple[str, float, int], ChatOpenAI] = {}
+_llm_lock = threading.Lock()
+
+
+def _http_client_options() -> Dict[str, Any]:
+    return {
+        "limits": httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        "timeout": httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    }
+
+
+def get_http_clients() -> Tuple[httpx.Client, httpx.AsyncClient]:
+    """Process-wide sync and async HTTP clients shared by all LLM instances."""
+    global _http_client, _http_async_client
+    with _llm_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(**_http_client_options())
+            _http_async_client = httpx.AsyncClient(**_http_client_options())
+    return _http_client, _http_async_client
+
+
+async def aclose_http_clients() -> None:
+    """Close the shared connection pools; only at application shutdown, as chains keep using them."""
+    if _http_client is not None:
+        _http_client.close()
+    if _http_async_client is not None:
+        await _http_async_client.aclose()
 
 
 def create_llm(
@@ -73,7 +248,9 @@ def create_llm(
     """
     Create a ChatOpenAI instance configured for DeepSeek API.
     DeepSeek API is compatible with OpenAI API format.
-    Rate limiting is handled by calling rate_limit_delay() before each invoke.
+    The instance uses the shared HTTP connection pool; prefer get_llm(), which
+    also reuses the instance.
+    Rate limiting is handled by wrapping chains with rate_limited().
     
     Args:
         model: Model name (default: deepseek-chat)
@@ -90,13 +267,28 @@ def create_llm(
             "Please set it in your .env file."
         )
     
+    http_client, http_async_client = get_http_clients()
     return ChatOpenAI(
         model=model,
         temperature=temperature,
         max_retries=max_retries,
         api_key=api_key,
         base_url="https://api.deepseek.com/v1",
+        http_client=http_client,
+        http_async_client=http_async_client,
     )
 
 
-
+def get_llm(
+    model: str = "deepseek-chat",
+    temperature: float = 0,
+    max_retries: int = 3,
+) -> ChatOpenAI:
+    """Shared ChatOpenAI instance per (model, temperature, max_retries)."""
+    key = (model, float(temperature), max_retries)
+    llm = _llms.get(key)
+    if llm is None:
+        llm = create_llm(model=model, temperature=temperature, max_retries=max_retries)
+        with _llm_lock:
+            llm = _llms.setdefault(key, llm)
+    return llm
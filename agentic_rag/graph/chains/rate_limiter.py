@@ -0,0 +1,174 @@
+"""
+Token-bucket rate limiter for LLM API calls.
+
+The bucket holds up to `burst` tokens and refills at `rate_per_minute / 60`
+tokens per second. A call takes one token; it only waits when the bucket is
+empty, so traffic under the limit is never delayed while sustained traffic is
+held at the configured rate. Safe to share across threads, and `acquire_async`
+waits with asyncio.sleep so it never blocks the event loop.
+
+Bucket state lives in a pluggable backend:
+    InMemoryBucketBackend  - per process (single worker)
+    SQLiteBucketBackend    - shared by every process on the host through a
+                             file-locked SQLite row (uvicorn --workers N)
+A networked store only needs to implement RateLimiterBackend.reserve().
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+RATE_LIMIT_BACKEND = os.getenv("RAG_RATE_LIMIT_BACKEND", "sqlite").lower()
+RATE_LIMIT_DB = os.getenv(
+    "RAG_RATE_LIMIT_DB", os.path.join(tempfile.gettempdir(), "agentic-rag-ratelimit.sqlite")
+)
+
+
+class RateLimiterBackend(ABC):
+    """Atomically take tokens from a named bucket."""
+
+    @abstractmethod
+    def reserve(self, name: str, tokens: float, rate_per_second: float, burst: int) -> float:
+        """
+        Refill the bucket, take `tokens` (letting it go negative, i.e. a reservation
+        in the future) and return how long the caller must wait before proceeding.
+        Reserving instead of retrying keeps waiters in FIFO order.
+        """
+
+
+class InMemoryBucketBackend(RateLimiterBackend):
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, tuple] = {}
+
+    def reserve(self, name: str, tokens: float, rate_per_second: float, burst: int) -> float:
+        with self._lock:
+            now = time.monotonic()
+            available, updated = self._buckets.get(name, (float(burst), now))
+            available = min(burst, available + (now - updated) * rate_per_second) - tokens
+            self._buckets[name] = (available, now)
+            return max(0.0, -available / rate_per_second)
+
+
+class SQLiteBucketBackend(RateLimiterBackend):
+    """
+    Bucket rows in a local SQLite file. `BEGIN IMMEDIATE` takes the database write
+    lock, so the read-refill-write of a reservation is atomic across processes.
+    Wall-clock time is used since monotonic clocks are not comparable between processes.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB) -> None:
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads: one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, name: str, tokens: float, rate_per_second: float, burst: int) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            available, updated = row if row else (float(burst), now)
+            available = min(burst, available + max(0.0, now - updated) * rate_per_second) - tokens
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                (name, available, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return max(0.0, -available / rate_per_second)
+
+
+def create_backend(kind: str = RATE_LIMIT_BACKEND) -> RateLimiterBackend:
+    """Backend from RAG_RATE_LIMIT_BACKEND ("sqlite" or "memory")."""
+    if kind == "sqlite":
+        try:
+            return SQLiteBucketBackend()
+        except Exception as e:
+            print(f"[RATE LIMIT] SQLite backend unavailable ({RATE_LIMIT_DB}: {e}), using per-process limiter")
+    elif kind != "memory":
+        print(f"[RATE LIMIT] Unknown backend '{kind}', using per-process limiter")
+    return InMemoryBucketBackend()
+
+
+@dataclass
+class RateLimiterStats:
+    acquired: int = 0
+    waited: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+
+
+class TokenBucketRateLimiter:
+    def __init__(
+        self,
+        rate_per_minute: float,
+        burst: int,
+        name: str = "default",
+        backend: Optional[RateLimiterBackend] = None,
+    ) -> None:
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.backend = backend or InMemoryBucketBackend()
+        self._lock = threading.Lock()
+        self._stats = RateLimiterStats()
+
+    def _reserve(self, tokens: float) -> float:
+        wait = self.backend.reserve(self.name, tokens, self.rate_per_second, self.burst)
+        with self._lock:
+            self._stats.acquired += 1
+            if wait > 0:
+                self._stats.waited += 1
+                self._stats.total_wait_seconds += wait
+                self._stats.max_wait_seconds = max(self._stats.max_wait_seconds, wait)
+        return wait
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Block until `tokens` are available; returns the seconds waited."""
+        wait = self._reserve(tokens)
+        if wait > 0:
+            if wait > 0.1:  # Only print if delay is significant
+                print(f"[RATE LIMIT] Waiting {wait:.2f}s for a request slot...")
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens: float = 1) -> float:
+        """Awaitable acquire that yields to the event loop while waiting."""
+        # The SQLite backend may briefly block on the file lock: keep it off the loop
+        wait = await asyncio.to_thread(self._reserve, tokens)
+        if wait > 0:
+            if wait > 0.1:
+                print(f"[RATE LIMIT] Waiting {wait:.2f}s for a request slot...")
+            await asyncio.sleep(wait)
+        return wait
+
+    def stats(self) -> Dict[str, float]:
+        """Counters of this process's acquires (the bucket itself may be shared)."""
+        with self._lock:
+            return asdict(self._stats)
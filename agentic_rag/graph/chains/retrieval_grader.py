@@ -2,14 +2,13 @@ from dotenv import load_dotenv
 
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnableLambda
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import get_llm, rate_limited
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
 
-llm = create_llm(model="deepseek-chat", temperature=0)
+llm = get_llm(model="deepseek-chat", temperature=0)
 
 
 class GradeDocuments(BaseModel):
@@ -35,10 +34,4 @@ grade_prompt = ChatPromptTemplate.from_messages(
 base_grader = grade_prompt | structured_llm_grader
 
 
-def _rate_limited_invoke(input_dict: dict):
-    """Wrapper to add rate limiting to retrieval grader chain"""
-    rate_limit_delay()
-    return base_grader.invoke(input_dict)
-
-
-retrieval_grader = RunnableLambda(_rate_limited_invoke)
+retrieval_grader = rate_limited(base_grader, name="retrieval_grader")
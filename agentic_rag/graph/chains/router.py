@@ -3,9 +3,8 @@ from typing import Literal
 from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnableLambda
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import cached_structured_chain, get_llm
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
@@ -20,8 +19,7 @@ class RouteQuery(BaseModel):
     )
 
 
-llm = create_llm(model="deepseek-chat", temperature=0)
-structured_llm_router = llm.with_structured_output(RouteQuery)
+llm = get_llm(model="deepseek-chat", temperature=0)
 
 message = """You are an expert router for EdTech that decides whether a user's question should be answered using the internal vectorstore or web search.
 
@@ -71,13 +69,5 @@ router_prompt = ChatPromptTemplate.from_messages(
     [("system", message), ("human", "{question}")]
 )
 
-base_router = router_prompt | structured_llm_router
 
-
-def _rate_limited_invoke(input_dict: dict):
-    """Wrapper to add rate limiting to router chain"""
-    rate_limit_delay()
-    return base_router.invoke(input_dict)
-
-
-question_router = RunnableLambda(_rate_limited_invoke)
+question_router = cached_structured_chain("question_router", router_prompt, llm, RouteQuery)
@@ -1,16 +1,29 @@
+import asyncio
+from typing import Dict, Optional
+
 from dotenv import load_dotenv
 
-from langgraph.graph import END, StateGraph
+from langchain_core.runnables import RunnableLambda
 
+from graph.builder import build_graph
 from graph.state import GraphState
+from graph.streaming import emit
 from graph.consts import RETRIEVE, GENERATE, GRADE_DOCUMENTS, WEBSEARCH, GREETING, REJECT
 from graph.chains import hallucination_grader, answer_grader, question_router, combined_grader
+from context_packer import pack_documents
+from retrieval import RETRIEVAL_HIGH_CONFIDENCE
+from tracing import annotate, traced
 from graph.nodes import (
     generate, 
+    agenerate,
     grade_documents, 
+    agrade_documents,
     retrieve, 
+    aretrieve,
     web_search, 
+    aweb_search,
     greeting, 
+    agreeting,
     _is_greeting,
     reject_unrelated_question,
     _is_unrelated_question_simple,
@@ -21,6 +34,26 @@ from graph.nodes import (
 load_dotenv(override=False)
 
 
+@traced("edge", result_attribute="decision")
+def decide_after_retrieval(state: GraphState):
+    """
+    Route on retrieval scores: no (or only weak, dropped in retrieve) documents go
+    to the web search fallback, high-confidence hits skip LLM document grading.
+    """
+    print("---ASSESS RETRIEVAL CONFIDENCE---")
+    confidence = state.get("retrieval_confidence") or 0.0
+
+    if not state["documents"]:
+        print("---DECISION: NO CONFIDENT DOCUMENTS, GO TO WEB---")
+        return WEBSEARCH
+    if confidence >= RETRIEVAL_HIGH_CONFIDENCE:
+        print(f"---DECISION: HIGH CONFIDENCE ({confidence:.3f}), SKIP GRADING AND GENERATE---")
+        return GENERATE
+    print(f"---DECISION: CONFIDENCE {confidence:.3f}, GRADE DOCUMENTS---")
+    return GRADE_DOCUMENTS
+
+
+@traced("edge", result_attribute="decision")
 def decide_to_generate(state):
     print("---ASSESS GRADED DOCUMENTS---")
 
@@ -32,6 +65,16 @@ def decide_to_generate(state):
         return GENERATE
 
 
+def _emit_decision(decision: str) -> str:
+    """Streaming clients get the decision, and a "discard" event when the streamed
+    answer will be replaced by a regeneration or a web search answer."""
+    emit("decision", {"decision": decision})
+    if decision != "useful":
+        emit("discard", {"reason": decision})
+    return decision
+
+
+@traced("edge", result_attribute="decision")
 def grade_generation_grounded_in_documents_and_question(state: GraphState):
     """
     Combined grader: Check both hallucination and answer relevance in one API call.
@@ -39,8 +82,58 @@ def grade_generation_grounded_in_documents_and_question(state: GraphState):
     Prevents infinite loops by limiting regeneration attempts.
     """
     print("---CHECK HALLUCINATIONS AND ANSWER RELEVANCE (COMBINED)---")
+    decision = _grading_limit_decision(state)
+    if decision is not None:
+        return _emit_decision(decision)
 
-    question = state["question"]
+    grader_input = _grader_input(state)
+    try:
+        # Use combined grader to check both in one call
+        decision = _combined_decision(state, combined_grader.invoke(grader_input))
+    except Exception as e:
+        print(f"---COMBINED GRADER ERROR: {e}, FALLING BACK TO SEPARATE GRADERS---")
+        # Fallback to separate graders on error
+        score = hallucination_grader.invoke(
+            {"documents": grader_input["documents"], "generation": grader_input["generation"]}
+        )
+        if hallucination_grade := score.binary_score:
+            print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
+            print("---CHECK ANSWER---")
+            score = answer_grader.invoke({"question": grader_input["question"], "generation": grader_input["generation"]})
+            decision = _answer_decision(score.binary_score)
+        else:
+            decision = _not_grounded_decision(state)
+    return _emit_decision(decision)
+
+
+@traced("edge", "grade_generation_grounded_in_documents_and_question", result_attribute="decision")
+async def agrade_generation_grounded_in_documents_and_question(state: GraphState):
+    """Async grade_generation_grounded_in_documents_and_question."""
+    print("---CHECK HALLUCINATIONS AND ANSWER RELEVANCE (COMBINED)---")
+    decision = _grading_limit_decision(state)
+    if decision is not None:
+        return _emit_decision(decision)
+
+    grader_input = await asyncio.to_thread(_grader_input, state)
+    try:
+        decision = _combined_decision(state, await combined_grader.ainvoke(grader_input))
+    except Exception as e:
+        print(f"---COMBINED GRADER ERROR: {e}, FALLING BACK TO SEPARATE GRADERS---")
+        score = await hallucination_grader.ainvoke(
+            {"documents": grader_input["documents"], "generation": grader_input["generation"]}
+        )
+        if score.binary_score:
+            print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
+            print("---CHECK ANSWER---")
+            score = await answer_grader.ainvoke({"question": grader_input["question"], "generation": grader_input["generation"]})
+            decision = _answer_decision(score.binary_score)
+        else:
+            decision = _not_grounded_decision(state)
+    return _emit_decision(decision)
+
+
+def _grading_limit_decision(state: GraphState) -> Optional[str]:
+    """Decision without grading, when a loop limit is reached or nothing can be graded."""
     documents = state["documents"]
     generation = state["generation"]
     regeneration_count = state.get("regeneration_count") or 0
@@ -65,75 +158,71 @@ def grade_generation_grounded_in_documents_and_question(state: GraphState):
     if regeneration_count >= 1 and not generation:
         print(f"---DECISION: ALREADY REGENERATED ONCE ({regeneration_count} attempts), FALLBACK TO WEB SEARCH---")
         return "not_useful"  # Fallback to web search instead of regenerating again
-    
-    documents_text = "\n\n-----\n\n".join([doc.page_content for doc in documents])
+    return None
 
-    try:
-        # Use combined grader to check both in one call
-        result = combined_grader.invoke({
-            "question": question,
-            "documents": documents_text,
-            "generation": generation
-        })
-        
-        is_grounded = result.is_grounded
-        addresses_question = result.addresses_question
-        
-        print(f"---COMBINED GRADING RESULT: grounded={is_grounded}, addresses_question={addresses_question}---")
-        print(f"---REASONING: {result.reasoning[:100]}...---")
-        
-        if is_grounded and addresses_question:
-            print("---DECISION: ANSWER IS GROUNDED AND ADDRESSES QUESTION---")
-            return "useful"
-        elif not is_grounded:
-            print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS---")
-            # If no documents or already regenerated once, fallback to web search instead of regenerating
-            if not documents or regeneration_count >= 1:
-                print("---DECISION: FALLBACK TO WEB SEARCH INSTEAD OF REGENERATING---")
-                return "not_useful"
-            # Only allow regeneration if we haven't tried yet
-            if regeneration_count == 0:
-                return "not_supported"
-            else:
-                print("---DECISION: REGENERATION ALREADY ATTEMPTED, FALLBACK TO WEB SEARCH---")
-                return "not_useful"
-        else:
-            print("---DECISION: ANSWER DOES NOT ADDRESS THE USER QUESTION---")
-            # If already tried web search once, accept answer to prevent loop
-            if web_search_count >= 1:
-                print(f"---DECISION: ALREADY TRIED WEB SEARCH ({web_search_count} attempts), ACCEPTING ANSWER---")
-                return "useful"
+
+def _grader_input(state: GraphState) -> Dict[str, str]:
+    return {
+        "question": state["question"],
+        "documents": pack_documents(state["documents"], "combined_grader"),
+        "generation": state["generation"],
+    }
+
+
+def _combined_decision(state: GraphState, result) -> str:
+    regeneration_count = state.get("regeneration_count") or 0
+    web_search_count = state.get("web_search_count") or 0
+
+    is_grounded = result.is_grounded
+    addresses_question = result.addresses_question
+    emit("grade", {"grounded": is_grounded, "addresses_question": addresses_question})
+    annotate(grounded=is_grounded, addresses_question=addresses_question)
+    
+    print(f"---COMBINED GRADING RESULT: grounded={is_grounded}, addresses_question={addresses_question}---")
+    print(f"---REASONING: {result.reasoning[:100]}...---")
+    
+    if is_grounded and addresses_question:
+        print("---DECISION: ANSWER IS GROUNDED AND ADDRESSES QUESTION---")
+        return "useful"
+    elif not is_grounded:
+        print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS---")
+        # If no documents or already regenerated once, fallback to web search instead of regenerating
+        if not state["documents"] or regeneration_count >= 1:
+            print("---DECISION: FALLBACK TO WEB SEARCH INSTEAD OF REGENERATING---")
             return "not_useful"
-            
-    except Exception as e:
-        print(f"---COMBINED GRADER ERROR: {e}, FALLING BACK TO SEPARATE GRADERS---")
-        # Fallback to separate graders on error
-        score = hallucination_grader.invoke(
-            {"documents": documents_text, "generation": generation}
-        )
-        if hallucination_grade := score.binary_score:
-            print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-            print("---CHECK ANSWER---")
-            score = answer_grader.invoke({"question": question, "generation": generation})
-            if answer_grade := score.binary_score:
-                print("---DECISION: ANSWER ADDRESSES THE USER QUESTION---")
-                return "useful"
-            else:
-                print("---DECISION: ANSWER DOES NOT ADDRESS THE USER QUESTION---")
-                return "not_useful"
-        else:
-            print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS---")
-            # If no documents or already regenerated, fallback to web search
-            if not documents or regeneration_count >= 1:
-                print("---DECISION: FALLBACK TO WEB SEARCH INSTEAD OF REGENERATING---")
-                return "not_useful"
+        # Only allow regeneration if we haven't tried yet
+        if regeneration_count == 0:
             return "not_supported"
+        else:
+            print("---DECISION: REGENERATION ALREADY ATTEMPTED, FALLBACK TO WEB SEARCH---")
+            return "not_useful"
+    else:
+        print("---DECISION: ANSWER DOES NOT ADDRESS THE USER QUESTION---")
+        # If already tried web search once, accept answer to prevent loop
+        if web_search_count >= 1:
+            print(f"---DECISION: ALREADY TRIED WEB SEARCH ({web_search_count} attempts), ACCEPTING ANSWER---")
+            return "useful"
+        return "not_useful"
 
 
-def route_question(state: GraphState):
-    print("---ROUTE QUESTION---")
-    question = state["question"]
-    
+def _answer_decision(answer_grade) -> str:
+    if answer_grade:
+        print("---DECISION: ANSWER ADDRESSES THE USER QUESTION---")
+        return "useful"
+    print("---DECISION: ANSWER DOES NOT ADDRESS THE USER QUESTION---")
+    return "not_useful"
+
+
+def _not_grounded_decision(state: GraphState) -> str:
+    print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS---")
+    # If no documents or already regenerated, fallback to web search
+    if not state["documents"] or (state.get("regeneration_count") or 0) >= 1:
+        print("---DECISION: FALLBACK TO WEB SEARCH INSTEAD OF REGENERATING---")
+        return "not_useful"
+    return "not_supported"
+
+
+def _route_without_llm(question: str) -> Optional[str]:
     # Check greeting/chit-chat FIRST (avoid unnecessary resource consumption)
     if _is_greeting(question):
         print("---DECISION: ROUTE QUESTION TO GREETING (CHIT-CHAT)---")
@@ -143,13 +232,10 @@ def route_question(state: GraphState):
     if _is_unrelated_question_simple(question):
         print("---DECISION: QUESTION IS UNRELATED TO COURSES (PATTERN CHECK)---")
         return REJECT
+    return None
 
-    try:
-        source = question_router.invoke({"question": question})
-    except Exception as e:
-        print(f"---ERROR: ROUTER FAILED ({type(e).__name__}: {e}), DEFAULTING TO RAG---")
-        return RETRIEVE
 
+def _route_from_source(source) -> str:
     # Check if source is None, default to vectorstore
     if source is None:
         print("---WARNING: ROUTER RETURNED NONE, DEFAULTING TO RAG---")
@@ -169,42 +255,65 @@ def route_question(state: GraphState):
     return RETRIEVE
 
 
-flow = StateGraph(state_schema=GraphState)
+@traced("edge", result_attribute="decision")
+def route_question(state: GraphState):
+    print("---ROUTE QUESTION---")
+    question = state["question"]
+    route = _route_without_llm(question)
+    if route is not None:
+        return route
 
-flow.add_node(RETRIEVE, retrieve)
-flow.add_node(GRADE_DOCUMENTS, grade_documents)
-flow.add_node(GENERATE, generate)
-flow.add_node(WEBSEARCH, web_search)
-flow.add_node(GREETING, greeting)
-flow.add_node(REJECT, reject_unrelated_question)
+    try:
+        source = question_router.invoke({"question": question})
+    except Exception as e:
+        print(f"---ERROR: ROUTER FAILED ({type(e).__name__}: {e}), DEFAULTING TO RAG---")
+        return RETRIEVE
+    return _route_from_source(source)
 
-flow.set_conditional_entry_point(
-    route_question, 
-    path_map={
-        RETRIEVE: RETRIEVE, 
-        WEBSEARCH: WEBSEARCH, 
-        GREETING: GREETING,
-        REJECT: REJECT
-    }
-)
 
-flow.add_edge(RETRIEVE, GRADE_DOCUMENTS)
+@traced("edge", "route_question", result_attribute="decision")
+async def aroute_question(state: GraphState):
+    """Async route_question."""
+    print("---ROUTE QUESTION---")
+    question = state["question"]
+    route = _route_without_llm(question)
+    if route is not None:
+        return route
+
+    try:
+        source = await question_router.ainvoke({"question": question})
+    except Exception as e:
+        print(f"---ERROR: ROUTER FAILED ({type(e).__name__}: {e}), DEFAULTING TO RAG---")
+        return RETRIEVE
+    return _route_from_source(source)
 
-flow.add_conditional_edges(
-    GRADE_DOCUMENTS,
-    decide_to_generate,
-    path_map={WEBSEARCH: WEBSEARCH, GENERATE: GENERATE},
-)
-flow.add_conditional_edges(
-    GENERATE,
-    grade_generation_grounded_in_documents_and_question,
-    path_map={"useful": END, "not_useful": WEBSEARCH, "not_supported": GENERATE},
-)
 
-flow.add_edge(WEBSEARCH, GENERATE)
-# Note: GENERATE already has conditional edge above, don't add fixed edge
-flow.add_edge(GREETING, END)  # Greeting node ends immediately, no need to continue
-flow.add_edge(REJECT, END)  # Reject node ends immediately
+def _node(name: str, func, afunc=None):
+    """Graph node running in a "node" span of the request trace (tracing.py)."""
+    if afunc is None:
+        return traced("node", name)(func)
+    return RunnableLambda(traced("node", name)(func), afunc=traced("node", name)(afunc))
 
-app = flow.compile()
+
+# Nodes have a sync and an async implementation (like the LLM-backed edges below):
+# app.invoke runs the former, app.ainvoke / app.astream the latter
+_NODE_IMPLEMENTATIONS = {
+    RETRIEVE: (retrieve, aretrieve),
+    GRADE_DOCUMENTS: (grade_documents, agrade_documents),
+    GENERATE: (generate, agenerate),
+    WEBSEARCH: (web_search, aweb_search),
+    GREETING: (greeting, agreeting),
+    REJECT: (reject_unrelated_question, None),
+}
+
+app = build_graph(
+    nodes={name: _node(name, *implementations) for name, implementations in _NODE_IMPLEMENTATIONS.items()},
+    route_question=RunnableLambda(route_question, afunc=aroute_question),
+    decide_after_retrieval=decide_after_retrieval,
+    decide_to_generate=decide_to_generate,
+    grade_generation=RunnableLambda(
+        grade_generation_grounded_in_documents_and_question,
+        afunc=agrade_generation_grounded_in_documents_and_question,
+    ),
+)
 app.get_graph().draw_mermaid_png(output_file_path="graph.png")
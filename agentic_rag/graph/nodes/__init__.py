@@ -1,18 +1,23 @@
-from graph.nodes.generate import generate
-from graph.nodes.retrieve import retrieve
-from graph.nodes.grade import grade_documents
-from graph.nodes.web_search import web_search
-from graph.nodes.greeting import greeting, _is_greeting
+from graph.nodes.generate import agenerate, generate
+from graph.nodes.retrieve import aretrieve, retrieve
+from graph.nodes.grade import agrade_documents, grade_documents
+from graph.nodes.web_search import aweb_search, web_search
+from graph.nodes.greeting import agreeting, greeting, _is_greeting
 from graph.nodes.reject import reject_unrelated_question
 from graph.nodes.question_validator import _is_unrelated_question_simple
 
 
 __all__ = [
     "generate", 
+    "agenerate",
     "retrieve", 
+    "aretrieve",
     "grade_documents", 
+    "agrade_documents",
     "web_search", 
+    "aweb_search",
     "greeting", 
+    "agreeting",
     "_is_greeting",
     "reject_unrelated_question",
     "_is_unrelated_question_simple",
@@ -1,10 +1,15 @@
-from typing import Any, Dict, List
+import asyncio
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
 
 from langchain_core.documents import Document
+from langchain_core.runnables import Runnable
 
-from database import fetch_course_structure
+from context_packer import CONTEXT_BUDGETS, log_token_usage, pack, pack_documents, trim_to_tokens
+from course_catalog import course_roadmaps
 from graph.chains.generation import generation_chain, generation_chain_platform
 from graph.state import GraphState
+from graph.streaming import agenerate_text, emit, generate_text
 
 SOURCE_KEYS = [
     "document_id",
@@ -24,21 +29,22 @@ SOURCE_KEYS = [
 ]
 
 
-def _build_context(documents: List[Document]) -> str:
-    context_chunks = []
-    for doc in documents:
-        metadata = doc.metadata or {}
-        header_parts = []
-        if metadata.get("course_title"):
-            header_parts.append(f"Course: {metadata['course_title']}")
-        if metadata.get("chapter_title"):
-            header_parts.append(f"Chapter: {metadata['chapter_title']}")
-        if metadata.get("lesson_title"):
-            header_parts.append(f"Lesson: {metadata['lesson_title']}")
-        header = " • ".join(header_parts)
-        chunk = "\n\n".join(filter(None, [header, doc.page_content]))
-        context_chunks.append(chunk.strip())
-    return "\n\n-----\n\n".join(context_chunks)
+def _render_document(doc: Document) -> str:
+    metadata = doc.metadata or {}
+    header_parts = []
+    if metadata.get("course_title"):
+        header_parts.append(f"Course: {metadata['course_title']}")
+    if metadata.get("chapter_title"):
+        header_parts.append(f"Chapter: {metadata['chapter_title']}")
+    if metadata.get("lesson_title"):
+        header_parts.append(f"Lesson: {metadata['lesson_title']}")
+    header = " • ".join(header_parts)
+    return "\n\n".join(filter(None, [header, doc.page_content])).strip()
+
+
+def _build_context(documents: List[Document], chain: str = "generate") -> str:
+    """Documents in relevance order, packed into the chain's token budget (see context_packer)."""
+    return pack_documents(documents, chain, render=_render_document)
 
 
 def _extract_sources(documents: List[Document]) -> List[Dict[str, Any]]:
@@ -49,8 +55,9 @@ def _extract_sources(documents: List[Document]) -> List[Dict[str, Any]]:
         for key in SOURCE_KEYS:
             if key in metadata and metadata[key] is not None:
                 source_entry[key] = metadata[key]
-        if "distance" in metadata:
-            source_entry["distance"] = metadata["distance"]
+        for key in ("distance", "relevance_score", "rerank_score"):
+            if key in metadata:
+                source_entry[key] = metadata[key]
         sources.append(source_entry)
     return sources
 
@@ -121,74 +128,6 @@ def _extract_course_id_from_documents(documents: List[Document]) -> str | None:
     return None
 
 
-def _format_roadmap(course_structure: Dict[str, object]) -> str:
-    """Format course structure into a well-formatted roadmap text"""
-    lines = []
-    
-    course_title = course_structure.get("course_title", "Unknown Course")
-    course_description = course_structure.get("course_description", "")
-    skill_level = course_structure.get("course_skill_level", "")
-    target_audience = course_structure.get("course_target_audience", "")
-    
-    lines.append(f"# 📚 {course_title}")
-    if course_description:
-        lines.append(f"\n{course_description}")
-    if skill_level:
-        lines.append(f"\n**Skill Level:** {skill_level}")
-    if target_audience:
-        lines.append(f"**Target Audience:** {target_audience}")
-    
-    chapters = course_structure.get("chapters", [])
-    if not chapters:
-        lines.append("\n\n⚠️ No chapters found in this course.")
-        return "\n".join(lines)
-    
-    lines.append("\n\n## 📖 Course Structure\n")
-    
-    for chapter_idx, chapter in enumerate(chapters, start=1):
-        chapter_title = chapter.get("chapter_title", "Untitled Chapter")
-        chapter_summary = chapter.get("chapter_summary", "")
-        position = chapter.get("position")
-        
-        chapter_header = f"### Chapter {chapter_idx}"
-        if position is not None:
-            chapter_header += f" (Position: {position})"
-        chapter_header += f": {chapter_title}"
-        lines.append(chapter_header)
-        
-        if chapter_summary:
-            lines.append(f"\n{chapter_summary}\n")
-        
-        lessons = chapter.get("lessons", [])
-        if lessons:
-            lines.append("**Lessons:**")
-            for lesson_idx, lesson in enumerate(lessons, start=1):
-                lesson_title = lesson.get("lesson_title", "Untitled Lesson")
-                lesson_position = lesson.get("position")
-                has_video = lesson.get("has_video", False)
-                has_file = lesson.get("has_file", False)
-                
-                lesson_line = f"  {chapter_idx}.{lesson_idx}. {lesson_title}"
-                if lesson_position is not None:
-                    lesson_line += f" (Position: {lesson_position})"
-                
-                badges = []
-                if has_video:
-                    badges.append("🎥 Video")
-                if has_file:
-                    badges.append("📎 File")
-                if badges:
-                    lesson_line += f" [{', '.join(badges)}]"
-                
-                lines.append(lesson_line)
-        else:
-            lines.append("  *No lessons in this chapter*")
-        
-        lines.append("")  # Empty line between chapters
-    
-    return "\n".join(lines)
-
-
 def _build_conversation_context(chat_history: List[tuple[str, str]] | None) -> str:
     """Build conversation context from chat history"""
     if not chat_history:
@@ -203,11 +142,15 @@ def _build_conversation_context(chat_history: List[tuple[str, str]] | None) -> s
         ""
     ]
     
-    for idx, (prev_question, prev_answer) in enumerate(recent_history, start=1):
-        context_parts.append(f"**Previous Question {idx}:** {prev_question}")
-        # Include full answer for better context, but limit length
-        answer_preview = prev_answer[:500] + "..." if len(prev_answer) > 500 else prev_answer
-        context_parts.append(f"**Previous Answer {idx}:** {answer_preview}")
+    exchanges = [
+        f"**Previous Question {idx}:** {prev_question}\n**Previous Answer {idx}:** {prev_answer}"
+        for idx, (prev_question, prev_answer) in enumerate(recent_history, start=1)
+    ]
+    # Fill the history budget from the most recent exchange backwards; older answers get trimmed first
+    packed = pack(exchanges[::-1], CONTEXT_BUDGETS["history"], separator="\n\n", dedupe=False)
+    packed.log("history", len(exchanges))
+    for exchange in packed.sections[::-1]:
+        context_parts.append(exchange)
         context_parts.append("")  # Empty line between exchanges
     
     context_parts.append("---")
@@ -217,35 +160,29 @@ def _build_conversation_context(chat_history: List[tuple[str, str]] | None) -> s
     return "\n".join(context_parts)
 
 
-def generate(state: GraphState) -> Dict[str, Any]:
-    """
-    Generate a response to the user question.
-    If the question is about roadmap, it will fetch and format course structure.
-    Includes conversation history for context-aware responses.
+@dataclass
+class GenerationRequest:
+    """The generation chain and its inputs, or a fixed answer when no LLM call is needed."""
 
-    Args:
-        state (dict): The current state of the graph.
+    chain: Optional[Runnable] = None
+    chain_name: str = ""
+    context: str = ""
+    question: str = ""
+    generation: str = ""
 
-    Returns:
-        state (dict): A dictionary containing the generated response and the question
+    @property
+    def inputs(self) -> Dict[str, str]:
+        return {"context": self.context, "question": self.question}
+
+
+def _generation_request(state: GraphState) -> GenerationRequest:
+    """
+    Pick the prompt and build its context (course structures for roadmap questions,
+    conversation history, packed documents). Blocking: reads course structures from Postgres.
     """
-    print("---GENERATE---")
     question = state["question"]
     documents = state["documents"]
     chat_history = state.get("chat_history", [])
-    regeneration_count = state.get("regeneration_count") or 0
-    
-    # Increment regeneration count if this is a regeneration attempt
-    # (regeneration happens when coming back from grade_generation_grounded_in_documents_and_question with "not_supported")
-    # Check if there's already a generation in state, which means this is a retry
-    if state.get("generation") and regeneration_count == 0:
-        # First regeneration attempt
-        regeneration_count = 1
-        print(f"---REGENERATION ATTEMPT #1---")
-    elif regeneration_count > 0:
-        # Subsequent regeneration attempts
-        regeneration_count += 1
-        print(f"---REGENERATION ATTEMPT #{regeneration_count}---")
     
     # Build conversation context
     conversation_context = _build_conversation_context(chat_history)
@@ -257,10 +194,10 @@ def generate(state: GraphState) -> Dict[str, Any]:
         
         if course_id:
             print(f"---FETCHING COURSE STRUCTURE FOR COURSE: {course_id}---")
-            course_structures = fetch_course_structure(course_id=course_id)
+            course_roadmap = course_roadmaps(course_id=course_id)
             
-            if course_structures:
-                roadmap_text = _format_roadmap(course_structures[0])
+            if course_roadmap:
+                roadmap_text = trim_to_tokens(course_roadmap[0], CONTEXT_BUDGETS["roadmap"])
                 # Add context from documents so LLM can provide additional explanations
                 context = _build_context(documents)
                 enhanced_context = f"{context}\n\n---\n\n## Course Roadmap:\n\n{roadmap_text}"
@@ -273,23 +210,18 @@ def generate(state: GraphState) -> Dict[str, Any]:
                         + f"{conversation_context}\n\n---\n\n{enhanced_context}"
                     )
                 
-                generation = generation_chain.invoke({
-                    "context": enhanced_context,
-                    "question": question
-                })
+                return GenerationRequest(generation_chain, "generate", enhanced_context, question)
             else:
-                generation = "I couldn't find the course structure. Please make sure you're asking about a specific course."
+                return GenerationRequest(generation="I couldn't find the course structure. Please make sure you're asking about a specific course.")
         else:
             # No specific course_id, fetch all courses
             print("---FETCHING ALL COURSE STRUCTURES---")
-            all_courses = fetch_course_structure()
+            roadmaps = course_roadmaps(limit=5)  # Limit to 5 courses to avoid being too long
             
-            if all_courses:
-                roadmaps = []
-                for course in all_courses[:5]:  # Limit to 5 courses to avoid being too long
-                    roadmaps.append(_format_roadmap(course))
-                
-                roadmap_text = "\n\n---\n\n".join(roadmaps)
+            if roadmaps:
+                packed_roadmaps = pack(roadmaps, CONTEXT_BUDGETS["roadmap"], separator="\n\n---\n\n", dedupe=False)
+                packed_roadmaps.log("roadmap", len(roadmaps))
+                roadmap_text = packed_roadmaps.text
                 context = _build_context(documents)
                 enhanced_context = f"{context}\n\n---\n\n## Available Courses Roadmaps:\n\n{roadmap_text}"
                 
@@ -301,16 +233,11 @@ def generate(state: GraphState) -> Dict[str, Any]:
                         + f"{conversation_context}\n\n---\n\n{enhanced_context}"
                     )
                 
-                generation = generation_chain.invoke({
-                    "context": enhanced_context,
-                    "question": question
-                })
+                return GenerationRequest(generation_chain, "generate", enhanced_context, question)
             else:
-                generation = "I couldn't find any course structures. Please try asking about a specific course."
+                return GenerationRequest(generation="I couldn't find any course structures. Please try asking about a specific course.")
     else:
         # Regular question
-        context = _build_context(documents)
-        
         # Check if this is a platform question with primarily knowledge-base documents
         # Use concise prompt for platform/knowledge-base questions
         is_platform_question = state.get("is_platform_question", False)
@@ -319,14 +246,16 @@ def generate(state: GraphState) -> Dict[str, Any]:
         
         if is_platform_question and is_mostly_kb:
             print("---PLATFORM QUESTION WITH KB DOCS - USING CONCISE PROMPT---")
+            context = _build_context(documents, "generate_platform")
             # For platform questions with KB docs, use concise prompt (like knowledge base docs)
             if conversation_context:
                 enhanced_context = f"{conversation_context}\n\n## RETRIEVED DOCUMENTS:\n\n{context}"
             else:
                 enhanced_context = context
-            generation = generation_chain_platform.invoke({"context": enhanced_context, "question": question})
+            return GenerationRequest(generation_chain_platform, "generate_platform", enhanced_context, question)
         else:
             # Regular generation with comprehensive prompt
+            context = _build_context(documents)
             # Add conversation context if available - place it BEFORE documents for better context understanding
             if conversation_context:
                 # Put conversation history first so LLM sees it first
@@ -341,8 +270,30 @@ def generate(state: GraphState) -> Dict[str, Any]:
             else:
                 enhanced_context = context
             
-            generation = generation_chain.invoke({"context": enhanced_context, "question": question})
+            return GenerationRequest(generation_chain, "generate", enhanced_context, question)
+
+
+def _regeneration_count(state: GraphState) -> int:
+    regeneration_count = state.get("regeneration_count") or 0
     
+    # Increment regeneration count if this is a regeneration attempt
+    # (regeneration happens when coming back from grade_generation_grounded_in_documents_and_question with "not_supported")
+    # Check if there's already a generation in state, which means this is a retry
+    if state.get("generation") and regeneration_count == 0:
+        # First regeneration attempt
+        regeneration_count = 1
+        print(f"---REGENERATION ATTEMPT #1---")
+    elif regeneration_count > 0:
+        # Subsequent regeneration attempts
+        regeneration_count += 1
+        print(f"---REGENERATION ATTEMPT #{regeneration_count}---")
+    return regeneration_count
+
+
+def _generated_state(state: GraphState, generation: str, regeneration_count: int) -> Dict[str, Any]:
+    question = state["question"]
+    documents = state["documents"]
+    chat_history = state.get("chat_history", [])
     sources = _extract_sources(documents)
     
     # Update chat history with current Q&A
@@ -361,3 +312,45 @@ def generate(state: GraphState) -> Dict[str, Any]:
         "regeneration_count": regeneration_count,
         "web_search_count": state.get("web_search_count") or 0,  # Preserve web search count
     }
+
+
+def generate(state: GraphState) -> Dict[str, Any]:
+    """
+    Generate a response to the user question.
+    If the question is about roadmap, it will fetch and format course structure.
+    Includes conversation history for context-aware responses.
+
+    Args:
+        state (dict): The current state of the graph.
+
+    Returns:
+        state (dict): A dictionary containing the generated response and the question
+    """
+    print("---GENERATE---")
+    regeneration_count = _regeneration_count(state)
+    emit("generation_start", {"node": "generate", "attempt": regeneration_count})
+    
+    request = _generation_request(state)
+    if request.chain is not None:
+        generation = generate_text(request.chain, request.inputs)
+        log_token_usage(request.chain_name, request.context + request.question, generation)
+    else:
+        generation = request.generation
+    
+    return _generated_state(state, generation, regeneration_count)
+
+
+async def agenerate(state: GraphState) -> Dict[str, Any]:
+    """Async generate: context building (Postgres, token counting) runs in a worker thread."""
+    print("---GENERATE---")
+    regeneration_count = _regeneration_count(state)
+    emit("generation_start", {"node": "generate", "attempt": regeneration_count})
+    
+    request = await asyncio.to_thread(_generation_request, state)
+    if request.chain is not None:
+        generation = await agenerate_text(request.chain, request.inputs)
+        log_token_usage(request.chain_name, request.context + request.question, generation)
+    else:
+        generation = request.generation
+    
+    return _generated_state(state, generation, regeneration_count)
@@ -1,111 +1,236 @@
-from typing import Any, Dict
+import asyncio
+from typing import Any, Dict, List, Tuple
 
+from langchain_core.documents import Document
+
+from context_packer import CONTEXT_BUDGETS, trim_to_tokens
 from graph.chains.retrieval_grader import retrieval_grader
 from graph.chains.batch_retrieval_grader import batch_retrieval_grader
 from graph.state import GraphState
+from reranker import RERANK_LLM_FALLBACK, RERANK_MARGIN, RERANK_THRESHOLD, rerank
 
 
-def grade_documents(state: GraphState) -> Dict[str, Any]:
-    """
-    Determines whether the retrieved documents are relevant to the user question.
-    Uses batch grading to reduce API calls (grade all documents in one call).
-    If any document is not relevant, we will set a flag to run web search.
+def _batch_documents_text(documents: List[Document]) -> str:
+    # Format documents with indices; each gets an equal share of the grader's token budget
+    per_document = CONTEXT_BUDGETS["batch_retrieval_grader"] // len(documents)
+    print(f"[CONTEXT] batch_retrieval_grader: {len(documents)} documents, {per_document} tokens each")
+    return "\n\n".join([
+        f"Document {idx}:\n{trim_to_tokens(doc.page_content, per_document)}"
+        for idx, doc in enumerate(documents)
+    ])
 
-    Args:
-        state (dict): The current state of the graph.
 
-    Returns:
-        state (dict): Filtered out irrelevant documents and updated use_web_search state.
-    """
-    print("---GRADE DOCUMENTS---")
-    question = state["question"]
-    documents = state["documents"]
+def _apply_batch_grade(documents: List[Document], result) -> Tuple[List[Document], bool]:
+    relevant_indices = set(result.relevant_document_indices)
+    print(f"---BATCH GRADING RESULT: {len(relevant_indices)}/{len(documents)} documents relevant---")
+    print(f"---REASONING: {result.reasoning[:100]}...---")
+    
+    filtered_documents = [
+        doc for idx, doc in enumerate(documents)
+        if idx in relevant_indices
+    ]
+    
+    # Log individual results
+    for idx, doc in enumerate(documents):
+        if idx in relevant_indices:
+            print(f"---DOCUMENT {idx} IS RELEVANT---")
+        else:
+            print(f"---DOCUMENT {idx} IS NOT RELEVANT---")
+    
+    # If no documents are relevant, trigger web search
+    return filtered_documents, len(filtered_documents) == 0
 
-    if not documents:
-        return {
-            "documents": [],
-            "use_web_search": True,
-            "question": question,
-            "user_id": state.get("user_id"),
-            "chat_history": state.get("chat_history", []),
-        }
 
+def _is_relevant(result) -> bool:
+    if result.binary_score.lower() == "yes":
+        print("---DOCUMENT IS RELEVANT---")
+        return True
+    print("---DOCUMENT IS NOT RELEVANT---")
+    return False
+
+
+def _llm_grade(question: str, documents: List[Document]) -> Tuple[List[Document], bool]:
+    """
+    Grade documents with the LLM grader (batch call for 2+ documents).
+
+    Returns:
+        The relevant documents and whether web search should be used.
+    """
     # Use batch grading for 2+ documents to reduce API calls
     # For single document, use individual grader (simpler and faster)
     if len(documents) >= 2:
         print(f"---BATCH GRADING {len(documents)} DOCUMENTS---")
-        
-        # Format documents with indices
-        documents_text = "\n\n".join([
-            f"Document {idx}:\n{doc.page_content[:1000]}"  # Limit length to avoid token limits
-            for idx, doc in enumerate(documents)
-        ])
-        
         try:
             result = batch_retrieval_grader.invoke({
                 "question": question,
-                "documents": documents_text
+                "documents": _batch_documents_text(documents)
             })
-            
-            relevant_indices = set(result.relevant_document_indices)
-            print(f"---BATCH GRADING RESULT: {len(relevant_indices)}/{len(documents)} documents relevant---")
-            print(f"---REASONING: {result.reasoning[:100]}...---")
-            
-            filtered_documents = [
-                doc for idx, doc in enumerate(documents)
-                if idx in relevant_indices
-            ]
-            
-            # If no documents are relevant, trigger web search
-            use_web_search = len(filtered_documents) == 0
-            
-            # Log individual results
-            for idx, doc in enumerate(documents):
-                if idx in relevant_indices:
-                    print(f"---DOCUMENT {idx} IS RELEVANT---")
-                else:
-                    print(f"---DOCUMENT {idx} IS NOT RELEVANT---")
-            
+            return _apply_batch_grade(documents, result)
         except Exception as e:
             print(f"---BATCH GRADING ERROR: {e}, FALLING BACK TO INDIVIDUAL GRADING---")
             # Fallback to individual grading on error
-            filtered_documents = []
-            use_web_search = False
-            for doc in documents:
-                result = retrieval_grader.invoke(
-                    {"question": question, "document": doc.page_content}
-                )
-                grade = result.binary_score
-                if grade.lower() == "yes":
-                    print("---DOCUMENT IS RELEVANT---")
-                    filtered_documents.append(doc)
-                else:
-                    print("---DOCUMENT IS NOT RELEVANT---")
-                    use_web_search = True
     else:
         # Single document: use individual grader
         print("---GRADING SINGLE DOCUMENT---")
-        doc = documents[0]
-        result = retrieval_grader.invoke(
-            {"question": question, "document": doc.page_content}
-        )
-        grade = result.binary_score
-        if grade.lower() == "yes":
-            print("---DOCUMENT IS RELEVANT---")
-            filtered_documents = [doc]
-            use_web_search = False
+
+    filtered_documents = [
+        doc for doc in documents
+        if _is_relevant(retrieval_grader.invoke({"question": question, "document": doc.page_content}))
+    ]
+    return filtered_documents, len(filtered_documents) < len(documents)
+
+
+async def _allm_grade(question: str, documents: List[Document]) -> Tuple[List[Document], bool]:
+    """Async _llm_grade; individual fallback grades run concurrently."""
+    if len(documents) >= 2:
+        print(f"---BATCH GRADING {len(documents)} DOCUMENTS---")
+        try:
+            documents_text = await asyncio.to_thread(_batch_documents_text, documents)
+            result = await batch_retrieval_grader.ainvoke({
+                "question": question,
+                "documents": documents_text
+            })
+            return _apply_batch_grade(documents, result)
+        except Exception as e:
+            print(f"---BATCH GRADING ERROR: {e}, FALLING BACK TO INDIVIDUAL GRADING---")
+    else:
+        print("---GRADING SINGLE DOCUMENT---")
+
+    results = await asyncio.gather(*[
+        retrieval_grader.ainvoke({"question": question, "document": doc.page_content})
+        for doc in documents
+    ])
+    filtered_documents = [doc for doc, result in zip(documents, results) if _is_relevant(result)]
+    return filtered_documents, len(filtered_documents) < len(documents)
+
+
+def _split_by_rerank_score(
+    scored: List[Tuple[Document, float]]
+) -> Tuple[List[Document], List[Tuple[Document, float]]]:
+    """Clearly relevant documents and the ambiguous (document, score) pairs around the threshold."""
+    relevant: List[Document] = []
+    ambiguous: List[Tuple[Document, float]] = []
+    for idx, (doc, score) in enumerate(scored):
+        if score >= RERANK_THRESHOLD + RERANK_MARGIN:
+            print(f"---DOCUMENT {idx} IS RELEVANT (rerank={score:.3f})---")
+            relevant.append(doc)
+        elif score >= RERANK_THRESHOLD - RERANK_MARGIN:
+            ambiguous.append((doc, score))
         else:
-            print("---DOCUMENT IS NOT RELEVANT---")
-            filtered_documents = []
-            use_web_search = True
-    
+            print(f"---DOCUMENT {idx} IS NOT RELEVANT (rerank={score:.3f})---")
+    return relevant, ambiguous
+
+
+def _merge_ambiguous(
+    relevant: List[Document],
+    ambiguous: List[Tuple[Document, float]],
+    graded: List[Document] | None,
+    total: int,
+) -> Tuple[List[Document], bool]:
+    if graded is not None:
+        graded_ids = {id(doc) for doc in graded}
+        relevant.extend(doc for doc, _ in ambiguous if id(doc) in graded_ids)
+    else:
+        relevant.extend(doc for doc, score in ambiguous if score >= RERANK_THRESHOLD)
+
+    print(f"---RERANK RESULT: {len(relevant)}/{total} documents relevant---")
+    return relevant, not relevant
+
+
+def _rerank_grade(
+    question: str, scored: List[Tuple[Document, float]]
+) -> Tuple[List[Document], bool]:
+    """
+    Grade documents by cross-encoder score (best first). Documents within the
+    ambiguous band around the threshold go to the LLM grader if enabled.
+    """
+    relevant, ambiguous = _split_by_rerank_score(scored)
+    graded = None
+    if ambiguous and RERANK_LLM_FALLBACK:
+        print(f"---{len(ambiguous)} AMBIGUOUS DOCUMENTS, GRADING WITH LLM---")
+        graded, _ = _llm_grade(question, [doc for doc, _ in ambiguous])
+    return _merge_ambiguous(relevant, ambiguous, graded, len(scored))
+
+
+async def _arerank_grade(
+    question: str, scored: List[Tuple[Document, float]]
+) -> Tuple[List[Document], bool]:
+    relevant, ambiguous = _split_by_rerank_score(scored)
+    graded = None
+    if ambiguous and RERANK_LLM_FALLBACK:
+        print(f"---{len(ambiguous)} AMBIGUOUS DOCUMENTS, GRADING WITH LLM---")
+        graded, _ = await _allm_grade(question, [doc for doc, _ in ambiguous])
+    return _merge_ambiguous(relevant, ambiguous, graded, len(scored))
+
+
+def grade_documents(state: GraphState) -> Dict[str, Any]:
+    """
+    Determines whether the retrieved documents are relevant to the user question.
+    Documents are scored and reordered by a local cross-encoder; the LLM grader
+    (batch grading, one call for all documents) is only used for ambiguous scores
+    or when no reranker is available.
+    If no document is relevant, we will set a flag to run web search.
+
+    Args:
+        state (dict): The current state of the graph.
+
+    Returns:
+        state (dict): Filtered out irrelevant documents and updated use_web_search state.
+    """
+    print("---GRADE DOCUMENTS---")
+    question = state["question"]
+    documents = state["documents"]
+
+    if not documents:
+        return _no_documents_state(state)
+
+    scored = rerank(question, documents)
+    if scored is not None:
+        print(f"---RERANKING {len(documents)} DOCUMENTS---")
+        filtered_documents, use_web_search = _rerank_grade(question, scored)
+    else:
+        filtered_documents, use_web_search = _llm_grade(question, documents)
+
+    return _graded_state(state, filtered_documents, use_web_search)
+
+
+async def agrade_documents(state: GraphState) -> Dict[str, Any]:
+    """Async grade_documents: the cross-encoder runs in a worker thread, LLM grading with ainvoke."""
+    print("---GRADE DOCUMENTS---")
+    question = state["question"]
+    documents = state["documents"]
+
+    if not documents:
+        return _no_documents_state(state)
+
+    scored = await asyncio.to_thread(rerank, question, documents)
+    if scored is not None:
+        print(f"---RERANKING {len(documents)} DOCUMENTS---")
+        filtered_documents, use_web_search = await _arerank_grade(question, scored)
+    else:
+        filtered_documents, use_web_search = await _allm_grade(question, documents)
+
+    return _graded_state(state, filtered_documents, use_web_search)
+
+
+def _no_documents_state(state: GraphState) -> Dict[str, Any]:
+    return {
+        "documents": [],
+        "use_web_search": True,
+        "question": state["question"],
+        "user_id": state.get("user_id"),
+        "chat_history": state.get("chat_history", []),
+    }
+
+
+def _graded_state(state: GraphState, filtered_documents: List[Document], use_web_search: bool) -> Dict[str, Any]:
     if not filtered_documents:
         use_web_search = True
 
     return {
         "documents": filtered_documents,
         "use_web_search": use_web_search,
-        "question": question,
+        "question": state["question"],
         "user_id": state.get("user_id"),
         "lesson_id": state.get("lesson_id"),  # Preserve lesson_id
         "is_platform_question": state.get("is_platform_question", False),  # Preserve platform question flag
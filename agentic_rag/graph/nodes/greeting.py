@@ -4,7 +4,30 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
 from graph.state import GraphState
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.streaming import agenerate_text, emit, generate_text
+from graph.chains.llm_config import get_llm, rate_limited
+
+
+# Simple prompt for greeting
+greeting_prompt = ChatPromptTemplate.from_messages([
+    ("system", """You are a friendly and helpful AI assistant for EdTech.
+When users greet you or engage in small talk, respond warmly and briefly.
+Keep responses concise (1-2 sentences) and natural.
+If they ask about yourself, briefly introduce yourself as an AI assistant for EdTech that helps with course-related questions.
+When referring to the platform, use "EdTech" rather than generic terms.
+If they thank you, respond politely.
+If they say goodbye, respond appropriately."""),
+    ("human", "{question}")
+])
+
+# Simple chain for greeting (no document context needed), built once and reused
+greeting_chain = rate_limited(
+    greeting_prompt
+    | get_llm(model="deepseek-chat", temperature=0.7)  # Higher temperature for more natural responses
+    | StrOutputParser(),
+    streaming=True,
+    name="greeting",
+)
 
 
 def _is_greeting(question: str) -> bool:
@@ -72,25 +95,23 @@ def greeting(state: GraphState) -> Dict[str, Any]:
         Dictionary containing generation and necessary information
     """
     print("---GREETING/CHIT-CHAT---")
+    emit("generation_start", {"node": "greeting", "attempt": 0})
+    generation = generate_text(greeting_chain, {"question": _greeting_question(state)})
+    return _greeting_state(state, generation)
+
+
+async def agreeting(state: GraphState) -> Dict[str, Any]:
+    """Async greeting."""
+    print("---GREETING/CHIT-CHAT---")
+    emit("generation_start", {"node": "greeting", "attempt": 0})
+    generation = await agenerate_text(greeting_chain, {"question": _greeting_question(state)})
+    return _greeting_state(state, generation)
+
+
+def _greeting_question(state: GraphState) -> str:
     question = state["question"]
     chat_history = state.get("chat_history", [])
     
-    # Create simple prompt for greeting
-    greeting_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are a friendly and helpful AI assistant for EdTech.
-When users greet you or engage in small talk, respond warmly and briefly.
-Keep responses concise (1-2 sentences) and natural.
-If they ask about yourself, briefly introduce yourself as an AI assistant for EdTech that helps with course-related questions.
-When referring to the platform, use "EdTech" rather than generic terms.
-If they thank you, respond politely.
-If they say goodbye, respond appropriately."""),
-        ("human", "{question}")
-    ])
-    
-    # Create simple chain for greeting (no document context needed)
-    llm = create_llm(model="deepseek-chat", temperature=0.7)  # Higher temperature for more natural responses
-    greeting_chain = greeting_prompt | llm | StrOutputParser()
-    
     # Add conversation context if available
     if chat_history:
         # Get the most recent messages for context
@@ -98,12 +119,13 @@ If they say goodbye, respond appropriately."""),
             f"User: {q}\nAssistant: {a}" 
             for q, a in chat_history[-3:]  # Only take the last 3 messages
         ])
-        enhanced_question = f"Previous conversation:\n{recent_context}\n\nCurrent message: {question}"
-        rate_limit_delay()  # Call rate limit before invoke
-        generation = greeting_chain.invoke({"question": enhanced_question})
-    else:
-        rate_limit_delay()  # Call rate limit before invoke
-        generation = greeting_chain.invoke({"question": question})
+        return f"Previous conversation:\n{recent_context}\n\nCurrent message: {question}"
+    return question
+
+
+def _greeting_state(state: GraphState, generation: str) -> Dict[str, Any]:
+    question = state["question"]
+    chat_history = state.get("chat_history", [])
     
     # Update chat history
     updated_history = list(chat_history) if chat_history else []
@@ -117,4 +139,3 @@ If they say goodbye, respond appropriately."""),
         "user_id": state.get("user_id"),
         "chat_history": updated_history,
     }
-
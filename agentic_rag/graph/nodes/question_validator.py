@@ -6,11 +6,10 @@ This prevents unnecessary API calls for questions like "how is the weather today
 from typing import Tuple
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnableLambda
 
 from dotenv import load_dotenv
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import cached_structured_chain, get_llm
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
 load_dotenv(override=False)
@@ -29,8 +28,7 @@ class QuestionValidation(BaseModel):
     )
 
 
-llm_validator = create_llm(model="deepseek-chat", temperature=0)
-structured_validator = llm_validator.with_structured_output(QuestionValidation)
+llm_validator = get_llm(model="deepseek-chat", temperature=0)
 
 validation_message = """You are a validator for EdTech. Your job is to determine if a user's question is related to courses, education, or platform usage.
 
@@ -66,16 +64,10 @@ validation_prompt = ChatPromptTemplate.from_messages(
     [("system", validation_message), ("human", "Question: {question}")]
 )
 
-base_validator = validation_prompt | structured_validator
 
-
-def _rate_limited_validate(input_dict: dict):
-    """Wrapper to add rate limiting to validator"""
-    rate_limit_delay()
-    return base_validator.invoke(input_dict)
-
-
-question_validator = RunnableLambda(_rate_limited_validate)
+question_validator = cached_structured_chain(
+    "question_validator", validation_prompt, llm_validator, QuestionValidation
+)
 
 
 def validate_question(question: str) -> Tuple[bool, str]:
@@ -1,9 +1,10 @@
+import asyncio
 from typing import Any, Dict, List
 
 from langchain_core.documents import Document
 
-from database import fetch_user_enrollments
-from ingestion import retriever
+from enrollment_cache import get_user_enrollments
+from retrieval import RETRIEVAL_MIN_CONFIDENCE, filtered_search, relevance_of
 from graph.state import GraphState
 
 
@@ -79,7 +80,9 @@ def _is_platform_question(question: str) -> bool:
 
 def retrieve(state: GraphState) -> Dict[str, Any]:
     """
-    Retrieve documents from the retriever.
+    Retrieve documents with a filtered vector search.
+    Lesson scope and enrollment permissions are applied inside the query, so the
+    result holds up to k permitted documents.
     Enhances query with conversation history for better context-aware retrieval.
     Prioritizes knowledge-base documents for platform usage questions.
 
@@ -99,6 +102,10 @@ def retrieve(state: GraphState) -> Dict[str, Any]:
     if lesson_id:
         print(f"---LESSON FILTER MODE: Only retrieving documents from lesson_id={lesson_id}---")
 
+    # Enrollment check is pushed into the vector query: public documents plus
+    # enrollment-only documents of the user's courses
+    allowed_courses = get_user_enrollments(user_id) if user_id else None
+
     # Check if this is a platform usage question (excludes course recommendation)
     is_platform_question = _is_platform_question(question)
     is_course_recommendation = _is_course_recommendation_question(question)
@@ -106,40 +113,30 @@ def retrieve(state: GraphState) -> Dict[str, Any]:
     if is_course_recommendation:
         print("---DETECTED COURSE RECOMMENDATION QUESTION - USING COURSE CONTENT---")
     
-    # Optimize for platform questions: enhance query + post-filter knowledge-base
-    if is_platform_question:
+    # Optimize for platform questions: search the knowledge base directly.
+    # Skipped in lesson mode, knowledge-base documents don't belong to a lesson.
+    if is_platform_question and not lesson_id:
         print("---DETECTED PLATFORM USAGE QUESTION - OPTIMIZING FOR KNOWLEDGE BASE---")
         
-        # Enhance query with knowledge-base keywords to boost KB in vector search
-        kb_keywords = "knowledge base guide tutorial platform guide user guide instructor guide"
-        enhanced_query = f"{question} {kb_keywords}"
-        print(f"---ENHANCED QUERY FOR KB: {enhanced_query[:150]}...---")
-        
-        # Retrieve documents (enhanced query helps KB rank higher)
-        all_documents = retriever.invoke(enhanced_query)
+        # Max 5 KB docs for cost optimization
+        kb_documents = filtered_search(
+            question, k=5, doc_types=["knowledge_base"], allowed_course_ids=allowed_courses
+        )
         
-        # Post-filter: Separate knowledge-base and other documents
-        kb_documents = []
-        other_documents = []
-        for doc in all_documents:
-            metadata = doc.metadata or {}
-            if metadata.get("doc_type") == "knowledge_base":
-                kb_documents.append(doc)
-            else:
-                other_documents.append(doc)
-        
-        # Optimization: Prioritize KB, limit total documents to reduce token usage
         if len(kb_documents) >= 3:
-            # Use only KB docs if we have enough (max 5 for cost optimization)
-            documents = kb_documents[:5]
-            print(f"---OPTIMIZED: Using {len(documents)} KB docs only (post-filtered)---")
+            # Use only KB docs if we have enough
+            documents = kb_documents
+            print(f"---OPTIMIZED: Using {len(documents)} KB docs only---")
         elif len(kb_documents) > 0:
             # If we have some KB docs, prioritize them + add top 2 course docs for context
-            documents = kb_documents + other_documents[:2]
-            print(f"---OPTIMIZED: {len(kb_documents)} KB docs + {len(other_documents[:2])} course docs (post-filtered)---")
+            other_documents = filtered_search(
+                question, k=2, exclude_doc_types=["knowledge_base"], allowed_course_ids=allowed_courses
+            )
+            documents = kb_documents + other_documents
+            print(f"---OPTIMIZED: {len(kb_documents)} KB docs + {len(other_documents)} course docs---")
         else:
-            # Fallback: No KB docs found, use all docs but log warning
-            documents = all_documents
+            # Fallback: No KB docs found, use all permitted docs but log warning
+            documents = filtered_search(question, allowed_course_ids=allowed_courses)
             print(f"---WARNING: No KB docs found for platform question, using all {len(documents)} docs---")
     else:
         # Normal retrieval for course content questions (including course recommendations)
@@ -167,42 +164,23 @@ def retrieve(state: GraphState) -> Dict[str, Any]:
                 print(f"Original: {question}")
                 print(f"Enhanced: {enhanced_query[:200]}...")
         
-        documents: List[Document] = retriever.invoke(enhanced_query)
+        # When lesson_id is provided, ONLY documents from that specific lesson are searched
+        # (knowledge-base documents have no lesson_id and are excluded)
+        documents: List[Document] = filtered_search(
+            enhanced_query, lesson_id=lesson_id, allowed_course_ids=allowed_courses
+        )
 
-    # Filter by lesson_id if provided (priority filter - applies before user permission check)
-    # When lesson_id is provided, ONLY retrieve documents from that specific lesson
-    # Knowledge-base documents are excluded when filtering by lesson_id
     if lesson_id:
-        lesson_filtered_documents = []
-        for doc in documents:
-            metadata = doc.metadata or {}
-            doc_lesson_id = metadata.get("lesson_id")
-            # Only include documents that match the lesson_id exactly
-            # Exclude knowledge_base documents when filtering by lesson
-            if doc_lesson_id == lesson_id:
-                lesson_filtered_documents.append(doc)
-            else:
-                print(f"---DOCUMENT FILTERED: Not from lesson_id={lesson_id} (doc lesson_id={doc_lesson_id}, doc_type={metadata.get('doc_type')})---")
-        documents = lesson_filtered_documents
         print(f"---LESSON FILTER RESULT: {len(documents)} documents from lesson_id={lesson_id}---")
         if len(documents) == 0:
             print(f"---WARNING: No documents found for lesson_id={lesson_id}, will trigger web search if no relevant docs---")
 
-    # Filter by user permissions (enrollment check)
-    if user_id:
-        allowed_courses = fetch_user_enrollments(user_id)
-        filtered_documents = []
-        for doc in documents:
-            metadata = doc.metadata or {}
-            requires_enrollment = metadata.get("requires_enrollment", False)
-            doc_course_id = metadata.get("course_id")
-            if not requires_enrollment:
-                filtered_documents.append(doc)
-            elif doc_course_id and doc_course_id in allowed_courses:
-                filtered_documents.append(doc)
-            else:
-                print("---DOCUMENT FILTERED: USER LACKS ACCESS---")
-        documents = filtered_documents
+    # Best similarity drives routing (see decide_after_retrieval in graph.py)
+    retrieval_confidence = max((relevance_of(doc) for doc in documents), default=0.0)
+    print(f"---RETRIEVED {len(documents)} DOCUMENTS, BEST RELEVANCE {retrieval_confidence:.3f}---")
+    if documents and retrieval_confidence < RETRIEVAL_MIN_CONFIDENCE:
+        print(f"---LOW CONFIDENCE (< {RETRIEVAL_MIN_CONFIDENCE}), DISCARDING DOCUMENTS---")
+        documents = []
 
     return {
         "documents": documents,
@@ -210,6 +188,15 @@ def retrieve(state: GraphState) -> Dict[str, Any]:
         "user_id": user_id,
         "lesson_id": lesson_id,  # Preserve lesson_id in state
         "is_platform_question": is_platform_question,  # Track if this is a platform question
+        "retrieval_confidence": retrieval_confidence,
         "chat_history": state.get("chat_history", []),
         "regeneration_count": 0,  # Reset regeneration count for new retrieval
     }
+
+
+async def aretrieve(state: GraphState) -> Dict[str, Any]:
+    """
+    Async retrieve. FastEmbed, Chroma and the enrollment query are blocking calls,
+    so the whole search runs in a worker thread.
+    """
+    return await asyncio.to_thread(retrieve, state)
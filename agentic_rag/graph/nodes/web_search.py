@@ -1,15 +1,49 @@
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from langchain_core.documents import Document
 from langchain_community.tools.tavily_search import TavilySearchResults
 
 from graph.state import GraphState
-from graph.nodes.web_search_validator import validate_web_search
+from graph.nodes.web_search_validator import avalidate_web_search, validate_web_search
 
 
 web_search_tool = TavilySearchResults(max_results=3)
 
 
+def _web_search_state(state: GraphState, documents: List[Document], web_search_count: int) -> Dict[str, Any]:
+    return {
+        "documents": documents,
+        "question": state["question"],
+        "user_id": state.get("user_id"),
+        "lesson_id": state.get("lesson_id"),  # Preserve lesson_id
+        "chat_history": state.get("chat_history", []),
+        "regeneration_count": 0,  # Reset when starting web search flow
+        "web_search_count": web_search_count,
+    }
+
+
+def _web_search_query(question: str) -> Dict[str, str]:
+    # Enhance query to focus on educational/technical content
+    # Add context to search query to get more relevant results
+    return {"query": f"{question} educational course tutorial"}
+
+
+def _web_search_document(question: str, tavily_results: List[Dict[str, Any]]) -> Document:
+    # get one huge string with all the results
+    tavily_results_joined = "\n".join([res["content"] for res in tavily_results])
+
+    # create a document object
+    return Document(
+        page_content=tavily_results_joined,
+        metadata={
+            "doc_type": "web_search",
+            "source": "tavily",
+            "requires_enrollment": False,
+            "search_query": question,
+        },
+    )
+
+
 def web_search(state: GraphState) -> Dict[str, Any]:
     """
     Search the web for documents.
@@ -33,60 +67,45 @@ def web_search(state: GraphState) -> Dict[str, Any]:
         print(f"---WEB SEARCH REJECTED: {reason}---")
         print("---RETURNING WITHOUT WEB SEARCH---")
         # Return without web search - let existing documents handle the question
-        return {
-            "documents": documents,
-            "question": question,
-            "user_id": state.get("user_id"),
-            "lesson_id": state.get("lesson_id"),  # Preserve lesson_id
-            "chat_history": state.get("chat_history", []),
-            "regeneration_count": 0,  # Reset when starting web search flow
-            "web_search_count": web_search_count,
-        }
+        return _web_search_state(state, documents, web_search_count)
 
     print(f"---WEB SEARCH VALIDATED: {reason}---")
     
-    # Enhance query to focus on educational/technical content
-    # Add context to search query to get more relevant results
-    enhanced_query = f"{question} educational course tutorial"
-    
     try:
-        tavily_results = web_search_tool.invoke({"query": enhanced_query})
+        tavily_results = web_search_tool.invoke(_web_search_query(question))
     except Exception as e:
         print(f"---WEB SEARCH ERROR: {e}---")
         # Return without web search on error
-        return {
-            "documents": documents,
-            "question": question,
-            "user_id": state.get("user_id"),
-            "lesson_id": state.get("lesson_id"),  # Preserve lesson_id
-            "chat_history": state.get("chat_history", []),
-            "regeneration_count": 0,  # Reset when starting web search flow
-            "web_search_count": web_search_count,
-        }
+        return _web_search_state(state, documents, web_search_count)
 
-    # get one huge string with all the results
-    tavily_results_joined = "\n".join([res["content"] for res in tavily_results])
+    # append web search to the list of documents
+    documents.append(_web_search_document(question, tavily_results))
 
-    # create a document object
-    web_search_result = Document(
-        page_content=tavily_results_joined,
-        metadata={
-            "doc_type": "web_search",
-            "source": "tavily",
-            "requires_enrollment": False,
-            "search_query": question,
-        },
-    )
+    return _web_search_state(state, documents, web_search_count)
 
-    # append web search to the list of documents
-    documents.append(web_search_result)
 
-    return {
-        "documents": documents,
-        "question": question,
-        "user_id": state.get("user_id"),
-        "lesson_id": state.get("lesson_id"),  # Preserve lesson_id
-        "chat_history": state.get("chat_history", []),
-        "regeneration_count": 0,  # Reset when starting web search flow
-        "web_search_count": web_search_count,
-    }
+async def aweb_search(state: GraphState) -> Dict[str, Any]:
+    """Async web_search: validation with ainvoke, Tavily over its async HTTP client."""
+    print("---WEB SEARCH---")
+    question = state["question"]
+    documents = state["documents"] or []  # only relevant documents
+    web_search_count = (state.get("web_search_count") or 0) + 1  # Increment web search counter
+
+    is_valid, reason = await avalidate_web_search(question)
+    
+    if not is_valid:
+        print(f"---WEB SEARCH REJECTED: {reason}---")
+        print("---RETURNING WITHOUT WEB SEARCH---")
+        return _web_search_state(state, documents, web_search_count)
+
+    print(f"---WEB SEARCH VALIDATED: {reason}---")
+    
+    try:
+        tavily_results = await web_search_tool.ainvoke(_web_search_query(question))
+    except Exception as e:
+        print(f"---WEB SEARCH ERROR: {e}---")
+        return _web_search_state(state, documents, web_search_count)
+
+    documents.append(_web_search_document(question, tavily_results))
+
+    return _web_search_state(state, documents, web_search_count)
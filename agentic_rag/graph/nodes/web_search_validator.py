@@ -6,11 +6,10 @@ Only allows web search for course-related technical questions.
 from typing import Dict, Any, Tuple
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.runnables import RunnableLambda
 
 from dotenv import load_dotenv
 
-from graph.chains.llm_config import create_llm, rate_limit_delay
+from graph.chains.llm_config import cached_structured_chain, get_llm
 from graph.state import GraphState
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
@@ -30,8 +29,7 @@ class WebSearchValidation(BaseModel):
     )
 
 
-llm_validator = create_llm(model="deepseek-chat", temperature=0)
-structured_validator = llm_validator.with_structured_output(WebSearchValidation)
+llm_validator = get_llm(model="deepseek-chat", temperature=0)
 
 validation_message = """You are a validator for EdTech. Your job is to determine if a user's question is appropriate for web search.
 
@@ -65,16 +63,10 @@ validation_prompt = ChatPromptTemplate.from_messages(
     [("system", validation_message), ("human", "Question: {question}")]
 )
 
-base_validator = validation_prompt | structured_validator
 
-
-def _rate_limited_validate(input_dict: dict):
-    """Wrapper to add rate limiting to validator"""
-    rate_limit_delay()
-    return base_validator.invoke(input_dict)
-
-
-web_search_validator = RunnableLambda(_rate_limited_validate)
+web_search_validator = cached_structured_chain(
+    "web_search_validator", validation_prompt, llm_validator, WebSearchValidation
+)
 
 
 def validate_web_search(question: str) -> Tuple[bool, str]:
@@ -91,3 +83,13 @@ def validate_web_search(question: str) -> Tuple[bool, str]:
         print(f"[VALIDATOR] Error validating question: {e}")
         # On error, be conservative and disallow web search
         return False, f"Validation error: {str(e)}"
+
+
+async def avalidate_web_search(question: str) -> Tuple[bool, str]:
+    """Async validate_web_search."""
+    try:
+        result = await web_search_validator.ainvoke({"question": question})
+        return result.is_valid, result.reason
+    except Exception as e:
+        print(f"[VALIDATOR] Error validating question: {e}")
+        return False, f"Validation error: {str(e)}"
@@ -17,6 +17,7 @@ class GraphState(TypedDict, total=False):
         lesson_id: Optional lesson ID to filter documents to specific lesson
         chat_history: List of tuples (question, answer) for conversation context
         regeneration_count: Number of times generation has been regenerated (to prevent infinite loops)
+        retrieval_confidence: Best relevance score (0-1) among retrieved documents
     """
 
     question: str
@@ -30,3 +31,4 @@ class GraphState(TypedDict, total=False):
     chat_history: List[Tuple[str, str]]
     regeneration_count: int
     web_search_count: int  # Track number of web search attempts to prevent loops
+    retrieval_confidence: float
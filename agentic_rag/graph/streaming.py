@@ -0,0 +1,129 @@
+"""
+Incremental events from a graph run, for streaming clients (SSE endpoint, UI).
+
+Nodes publish through emit(); it is a no-op unless the run was started by
+stream_events() / astream_events(), which install a per-run sink in a context
+variable (LangGraph runs nodes in copies of the caller's context), so concurrent
+runs never see each other's events.
+
+Events (name, data):
+    generation_start  {"node", "attempt"}       a new answer starts streaming
+    token             {"text"}                  a chunk of the answer
+    grade             {"grounded", "addresses_question"}
+    decision          {"decision"}              outcome of the answer grading
+    discard           {"reason"}                drop the tokens streamed so far, a new answer follows
+    result            the final graph state (always last, unless "error")
+    error             {"detail"}
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from langchain_core.runnables import Runnable
+
+Event = Tuple[str, Any]
+
+_event_sink: contextvars.ContextVar[Optional[Callable[[str, Any], None]]] = contextvars.ContextVar(
+    "rag_event_sink", default=None
+)
+
+
+def is_streaming() -> bool:
+    return _event_sink.get() is not None
+
+
+def emit(event: str, data: Any) -> None:
+    sink = _event_sink.get()
+    if sink is not None:
+        sink(event, data)
+
+
+def generate_text(chain: Runnable, inputs: Dict[str, Any]) -> str:
+    """Invoke a text chain, emitting its chunks as "token" events when streaming."""
+    if not is_streaming():
+        return chain.invoke(inputs)
+    chunks = []
+    for chunk in chain.stream(inputs):
+        chunks.append(chunk)
+        emit("token", {"text": chunk})
+    return "".join(chunks)
+
+
+async def agenerate_text(chain: Runnable, inputs: Dict[str, Any]) -> str:
+    """Async generate_text."""
+    if not is_streaming():
+        return await chain.ainvoke(inputs)
+    chunks = []
+    async for chunk in chain.astream(inputs):
+        chunks.append(chunk)
+        emit("token", {"text": chunk})
+    return "".join(chunks)
+
+
+def stream_events(
+    invoke: Callable[[Dict[str, Any]], Dict[str, Any]],
+    payload: Dict[str, Any],
+) -> Iterator[Event]:
+    """
+    Run `invoke(payload)` (the graph) in a worker thread and yield its events as
+    they are emitted, ending with ("result", final_state) or ("error", {...}).
+    """
+    events: "queue.Queue[Optional[Event]]" = queue.Queue()
+
+    def run() -> None:
+        _event_sink.set(lambda event, data: events.put((event, data)))
+        try:
+            events.put(("result", invoke(payload)))
+        except Exception as e:
+            events.put(("error", {"detail": f"Error processing question: {e}"}))
+        finally:
+            events.put(None)
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), name="graph-stream", daemon=True).start()
+    while True:
+        event = events.get()
+        if event is None:
+            return
+        yield event
+
+
+async def astream_events(
+    ainvoke: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+    payload: Dict[str, Any],
+) -> AsyncIterator[Event]:
+    """
+    Async stream_events: runs `ainvoke(payload)` as a task on the running loop.
+    Closing the iterator early (client gone) cancels the run.
+    """
+    loop = asyncio.get_running_loop()
+    events: "asyncio.Queue[Optional[Event]]" = asyncio.Queue()
+
+    def put(item: Optional[Event]) -> None:
+        # Nodes may emit from worker threads (asyncio.to_thread)
+        loop.call_soon_threadsafe(events.put_nowait, item)
+
+    async def run() -> None:
+        _event_sink.set(lambda event, data: put((event, data)))
+        try:
+            put(("result", await ainvoke(payload)))
+        except Exception as e:
+            put(("error", {"detail": f"Error processing question: {e}"}))
+        finally:
+            put(None)
+
+    task = asyncio.create_task(run())
+    try:
+        while True:
+            event = await events.get()
+            if event is None:
+                return
+            yield event
+    finally:
+        if not task.done():
+            task.cancel()
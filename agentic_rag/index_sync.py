@@ -0,0 +1,50 @@
+"""
+Keep a process's view of the index in step with writes made by other processes.
+
+Only one process writes the collection at a time (the API leader's source
+watcher and change feed, or ingest.py), and each write bumps the version in
+INDEX_VERSION_PATH. Every API worker polls that version and, when it moves,
+reopens its Chroma handle and drops the derived caches (BM25, answer cache)
+through ingestion.sync_index_version.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from typing import Optional
+
+from ingestion import sync_index_version
+
+INDEX_SYNC_ENABLED = os.getenv("RAG_INDEX_SYNC", "true").lower() in ("1", "true", "yes")
+INDEX_SYNC_INTERVAL = float(os.getenv("RAG_INDEX_SYNC_INTERVAL", "2"))
+
+
+class IndexVersionWatcher:
+    """Poll the on-disk index version every `interval` seconds."""
+
+    def __init__(self, interval: float = INDEX_SYNC_INTERVAL) -> None:
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-sync", daemon=True)
+        self._thread.start()
+        print(f"[INDEX] Watching the index version every {self.interval:.0f}s")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                sync_index_version()
+            except Exception as e:
+                print(f"[INDEX] Index version sync failed: {e}")
@@ -0,0 +1,53 @@
+"""
+Command-line entry point for building or updating the vector index.
+The API and UI only open the persisted collection, they never build it.
+
+Usage:
+    cd agentic_rag
+    poetry run python ingest.py          # incremental (default, see RAG_INGEST_MODE)
+    poetry run python ingest.py --full   # rebuild everything into a new collection and swap it in
+    poetry run python ingest.py --evict-cache   # also drop unreferenced cached embeddings
+"""
+
+import argparse
+import sys
+import time
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# Only load .env file if not in Docker (override=False prevents overriding existing env vars)
+load_dotenv(override=False)
+
+from ingestion import build_vectorstore
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Build or update the Agentic RAG vector index.")
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild every document into a new collection (swapped in when complete) instead of an incremental update.",
+    )
+    parser.add_argument(
+        "--evict-cache",
+        action="store_true",
+        help="Evict cached embeddings not referenced by the index after ingestion.",
+    )
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    try:
+        build_vectorstore(
+            full_rebuild=True if args.full else None,
+            evict_cache=True if args.evict_cache else None,
+        )
+    except Exception as e:
+        print(f"[INGEST] Ingestion failed: {e}")
+        return 1
+    print(f"[INGEST] Done in {time.perf_counter() - start_time:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
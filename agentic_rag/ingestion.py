@@ -1,21 +1,36 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from itertools import chain, islice
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
+from chromadb.api.client import SharedSystemClient
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_chroma import Chroma
 from langchain_community.embeddings import FastEmbedEmbeddings
 from langchain_core.documents import Document
 
+from embedding_cache import EmbeddingCache, content_key
+from embedding_pipeline import EmbeddingPipeline
+from process_lock import FileLock
 from database import (
-    fetch_courses,
+    fetch_content_ids,
+    fetch_courses_by_ids,
     fetch_labels,
-    fetch_lessons_with_context,
+    fetch_lessons_with_context_by_ids,
+    fetch_lessons_with_context_for,
     fetch_tags,
+    iter_courses,
+    iter_lessons_with_context,
 )
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
@@ -26,6 +41,7 @@ CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION_NAME", "rag-edtech")
 CHROMA_PERSIST_DIR = os.getenv("CHROMA_PERSIST_DIR", "./.chroma")
 CHUNK_SIZE = int(os.getenv("RAG_CHUNK_SIZE", "700"))
 CHUNK_OVERLAP = int(os.getenv("RAG_CHUNK_OVERLAP", "120"))
+EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
 TRANSCRIPTS_DIR = os.getenv("TRANSCRIPTS_DIR", "../../transcription-worker/transcripts")
 
 # Resolve knowledge-base directory relative to project root (not current working directory)
@@ -43,6 +59,37 @@ if _default_kb_dir is None:
 
 KNOWLEDGE_BASE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", _default_kb_dir)
 
+# Incremental ingestion: "incremental" (default) only re-embeds new/changed documents,
+# "full" drops the collection and rebuilds everything from scratch
+INGEST_MODE = os.getenv("RAG_INGEST_MODE", "incremental").lower()
+INGEST_MANIFEST_PATH = os.getenv(
+    "RAG_INGEST_MANIFEST", os.path.join(CHROMA_PERSIST_DIR, "ingest_manifest.json")
+)
+INGEST_WRITE_BATCH_SIZE = int(os.getenv("RAG_INGEST_WRITE_BATCH_SIZE", "1000"))
+
+# Content-addressed embedding cache: unchanged chunk texts are never re-embedded
+EMBED_CACHE_ENABLED = os.getenv("RAG_EMBED_CACHE", "true").lower() in ("1", "true", "yes")
+EMBED_CACHE_DIR = os.getenv("RAG_EMBED_CACHE_DIR", os.path.join(CHROMA_PERSIST_DIR, "embedding_cache"))
+# Drop cached vectors not referenced by the current index after each ingestion run
+EMBED_CACHE_EVICT = os.getenv("RAG_EMBED_CACHE_EVICT", "false").lower() in ("1", "true", "yes")
+_MANIFEST_VERSION = 1
+
+# A full rebuild writes "<collection>-rebuild" and swaps it in when complete; the
+# replaced collection is kept as "<collection>-previous" until the next full rebuild
+_REBUILD_SUFFIX = "-rebuild"
+_PREVIOUS_SUFFIX = "-previous"
+
+# Writers (API leader, ingest.py) bump this version after every write so the other
+# processes serving the index reload their collection handle and derived caches
+INDEX_VERSION_PATH = os.getenv("RAG_INDEX_VERSION_PATH", os.path.join(CHROMA_PERSIST_DIR, "index_version.json"))
+
+# Extract the sources (courses, lessons, transcripts, knowledge base, tags, labels) concurrently
+INGEST_PARALLEL_EXTRACT = os.getenv("RAG_INGEST_PARALLEL_EXTRACT", "true").lower() in ("1", "true", "yes")
+# Documents buffered between the extracting threads and the chunking/embedding stage
+INGEST_EXTRACT_QUEUE = int(os.getenv("RAG_INGEST_EXTRACT_QUEUE", "256"))
+# Transcripts whose lesson context is fetched in one query
+_TRANSCRIPT_CONTEXT_BATCH = 200
+
 
 def _isoformat(value: Optional[object]) -> Optional[str]:
     if value is None:
@@ -82,11 +129,10 @@ def _sanitize_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
 
 
 def _build_course_documents(
-    courses: List[Dict[str, object]],
+    courses: Iterable[Dict[str, object]],
     tags: Dict[Tuple[str, str], List[str]],
     labels: Dict[Tuple[str, str], List[str]],
-) -> List[Document]:
-    documents: List[Document] = []
+) -> Iterator[Document]:
     for course in courses:
         course_id = str(course["course_id"])
         content_parts = [
@@ -112,18 +158,14 @@ def _build_course_documents(
             "last_modified": _isoformat(course.get("course_modified")),
             "course_status": course.get("course_status"),
         }
-        documents.append(
-            Document(page_content=content, metadata=_sanitize_metadata(metadata))
-        )
-    return documents
+        yield Document(page_content=content, metadata=_sanitize_metadata(metadata))
 
 
 def _build_lesson_documents(
-    lessons: List[Dict[str, object]],
+    lessons: Iterable[Dict[str, object]],
     tags: Dict[Tuple[str, str], List[str]],
     labels: Dict[Tuple[str, str], List[str]],
-) -> List[Document]:
-    documents: List[Document] = []
+) -> Iterator[Document]:
     for lesson in lessons:
         lesson_id = lesson.get("lesson_id")
         course_id = lesson.get("course_id")
@@ -175,14 +217,79 @@ def _build_lesson_documents(
             "course_skill_level": lesson.get("course_skill_level"),
             "course_language": lesson.get("course_language"),
         }
-        documents.append(
-            Document(page_content=content, metadata=_sanitize_metadata(metadata))
-        )
-    return documents
+        yield Document(page_content=content, metadata=_sanitize_metadata(metadata))
+
+
+# Lesson columns transcripts need for context (everything except the heavy content)
+_LESSON_CONTEXT_KEYS = (
+    "lesson_id",
+    "lesson_title",
+    "course_id",
+    "course_title",
+    "chapter_id",
+    "chapter_title",
+    "chapter_summary",
+    "course_skill_level",
+    "course_language",
+)
+
+
+def _collect_lesson_context(
+    lessons: Iterable[Dict[str, object]],
+    lesson_index: Dict[str, Dict[str, object]],
+) -> Iterator[Dict[str, object]]:
+    """Pass lesson rows through while keeping a slim lesson_id -> context map for transcripts."""
+    for lesson in lessons:
+        lesson_id = lesson.get("lesson_id")
+        if lesson_id:
+            lesson_index[str(lesson_id)] = {key: lesson.get(key) for key in _LESSON_CONTEXT_KEYS}
+        yield lesson
+
 
+def iter_transcript_files() -> Iterator[Path]:
+    """Transcript JSON files currently in TRANSCRIPTS_DIR (absolute paths)"""
+    transcripts_dir = Path(TRANSCRIPTS_DIR).resolve()
+    if transcripts_dir.exists():
+        yield from transcripts_dir.glob("*.json")
 
-def _load_transcript_files() -> List[Dict[str, Any]]:
-    """Load all transcript files from the transcripts directory"""
+
+def _load_transcript_file(transcript_file: Path) -> Optional[Dict[str, Any]]:
+    """Load one transcript file, or None if it cannot be read"""
+    try:
+        with open(transcript_file, "r", encoding="utf-8") as f:
+            data = json.load(f)
+            lesson_id = data.get("lessonId", "unknown")
+            text_preview = (data.get("translatedText") or data.get("text", ""))[:100]
+            duration = data.get("duration", 0)
+            language = data.get("language", "unknown")
+            segments_count = len(data.get("segments", []))
+            print(
+                f"[INGEST] Loaded transcript | "
+                f"file={transcript_file.name} | "
+                f"lessonId={lesson_id[:8] if len(str(lesson_id)) > 8 else lesson_id}... | "
+                f"language={language} | "
+                f"duration={duration:.1f}s | "
+                f"segments={segments_count} | "
+                f"preview={text_preview}..."
+            )
+        return data
+    except Exception as e:
+        print(f"[INGEST] Failed to load transcript {transcript_file}: {e}")
+        return None
+
+
+def transcript_document_id(transcript_file: Path) -> Optional[str]:
+    """document_id of the transcript stored in `transcript_file` (None if unreadable)"""
+    try:
+        with open(transcript_file, "r", encoding="utf-8") as f:
+            lesson_id = json.load(f).get("lessonId")
+    except Exception:
+        return None
+    return f"transcript:{lesson_id}" if lesson_id else None
+
+
+def _load_transcript_files() -> Iterator[Dict[str, Any]]:
+    """Load transcript files from the transcripts directory one at a time"""
     transcripts_dir = Path(TRANSCRIPTS_DIR)
     # Resolve to absolute path for better error messages
     transcripts_dir = transcripts_dir.resolve()
@@ -190,51 +297,27 @@ def _load_transcript_files() -> List[Dict[str, Any]]:
     if not transcripts_dir.exists():
         print(f"[INGEST] Transcripts directory not found: {transcripts_dir}")
         print(f"[INGEST] Please check TRANSCRIPTS_DIR environment variable or ensure the directory exists")
-        return []
+        return
     
-    transcripts = []
-    for transcript_file in transcripts_dir.glob("*.json"):
-        try:
-            with open(transcript_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                lesson_id = data.get("lessonId", "unknown")
-                text_preview = (data.get("translatedText") or data.get("text", ""))[:100]
-                duration = data.get("duration", 0)
-                language = data.get("language", "unknown")
-                segments_count = len(data.get("segments", []))
-                print(
-                    f"[INGEST] Loaded transcript | "
-                    f"file={transcript_file.name} | "
-                    f"lessonId={lesson_id[:8] if len(str(lesson_id)) > 8 else lesson_id}... | "
-                    f"language={language} | "
-                    f"duration={duration:.1f}s | "
-                    f"segments={segments_count} | "
-                    f"preview={text_preview}..."
-                )
-                transcripts.append(data)
-        except Exception as e:
-            print(f"[INGEST] Failed to load transcript {transcript_file}: {e}")
+    loaded_count = 0
+    for transcript_file in iter_transcript_files():
+        data = _load_transcript_file(transcript_file)
+        if data is None:
             continue
+        loaded_count += 1
+        yield data
     
-    print(f"[INGEST] Total transcripts loaded: {len(transcripts)}")
-    return transcripts
+    print(f"[INGEST] Total transcripts loaded: {loaded_count}")
 
 
 def _build_transcript_documents(
-    transcripts: List[Dict[str, Any]],
-    lessons: List[Dict[str, object]],
+    transcripts: Iterable[Dict[str, Any]],
+    lesson_map: Dict[str, Dict[str, object]],
     tags: Dict[Tuple[str, str], List[str]],
     labels: Dict[Tuple[str, str], List[str]],
-) -> List[Document]:
-    """Tạo Document objects từ transcript data"""
-    documents: List[Document] = []
-    
-    # Tạo map từ lesson_id -> lesson metadata để lookup nhanh
-    lesson_map: Dict[str, Dict[str, object]] = {}
-    for lesson in lessons:
-        lesson_id_str = str(lesson.get("lesson_id", ""))
-        if lesson_id_str:
-            lesson_map[lesson_id_str] = lesson
+) -> Iterator[Document]:
+    """Tạo Document objects từ transcript data (lesson_map: lesson_id -> lesson context)"""
+    document_count = 0
     
     for transcript in transcripts:
         lesson_id = transcript.get("lessonId")
@@ -328,9 +411,8 @@ def _build_transcript_documents(
             "course_language": lesson_meta.get("course_language") if lesson_meta else None,
         }
         
-        documents.append(
-            Document(page_content=content, metadata=_sanitize_metadata(metadata))
-        )
+        document_count += 1
+        yield Document(page_content=content, metadata=_sanitize_metadata(metadata))
         
         # Log transcript document được tạo
         lesson_title = lesson_meta.get("lesson_title") if lesson_meta else "N/A"
@@ -346,12 +428,92 @@ def _build_transcript_documents(
             f"hasTranslation={bool(transcript.get('translatedText'))}"
         )
     
-    print(f"[INGEST] Total transcript documents created: {len(documents)}")
-    return documents
+    print(f"[INGEST] Total transcript documents created: {document_count}")
+
+
+def iter_knowledge_files() -> Iterator[Path]:
+    """Markdown guides currently in KNOWLEDGE_BASE_DIR (absolute paths, README.md excluded)"""
+    kb_dir = Path(KNOWLEDGE_BASE_DIR).resolve()
+    if not kb_dir.exists():
+        return
+    # Recursively find all .md files
+    for md_file in kb_dir.rglob("*.md"):
+        # Skip README.md files (they're documentation, not guides)
+        if md_file.name.lower() != "readme.md":
+            yield md_file
 
 
-def _load_markdown_files() -> List[Dict[str, Any]]:
-    """Load all markdown files from the knowledge-base directory"""
+def _knowledge_relative_path(md_file: Path) -> Path:
+    # Extract relative path from knowledge-base root
+    try:
+        return md_file.relative_to(Path(KNOWLEDGE_BASE_DIR).resolve())
+    except ValueError:
+        # If can't get relative path, use filename
+        return Path(md_file.name)
+
+
+def knowledge_document_id(md_file: Path) -> str:
+    """document_id of the knowledge base document built from `md_file`"""
+    return f"knowledge_base:{_knowledge_relative_path(md_file)}"
+
+
+def _load_markdown_file(md_file: Path) -> Optional[Dict[str, Any]]:
+    """Load one markdown guide, or None if it cannot be read"""
+    try:
+        with open(md_file, "r", encoding="utf-8") as f:
+            content = f.read()
+
+        relative_path = _knowledge_relative_path(md_file)
+
+        # Determine category from directory structure
+        category = "unknown"
+        parts = relative_path.parts
+        if len(parts) > 0:
+            parent_dir = parts[0].lower()
+            if "instructor" in parent_dir or "instructor-guide" in parent_dir:
+                category = "instructor_guide"
+            elif "user" in parent_dir or "user-guide" in parent_dir:
+                category = "user_guide"
+            elif "faq" in parent_dir:
+                category = "faq"
+        
+        # Extract title from first H1 heading
+        title = None
+        lines = content.split("\n")
+        for line in lines:
+            line_stripped = line.strip()
+            if line_stripped.startswith("# ") and len(line_stripped) > 2:
+                title = line_stripped[2:].strip()
+                break
+        
+        # If no H1 found, use filename (without extension) as title
+        if not title:
+            title = md_file.stem.replace("-", " ").replace("_", " ").title()
+        
+        markdown_file = {
+            "file_path": str(relative_path),
+            "absolute_path": str(md_file),
+            "content": content,
+            "title": title,
+            "category": category,
+            "last_modified": md_file.stat().st_mtime,
+        }
+        
+        print(
+            f"[INGEST] Loaded markdown | "
+            f"file={relative_path} | "
+            f"category={category} | "
+            f"title={title[:50] if len(title) > 50 else title} | "
+            f"size={len(content)} chars"
+        )
+    except Exception as e:
+        print(f"[INGEST] Failed to load markdown {md_file}: {e}")
+        return None
+    return markdown_file
+
+
+def _load_markdown_files() -> Iterator[Dict[str, Any]]:
+    """Load markdown files from the knowledge-base directory one at a time"""
     kb_dir = Path(KNOWLEDGE_BASE_DIR)
     # Resolve to absolute path for better error messages
     kb_dir = kb_dir.resolve()
@@ -359,80 +521,24 @@ def _load_markdown_files() -> List[Dict[str, Any]]:
     if not kb_dir.exists():
         print(f"[INGEST] Knowledge base directory not found: {kb_dir}")
         print(f"[INGEST] Please check KNOWLEDGE_BASE_DIR environment variable or ensure the directory exists")
-        return []
+        return
     
-    markdown_files = []
-    # Recursively find all .md files
-    for md_file in kb_dir.rglob("*.md"):
-        # Skip README.md files (they're documentation, not guides)
-        if md_file.name.lower() == "readme.md":
-            continue
-            
-        try:
-            with open(md_file, "r", encoding="utf-8") as f:
-                content = f.read()
-                
-            # Extract relative path from knowledge-base root
-            try:
-                relative_path = md_file.relative_to(kb_dir)
-            except ValueError:
-                # If can't get relative path, use filename
-                relative_path = Path(md_file.name)
-            
-            # Determine category from directory structure
-            category = "unknown"
-            parts = relative_path.parts
-            if len(parts) > 0:
-                parent_dir = parts[0].lower()
-                if "instructor" in parent_dir or "instructor-guide" in parent_dir:
-                    category = "instructor_guide"
-                elif "user" in parent_dir or "user-guide" in parent_dir:
-                    category = "user_guide"
-                elif "faq" in parent_dir:
-                    category = "faq"
-            
-            # Extract title from first H1 heading
-            title = None
-            lines = content.split("\n")
-            for line in lines:
-                line_stripped = line.strip()
-                if line_stripped.startswith("# ") and len(line_stripped) > 2:
-                    title = line_stripped[2:].strip()
-                    break
-            
-            # If no H1 found, use filename (without extension) as title
-            if not title:
-                title = md_file.stem.replace("-", " ").replace("_", " ").title()
-            
-            markdown_files.append({
-                "file_path": str(relative_path),
-                "absolute_path": str(md_file),
-                "content": content,
-                "title": title,
-                "category": category,
-                "last_modified": md_file.stat().st_mtime,
-            })
-            
-            print(
-                f"[INGEST] Loaded markdown | "
-                f"file={relative_path} | "
-                f"category={category} | "
-                f"title={title[:50] if len(title) > 50 else title} | "
-                f"size={len(content)} chars"
-            )
-        except Exception as e:
-            print(f"[INGEST] Failed to load markdown {md_file}: {e}")
+    loaded_count = 0
+    for md_file in iter_knowledge_files():
+        markdown_file = _load_markdown_file(md_file)
+        if markdown_file is None:
             continue
+        loaded_count += 1
+        yield markdown_file
     
-    print(f"[INGEST] Total markdown files loaded: {len(markdown_files)}")
-    return markdown_files
+    print(f"[INGEST] Total markdown files loaded: {loaded_count}")
 
 
 def _build_knowledge_documents(
-    markdown_files: List[Dict[str, Any]]
-) -> List[Document]:
+    markdown_files: Iterable[Dict[str, Any]]
+) -> Iterator[Document]:
     """Create Document objects from markdown knowledge base files"""
-    documents: List[Document] = []
+    document_count = 0
     
     for md_data in markdown_files:
         content = md_data["content"]
@@ -453,11 +559,10 @@ def _build_knowledge_documents(
             "requires_enrollment": False,  # Knowledge base is public
         }
         
-        documents.append(
-            Document(
-                page_content=page_content,
-                metadata=_sanitize_metadata(metadata)
-            )
+        document_count += 1
+        yield Document(
+            page_content=page_content,
+            metadata=_sanitize_metadata(metadata)
         )
         
         print(
@@ -468,79 +573,385 @@ def _build_knowledge_documents(
             f"contentLength={len(page_content)} chars"
         )
     
-    print(f"[INGEST] Total knowledge base documents created: {len(documents)}")
-    return documents
+    print(f"[INGEST] Total knowledge base documents created: {document_count}")
+
+
+def _with_lesson_context(
+    transcripts: Iterable[Dict[str, Any]],
+    lesson_map: Dict[str, Dict[str, object]],
+    batch_size: int = _TRANSCRIPT_CONTEXT_BATCH,
+) -> Iterator[Dict[str, Any]]:
+    """Pass transcripts through in batches, adding each batch's lesson context to lesson_map first."""
+    transcripts = iter(transcripts)
+    while True:
+        batch = list(islice(transcripts, batch_size))
+        if not batch:
+            return
+        lesson_map.update(
+            _fetch_lesson_context(str(transcript["lessonId"]) for transcript in batch if transcript.get("lessonId"))
+        )
+        yield from batch
+
+
+@dataclass
+class SourceTiming:
+    """Extraction of one source: documents (or taxonomy entries) produced and time taken"""
+
+    documents: int = 0
+    seconds: float = 0.0
+    # Part of `seconds` spent handing documents on to the chunking/embedding stage
+    blocked_seconds: float = 0.0
+
+
+Taxonomy = Tuple[Dict[Tuple[str, str], List[str]], Dict[Tuple[str, str], List[str]]]
+
+
+def _document_sources(taxonomy: Callable[[], Taxonomy]) -> Dict[str, Callable[[], Iterator[Document]]]:
+    """Document source name -> function streaming its documents; `taxonomy()` returns (tags, labels)."""
+
+    def courses() -> Iterator[Document]:
+        return _build_course_documents(iter_courses(), *taxonomy())
+
+    def lessons() -> Iterator[Document]:
+        return _build_lesson_documents(iter_lessons_with_context(), *taxonomy())
+
+    def transcripts() -> Iterator[Document]:
+        # Lesson context is looked up per batch rather than collected from the
+        # lesson stream, so transcripts don't have to wait for it
+        lesson_map: Dict[str, Dict[str, object]] = {}
+        return _build_transcript_documents(
+            _with_lesson_context(_load_transcript_files(), lesson_map), lesson_map, *taxonomy()
+        )
+
+    def knowledge_base() -> Iterator[Document]:
+        return _build_knowledge_documents(_load_markdown_files())
+
+    return {"courses": courses, "lessons": lessons, "transcripts": transcripts, "knowledge_base": knowledge_base}
+
+
+def _timed(timing: SourceTiming, fetch: Callable[[], Dict[Any, Any]]) -> Dict[Any, Any]:
+    started = time.perf_counter()
+    result = fetch()
+    timing.seconds = time.perf_counter() - started
+    timing.documents = len(result)
+    return result
+
+
+def _iter_sources_sequentially(
+    sources: Dict[str, Callable[[], Iterator[Document]]],
+    timings: Dict[str, SourceTiming],
+) -> Iterator[Document]:
+    for name, source in sources.items():
+        timing = timings[name]
+        started = time.perf_counter()
+        for doc in source():
+            timing.documents += 1
+            handed_off = time.perf_counter()
+            yield doc
+            timing.blocked_seconds += time.perf_counter() - handed_off
+        timing.seconds = time.perf_counter() - started
+
+
+def _iter_sources_concurrently(
+    sources: Dict[str, Callable[[], Iterator[Document]]],
+    timings: Dict[str, SourceTiming],
+    queue_size: int = INGEST_EXTRACT_QUEUE,
+) -> Iterator[Document]:
+    """
+    Run every source in its own thread (each streaming over its own pooled
+    connection) and yield their documents as they arrive. The bounded queue
+    keeps the extractors at most `queue_size` documents ahead of the consumer.
+    """
+    # (source name, document | None when the source is done | the exception it raised)
+    documents: "queue.Queue[Tuple[str, Any]]" = queue.Queue(maxsize=max(1, queue_size))
+    abandoned = threading.Event()
+
+    def put(item: Tuple[str, Any]) -> bool:
+        while not abandoned.is_set():
+            try:
+                documents.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce(name: str, source: Callable[[], Iterator[Document]]) -> None:
+        timing = timings[name]
+        started = time.perf_counter()
+        try:
+            for doc in source():
+                timing.documents += 1
+                handed_off = time.perf_counter()
+                if not put((name, doc)):
+                    return
+                timing.blocked_seconds += time.perf_counter() - handed_off
+        except Exception as e:
+            put((name, e))
+            return
+        finally:
+            timing.seconds = time.perf_counter() - started
+        put((name, None))
+
+    for name, source in sources.items():
+        threading.Thread(target=produce, args=(name, source), name=f"ingest-{name}", daemon=True).start()
+    try:
+        remaining = len(sources)
+        while remaining:
+            name, item = documents.get()
+            if item is None:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise RuntimeError(f"Extracting {name} failed: {item}") from item
+            else:
+                yield item
+    finally:
+        # Stops the other extractors if the consumer gave up or one of them failed
+        abandoned.set()
+
+
+def _log_extraction(timings: Dict[str, SourceTiming], wall_seconds: float) -> None:
+    for name, timing in timings.items():
+        blocked = ""
+        if timing.blocked_seconds >= 0.01:
+            blocked = f" ({timing.blocked_seconds:.2f}s waiting for chunking/embedding)"
+        print(f"[INGEST] Extracted {name}: {timing.documents} in {timing.seconds:.2f}s{blocked}")
+    print(
+        f"[INGEST] Extraction wall time {wall_seconds:.2f}s "
+        f"(sum of sources {sum(timing.seconds for timing in timings.values()):.2f}s)"
+    )
+
+
+def iter_documents(parallel: Optional[bool] = None) -> Iterator[Document]:
+    """
+    Stream raw documents from every source.
+    Courses and lessons are read through server-side cursors and turned into
+    documents row by row; transcripts look up their lesson context in batches.
+
+    With `parallel` (default RAG_INGEST_PARALLEL_EXTRACT) the sources, and the
+    tags and labels they need, are extracted concurrently, each over its own
+    pooled connection, so extraction takes as long as the slowest source
+    rather than their sum. Per-source timings are logged at the end.
+    """
+    if parallel is None:
+        parallel = INGEST_PARALLEL_EXTRACT
+    started = time.perf_counter()
+    timings = {
+        name: SourceTiming() for name in ("tags", "labels", "courses", "lessons", "transcripts", "knowledge_base")
+    }
+
+    if parallel:
+        executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="ingest-taxonomy")
+        tags_future = executor.submit(_timed, timings["tags"], fetch_tags)
+        labels_future = executor.submit(_timed, timings["labels"], fetch_labels)
+        executor.shutdown(wait=False)
+
+        def taxonomy() -> Taxonomy:
+            return tags_future.result(), labels_future.result()
+
+        documents = _iter_sources_concurrently(_document_sources(taxonomy), timings)
+    else:
+        fetched = (_timed(timings["tags"], fetch_tags), _timed(timings["labels"], fetch_labels))
+        documents = _iter_sources_sequentially(_document_sources(lambda: fetched), timings)
+
+    yield from documents
+    _log_extraction(timings, time.perf_counter() - started)
 
 
 def load_documents() -> List[Document]:
-    lessons = fetch_lessons_with_context()
-    courses = fetch_courses()
-    tags = fetch_tags()
-    labels = fetch_labels()
-    
-    # Load transcripts từ thư mục transcripts
-    transcripts = _load_transcript_files()
-    
-    # Load markdown knowledge base files
-    markdown_files = _load_markdown_files()
+    return list(iter_documents())
 
-    documents = []
-    documents.extend(_build_course_documents(courses, tags, labels))
-    documents.extend(_build_lesson_documents(lessons, tags, labels))
-    documents.extend(_build_transcript_documents(transcripts, lessons, tags, labels))
-    documents.extend(_build_knowledge_documents(markdown_files))
-    return documents
 
+def _document_hash(doc: Document) -> str:
+    """Content hash of a raw document (text + metadata), used to detect changes."""
+    payload = json.dumps(
+        {"content": doc.page_content, "metadata": doc.metadata},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-def build_vectorstore() -> Chroma:
-    raw_documents = load_documents()
-    if not raw_documents:
-        raise RuntimeError("No documents fetched from the database for ingestion.")
 
-    print(f"[INGEST] Raw documents fetched: {len(raw_documents)}")
-    
-    # Đếm theo doc_type
-    doc_counts = {}
-    for doc in raw_documents:
+def _chunk_ids(document_id: str, count: int) -> List[str]:
+    """Deterministic chunk ids so a document's chunks can be replaced in place."""
+    return [f"{document_id}::{idx}" for idx in range(count)]
+
+
+def _empty_manifest() -> Dict[str, Any]:
+    return {
+        "version": _MANIFEST_VERSION,
+        "collection": CHROMA_COLLECTION,
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "embedding_model": EMBEDDING_MODEL,
+        "documents": {},
+    }
+
+
+def _load_manifest() -> Dict[str, Any]:
+    """
+    Load the ingestion manifest (document_id -> content hash, last_modified, chunk ids).
+    Returns an empty manifest if it is missing, unreadable or was produced with
+    different collection, chunking or embedding model settings (those require a
+    full rebuild; vectors of two models must not share a collection).
+    """
+    manifest_path = Path(INGEST_MANIFEST_PATH)
+    if not manifest_path.exists():
+        return _empty_manifest()
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except Exception as e:
+        print(f"[INGEST] Failed to read manifest {manifest_path}: {e}")
+        return _empty_manifest()
+
+    expected = _empty_manifest()
+    for key in ("version", "collection", "chunk_size", "chunk_overlap", "embedding_model"):
+        if manifest.get(key) != expected[key]:
+            print(
+                f"[INGEST] Manifest {key} changed "
+                f"({manifest.get(key)} -> {expected[key]}), full rebuild required"
+            )
+            return _empty_manifest()
+    manifest.setdefault("documents", {})
+    return manifest
+
+
+def _save_manifest(manifest: Dict[str, Any]) -> None:
+    """Atomically write the ingestion manifest next to the Chroma data."""
+    manifest_path = Path(INGEST_MANIFEST_PATH)
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = manifest_path.with_suffix(manifest_path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+@dataclass
+class IngestSummary:
+    """Counters of one ingestion/reindex run"""
+
+    seen: Set[str] = field(default_factory=set)
+    doc_counts: Dict[str, int] = field(default_factory=dict)
+    changed: int = 0
+    unchanged: int = 0
+    deleted_chunks: int = 0
+    # document_ids whose chunks were (re)written or removed
+    updated: Set[str] = field(default_factory=set)
+
+
+def _delete_chunks(vector_store: Chroma, chunk_ids: List[str]) -> None:
+    for start in range(0, len(chunk_ids), INGEST_WRITE_BATCH_SIZE):
+        vector_store.delete(ids=chunk_ids[start:start + INGEST_WRITE_BATCH_SIZE])
+
+
+def _preview_document(idx: int, doc: Document) -> None:
+    preview = (doc.page_content or "").strip()
+    if len(preview) > 200:
+        preview = preview[:200].rstrip() + "..."
+
+    doc_info = {
+        "document_id": doc.metadata.get("document_id"),
+        "doc_type": doc.metadata.get("doc_type"),
+        "course_id": doc.metadata.get("course_id"),
+        "lesson_id": doc.metadata.get("lesson_id"),
+        "title": doc.metadata.get("lesson_title") or doc.metadata.get("course_title"),
+        "preview": preview,
+    }
+
+    # Thêm thông tin đặc biệt cho transcript
+    if doc.metadata.get("doc_type") == "transcript":
+        doc_info["transcript_language"] = doc.metadata.get("transcript_language")
+        doc_info["transcript_duration"] = doc.metadata.get("transcript_duration")
+        doc_info["has_translation"] = doc.metadata.get("has_translation")
+
+    print(f"[INGEST] Preview {idx}: {doc_info}")
+
+
+def _iter_changed_chunks(
+    documents: Iterable[Document],
+    text_splitter: RecursiveCharacterTextSplitter,
+    vector_store: Chroma,
+    manifest_documents: Dict[str, Dict[str, Any]],
+    summary: IngestSummary,
+) -> Iterator[Tuple[str, Document]]:
+    """
+    Compare streamed documents against the manifest and yield (chunk_id, chunk)
+    for new/changed documents only. Chunk ids are deterministic, so a changed
+    document's chunks are overwritten in place; only surplus old chunks are deleted.
+    """
+    for doc in documents:
+        document_id = doc.metadata.get("document_id")
+        if not document_id:
+            continue
+        if document_id in summary.seen:
+            print(f"[INGEST] Duplicate document_id={document_id}, keeping first occurrence")
+            continue
+        summary.seen.add(document_id)
+
         doc_type = doc.metadata.get("doc_type", "unknown")
-        doc_counts[doc_type] = doc_counts.get(doc_type, 0) + 1
-    print(f"[INGEST] Document breakdown: {doc_counts}")
-    
-    # Preview một số documents
-    for idx, doc in enumerate(raw_documents[:5], start=1):
-        preview = (doc.page_content or "").strip()
-        if len(preview) > 200:
-            preview = preview[:200].rstrip() + "..."
-        
-        doc_info = {
-            "document_id": doc.metadata.get("document_id"),
-            "doc_type": doc.metadata.get("doc_type"),
-            "course_id": doc.metadata.get("course_id"),
-            "lesson_id": doc.metadata.get("lesson_id"),
-            "title": doc.metadata.get("lesson_title") or doc.metadata.get("course_title"),
-            "preview": preview,
+        summary.doc_counts[doc_type] = summary.doc_counts.get(doc_type, 0) + 1
+        if len(summary.seen) <= 5:
+            _preview_document(len(summary.seen), doc)
+
+        content_hash = _document_hash(doc)
+        entry = manifest_documents.get(document_id)
+        if entry and entry.get("hash") == content_hash:
+            summary.unchanged += 1
+            continue
+
+        chunks = text_splitter.split_documents([doc])
+        chunk_ids = _chunk_ids(document_id, len(chunks))
+        if entry:
+            new_ids = set(chunk_ids)
+            surplus = [chunk_id for chunk_id in entry.get("chunk_ids", []) if chunk_id not in new_ids]
+            if surplus:
+                _delete_chunks(vector_store, surplus)
+                summary.deleted_chunks += len(surplus)
+
+        manifest_documents[document_id] = {
+            "hash": content_hash,
+            "last_modified": doc.metadata.get("last_modified"),
+            "chunk_ids": chunk_ids,
+            "chunk_keys": [content_key(EMBEDDING_MODEL, chunk.page_content) for chunk in chunks],
         }
-        
-        # Thêm thông tin đặc biệt cho transcript
-        if doc.metadata.get("doc_type") == "transcript":
-            doc_info["transcript_language"] = doc.metadata.get("transcript_language")
-            doc_info["transcript_duration"] = doc.metadata.get("transcript_duration")
-            doc_info["has_translation"] = doc.metadata.get("has_translation")
-        
-        print(f"[INGEST] Preview {idx}: {doc_info}")
+        summary.changed += 1
+        summary.updated.add(document_id)
+        yield from zip(chunk_ids, chunks)
+
 
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+def _drop_documents(
+    vector_store: Chroma,
+    manifest_documents: Dict[str, Dict[str, Any]],
+    document_ids: Iterable[str],
+) -> int:
+    """Delete the chunks of the given documents and forget them; returns chunks deleted."""
+    stale_chunk_ids: List[str] = []
+    for document_id in document_ids:
+        entry = manifest_documents.pop(document_id, None)
+        if entry:
+            stale_chunk_ids.extend(entry.get("chunk_ids", []))
+    if stale_chunk_ids:
+        _delete_chunks(vector_store, stale_chunk_ids)
+    return len(stale_chunk_ids)
+
+
+def _text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
         chunk_size=CHUNK_SIZE,
         chunk_overlap=CHUNK_OVERLAP,
     )
-    doc_splits = text_splitter.split_documents(raw_documents)
-    print(f"[INGEST] Chunks generated: {len(doc_splits)}")
 
-    embedding = FastEmbedEmbeddings()
-    # Reset collection before re-ingesting
+
+def _open_embedding_cache() -> Optional[EmbeddingCache]:
+    # Opened per run: the cache files may have been extended by another process since
+    return EmbeddingCache(EMBED_CACHE_DIR, EMBEDDING_MODEL) if EMBED_CACHE_ENABLED else None
+
+
+def _drop_collection(name: str, embedding: FastEmbedEmbeddings) -> None:
     try:
         Chroma(
-            collection_name=CHROMA_COLLECTION,
+            collection_name=name,
             persist_directory=CHROMA_PERSIST_DIR,
             embedding_function=embedding,
         ).delete_collection()
@@ -548,18 +959,455 @@ def build_vectorstore() -> Chroma:
         # Collection may not exist yet on first run
         pass
 
-    vector_store = Chroma.from_documents(
-        documents=doc_splits,
+
+def _swap_in_collection(staging: Chroma, embedding: FastEmbedEmbeddings) -> Chroma:
+    """
+    Make the fully built staging collection the live one. The replaced collection
+    is renamed rather than deleted, so processes still holding it (they reopen on
+    the index version bump) keep answering; it is dropped by the next full rebuild.
+    """
+    previous_name = CHROMA_COLLECTION + _PREVIOUS_SUFFIX
+    _drop_collection(previous_name, embedding)
+    try:
+        live = staging._client.get_collection(CHROMA_COLLECTION, embedding_function=None)
+    except ValueError:
+        live = None  # First build
+    if live is not None:
+        live.modify(name=previous_name)
+    staging._collection.modify(name=CHROMA_COLLECTION)
+    return Chroma(
         collection_name=CHROMA_COLLECTION,
-        embedding=embedding,
         persist_directory=CHROMA_PERSIST_DIR,
+        embedding_function=embedding,
+    )
+
+
+def _evict_embedding_cache(cache: EmbeddingCache, manifest_documents: Dict[str, Dict[str, Any]]) -> None:
+    """Evict cached vectors that no chunk of the current index refers to."""
+    keep_keys: Set[str] = set()
+    for document_id, entry in manifest_documents.items():
+        if "chunk_keys" not in entry:
+            print(f"[EMBED CACHE] Manifest entry {document_id} has no chunk keys, skipping eviction")
+            return
+        keep_keys.update(entry["chunk_keys"])
+    cache.evict(keep_keys)
+
+
+def build_vectorstore(
+    full_rebuild: Optional[bool] = None,
+    evict_cache: Optional[bool] = None,
+) -> Chroma:
+    """
+    Build or update the persisted Chroma collection.
+
+    In incremental mode (default, RAG_INGEST_MODE=incremental) the manifest of
+    document_id -> content hash is compared with the freshly loaded documents and
+    only new/changed documents are re-chunked and re-embedded; chunks of documents
+    whose source row or file disappeared are deleted. A full rebuild builds a new
+    collection and swaps it in once complete, so the API never sees a missing or
+    half-built collection.
+
+    Chunk vectors come from the on-disk embedding cache when the same text (for
+    the same model) was embedded before, so even a full rebuild only embeds new text.
+
+    Args:
+        full_rebuild: Force (True) or skip (False) a full rebuild. Defaults to RAG_INGEST_MODE.
+        evict_cache: Evict cached vectors not referenced by the index afterwards.
+            Defaults to RAG_EMBED_CACHE_EVICT.
+    """
+    if full_rebuild is None:
+        full_rebuild = INGEST_MODE == "full"
+    if evict_cache is None:
+        evict_cache = EMBED_CACHE_EVICT
+
+    with _ingest_lock:
+        return _build_vectorstore(full_rebuild, evict_cache)
+
+
+def _build_vectorstore(full_rebuild: bool, evict_cache: bool) -> Chroma:
+    documents = iter_documents()
+    first_document = next(documents, None)
+    if first_document is None:
+        raise RuntimeError("No documents fetched from the database for ingestion.")
+    documents = chain([first_document], documents)
+
+    text_splitter = _text_splitter()
+    embedding = get_embedding()
+
+    manifest = _empty_manifest() if full_rebuild else _load_manifest()
+    rebuild = full_rebuild or not manifest["documents"]
+    collection_name = CHROMA_COLLECTION
+    if rebuild:
+        # Nothing to diff against: build a new collection next to the live one,
+        # which keeps serving the API until the new one is swapped in
+        collection_name = CHROMA_COLLECTION + _REBUILD_SUFFIX
+        print(f"[INGEST] Full rebuild into '{collection_name}'")
+        _drop_collection(collection_name, embedding)  # Left over by a failed rebuild
+        manifest = _empty_manifest()
+
+    vector_store = Chroma(
+        collection_name=collection_name,
+        persist_directory=CHROMA_PERSIST_DIR,
+        embedding_function=embedding,
+    )
+    if manifest["documents"] and vector_store._collection.count() == 0:
+        # Manifest survived but the collection did not (e.g. volume wiped)
+        print("[INGEST] Manifest found but collection is empty, re-ingesting everything")
+        manifest = _empty_manifest()
+
+    # Stream: source rows -> documents -> changed chunks -> batched embedding -> collection
+    manifest_documents: Dict[str, Dict[str, Any]] = manifest["documents"]
+    summary = IngestSummary()
+    cache = _open_embedding_cache()
+    stats = EmbeddingPipeline(vector_store, embedding, cache=cache).run(
+        _iter_changed_chunks(documents, text_splitter, vector_store, manifest_documents, summary)
+    )
+    print(f"[INGEST] Raw documents fetched: {len(summary.seen)}")
+    print(f"[INGEST] Document breakdown: {summary.doc_counts}")
+
+    # Drop chunks of documents whose source row or file disappeared
+    removed_ids = [document_id for document_id in manifest_documents if document_id not in summary.seen]
+    summary.deleted_chunks += _drop_documents(vector_store, manifest_documents, removed_ids)
+
+    if rebuild:
+        vector_store = _swap_in_collection(vector_store, embedding)
+        print(f"[INGEST] Swapped '{collection_name}' in as '{CHROMA_COLLECTION}'")
+        # A handle opened by this process still points at the replaced collection
+        _reopen_vectorstore()
+    _save_manifest(manifest)
+    _notify_index_changed(None)
+    if cache is not None and evict_cache:
+        _evict_embedding_cache(cache, manifest_documents)
+    print(
+        f"[INGEST] Collection updated | new_or_changed={summary.changed} | "
+        f"removed={len(removed_ids)} | unchanged={summary.unchanged} | "
+        f"chunks_written={stats.chunks} | chunks_deleted={summary.deleted_chunks} | "
+        f"total_documents={len(manifest_documents)}"
     )
     return vector_store
 
 
-vectorstore = build_vectorstore()
-retriever = vectorstore.as_retriever(search_kwargs={"k": 7})
+def reindex_documents(
+    documents: Iterable[Document],
+    removed_document_ids: Iterable[str] = (),
+) -> IngestSummary:
+    """
+    Hot-update the live collection with a subset of documents.
+
+    Only documents whose content hash differs from the manifest are re-chunked and
+    re-embedded (in-process, through the embedding cache); their chunks are upserted
+    under the same deterministic ids, so queries never see a missing document.
+    Documents listed in `removed_document_ids` (and not re-supplied) are deleted.
+    """
+    with _ingest_lock:
+        vector_store = get_vectorstore()
+        manifest = _load_manifest()
+        manifest_documents: Dict[str, Dict[str, Any]] = manifest["documents"]
+        summary = IngestSummary()
+        stats = EmbeddingPipeline(
+            vector_store, get_embedding(), workers=1, cache=_open_embedding_cache()
+        ).run(_iter_changed_chunks(documents, _text_splitter(), vector_store, manifest_documents, summary))
+
+        removed_ids = [
+            document_id for document_id in removed_document_ids
+            if document_id in manifest_documents and document_id not in summary.seen
+        ]
+        summary.deleted_chunks += _drop_documents(vector_store, manifest_documents, removed_ids)
+        summary.updated.update(removed_ids)
+        _save_manifest(manifest)
+        if summary.updated:
+            _notify_index_changed(summary.updated)
+
+    print(
+        f"[INGEST] Reindexed | new_or_changed={summary.changed} | removed={len(removed_ids)} | "
+        f"unchanged={summary.unchanged} | chunks_written={stats.chunks} | "
+        f"chunks_deleted={summary.deleted_chunks}"
+    )
+    return summary
+
+
+def _fetch_lesson_context(lesson_ids: Iterable[str]) -> Dict[str, Dict[str, object]]:
+    lesson_index: Dict[str, Dict[str, object]] = {}
+    for _ in _collect_lesson_context(fetch_lessons_with_context_by_ids(sorted(lesson_ids)), lesson_index):
+        pass
+    return lesson_index
+
+
+def reindex_files(
+    knowledge_files: Iterable[Path] = (),
+    transcript_files: Iterable[Path] = (),
+    removed_document_ids: Iterable[str] = (),
+) -> IngestSummary:
+    """
+    Re-parse the given knowledge base / transcript files and hot-swap their chunks
+    into the live collection (see reindex_documents). Used by the source watcher.
+    """
+    markdown_files = [data for data in map(_load_markdown_file, knowledge_files) if data]
+    transcripts = [data for data in map(_load_transcript_file, transcript_files) if data]
+
+    documents: Iterable[Document] = _build_knowledge_documents(markdown_files)
+    if transcripts:
+        # Transcripts carry lesson/course context and taxonomy from the database
+        lesson_map = _fetch_lesson_context(
+            str(transcript["lessonId"]) for transcript in transcripts if transcript.get("lessonId")
+        )
+        documents = chain(
+            documents,
+            _build_transcript_documents(transcripts, lesson_map, fetch_tags(), fetch_labels()),
+        )
+    return reindex_documents(documents, removed_document_ids)
+
+
+def reindex_content(
+    course_ids: Iterable[str] = (),
+    chapter_ids: Iterable[str] = (),
+    lesson_ids: Iterable[str] = (),
+) -> IngestSummary:
+    """
+    Rebuild the course documents of `course_ids` and the lesson documents of
+    `lesson_ids` and of every lesson in `chapter_ids` / `course_ids` from the
+    database, and hot-swap their chunks into the live collection (see
+    reindex_documents). Courses and lessons that no longer exist, or no longer
+    produce a document, are removed from the index, and lessons indexed under
+    `chapter_ids` / `course_ids` that moved elsewhere are rebuilt with their new
+    context, so no deletion trigger is needed. Used by the change feed.
+    """
+    course_ids, chapter_ids, lesson_ids = sorted(set(course_ids)), sorted(set(chapter_ids)), sorted(set(lesson_ids))
+    courses = fetch_courses_by_ids(course_ids)
+    lessons = list(fetch_lessons_with_context_for(lesson_ids, chapter_ids, course_ids))
+
+    # Lessons indexed under these chapters / courses that are no longer in them were
+    # moved elsewhere (rebuilt with their new context) or deleted (dropped below)
+    left_ids = _indexed_lesson_ids_under(chapter_ids, course_ids) - {
+        str(lesson["lesson_id"]) for lesson in lessons if lesson.get("lesson_id")
+    }
+    if left_ids:
+        _, existing_lesson_ids = fetch_content_ids()
+        moved_ids = sorted(left_ids & existing_lesson_ids)
+        if moved_ids:
+            lessons.extend(fetch_lessons_with_context_for(moved_ids, [], []))
+
+    # Lesson documents carry the taxonomy of their chapter and course as well
+    entity_ids = set(course_ids)
+    for lesson in lessons:
+        entity_ids.update(str(lesson[key]) for key in ("lesson_id", "chapter_id", "course_id") if lesson.get(key))
+    tags = fetch_tags(sorted(entity_ids))
+    labels = fetch_labels(sorted(entity_ids))
+
+    documents = chain(
+        _build_course_documents(courses, tags, labels),
+        _build_lesson_documents(lessons, tags, labels),
+    )
+    # Dropped unless rebuilt above
+    stale_ids = (
+        [f"course:{course_id}" for course_id in course_ids]
+        + [f"lesson:{lesson_id}" for lesson_id in lesson_ids]
+        + [f"lesson:{lesson['lesson_id']}" for lesson in lessons if lesson.get("lesson_id")]
+        + [f"lesson:{lesson_id}" for lesson_id in sorted(left_ids)]
+    )
+    return reindex_documents(documents, stale_ids)
+
+
+def _indexed_lesson_ids_under(chapter_ids: List[str], course_ids: List[str]) -> Set[str]:
+    """Lessons whose indexed document places them in one of `chapter_ids` / `course_ids`."""
+    clauses: List[Dict[str, Any]] = []
+    if chapter_ids:
+        clauses.append({"chapter_id": {"$in": chapter_ids}})
+    if course_ids:
+        clauses.append({"course_id": {"$in": course_ids}})
+    if not clauses:
+        return set()
+    where = {"$and": [{"doc_type": "lesson"}, clauses[0] if len(clauses) == 1 else {"$or": clauses}]}
+    batch = get_vectorstore()._collection.get(where=where, include=["metadatas"])
+    return {metadata["lesson_id"] for metadata in batch["metadatas"] if metadata.get("lesson_id")}
+
+
+def indexed_document_ids() -> Set[str]:
+    """document_ids currently in the collection (according to the manifest)."""
+    with _ingest_lock:
+        return set(_load_manifest()["documents"])
+
+
+# Serializes writers of the collection + manifest (full ingestion, hot reindex),
+# across threads and processes
+_ingest_lock = FileLock(os.path.join(CHROMA_PERSIST_DIR, "ingest.lock"))
+_index_version = 0
+_index_listeners: List[Callable[[Optional[Set[str]]], None]] = []
+# Last on-disk index version this process has applied (None: not read yet)
+_disk_version: Optional[int] = None
+_disk_version_lock = threading.Lock()
+
+
+def add_index_listener(listener: Callable[[Optional[Set[str]]], None]) -> None:
+    """
+    Register `listener(document_ids)`, called after writes to the collection with the
+    document_ids whose chunks changed, or None when the whole collection was rebuilt.
+    Writes by other processes are reported through sync_index_version().
+    """
+    _index_listeners.append(listener)
+
+
+def index_version() -> int:
+    """Incremented on every write to the collection (for caches derived from it)."""
+    return _index_version
+
+
+def _read_index_version() -> Tuple[int, Optional[List[str]]]:
+    """(version, document_ids of the last write or None) from INDEX_VERSION_PATH."""
+    try:
+        with open(INDEX_VERSION_PATH, "r", encoding="utf-8") as f:
+            record = json.load(f)
+        return int(record["version"]), record.get("document_ids")
+    except FileNotFoundError:
+        return 0, None
+    except Exception as e:
+        print(f"[INDEX] Failed to read index version {INDEX_VERSION_PATH}: {e}")
+        return 0, None
+
+
+def _write_index_version(version: int, document_ids: Optional[Set[str]]) -> None:
+    path = Path(INDEX_VERSION_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "document_ids": None if document_ids is None else sorted(document_ids)}, f)
+    os.replace(tmp_path, path)
+
+
+def _call_index_listeners(document_ids: Optional[Set[str]]) -> None:
+    global _index_version
+    _index_version += 1
+    for listener in list(_index_listeners):
+        try:
+            listener(document_ids)
+        except Exception as e:
+            print(f"[INDEX] Index listener failed: {e}")
+
+
+def _notify_index_changed(document_ids: Optional[Set[str]]) -> None:
+    """Publish a write to the collection; called with _ingest_lock held."""
+    global _disk_version
+    with _disk_version_lock:
+        version = _read_index_version()[0] + 1
+        try:
+            _write_index_version(version, document_ids)
+            _disk_version = version
+        except OSError as e:
+            print(f"[INDEX] Failed to write index version {INDEX_VERSION_PATH}: {e}")
+    _call_index_listeners(document_ids)
+
+
+def sync_index_version() -> bool:
+    """
+    Apply writes made by other processes since the last call: reopen the
+    collection (Chroma only loads the vector index of a collection once per
+    process) and notify the index listeners. Returns True if anything changed.
+    """
+    global _disk_version
+    with _disk_version_lock:
+        version, document_ids = _read_index_version()
+        previous, _disk_version = _disk_version, version
+    if previous is None or version == previous:
+        # First read: nothing derived from an older version was loaded yet
+        return False
+    print(f"[INDEX] Index version {previous} -> {version} written by another process, reloading")
+    _reopen_vectorstore()
+    # Only the last write's documents are known; after several, reload everything
+    changed = set(document_ids) if document_ids is not None and version == previous + 1 else None
+    _call_index_listeners(changed)
+    return True
+
+
+_embedding: Optional[FastEmbedEmbeddings] = None
+_embedding_lock = threading.Lock()
+_vectorstore: Optional[Chroma] = None
+_vectorstore_lock = threading.Lock()
+_vectorstore_error: Optional[str] = None
+
+
+def get_embedding() -> FastEmbedEmbeddings:
+    """Shared FastEmbed model (loading the ONNX model is expensive, do it once)."""
+    global _embedding
+    if _embedding is None:
+        with _embedding_lock:
+            if _embedding is None:
+                _embedding = FastEmbedEmbeddings(model_name=EMBEDDING_MODEL)
+    return _embedding
+
+
+def open_vectorstore() -> Chroma:
+    """
+    Open the persisted Chroma collection without (re)building it.
+    The index is built by the separate ingest entry point (ingest.py / run_ingest.py).
+
+    Raises:
+        RuntimeError: If the collection does not exist in CHROMA_PERSIST_DIR yet.
+    """
+    try:
+        vector_store = Chroma(
+            collection_name=CHROMA_COLLECTION,
+            persist_directory=CHROMA_PERSIST_DIR,
+            embedding_function=get_embedding(),
+            create_collection_if_not_exists=False,
+        )
+    except Exception as e:
+        raise RuntimeError(
+            f"Vector index '{CHROMA_COLLECTION}' not found in {CHROMA_PERSIST_DIR}. "
+            f"Run the ingest entry point first (python run_ingest.py). Cause: {e}"
+        ) from e
+
+    count = vector_store._collection.count()
+    if count == 0:
+        print(f"[INDEX] Warning: collection '{CHROMA_COLLECTION}' is empty")
+    print(f"[INDEX] Opened collection '{CHROMA_COLLECTION}' ({count} chunks) from {CHROMA_PERSIST_DIR}")
+    return vector_store
+
+
+def get_vectorstore() -> Chroma:
+    """Lazily open the persisted collection on first use (thread-safe)."""
+    global _vectorstore, _vectorstore_error, _disk_version
+    if _vectorstore is None:
+        with _vectorstore_lock:
+            if _vectorstore is None:
+                try:
+                    with _disk_version_lock:
+                        if _disk_version is None:
+                            # Writes after this point are picked up by sync_index_version()
+                            _disk_version = _read_index_version()[0]
+                    _vectorstore = open_vectorstore()
+                    _vectorstore_error = None
+                except Exception as e:
+                    _vectorstore_error = str(e)
+                    raise
+    return _vectorstore
+
+
+def _reopen_vectorstore() -> None:
+    """Reload the opened collection from disk (no-op if it was never opened)."""
+    global _vectorstore, _vectorstore_error
+    with _vectorstore_lock:
+        if _vectorstore is None:
+            return
+        # Chroma shares one in-memory system (and vector index) per persist directory;
+        # forget it so the collection is reopened from disk. Queries still running on
+        # the old handle keep using the old system.
+        SharedSystemClient._identifer_to_system.pop(_vectorstore._client._identifier, None)
+        try:
+            _vectorstore = open_vectorstore()
+            _vectorstore_error = None
+        except Exception as e:
+            print(f"[INDEX] Failed to reopen vector index: {e}")
+            _vectorstore, _vectorstore_error = None, str(e)
+
+
+def get_retriever(k: int = 7):
+    return get_vectorstore().as_retriever(search_kwargs={"k": k})
+
+
+def is_index_ready() -> bool:
+    return _vectorstore is not None
+
 
-# Note: langchain_chroma does not support 'where' filter in search_kwargs
-# Metadata filtering is done in retrieve.py node using post-filter approach
-# This is still efficient as it filters after retrieval but before batch grading
+def index_error() -> Optional[str]:
+    """Last error raised while opening the index, if any."""
+    return _vectorstore_error
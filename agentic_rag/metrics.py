@@ -0,0 +1,333 @@
+"""
+Prometheus metrics for the API (`GET /metrics`, text exposition format 0.0.4).
+
+Latency histograms and decision counters are fed by the tracing spans
+(tracing.add_span_listener), so every instrumented step is measured whether or
+not the request is traced:
+    node        rag_node_duration_seconds{node}
+    edge        rag_edge_duration_seconds{edge}, rag_decisions_total{edge, decision}
+    llm         rag_llm_call_duration_seconds{chain}, rag_rate_limit_wait_seconds
+    retrieval   rag_retrieval_duration_seconds{method}
+    rerank      rag_rerank_duration_seconds
+    db          rag_db_query_duration_seconds{query}
+    db_connect  rag_db_connect_duration_seconds
+    cdc         rag_cdc_reindex_duration_seconds, rag_cdc_freshness_seconds
+Failed spans count in rag_errors_total{kind, name}. track_request() adds the
+request latency and the number of LLM calls per question. Cache, rate limiter
+and database pool counters are read from their stats() when scraped.
+
+Values are per process: with several uvicorn workers, each is scraped separately.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from answer_cache import get_answer_cache
+from change_feed import change_feed_stats
+from course_catalog import get_course_catalog
+from database import pool_stats
+from enrollment_cache import get_enrollment_cache
+from graph.chains.llm_config import llm_cache_stats, rate_limiter
+from tracing import Span, add_span_listener
+
+METRICS_ENABLED = os.getenv("RAG_METRICS", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+WAIT_BUCKETS = (0.0, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15)
+FRESHNESS_BUCKETS = (1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+Labels = Tuple[str, ...]
+# (metric name suffix, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    value = float(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render_family(name: str, kind: str, help_text: str, samples: Sequence[Sample]) -> List[str]:
+    """Exposition lines of one metric family; `samples` are (name suffix, labels, value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for suffix, labels, value in samples:
+        label_text = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels.items())
+        if label_text:
+            label_text = "{" + label_text + "}"
+        lines.append(f"{name}{suffix}{label_text} {_format_value(value)}")
+    return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return render_family(
+            self.name, "counter", self.help_text,
+            [("", dict(zip(self.labelnames, key)), value) for key, value in values],
+        )
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # labels -> (per-bucket counts, sum, count)
+        self._values: Dict[Labels, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total, count = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            self._values[key] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, (list(value[0]), value[1], value[2])) for key, value in self._values.items())
+        samples: List[Sample] = []
+        for key, (counts, total, count) in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            samples.append(("_bucket", {**labels, "le": "+Inf"}, count))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, count))
+        return render_family(self.name, "histogram", self.help_text, samples)
+
+
+NODE_DURATION = Histogram("rag_node_duration_seconds", "Graph node latency", ["node"])
+EDGE_DURATION = Histogram(
+    "rag_edge_duration_seconds", "Graph routing/grading edge latency (includes their LLM calls)", ["edge"]
+)
+DECISIONS = Counter(
+    "rag_decisions_total",
+    "Graph edge decisions (route_question: greeting/reject/retrieve/web_search; "
+    "grade_generation_grounded_in_documents_and_question: not_supported = regeneration)",
+    ["edge", "decision"],
+)
+LLM_CALL_DURATION = Histogram(
+    "rag_llm_call_duration_seconds", "LLM call latency per chain, rate limit wait included", ["chain"]
+)
+RATE_LIMIT_WAIT = Histogram("rag_rate_limit_wait_seconds", "Wait for an LLM rate limit slot", buckets=WAIT_BUCKETS)
+RETRIEVAL_DURATION = Histogram("rag_retrieval_duration_seconds", "Filtered vector / hybrid search latency", ["method"])
+RERANK_DURATION = Histogram("rag_rerank_duration_seconds", "Cross-encoder reranking latency")
+DB_QUERY_DURATION = Histogram("rag_db_query_duration_seconds", "Database query latency", ["query"])
+DB_CONNECT_DURATION = Histogram("rag_db_connect_duration_seconds", "Time to get a database connection")
+ERRORS = Counter("rag_errors_total", "Failed nodes, edges, LLM calls, searches and queries", ["kind", "name"])
+REQUEST_DURATION = Histogram("rag_request_duration_seconds", "Question latency per endpoint", ["endpoint"])
+LLM_CALLS_PER_REQUEST = Histogram(
+    "rag_llm_calls_per_request", "LLM calls made to answer one question", buckets=COUNT_BUCKETS
+)
+CDC_REINDEX_DURATION = Histogram("rag_cdc_reindex_duration_seconds", "Reindex of the documents of changed rows")
+CDC_FRESHNESS = Histogram(
+    "rag_cdc_freshness_seconds", "Time from a database edit to its documents being reindexed",
+    buckets=FRESHNESS_BUCKETS,
+)
+
+_METRICS = (
+    NODE_DURATION,
+    EDGE_DURATION,
+    DECISIONS,
+    LLM_CALL_DURATION,
+    RATE_LIMIT_WAIT,
+    RETRIEVAL_DURATION,
+    RERANK_DURATION,
+    DB_QUERY_DURATION,
+    DB_CONNECT_DURATION,
+    ERRORS,
+    REQUEST_DURATION,
+    LLM_CALLS_PER_REQUEST,
+    CDC_REINDEX_DURATION,
+    CDC_FRESHNESS,
+)
+
+# LLM calls of the current request (a one-element list shared with the run's threads and tasks)
+_request_llm_calls: contextvars.ContextVar[Optional[List[int]]] = contextvars.ContextVar(
+    "rag_request_llm_calls", default=None
+)
+
+
+def _observe_span(span_: Span) -> None:
+    seconds = (span_.duration_ms or 0.0) / 1000
+    kind = span_.kind
+    if span_.error is not None:
+        ERRORS.inc(kind=kind, name=span_.name)
+    if kind == "node":
+        NODE_DURATION.observe(seconds, node=span_.name)
+    elif kind == "edge":
+        EDGE_DURATION.observe(seconds, edge=span_.name)
+        if "decision" in span_.attributes:
+            DECISIONS.inc(edge=span_.name, decision=span_.attributes["decision"])
+    elif kind == "llm":
+        LLM_CALL_DURATION.observe(seconds, chain=span_.name)
+        if "rate_limit_wait_s" in span_.attributes:
+            RATE_LIMIT_WAIT.observe(span_.attributes["rate_limit_wait_s"])
+        calls = _request_llm_calls.get()
+        if calls is not None:
+            calls[0] += 1
+    elif kind == "retrieval":
+        RETRIEVAL_DURATION.observe(seconds, method=span_.name)
+    elif kind == "rerank":
+        RERANK_DURATION.observe(seconds)
+    elif kind == "db":
+        DB_QUERY_DURATION.observe(seconds, query=span_.name)
+    elif kind == "db_connect":
+        DB_CONNECT_DURATION.observe(seconds)
+    elif kind == "cdc":
+        CDC_REINDEX_DURATION.observe(seconds)
+        if "freshness_s" in span_.attributes:
+            CDC_FRESHNESS.observe(span_.attributes["freshness_s"])
+
+
+if METRICS_ENABLED:
+    add_span_listener(_observe_span)
+
+
+@contextmanager
+def track_request(endpoint: str) -> Iterator[None]:
+    """Measure a question's latency and LLM call count under `endpoint`."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    calls = [0]
+    token = _request_llm_calls.set(calls)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _request_llm_calls.reset(token)
+        REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+        LLM_CALLS_PER_REQUEST.observe(calls[0])
+
+
+def _stats_lines() -> List[str]:
+    """Counters kept by the caches and the rate limiter themselves."""
+    lines: List[str] = []
+    llm_cache = llm_cache_stats()
+    for field in ("hits", "misses"):
+        lines += render_family(
+            f"rag_llm_cache_{field}_total", "counter", f"LLM response cache {field} per chain",
+            [("", {"chain": chain}, stats[field]) for chain, stats in sorted(llm_cache.items())],
+        )
+    answer_cache = get_answer_cache().stats()
+    enrollments = get_enrollment_cache().stats()
+    limiter = rate_limiter.stats()
+    for name, kind, help_text, value in (
+        ("rag_answer_cache_hits_total", "counter", "Semantic answer cache hits", answer_cache["hits"]),
+        ("rag_answer_cache_misses_total", "counter", "Semantic answer cache misses", answer_cache["misses"]),
+        ("rag_answer_cache_entries", "gauge", "Semantic answer cache entries", answer_cache["entries"]),
+        ("rag_enrollment_cache_hits_total", "counter", "Enrollment cache hits", enrollments["hits"]),
+        ("rag_enrollment_cache_misses_total", "counter", "Enrollment cache misses", enrollments["misses"]),
+        ("rag_enrollment_cache_invalidations_total", "counter", "Enrollment cache invalidations",
+         enrollments["invalidations"]),
+        ("rag_enrollment_cache_entries", "gauge", "Enrollment cache entries", enrollments["entries"]),
+        ("rag_rate_limiter_acquired_total", "counter", "LLM rate limit slots taken", limiter["acquired"]),
+        ("rag_rate_limiter_waited_total", "counter", "LLM rate limit slots that had to wait", limiter["waited"]),
+        ("rag_rate_limiter_wait_seconds_total", "counter", "Total wait for LLM rate limit slots",
+         limiter["total_wait_seconds"]),
+        ("rag_rate_limiter_max_wait_seconds", "gauge", "Longest wait for an LLM rate limit slot",
+         limiter["max_wait_seconds"]),
+    ):
+        lines += render_family(name, kind, help_text, [("", {}, value)])
+    catalog = get_course_catalog().stats()
+    lines += render_family(
+        "rag_course_catalog_rows", "gauge", "Rows held by the in-memory course catalog",
+        [("", {"table": table}, catalog[table]) for table in ("courses", "chapters", "lessons")],
+    )
+    for field, help_text in (
+        ("full_loads", "Full course catalog loads"),
+        ("incremental_refreshes", "Incremental course catalog refreshes"),
+        ("rebuilt_courses", "Courses rebuilt by course catalog refreshes"),
+        ("refresh_errors", "Failed course catalog refreshes"),
+    ):
+        lines += render_family(f"rag_course_catalog_{field}_total", "counter", help_text, [("", {}, catalog[field])])
+    feed = change_feed_stats()
+    for field, help_text in (
+        ("polls", "Change feed polls"),
+        ("notifications", "Change notifications received"),
+        ("changed_rows", "Changed database rows applied by the change feed"),
+        ("reindexed_documents", "Documents rewritten or removed by the change feed"),
+        ("reconciled_documents", "Documents of deleted rows removed by change feed reconciliation"),
+        ("failures", "Failed change feed reindexes"),
+    ):
+        lines += render_family(f"rag_cdc_{field}_total", "counter", help_text, [("", {}, feed[field])])
+    pool = pool_stats()
+    lines += render_family(
+        "rag_db_pool_connections", "gauge", "Pooled database connections",
+        [("", {"state": state}, pool[state]) for state in ("idle", "in_use")],
+    )
+    lines += render_family("rag_db_pool_max_connections", "gauge", "Database pool size limit",
+                           [("", {}, pool["max_size"])])
+    for field, help_text in (
+        ("opened", "Database connections opened"),
+        ("closed", "Database connections closed (idle, broken or failed health check)"),
+        ("checkouts", "Database connections handed out"),
+        ("waits", "Checkouts that waited for a free connection"),
+        ("timeouts", "Checkouts that found no free connection in time"),
+        ("failed_health_checks", "Pooled connections replaced after a failed health check"),
+        ("connect_failures", "Failed connection attempts"),
+    ):
+        lines += render_family(f"rag_db_pool_{field}_total", "counter", help_text, [("", {}, pool[field])])
+    lines += render_family("rag_db_pool_wait_seconds_total", "counter", "Total wait for a free database connection",
+                           [("", {}, pool["wait_seconds"])])
+    return lines
+
+
+_collectors: List[Callable[[], List[str]]] = [_stats_lines]
+
+
+def add_collector(collector: Callable[[], List[str]]) -> None:
+    """Add exposition lines computed at scrape time (see render_family)."""
+    _collectors.append(collector)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines += metric.render()
+    for collector in _collectors:
+        try:
+            lines += collector()
+        except Exception as e:
+            print(f"[METRICS] Collector failed: {e}")
+    return "\n".join(lines) + "\n"
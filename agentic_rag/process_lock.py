@@ -0,0 +1,136 @@
+"""
+Locks shared by the processes serving one index (uvicorn workers, ingest.py).
+
+FileLock serializes writers of the Chroma collection and ingestion manifest
+across threads and processes (flock on a file next to the Chroma data).
+LeaderElection runs background components that must exist once per
+deployment, not once per worker (source watcher, change feed), in whichever
+process holds the leader lock; the others take over if the leader exits.
+
+flock is not available on Windows; there the locks only cover the threads of
+one process, so run a single worker.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Optional, Protocol, Sequence
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class FileLock:
+    """Exclusive lock held across the threads of this process and across processes locking `path`."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._fd: Optional[int] = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        if not self._thread_lock.acquire(blocking):
+            return False
+        try:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            if fcntl is not None:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    os.close(fd)
+                    self._thread_lock.release()
+                    return False
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        self._fd = fd
+        return True
+
+    def release(self) -> None:
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._thread_lock.release()
+
+    def locked(self) -> bool:
+        """Whether this process holds the lock."""
+        return self._fd is not None
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+class Component(Protocol):
+    def start(self) -> None: ...
+
+    def stop(self) -> None: ...
+
+
+class LeaderElection:
+    """
+    Start `components` once this process holds the lock at `path`.
+
+    Processes that do not get the lock retry every `interval` seconds, so a
+    worker takes over when the leader exits (the OS releases flock locks of
+    dead processes). stop() stops the components and releases the lock.
+    """
+
+    def __init__(self, path: str, components: Sequence[Component], interval: float = 10.0) -> None:
+        self.components = list(components)
+        self.interval = interval
+        self._lock = FileLock(path)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock.locked()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+        if self.is_leader:
+            for component in self.components:
+                component.stop()
+            self._lock.release()
+            print("[LEADER] Released leadership")
+
+    def try_acquire(self) -> bool:
+        """Take the lock if it is free and start the components; True if this process leads."""
+        if self.is_leader:
+            return True
+        if not self._lock.acquire(blocking=False):
+            return False
+        print(f"[LEADER] Process {os.getpid()} is the leader, starting {len(self.components)} components")
+        for component in self.components:
+            component.start()
+        return True
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.try_acquire():
+                    return
+            except Exception as e:
+                print(f"[LEADER] Leader election failed: {e}")
+            self._stop.wait(self.interval)
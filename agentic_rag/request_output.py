@@ -0,0 +1,65 @@
+"""
+Per-request capture of print() output for the API / UI `trace`.
+
+contextlib.redirect_stdout swaps the process-wide sys.stdout, so with concurrent
+requests (async endpoints, thread pools) every request's prints end up in
+whichever buffer was installed last, and overlapping exits can leave sys.stdout
+pointing at a finished request's buffer. Instead sys.stdout is replaced once by a
+proxy that writes to the buffer of the current context (a context variable, which
+asyncio tasks, asyncio.to_thread and LangGraph's node executor all inherit) and
+to the real stdout otherwise.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import io
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional, TextIO
+
+_buffer: contextvars.ContextVar[Optional[io.StringIO]] = contextvars.ContextVar("rag_output_buffer", default=None)
+_install_lock = threading.Lock()
+
+
+class _ContextStdout(io.TextIOBase):
+    def __init__(self, stdout: TextIO) -> None:
+        self._stdout = stdout
+
+    def _target(self) -> TextIO:
+        return _buffer.get() or self._stdout
+
+    def write(self, text: str) -> int:
+        return self._target().write(text)
+
+    def flush(self) -> None:
+        self._target().flush()
+
+    def isatty(self) -> bool:
+        return self._stdout.isatty()
+
+    @property
+    def encoding(self) -> str:
+        return getattr(self._stdout, "encoding", "utf-8")
+
+    def fileno(self) -> int:
+        return self._stdout.fileno()
+
+
+def _install() -> None:
+    with _install_lock:
+        if not isinstance(sys.stdout, _ContextStdout):
+            sys.stdout = _ContextStdout(sys.stdout)
+
+
+@contextmanager
+def capture_output() -> Iterator[io.StringIO]:
+    """Collect what this request (context) prints into the yielded buffer."""
+    _install()
+    buf = io.StringIO()
+    token = _buffer.set(buf)
+    try:
+        yield buf
+    finally:
+        _buffer.reset(token)
@@ -0,0 +1,136 @@
+"""
+Local cross-encoder reranker for retrieved documents.
+
+A small ONNX cross-encoder (FastEmbed rerank models) scores (question, chunk)
+pairs on CPU. Raw logits are mapped to [0, 1] with a sigmoid and compared with
+a calibrated threshold, replacing the LLM relevance grader on the hot path.
+Scores within RAG_RERANK_MARGIN of the threshold count as ambiguous (see
+graph/nodes/grade.py, which can send those to the LLM grader).
+
+The default threshold 0.5 is logit 0, the decision boundary the ms-marco
+cross-encoders were trained for with a binary relevance loss. It is not
+calibrated on course content: label a sample of (question, chunk) pairs and run
+calibrate_reranker.py, which picks the F1-optimal threshold (optionally subject
+to a minimum precision) via calibrate_threshold(), then set RAG_RERANK_THRESHOLD.
+Recalibrate whenever RAG_RERANKER_MODEL changes.
+
+TextCrossEncoder ships with fastembed >= 0.4.0; with older versions, or when
+RAG_RERANKER=false, rerank() returns None and grading uses the LLM grader.
+"""
+
+from __future__ import annotations
+
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from tracing import span
+
+try:
+    from fastembed.rerank.cross_encoder import TextCrossEncoder
+except ImportError:  # fastembed < 0.4.0
+    TextCrossEncoder = None
+
+RERANKER_ENABLED = os.getenv("RAG_RERANKER", "true").lower() in ("1", "true", "yes")
+RERANKER_MODEL = os.getenv("RAG_RERANKER_MODEL", "Xenova/ms-marco-MiniLM-L-6-v2")
+# Relevance probability above which a document counts as relevant (see module docstring)
+RERANK_THRESHOLD = float(os.getenv("RAG_RERANK_THRESHOLD", "0.5"))
+# Scores within +/- margin of the threshold are ambiguous
+RERANK_MARGIN = float(os.getenv("RAG_RERANK_MARGIN", "0.15"))
+# Let the LLM grader decide ambiguous documents (otherwise the threshold alone does)
+RERANK_LLM_FALLBACK = os.getenv("RAG_RERANK_LLM_FALLBACK", "true").lower() in ("1", "true", "yes")
+# Characters of each chunk passed to the cross-encoder
+RERANK_MAX_CHARS = int(os.getenv("RAG_RERANK_MAX_CHARS", "2000"))
+
+_reranker = None
+_reranker_lock = threading.Lock()
+_reranker_failed = False
+
+
+def get_reranker():
+    """Lazily load the cross-encoder; None if unavailable or disabled."""
+    global _reranker, _reranker_failed
+    if _reranker is None and not _reranker_failed:
+        with _reranker_lock:
+            if _reranker is None and not _reranker_failed:
+                if not RERANKER_ENABLED or TextCrossEncoder is None:
+                    if RERANKER_ENABLED:
+                        print("[RERANK] fastembed TextCrossEncoder not available, using LLM grader")
+                    _reranker_failed = True
+                    return None
+                try:
+                    _reranker = TextCrossEncoder(model_name=RERANKER_MODEL)
+                    print(f"[RERANK] Loaded cross-encoder {RERANKER_MODEL}")
+                except Exception as e:
+                    print(f"[RERANK] Failed to load {RERANKER_MODEL}, using LLM grader: {e}")
+                    _reranker_failed = True
+    return _reranker
+
+
+def _sigmoid(logit: float) -> float:
+    if logit >= 0:
+        return 1.0 / (1.0 + math.exp(-logit))
+    exp = math.exp(logit)
+    return exp / (1.0 + exp)
+
+
+def rerank(question: str, documents: List[Document]) -> Optional[List[Tuple[Document, float]]]:
+    """
+    Score documents against the question, best first.
+    Each document also gets its score in metadata["rerank_score"].
+
+    Returns:
+        (document, relevance in [0, 1]) pairs, or None if no reranker is available.
+    """
+    reranker = get_reranker()
+    if reranker is None:
+        return None
+    if not documents:
+        return []
+    with span("rerank", "cross_encoder", documents=len(documents)):
+        logits = reranker.rerank(question, [doc.page_content[:RERANK_MAX_CHARS] for doc in documents])
+    scored = [(doc, _sigmoid(float(logit))) for doc, logit in zip(documents, logits)]
+    for doc, score in scored:
+        doc.metadata["rerank_score"] = round(score, 4)
+    return sorted(scored, key=lambda item: item[1], reverse=True)
+
+
+def calibrate_threshold(
+    labelled: Iterable[Tuple[float, bool]], min_precision: float = 0.0
+) -> Tuple[float, Dict[str, float]]:
+    """
+    Pick the score threshold that best separates relevant from irrelevant documents.
+
+    Args:
+        labelled: (rerank score, is relevant) pairs.
+        min_precision: Only consider thresholds with at least this precision.
+
+    Returns:
+        (threshold, {"precision", "recall", "f1"}) for the threshold with the
+        highest F1; ties go to the higher threshold.
+    """
+    pairs = sorted(labelled, key=lambda item: item[0], reverse=True)
+    positives = sum(1 for _, relevant in pairs if relevant)
+    if not positives:
+        raise ValueError("calibration needs at least one relevant example")
+
+    best: Optional[Tuple[float, Dict[str, float]]] = None
+    true_positives = 0
+    for idx, (score, relevant) in enumerate(pairs):
+        true_positives += relevant
+        # Documents scoring >= score are predicted relevant; wait for the last of equal scores
+        if idx + 1 < len(pairs) and pairs[idx + 1][0] == score:
+            continue
+        precision = true_positives / (idx + 1)
+        recall = true_positives / positives
+        if precision < min_precision:
+            continue
+        f1 = 2 * precision * recall / (precision + recall) if true_positives else 0.0
+        if best is None or f1 > best[1]["f1"]:
+            best = (score, {"precision": precision, "recall": recall, "f1": f1})
+    if best is None:
+        raise ValueError(f"no threshold reaches precision {min_precision}")
+    return best
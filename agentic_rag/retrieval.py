@@ -0,0 +1,231 @@
+"""
+Filtered hybrid search over the persisted index.
+
+Lesson scoping, document types and enrollment permissions are applied inside the
+Chroma query (`where` with `$in` / `$and` / `$or`), so a search returns up to k
+permitted documents in one query instead of filtering a global top-k afterwards.
+
+Dense (vector) and sparse (BM25, see bm25_index) search run concurrently with the
+same filter and their rankings are merged with reciprocal-rank fusion.
+
+Every returned document carries its vector `distance` and `relevance_score`
+(0-1, the vector store's relevance function) in metadata. Without an explicit k,
+the number of documents adapts to the relevance distribution.
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from bm25_index import get_bm25_index
+from ingestion import get_vectorstore
+from tracing import span
+
+# Adaptive k: between MIN_K and K documents, dropping those whose relevance is
+# more than SCORE_GAP below the best one
+RETRIEVAL_K = int(os.getenv("RAG_RETRIEVAL_K", "7"))
+RETRIEVAL_MIN_K = int(os.getenv("RAG_RETRIEVAL_MIN_K", "3"))
+RETRIEVAL_SCORE_GAP = float(os.getenv("RAG_RETRIEVAL_SCORE_GAP", "0.15"))
+# Best relevance at or above which document grading is skipped
+RETRIEVAL_HIGH_CONFIDENCE = float(os.getenv("RAG_RETRIEVAL_HIGH_CONFIDENCE", "0.75"))
+# Best relevance below which retrieved documents are discarded (fallback path)
+RETRIEVAL_MIN_CONFIDENCE = float(os.getenv("RAG_RETRIEVAL_MIN_CONFIDENCE", "0.3"))
+HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+# Candidates taken from each ranking before fusion, as a multiple of k
+HYBRID_CANDIDATES = int(os.getenv("RAG_HYBRID_CANDIDATES", "3"))
+# Reciprocal-rank fusion constant: score = sum(1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# Dense queries run here while the calling thread searches BM25
+_search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="dense-search")
+
+
+def build_filter(
+    lesson_id: Optional[str] = None,
+    doc_types: Optional[Iterable[str]] = None,
+    exclude_doc_types: Optional[Iterable[str]] = None,
+    allowed_course_ids: Optional[Iterable[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Build a Chroma `where` filter.
+
+    Args:
+        lesson_id: Only documents of this lesson.
+        doc_types: Only these doc_type values.
+        exclude_doc_types: Skip these doc_type values.
+        allowed_course_ids: Enrollment check. Public documents (requires_enrollment=False)
+            always pass, enrollment-only documents only for these courses. None disables
+            the check; an empty set allows public documents only.
+
+    Returns:
+        The filter, or None when nothing is filtered.
+    """
+    clauses: List[Dict[str, Any]] = []
+    if lesson_id:
+        clauses.append({"lesson_id": str(lesson_id)})
+    if doc_types is not None:
+        doc_types = sorted(set(doc_types))
+        clauses.append({"doc_type": doc_types[0]} if len(doc_types) == 1 else {"doc_type": {"$in": doc_types}})
+    if exclude_doc_types:
+        clauses.append({"doc_type": {"$nin": sorted(set(exclude_doc_types))}})
+    if allowed_course_ids is not None:
+        course_ids = sorted({str(course_id) for course_id in allowed_course_ids})
+        public = {"requires_enrollment": False}
+        clauses.append(
+            {"$or": [public, {"course_id": {"$in": course_ids}}]} if course_ids else public
+        )
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def _scored_document(chunk_id: str, text: str, metadata: Optional[Dict[str, Any]], distance: float) -> Document:
+    metadata = dict(metadata or {})
+    metadata["distance"] = round(float(distance), 4)
+    metadata["relevance_score"] = round(float(get_vectorstore()._select_relevance_score_fn()(distance)), 4)
+    return Document(id=chunk_id, page_content=text, metadata=metadata)
+
+
+def relevance_of(document: Document) -> float:
+    return float((document.metadata or {}).get("relevance_score", 0.0))
+
+
+def dense_search(
+    query: str,
+    k: int,
+    where: Optional[Dict[str, Any]] = None,
+    query_embedding: Optional[List[float]] = None,
+) -> List[Document]:
+    """Top-k documents by vector similarity, with chunk id and scores (see module doc)."""
+    vector_store = get_vectorstore()
+    if query_embedding is None:
+        query_embedding = vector_store.embeddings.embed_query(query)
+    results = vector_store._collection.query(
+        query_embeddings=[query_embedding],
+        n_results=k,
+        where=where,
+        include=["documents", "metadatas", "distances"],
+    )
+    return [
+        _scored_document(chunk_id, text, metadata, distance)
+        for chunk_id, text, metadata, distance in zip(
+            results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+        )
+    ]
+
+
+def _distances(query_embedding: List[float], embeddings: List[List[float]]) -> List[float]:
+    """Distances in the collection's metric, as Chroma's own query would report them."""
+    collection = get_vectorstore()._collection
+    space = (collection.metadata or {}).get("hnsw:space", "l2")
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    vectors = np.asarray(embeddings, dtype=np.float32)
+    if space == "cosine":
+        norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector)
+        return (1.0 - vectors @ query_vector / np.maximum(norms, 1e-12)).tolist()
+    if space == "ip":
+        return (1.0 - vectors @ query_vector).tolist()
+    # Chroma's "l2" is the squared euclidean distance
+    return np.sum((vectors - query_vector) ** 2, axis=1).tolist()
+
+
+def _fetch_documents(chunk_ids: List[str], query_embedding: List[float]) -> Dict[str, Document]:
+    """Load chunks by id, scored against the query like dense_search results."""
+    if not chunk_ids:
+        return {}
+    results = get_vectorstore()._collection.get(
+        ids=chunk_ids, include=["documents", "metadatas", "embeddings"]
+    )
+    distances = _distances(query_embedding, results["embeddings"])
+    return {
+        chunk_id: _scored_document(chunk_id, text, metadata, distance)
+        for chunk_id, text, metadata, distance in zip(
+            results["ids"], results["documents"], results["metadatas"], distances
+        )
+    }
+
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], rrf_k: int = RRF_K) -> List[Tuple[str, float]]:
+    """Merge ranked id lists: each id scores sum(1 / (rrf_k + rank)) over the lists it is in."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def hybrid_search(query: str, k: int, where: Optional[Dict[str, Any]] = None) -> List[Document]:
+    """Dense + BM25 search under the same filter, fused with reciprocal-rank fusion."""
+    candidates = max(k, k * HYBRID_CANDIDATES)
+    query_embedding = get_vectorstore().embeddings.embed_query(query)
+    dense_future = _search_executor.submit(dense_search, query, candidates, where, query_embedding)
+    sparse_hits = get_bm25_index().search(query, candidates, where)
+    dense_hits = dense_future.result()
+
+    documents = {document.id: document for document in dense_hits}
+    fused = reciprocal_rank_fusion(
+        [[document.id for document in dense_hits], [chunk_id for chunk_id, _ in sparse_hits]]
+    )[:k]
+    # Chunks only found by BM25 are loaded from the collection
+    documents.update(
+        _fetch_documents([chunk_id for chunk_id, _ in fused if chunk_id not in documents], query_embedding)
+    )
+    return [documents[chunk_id] for chunk_id, _ in fused if chunk_id in documents]
+
+
+def adaptive_cut(
+    documents: List[Document],
+    min_k: int = RETRIEVAL_MIN_K,
+    score_gap: float = RETRIEVAL_SCORE_GAP,
+) -> List[Document]:
+    """
+    Keep as many documents (in ranked order) as score within `score_gap` of the best
+    relevance, but at least `min_k`. A clear winner yields few documents, a flat
+    distribution keeps all of them.
+    """
+    if not documents:
+        return documents
+    floor = max(relevance_of(document) for document in documents) - score_gap
+    keep = sum(1 for document in documents if relevance_of(document) >= floor)
+    return documents[:max(min_k, keep)]
+
+
+def filtered_search(
+    query: str,
+    k: Optional[int] = None,
+    lesson_id: Optional[str] = None,
+    doc_types: Optional[Iterable[str]] = None,
+    exclude_doc_types: Optional[Iterable[str]] = None,
+    allowed_course_ids: Optional[Iterable[str]] = None,
+) -> List[Document]:
+    """
+    Top-k documents for `query` among those matching the filters (see build_filter).
+    Uses hybrid dense + BM25 search unless RAG_HYBRID_SEARCH=false.
+    With k=None, up to RAG_RETRIEVAL_K documents are fetched and cut adaptively.
+    """
+    where = build_filter(
+        lesson_id=lesson_id,
+        doc_types=doc_types,
+        exclude_doc_types=exclude_doc_types,
+        allowed_course_ids=allowed_course_ids,
+    )
+    fetch_k = k or RETRIEVAL_K
+    with span("retrieval", "hybrid_search" if HYBRID_SEARCH else "dense_search", k=fetch_k) as search_span:
+        if HYBRID_SEARCH:
+            documents = hybrid_search(query, fetch_k, where)
+        else:
+            documents = dense_search(query, fetch_k, where)
+        documents = documents if k else adaptive_cut(documents)
+        if search_span.recording:
+            search_span.set(
+                filtered=where is not None,
+                documents=len(documents),
+                best_relevance=round(max((relevance_of(document) for document in documents), default=0.0), 4),
+            )
+    return documents
@@ -0,0 +1,149 @@
+"""
+Background watcher that hot-reindexes knowledge base and transcript files.
+
+KNOWLEDGE_BASE_DIR (*.md) and TRANSCRIPTS_DIR (*.json) are polled for mtime/size
+changes (mtime polling works on bind mounts and network volumes where inotify
+events are not delivered). Only touched files are re-parsed, re-chunked and
+re-embedded, and their chunks are swapped into the live collection through
+ingestion.reindex_files, so the API picks up edits without a restart.
+"""
+
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from ingestion import (
+    is_index_ready,
+    iter_knowledge_files,
+    iter_transcript_files,
+    knowledge_document_id,
+    reindex_files,
+    transcript_document_id,
+)
+
+WATCH_SOURCES = os.getenv("RAG_WATCH_SOURCES", "true").lower() in ("1", "true", "yes")
+WATCH_INTERVAL = float(os.getenv("RAG_WATCH_INTERVAL", "5"))
+
+# (mtime_ns, size) of a file at the last poll
+_Signature = Tuple[int, int]
+
+
+def _signature(path: Path) -> Optional[_Signature]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SourceWatcher:
+    """
+    Poll the source directories every `interval` seconds and reindex changed files.
+
+    A changed file is only reindexed once its signature is unchanged for a full
+    interval, so files that are still being written are not ingested half-done.
+    Failed reindexes are retried on the next polls.
+    """
+
+    def __init__(self, interval: float = WATCH_INTERVAL) -> None:
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot: Dict[Path, _Signature] = {}
+        self._pending: Dict[Path, _Signature] = {}
+        self._knowledge: Dict[Path, bool] = {}
+        # Transcript document ids depend on the file content (lessonId), remember
+        # them so deleted files can still be removed from the index
+        self._transcript_ids: Dict[Path, str] = {}
+
+    def _scan(self) -> Dict[Path, _Signature]:
+        files: Dict[Path, _Signature] = {}
+        for is_knowledge, paths in ((True, iter_knowledge_files()), (False, iter_transcript_files())):
+            for path in paths:
+                signature = _signature(path)
+                if signature is not None:
+                    files[path] = signature
+                    self._knowledge[path] = is_knowledge
+        return files
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._snapshot = self._scan()
+        for path, is_knowledge in self._knowledge.items():
+            if not is_knowledge:
+                document_id = transcript_document_id(path)
+                if document_id:
+                    self._transcript_ids[path] = document_id
+        print(f"[WATCH] Watching {len(self._snapshot)} source files (every {self.interval:g}s)")
+        self._thread = threading.Thread(target=self._run, name="source-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"[WATCH] Reindex failed, will retry: {e}")
+
+    def poll(self) -> bool:
+        """Check for changes once; returns True if a reindex ran."""
+        if not is_index_ready():
+            # Nothing to update yet; changes are picked up once the index is open
+            return False
+
+        current = self._scan()
+        changed = [path for path, signature in current.items() if self._snapshot.get(path) != signature]
+        removed = [path for path in self._snapshot if path not in current]
+        ready = [path for path in changed if self._pending.get(path) == current[path]]
+        self._pending = {path: current[path] for path in changed if path not in ready}
+        if not ready and not removed:
+            return False
+
+        knowledge_files: List[Path] = []
+        transcript_files: List[Path] = []
+        removed_ids: List[str] = []
+        transcript_ids: Dict[Path, str] = {}
+        for path in ready:
+            if self._knowledge.get(path):
+                knowledge_files.append(path)
+                continue
+            transcript_files.append(path)
+            document_id = transcript_document_id(path)
+            previous_id = self._transcript_ids.get(path)
+            if document_id:
+                transcript_ids[path] = document_id
+            if previous_id and previous_id != document_id:
+                # The file now holds another lesson's transcript
+                removed_ids.append(previous_id)
+        for path in removed:
+            if self._knowledge.get(path):
+                removed_ids.append(knowledge_document_id(path))
+            elif path in self._transcript_ids:
+                removed_ids.append(self._transcript_ids[path])
+
+        print(
+            f"[WATCH] Reindexing changed={len(ready)} removed={len(removed)} "
+            f"({', '.join(path.name for path in (ready + removed)[:5])}"
+            f"{', ...' if len(ready) + len(removed) > 5 else ''})"
+        )
+        reindex_files(knowledge_files, transcript_files, removed_ids)
+
+        # Only advance the snapshot once the reindex succeeded
+        for path in ready:
+            self._snapshot[path] = current[path]
+        self._transcript_ids.update(transcript_ids)
+        for path in removed:
+            self._snapshot.pop(path, None)
+            self._knowledge.pop(path, None)
+            self._transcript_ids.pop(path, None)
+        return True
@@ -0,0 +1,217 @@
+"""
+Per-request structured tracing.
+
+start_trace() installs a Trace in a context variable for the duration of a
+request. Instrumented code opens spans (graph nodes and edges, LLM calls, LLM
+cache lookups, retrieval, reranking, DB queries) which record their parent,
+start offset, duration, attributes (token counts, decisions, result sizes) and
+error. Context variables follow the run into LangGraph's node threads,
+asyncio tasks and asyncio.to_thread, so concurrent requests each get their own
+trace.
+
+Span listeners (add_span_listener, e.g. the Prometheus metrics) see every
+finished span, traced or not. Without an active trace (RAG_TRACING=false, or
+code running outside a request) and without listeners, span() yields a shared
+no-op span and traced() calls straight through, so the instrumentation costs a
+context variable lookup. Work that only feeds the trace, such as counting
+tokens, should be guarded with is_tracing().
+"""
+
+from __future__ import annotations
+
+import contextvars
+import functools
+import inspect
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+TRACING_ENABLED = os.getenv("RAG_TRACING", "true").lower() in ("1", "true", "yes")
+
+_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar("rag_trace", default=None)
+_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("rag_span", default=None)
+_span_listeners: List[Callable[["Span"], None]] = []
+
+
+@dataclass
+class Span:
+    id: int
+    parent_id: Optional[int]
+    kind: str
+    name: str
+    # Milliseconds since the start of the trace
+    start_ms: float
+    duration_ms: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    recording = True
+    # perf_counter() at open
+    started = 0.0
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+class _NoopSpan:
+    recording = False
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Trace:
+    def __init__(self) -> None:
+        self._start = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.spans: List[Span] = []
+
+    def _elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._start) * 1000
+
+    def open(self, kind: str, name: str, parent: Optional[Span], attributes: Dict[str, Any]) -> Span:
+        with self._lock:
+            span_ = Span(
+                id=next(self._ids),
+                parent_id=parent.id if parent is not None else None,
+                kind=kind,
+                name=name,
+                start_ms=round(self._elapsed_ms(), 3),
+                attributes=attributes,
+            )
+            span_.started = time.perf_counter()
+            self.spans.append(span_)
+        return span_
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [asdict(span_) for span_ in self.spans]
+        return {"duration_ms": round(self._elapsed_ms(), 3), "spans": spans}
+
+
+def is_tracing() -> bool:
+    return _trace.get() is not None
+
+
+def add_span_listener(listener: Callable[[Span], None]) -> None:
+    """Call `listener(span)` whenever a span finishes, whether or not a trace is active."""
+    _span_listeners.append(listener)
+
+
+def _open(kind: str, name: str, attributes: Dict[str, Any]) -> Any:
+    trace = _trace.get()
+    if trace is not None:
+        return trace.open(kind, name, _span.get(), attributes)
+    if not _span_listeners:
+        return NOOP_SPAN
+    # Not part of a trace, only timed for the listeners
+    span_ = Span(id=0, parent_id=None, kind=kind, name=name, start_ms=0.0, attributes=attributes)
+    span_.started = time.perf_counter()
+    return span_
+
+
+def _finish(span_: Span, error: Optional[BaseException] = None) -> None:
+    if error is not None:
+        span_.error = f"{type(error).__name__}: {error}"
+    span_.duration_ms = round((time.perf_counter() - span_.started) * 1000, 3)
+    for listener in _span_listeners:
+        listener(span_)
+
+
+@contextmanager
+def start_trace(enabled: bool = TRACING_ENABLED) -> Iterator[Optional[Trace]]:
+    """Trace the code run in this context; yields None when tracing is disabled."""
+    if not enabled:
+        yield None
+        return
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(kind: str, name: str, **attributes: Any) -> Iterator[Any]:
+    """A span around the block, the parent of spans opened inside it."""
+    span_ = _open(kind, name, attributes)
+    if not span_.recording:
+        yield span_
+        return
+    token = _span.set(span_)
+    error = None
+    try:
+        yield span_
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _span.reset(token)
+        _finish(span_, error)
+
+
+def start_span(kind: str, name: str, **attributes: Any) -> Any:
+    """
+    Open a span without making it the current one, for generators (whose body
+    may resume in another context); close it with end_span().
+    """
+    return _open(kind, name, attributes)
+
+
+def end_span(span_: Any, error: Optional[BaseException] = None) -> None:
+    if span_.recording:
+        _finish(span_, error)
+
+
+def annotate(**attributes: Any) -> None:
+    """Add attributes to the current span."""
+    span_ = _span.get()
+    if span_ is not None:
+        span_.set(**attributes)
+
+
+def traced(kind: str, name: Optional[str] = None, result_attribute: Optional[str] = None) -> Callable:
+    """
+    Decorator running the (sync or async) function in a span named after it.
+    With `result_attribute`, the return value is recorded under that attribute
+    (e.g. the decision of a graph edge).
+    """
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__name__
+
+        def _record(span_: Any, result: Any) -> Any:
+            if result_attribute is not None:
+                span_.set(**{result_attribute: result})
+            return result
+
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if _trace.get() is None and not _span_listeners:
+                    return await func(*args, **kwargs)
+                with span(kind, span_name) as span_:
+                    return _record(span_, await func(*args, **kwargs))
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None and not _span_listeners:
+                return func(*args, **kwargs)
+            with span(kind, span_name) as span_:
+                return _record(span_, func(*args, **kwargs))
+
+        return wrapper
+
+    return decorator
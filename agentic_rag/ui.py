@@ -1,14 +1,15 @@
 from __future__ import annotations
 
-import io
-from contextlib import redirect_stdout
-from typing import Iterable
+from typing import Iterable, Iterator
 
 import gradio as gr
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 
+from answer_cache import invoke_with_answer_cache
 from graph.graph import app
+from graph.streaming import stream_events
+from request_output import capture_output
 
 
 # Only load .env file if not in Docker (override=False prevents overriding existing env vars)
@@ -49,6 +50,23 @@ def _format_documents(documents: Iterable[Document] | None, preview_chars: int =
     return "\n\n---\n\n".join(chunks)
 
 
+def _payload(
+    question: str,
+    user_id: str | None,
+    chat_history: list[tuple[str, str]] | None,
+) -> dict:
+    payload = {"question": question.strip()}
+    if user_id and user_id.strip():
+        payload["user_id"] = user_id.strip()
+    if chat_history:
+        payload["chat_history"] = chat_history
+    return payload
+
+
+def _invoke_graph(payload: dict) -> dict:
+    return invoke_with_answer_cache(lambda graph_input: app.invoke(input=graph_input), payload)
+
+
 def answer_question(
     question: str,
     user_id: str | None = None,
@@ -69,15 +87,10 @@ def answer_question(
             chat_history or [],
         )
 
-    buf = io.StringIO()
-    payload = {"question": question.strip()}
-    if user_id and user_id.strip():
-        payload["user_id"] = user_id.strip()
-    if chat_history:
-        payload["chat_history"] = chat_history
+    payload = _payload(question, user_id, chat_history)
 
-    with redirect_stdout(buf):
-        result = app.invoke(input=payload)
+    with capture_output() as buf:
+        result = _invoke_graph(payload)
 
     trace = buf.getvalue()
     answer = result.get("generation", str(result))
@@ -88,6 +101,50 @@ def answer_question(
     return answer, trace, sources, formatted_docs, updated_history
 
 
+def stream_answer(
+    question: str,
+    user_id: str | None = None,
+    chat_history: list[tuple[str, str]] | None = None,
+) -> Iterator[tuple[str, str, list, str, list[tuple[str, str]]]]:
+    """
+    Streaming answer_question: consumes the same graph events as the SSE endpoint
+    (graph/streaming.py) and yields the partial answer as tokens arrive.
+    The trace lists the streaming events (node prints go to the console).
+
+    Yields:
+        tuple: (answer, trace, sources, formatted_docs, updated_chat_history)
+    """
+    if not question or not question.strip():
+        yield answer_question(question, user_id, chat_history)
+        return
+
+    history = list(chat_history or [])
+    answer = ""
+    trace_lines: list[str] = []
+    for event, data in stream_events(_invoke_graph, _payload(question, user_id, chat_history)):
+        if event == "result":
+            answer = data.get("generation", answer)
+            yield (
+                answer,
+                "\n".join(trace_lines),
+                data.get("sources", []),
+                _format_documents(data.get("documents")),
+                data.get("chat_history", history + [(question, answer)]),
+            )
+            return
+        if event == "error":
+            yield data["detail"], "\n".join(trace_lines), [], "_No documents retrieved._", history
+            return
+        if event == "token":
+            answer += data["text"]
+        else:
+            if event == "discard":
+                # The answer will be regenerated (or replaced by a web search answer)
+                answer = ""
+            trace_lines.append(f"[{event}] {data}")
+        yield answer, "\n".join(trace_lines), [], "_Generating..._", history + [(question, answer)]
+
+
 def build_interface() -> gr.Blocks:
     with gr.Blocks(title="Agentic RAG QA") as demo:
         gr.Markdown("# Agentic RAG • Conversational Q&A")
@@ -127,17 +184,17 @@ def build_interface() -> gr.Blocks:
         def chat_fn(message: str, history: list, user_id_input: str | None):
             """Handle chat interaction"""
             if not message or not message.strip():
-                return history, history, "", [], "_No documents retrieved._"
+                yield history, history, "", [], "_No documents retrieved._"
+                return
             
-            # Call answer_question with history
-            answer, trace_output, sources_output, docs_output, updated_history = answer_question(
+            # Stream the answer with history
+            for _, trace_output, sources_output, docs_output, updated_history in stream_answer(
                 question=message,
                 user_id=user_id_input,
                 chat_history=history,
-            )
-            
-            # Use updated_history from answer_question (already includes current Q&A)
-            return updated_history, updated_history, trace_output, sources_output, docs_output
+            ):
+                # updated_history already includes the current (partial) Q&A
+                yield updated_history, updated_history, trace_output, sources_output, docs_output
 
         def clear_chat():
             """Clear chat history"""
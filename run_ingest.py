@@ -0,0 +1,18 @@
+"""
+Script to build or update the vector index used by the Agentic RAG API.
+Run it before starting the API (or whenever content changes); pass --full to rebuild.
+"""
+
+import sys
+from pathlib import Path
+
+# Add the agentic_rag directory to Python path for imports
+current_dir = Path(__file__).parent
+agentic_rag_dir = current_dir / "agentic_rag"
+if str(agentic_rag_dir) not in sys.path:
+    sys.path.insert(0, str(agentic_rag_dir))
+
+from ingest import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,34 @@
 import sys
 import os
+import tempfile
+
+import pytest
+from dotenv import load_dotenv
 
 # Add the project root directory to the Python path
 project_root = os.path.abspath(
     os.path.join(os.path.dirname(__file__), "../agentic_rag")
 )
 sys.path.insert(0, project_root)
+
+# The chains read their API keys at import; tests that call the real APIs
+# (test_chains.py) need real keys in the environment or .env
+load_dotenv(os.path.join(os.path.dirname(project_root), ".env"), override=False)
+os.environ.setdefault("DEEPSEEK_API_KEY", "test-key")
+os.environ.setdefault("TAVILY_API_KEY", "test-key")
+# Keep the caches and the shared rate limit bucket of tests apart from a running app
+_state_dir = tempfile.mkdtemp(prefix="agentic-rag-tests-")
+os.environ.setdefault("RAG_LLM_CACHE_DB", os.path.join(_state_dir, "llm-cache.sqlite"))
+os.environ.setdefault("RAG_RATE_LIMIT_DB", os.path.join(_state_dir, "rate-limit.sqlite"))
+
+
+@pytest.fixture(scope="session")
+def graph_module():
+    """graph.graph without writing graph.png (rendering it calls mermaid.ink)."""
+    from langchain_core.runnables.graph import Graph
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(Graph, "draw_mermaid_png", lambda self, **kwargs: b"")
+        from graph import graph
+
+    return graph
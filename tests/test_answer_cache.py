@@ -0,0 +1,157 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import answer_cache
+from answer_cache import SemanticAnswerCache, _CachedAnswer, normalize_question
+
+_VOCABULARY = ("reset", "password", "enroll", "course", "python", "loop")
+
+
+class _Embeddings:
+    """Bag of known words: questions with the same words are identical vectors."""
+
+    def embed_query(self, text):
+        return [float(word in text) for word in _VOCABULARY] + [0.1]
+
+
+class _VectorStore:
+    embeddings = _Embeddings()
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    """A fresh cache in front of a graph answering every question, and the payloads the graph got."""
+    enrollments = {"u1": frozenset({"c1"}), "u2": frozenset({"c2"}), "u3": frozenset({"c1"})}
+    version = [1]
+    calls = []
+
+    def invoke(payload):
+        calls.append(payload)
+        return {"question": payload["question"], "generation": f"answer {len(calls)}",
+                "sources": [{"document_id": "kb:faq"}]}
+
+    monkeypatch.setattr(answer_cache, "_answer_cache", SemanticAnswerCache(threshold=0.95))
+    monkeypatch.setattr(answer_cache, "get_vectorstore", lambda: _VectorStore())
+    monkeypatch.setattr(answer_cache, "get_user_enrollments", enrollments.get)
+    monkeypatch.setattr(answer_cache, "index_version", lambda: version[0])
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_ENABLED", True)
+    return invoke, calls, version
+
+
+def _ask(invoke, question, **payload):
+    return answer_cache.invoke_with_answer_cache(invoke, {"question": question, **payload})
+
+
+def test_normalize_question() -> None:
+    assert normalize_question("  How do I   RESET my password?! ") == "how do i reset my password"
+
+
+def test_rephrased_question_is_answered_from_the_cache(graph) -> None:
+    invoke, calls, _ = graph
+
+    first = _ask(invoke, "How do I reset my password?", user_id="u1")
+    second = _ask(invoke, "password reset", user_id="u1")
+
+    assert len(calls) == 1
+    assert second["generation"] == first["generation"] == "answer 1"
+    assert second["sources"] == [{"document_id": "kb:faq"}]
+    assert second["chat_history"] == [("password reset", "answer 1")]
+    assert answer_cache.get_answer_cache().stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_answers_are_scoped_by_lesson_and_enrollments(graph) -> None:
+    invoke, calls, _ = graph
+
+    _ask(invoke, "python loop", user_id="u1")
+    _ask(invoke, "python loop", user_id="u2")  # Other courses
+    _ask(invoke, "python loop")  # Anonymous
+    _ask(invoke, "python loop", user_id="u1", lesson_id="l1")
+    _ask(invoke, "python loop", user_id="u3")  # Same enrollments as u1
+
+    assert len(calls) == 4
+
+
+def test_different_questions_miss(graph) -> None:
+    invoke, calls, _ = graph
+
+    _ask(invoke, "python loop")
+    _ask(invoke, "enroll in a course")
+
+    assert len(calls) == 2
+
+
+def test_follow_ups_and_web_answers_bypass_the_cache(graph) -> None:
+    invoke, calls, _ = graph
+
+    def web_invoke(payload):
+        return {**invoke(payload), "web_search_count": 1}
+
+    _ask(web_invoke, "python loop")
+    _ask(invoke, "python loop")
+    _ask(invoke, "python loop", chat_history=[("earlier", "answer")])
+
+    assert len(calls) == 3
+
+
+def test_answers_built_across_a_reindex_are_not_stored(graph) -> None:
+    invoke, calls, version = graph
+
+    def reindexing_invoke(payload):
+        version[0] += 1
+        return invoke(payload)
+
+    _ask(reindexing_invoke, "python loop")
+    _ask(invoke, "python loop")
+
+    assert len(calls) == 2
+
+
+def test_index_changes_clear_the_cache(graph) -> None:
+    invoke, calls, _ = graph
+    _ask(invoke, "python loop")
+
+    answer_cache._on_index_changed({"kb:faq"})
+    _ask(invoke, "python loop")
+
+    assert len(calls) == 2
+
+
+def test_async_lookup_serves_the_same_entries(graph) -> None:
+    invoke, calls, _ = graph
+
+    async def ainvoke(payload):
+        return invoke(payload)
+
+    async def ask(question):
+        return await answer_cache.ainvoke_with_answer_cache(ainvoke, {"question": question})
+
+    asyncio.run(ask("python loop"))
+    result = asyncio.run(ask("Python loop?"))
+
+    assert len(calls) == 1
+    assert result["generation"] == "answer 1"
+
+
+def _entry(question, created):
+    return _CachedAnswer(question=question, answer=question, sources=[], created=created)
+
+
+def test_expired_and_oldest_entries_are_dropped(monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now[0])
+    cache = SemanticAnswerCache(threshold=0.9, ttl=100, max_entries=2)
+    scope = ("", None)
+    vectors = np.eye(3, dtype=np.float32)
+
+    for n in range(3):
+        cache.store(scope, vectors[n], _entry(f"q{n}", now[0]))
+    assert len(cache) == 2
+    assert cache.lookup(scope, vectors[0]) is None
+    assert cache.lookup(scope, vectors[2])[0].question == "q2"
+
+    now[0] += 101
+    assert cache.lookup(scope, vectors[2]) is None
+    cache.store(scope, vectors[0], _entry("q0", now[0]))
+    assert len(cache) == 1
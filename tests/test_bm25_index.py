@@ -0,0 +1,137 @@
+from bm25_index import BM25Index, tokenize
+
+
+def _index():
+    index = BM25Index()
+    index.add("kb:sql::0", "SELECT rows with a WHERE clause", {"document_id": "kb:sql", "doc_type": "knowledge"})
+    index.add("kb:sql::1", "GROUP BY and HAVING", {"document_id": "kb:sql", "doc_type": "knowledge"})
+    index.add("lesson:l1::0", "Call print_table to show rows", {"document_id": "lesson:l1", "doc_type": "lesson"})
+    index.add("lesson:l2::0", "Lặp với vòng for trong Python", {"document_id": "lesson:l2", "doc_type": "lesson"})
+    return index
+
+
+def test_tokenize_keeps_identifiers_and_vietnamese_words() -> None:
+    assert tokenize("Gọi print_table() ở Bài 2") == ["gọi", "print_table", "ở", "bài", "2"]
+
+
+def test_search_ranks_exact_terms() -> None:
+    index = _index()
+
+    assert [chunk_id for chunk_id, _ in index.search("print_table", 5)] == ["lesson:l1::0"]
+    assert [chunk_id for chunk_id, _ in index.search("vòng for", 5)] == ["lesson:l2::0"]
+    hits = index.search("rows having", 5)
+    assert [chunk_id for chunk_id, _ in hits][:1] == ["kb:sql::1"]
+    assert {chunk_id for chunk_id, _ in hits} == {"kb:sql::1", "kb:sql::0", "lesson:l1::0"}
+    assert index.search("nothing matches", 5) == []
+
+
+def test_search_applies_the_filter() -> None:
+    hits = _index().search("rows", 5, where={"doc_type": "lesson"})
+
+    assert [chunk_id for chunk_id, _ in hits] == ["lesson:l1::0"]
+
+
+def test_removed_documents_are_not_found_and_slots_are_reused() -> None:
+    index = _index()
+    index.remove_documents(["kb:sql"])
+
+    assert len(index) == 2
+    assert [chunk_id for chunk_id, _ in index.search("rows", 5)] == ["lesson:l1::0"]
+    assert index.search("having", 5) == []
+
+    index.add("kb:sql::0", "rows again", {"document_id": "kb:sql"})
+    assert len(index._ids) == 4
+    assert {chunk_id for chunk_id, _ in index.search("rows", 5)} == {"kb:sql::0", "lesson:l1::0"}
+
+
+def test_adding_a_chunk_again_replaces_it() -> None:
+    index = _index()
+    index.add("lesson:l1::0", "Now about loops", {"document_id": "lesson:l1", "doc_type": "lesson"})
+
+    assert len(index) == 4
+    assert [chunk_id for chunk_id, _ in index.search("print_table", 5)] == []
+    assert [chunk_id for chunk_id, _ in index.search("loops", 5)] == ["lesson:l1::0"]
+
+
+class _Collection:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.requests = []
+
+    def get(self, where=None, include=None, limit=None, offset=0):
+        self.requests.append((where, limit, offset))
+        chunks = [chunk for chunk in self.chunks
+                  if where is None or chunk[2]["document_id"] in where["document_id"]["$in"]]
+        page = chunks[offset:offset + limit]
+        return {"ids": [c[0] for c in page], "documents": [c[1] for c in page], "metadatas": [c[2] for c in page]}
+
+
+def test_load_collection_pages_through_the_collection(monkeypatch) -> None:
+    import bm25_index
+
+    monkeypatch.setattr(bm25_index, "BM25_LOAD_BATCH_SIZE", 2)
+    collection = _Collection([(f"kb:d{n}::0", f"text {n}", {"document_id": f"kb:d{n}"}) for n in range(5)])
+    index = BM25Index()
+
+    assert index.load_collection(collection) == 5
+    assert [offset for _, _, offset in collection.requests] == [0, 2, 4]
+    assert index.load_collection(collection, ["kb:d1", "kb:d3"]) == 2
+    assert index.load_collection(collection, []) == 0
+    assert len(index) == 5
+
+
+def test_removed_chunks_leave_no_postings() -> None:
+    index = _index()
+    index.remove_documents(["kb:sql", "lesson:l1", "lesson:l2"])
+
+    assert len(index) == 0
+    assert index._postings == {}
+
+
+def test_reindex_during_the_initial_load_is_not_lost(monkeypatch) -> None:
+    import bm25_index
+
+    collection = _Collection([("kb:sql::0", "old text", {"document_id": "kb:sql"}),
+                              ("kb:faq::0", "reset a password", {"document_id": "kb:faq"})])
+    full_get = collection.get
+
+    def get(where=None, **kwargs):
+        page = full_get(where=where, **kwargs)
+        if where is None and len(collection.requests) == 1:
+            # A hot reindex lands after the loader has read the old chunk
+            collection.chunks[0] = ("kb:sql::0", "new text", {"document_id": "kb:sql"})
+            bm25_index._on_index_changed({"kb:sql"})
+        return page
+
+    collection.get = get
+    monkeypatch.setattr(bm25_index, "get_vectorstore", lambda: type("Store", (), {"_collection": collection}))
+    monkeypatch.setattr(bm25_index, "_bm25_index", None)
+
+    index = bm25_index.get_bm25_index()
+
+    assert index.search("old", 5) == []
+    assert [chunk_id for chunk_id, _ in index.search("new", 5)] == ["kb:sql::0"]
+    assert bm25_index._bm25_changes is None
+
+
+def test_rebuild_during_the_initial_load_reloads(monkeypatch) -> None:
+    import bm25_index
+
+    collection = _Collection([("kb:sql::0", "old text", {"document_id": "kb:sql"})])
+    full_get = collection.get
+
+    def get(where=None, **kwargs):
+        page = full_get(where=where, **kwargs)
+        if len(collection.requests) == 1:
+            collection.chunks = [("kb:faq::0", "new text", {"document_id": "kb:faq"})]
+            bm25_index._on_index_changed(None)
+        return page
+
+    collection.get = get
+    monkeypatch.setattr(bm25_index, "get_vectorstore", lambda: type("Store", (), {"_collection": collection}))
+    monkeypatch.setattr(bm25_index, "_bm25_index", None)
+
+    index = bm25_index.get_bm25_index()
+
+    assert [chunk_id for chunk_id, _ in index.search("new old", 5)] == ["kb:faq::0"]
+    assert [where for where, _, _ in collection.requests] == [None, None]
@@ -13,12 +13,12 @@ from agentic_rag.graph.chains.answer_grader import GradeAnswer, answer_grader
 from agentic_rag.graph.chains.generation import generation_chain
 from agentic_rag.graph.chains.router import RouteQuery, question_router
 
-from agentic_rag.ingestion import retriever
+from agentic_rag.ingestion import get_retriever
 
 
 # def test_retrieval_grader_answer_yes() -> None:
 #     question = "agent memory"
-#     docs = retriever.invoke(question)
+#     docs = get_retriever().invoke(question)
 #     doc_text = docs[1].page_content
 
 #     res: GradeDocuments = retrieval_grader.invoke(
@@ -33,7 +33,7 @@ from agentic_rag.ingestion import retriever
 
 # def test_retrieval_grader_answer_no() -> None:
 #     question = "donald trump"
-#     docs = retriever.invoke(question)
+#     docs = get_retriever().invoke(question)
 #     doc_text = docs[1].page_content
 
 #     res: GradeDocuments = retrieval_grader.invoke(
@@ -48,7 +48,7 @@ from agentic_rag.ingestion import retriever
 
 def test_retrieval_grader_answer_yes_or_no() -> None:
     question = "agent memory"
-    docs = retriever.invoke(question)
+    docs = get_retriever().invoke(question)
     doc_text = docs[1].page_content
 
     res: GradeDocuments = retrieval_grader.invoke(
@@ -60,7 +60,7 @@ def test_retrieval_grader_answer_yes_or_no() -> None:
 
 def test_generation_chain() -> None:
     question = "agent memory"
-    docs = retriever.invoke(question)
+    docs = get_retriever().invoke(question)
 
     generation = generation_chain.invoke({"context": docs, "question": question})
 
@@ -70,7 +70,7 @@ def test_generation_chain() -> None:
 
 def test_hallucination_grader_answer_yes_or_no() -> None:
     question = "agent memory"
-    docs = retriever.invoke(question)
+    docs = get_retriever().invoke(question)
 
     generation = generation_chain.invoke({"context": docs, "question": question})
     res: GradeHallucinations = hallucination_grader.invoke(
@@ -82,7 +82,7 @@ def test_hallucination_grader_answer_yes_or_no() -> None:
 
 def test_answer_grader_answer_yes_or_no() -> None:
     question = "agent memory"
-    docs = retriever.invoke(question)
+    docs = get_retriever().invoke(question)
 
     generation = generation_chain.invoke({"context": docs, "question": question})
     res: GradeAnswer = answer_grader.invoke(
@@ -0,0 +1,129 @@
+import json
+from datetime import datetime
+
+import pytest
+
+import change_feed
+from change_feed import ContentChangeFeed
+from ingestion import IngestSummary
+
+
+def _t(minute: int) -> datetime:
+    return datetime(2026, 1, 1, 0, minute)
+
+
+@pytest.mark.parametrize(
+    "payload, expected",
+    [
+        ('{"table": "lessons", "op": "DELETE", "id": 7}', ("lessons", "7", "Lesson")),
+        ('{"table": "courses", "id": "c1"}', ("courses", "c1", "Course")),
+        ('{"table": "tags", "entity_id": "h1", "entity_type": "Chapter"}', ("tags", "h1", "Chapter")),
+        ('{"table": "tags", "id": 3}', None),
+        ('{"table": "users", "id": 1}', None),
+        ('{"table": "lessons"}', None),
+        ('["lessons", 1]', None),
+        ("not json", None),
+    ],
+)
+def test_parse_notification(payload, expected) -> None:
+    assert ContentChangeFeed._parse_notification(payload) == expected
+
+
+class _Database:
+    """Rows of the watched tables, as fetch_changed_rows returns them."""
+
+    def __init__(self) -> None:
+        self.rows = {
+            "courses": [dict(id="c1", entity_type="Course", modified=_t(1))],
+            "chapters": [],
+            "lessons": [dict(id="l1", entity_type="Lesson", modified=_t(1))],
+        }
+        self.broken = set()
+
+    def changed_rows(self, table, since):
+        if table in self.broken:
+            raise RuntimeError(f'column "modified" does not exist in {table}')
+        rows = [row for row in self.rows[table] if since is None or row["modified"] >= since]
+        return sorted(rows, key=lambda row: row["modified"])
+
+    def max_modified(self, table):
+        if table in self.broken:
+            raise RuntimeError(f'column "modified" does not exist in {table}')
+        return max((row["modified"] for row in self.rows[table]), default=None)
+
+
+@pytest.fixture
+def feed(tmp_path, monkeypatch):
+    database = _Database()
+    reindexed = []
+
+    def reindex_content(course_ids, chapter_ids, lesson_ids):
+        reindexed.append((set(course_ids), set(chapter_ids), set(lesson_ids)))
+        return IngestSummary(updated={f"course:{course_id}" for course_id in course_ids})
+
+    monkeypatch.setattr(change_feed, "is_index_ready", lambda: True)
+    monkeypatch.setattr(change_feed, "fetch_changed_rows", database.changed_rows)
+    monkeypatch.setattr(change_feed, "fetch_max_modified", database.max_modified)
+    monkeypatch.setattr(change_feed, "reindex_content", reindex_content)
+    monkeypatch.setattr(change_feed, "COURSE_CATALOG_ENABLED", False)
+    feed = ContentChangeFeed(
+        tables=("courses", "chapters", "lessons"),
+        listen=False,
+        reconcile_interval=float("inf"),
+        state_path=str(tmp_path / "cdc_state.json"),
+    )
+    return feed, database, reindexed
+
+
+def test_poll_reindexes_rows_changed_after_the_watermark(feed) -> None:
+    feed, database, reindexed = feed
+
+    # Rows present on start are assumed indexed
+    assert not feed.poll()
+
+    database.rows["lessons"].append(dict(id="l2", entity_type="Lesson", modified=_t(2)))
+    database.rows["chapters"].append(dict(id="h1", entity_type="Chapter", modified=_t(3)))
+    assert feed.poll()
+    assert reindexed == [(set(), {"h1"}, {"l2"})]
+
+    # Nothing new: rows at the watermark are not applied twice
+    assert not feed.poll()
+    state = json.loads(feed.state_path.read_text())["tables"]
+    assert state["lessons"] == {"watermark": _t(2).isoformat(), "seen": ["l2|Lesson"]}
+
+
+def test_failing_table_does_not_block_the_others(feed) -> None:
+    feed, database, reindexed = feed
+    database.broken.add("lessons")
+    assert not feed.poll()
+
+    database.rows["courses"].append(dict(id="c2", entity_type="Course", modified=_t(2)))
+    database.rows["lessons"].append(dict(id="l2", entity_type="Lesson", modified=_t(2)))
+    assert feed.poll()
+    assert reindexed == [({"c2"}, set(), set())]
+    assert "lessons" not in json.loads(feed.state_path.read_text())["tables"]
+
+    # Once the table can be queried again it starts from its current state
+    database.broken.clear()
+    database.rows["lessons"].append(dict(id="l3", entity_type="Lesson", modified=_t(4)))
+    assert not feed.poll()
+    database.rows["lessons"].append(dict(id="l4", entity_type="Lesson", modified=_t(5)))
+    assert feed.poll()
+    assert reindexed[-1] == (set(), set(), {"l4"})
+
+
+def test_saved_state_survives_a_failing_table(feed, monkeypatch) -> None:
+    feed, database, reindexed = feed
+    feed.poll()
+    saved = json.loads(feed.state_path.read_text())["tables"]
+
+    restarted = ContentChangeFeed(
+        tables=feed.tables, listen=False, reconcile_interval=float("inf"), state_path=str(feed.state_path)
+    )
+    database.broken.add("lessons")
+    database.rows["courses"].append(dict(id="c2", entity_type="Course", modified=_t(2)))
+    assert restarted.poll()
+
+    tables = json.loads(feed.state_path.read_text())["tables"]
+    assert tables["lessons"] == saved["lessons"]
+    assert tables["courses"]["watermark"] == _t(2).isoformat()
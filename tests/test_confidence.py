@@ -0,0 +1,67 @@
+import importlib
+
+import pytest
+from langchain_core.documents import Document
+
+import retrieval
+from graph.consts import GENERATE, GRADE_DOCUMENTS, WEBSEARCH
+from retrieval import adaptive_cut, relevance_of
+
+
+def _scored(*scores):
+    return [Document(page_content=f"chunk {n}", metadata={"relevance_score": score})
+            for n, score in enumerate(scores)]
+
+
+def test_adaptive_cut_keeps_documents_close_to_the_best() -> None:
+    # A clear winner: only min_k documents
+    assert [relevance_of(doc) for doc in adaptive_cut(_scored(0.9, 0.5, 0.4, 0.3, 0.2), 1, 0.15)] == [0.9]
+    # A flat distribution: everything within the gap
+    assert len(adaptive_cut(_scored(0.8, 0.75, 0.7, 0.68, 0.2), 1, 0.15)) == 4
+    assert len(adaptive_cut(_scored(0.9, 0.5, 0.4), 3, 0.15)) == 3
+    assert adaptive_cut([], 3, 0.15) == []
+
+
+def test_filtered_search_without_k_cuts_adaptively(monkeypatch) -> None:
+    monkeypatch.setattr(retrieval, "HYBRID_SEARCH", False)
+    requested = []
+
+    def dense_search(query, k, where=None):
+        requested.append(k)
+        return _scored(0.95, 0.9, 0.4, 0.3)[:k]
+
+    monkeypatch.setattr(retrieval, "dense_search", dense_search)
+    monkeypatch.setattr(retrieval, "adaptive_cut", lambda docs: adaptive_cut(docs, 2, 0.15))
+
+    assert len(retrieval.filtered_search("question")) == 2
+    assert len(retrieval.filtered_search("question", k=3)) == 3
+    assert requested == [retrieval.RETRIEVAL_K, 3]
+
+
+@pytest.mark.parametrize(
+    "documents, confidence, decision",
+    [
+        ([], 0.0, WEBSEARCH),
+        (_scored(0.9), 0.9, GENERATE),
+        (_scored(0.5), 0.5, GRADE_DOCUMENTS),
+    ],
+)
+def test_confidence_routes_after_retrieval(graph_module, monkeypatch, documents, confidence, decision) -> None:
+    monkeypatch.setattr(graph_module, "RETRIEVAL_HIGH_CONFIDENCE", 0.75)
+
+    assert graph_module.decide_after_retrieval(
+        {"documents": documents, "retrieval_confidence": confidence}
+    ) == decision
+
+
+@pytest.mark.parametrize("best, kept", [(0.2, 0), (0.6, 2)])
+def test_retrieve_drops_low_confidence_documents(monkeypatch, best, kept) -> None:
+    # graph.nodes re-exports the node function under the module's name
+    retrieve_node = importlib.import_module("graph.nodes.retrieve")
+    monkeypatch.setattr(retrieve_node, "RETRIEVAL_MIN_CONFIDENCE", 0.3)
+    monkeypatch.setattr(retrieve_node, "filtered_search", lambda *args, **kwargs: _scored(best, best - 0.1))
+
+    result = retrieve_node.retrieve({"question": "What is a Python decorator used for?"})
+
+    assert len(result["documents"]) == kept
+    assert result["retrieval_confidence"] == best
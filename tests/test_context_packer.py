@@ -0,0 +1,93 @@
+import pytest
+from langchain_core.documents import Document
+
+import context_packer
+from context_packer import by_relevance, count_tokens, pack, pack_documents, trim_to_tokens
+
+
+@pytest.fixture(autouse=True)
+def estimated_tokens(monkeypatch):
+    """Token counts without the tiktoken download: one token per 4 characters."""
+    monkeypatch.setattr(context_packer, "_encoding", None)
+    monkeypatch.setattr(context_packer, "_encoding_failed", True)
+    monkeypatch.setattr(context_packer, "CONTEXT_MIN_SECTION_TOKENS", 4)
+
+
+def _sentences(prefix, count):
+    return " ".join(f"{prefix} sentence number {n:02d}." for n in range(count))
+
+
+def test_trim_to_tokens_keeps_whole_sentences() -> None:
+    text = "First sentence here. Second sentence here. Third sentence here."
+
+    assert trim_to_tokens(text, 100) == text
+    assert trim_to_tokens(text, 12) == "First sentence here. Second sentence here."
+    assert trim_to_tokens(text, 3) == text[:12].rstrip()
+    assert trim_to_tokens(text, 0) == ""
+
+
+def test_pack_fills_the_budget_in_order() -> None:
+    sections = [_sentences("alpha", 5), _sentences("beta", 5), _sentences("gamma", 5)]
+    full = count_tokens(sections[0])
+
+    result = pack(sections, budget=full + full // 2, separator="\n\n")
+
+    assert result.indices == [0, 1]
+    assert result.sections[0] == sections[0]
+    # The overflowing section is cut at a sentence boundary
+    assert sections[1].startswith(result.sections[1]) and result.sections[1].endswith(".")
+    assert result.tokens_out <= result.budget
+    assert result.tokens_in == sum(count_tokens(section) for section in sections)
+    assert result.text == "\n\n".join(result.sections)
+
+
+def test_pack_skips_near_duplicates_and_empty_sections() -> None:
+    original = _sentences("alpha", 6)
+    duplicate = original.replace("number 05", "number 99")
+
+    result = pack([original, "", duplicate, _sentences("beta", 2)], budget=1000)
+
+    assert result.indices == [0, 3]
+    assert result.sections[1] == _sentences("beta", 2)
+    assert pack([original, duplicate], budget=1000, dedupe=False).indices == [0, 1]
+
+
+def test_pack_does_not_start_a_section_without_room(monkeypatch) -> None:
+    monkeypatch.setattr(context_packer, "CONTEXT_MIN_SECTION_TOKENS", 20)
+    first = _sentences("alpha", 4)
+
+    result = pack([first, _sentences("beta", 10)], budget=count_tokens(first) + 10, separator=" ")
+
+    assert result.indices == [0]
+
+
+def test_documents_are_packed_by_relevance() -> None:
+    documents = [
+        Document(page_content="web result", metadata={}),
+        Document(page_content="weak match", metadata={"relevance_score": 0.4}),
+        Document(page_content="reranked match", metadata={"relevance_score": 0.1, "rerank_score": 0.9}),
+        Document(page_content="good match", metadata={"relevance_score": 0.7}),
+    ]
+
+    assert [document.page_content for document in by_relevance(documents)] == [
+        "reranked match", "good match", "weak match", "web result",
+    ]
+    assert pack_documents(documents, "generate", budget=10) == "reranked match\n\n-----\n\ngood match"
+
+
+def test_conversation_history_keeps_the_latest_exchanges(monkeypatch) -> None:
+    import importlib
+
+    generate_node = importlib.import_module("graph.nodes.generate")
+    history = [(f"Question {n}?", _sentences(f"answer{n}", 6)) for n in range(3)]
+    # Room for the latest exchange and part of the one before
+    latest = count_tokens(f"**Previous Question 3:** Question 2?\n**Previous Answer 3:** {history[2][1]}")
+    monkeypatch.setitem(generate_node.CONTEXT_BUDGETS, "history", latest + 30)
+
+    context = generate_node._build_conversation_context(history)
+
+    assert "answer2 sentence number 05." in context
+    assert "answer0" not in context
+    # The older exchange is trimmed; kept exchanges stay in chronological order
+    assert "answer1 sentence number 00." in context and "answer1 sentence number 05." not in context
+    assert context.index("answer1") < context.index("answer2")
@@ -0,0 +1,214 @@
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+import course_catalog
+import database
+from course_catalog import CourseCatalog
+
+
+def _t(minute: int) -> datetime:
+    return datetime(2026, 1, 1, 0, minute)
+
+
+class _Tables:
+    """Course, chapter and lesson rows standing in for the database."""
+
+    def __init__(self) -> None:
+        self.courses = {
+            "c1": dict(course_id="c1", course_title="Python", course_description="Basics", course_skill_level="Beginner",
+                       course_target_audience=None, course_language="en", course_slug="python", modified=_t(1)),
+            "c2": dict(course_id="c2", course_title="Algorithms", course_description=None, course_skill_level=None,
+                       course_target_audience=None, course_language="en", course_slug="algorithms", modified=_t(1)),
+        }
+        self.chapters = {
+            "h1": dict(chapter_id="h1", course_id="c1", chapter_title="Setup", chapter_summary=None, position=2,
+                       modified=_t(1)),
+            "h2": dict(chapter_id="h2", course_id="c1", chapter_title="Intro", chapter_summary="Why Python", position=1,
+                       modified=_t(1)),
+        }
+        self.lessons = {
+            "l1": dict(lesson_id="l1", course_id="c1", chapter_id="h1", lesson_title="Install", position=None,
+                       has_video=True, has_file=False, modified=_t(1)),
+            "l2": dict(lesson_id="l2", course_id="c1", chapter_id="h1", lesson_title="Editor", position=1,
+                       has_video=False, has_file=True, modified=_t(1)),
+        }
+        self.loads = []
+
+    def load(self, since):
+        self.loads.append(since)
+
+        def rows(table):
+            return [dict(row) for row in table.values() if since is None or row["modified"] >= since]
+
+        return rows(self.courses), rows(self.chapters), rows(self.lessons)
+
+    def count(self):
+        return len(self.courses), len(self.chapters), len(self.lessons)
+
+
+def _catalog(tables: _Tables) -> CourseCatalog:
+    # Only the first lookup loads; later refreshes are explicit
+    return CourseCatalog(tables.load, tables.count, refresh_interval=3600, full_refresh_interval=3600)
+
+
+def test_catalog_orders_courses_chapters_and_lessons() -> None:
+    catalog = _catalog(_Tables())
+
+    assert [course.course_title for course in catalog.courses()] == ["Algorithms", "Python"]
+    structure = catalog.course("c1").to_structure()
+    assert [chapter["chapter_id"] for chapter in structure["chapters"]] == ["h2", "h1"]
+    # Positions NULLS LAST, like the SQL it replaces
+    assert [lesson["lesson_id"] for lesson in structure["chapters"][1]["lessons"]] == ["l2", "l1"]
+    assert catalog.slugs(["c1", "c2", "missing"]) == {"c1": "python", "c2": "algorithms"}
+
+
+def test_catalog_roadmap_is_prerendered() -> None:
+    catalog = _catalog(_Tables())
+
+    course = catalog.course("c1")
+    assert course.roadmap == course_catalog.format_roadmap(course.to_structure())
+    assert "### Chapter 2 (Position: 2): Setup" in course.roadmap
+    assert "2.1. Editor (Position: 1) [📎 File]" in course.roadmap
+
+
+def test_incremental_refresh_rebuilds_only_affected_courses() -> None:
+    tables = _Tables()
+    catalog = _catalog(tables)
+    untouched = catalog.course("c2")
+
+    # A lesson moves to a new chapter of the other course
+    tables.chapters["h3"] = dict(chapter_id="h3", course_id="c2", chapter_title="Sorting", chapter_summary=None,
+                                 position=1, modified=_t(5))
+    tables.lessons["l2"].update(course_id="c2", chapter_id="h3", modified=_t(5))
+    catalog.refresh()
+
+    assert tables.loads == [None, _t(1)]
+    assert catalog.stats()["full_loads"] == 1
+    assert [lesson.lesson_id for lesson in catalog.course("c1").chapters[1].lessons] == ["l1"]
+    assert [lesson.lesson_id for lesson in catalog.course("c2").chapters[0].lessons] == ["l2"]
+    assert catalog.course("c2") is not untouched
+
+    # Rows at the watermark are fetched again but change nothing
+    catalog.refresh()
+    assert catalog.stats()["rebuilt_courses"] == 4
+
+
+def test_deleted_rows_trigger_a_full_reload() -> None:
+    tables = _Tables()
+    catalog = _catalog(tables)
+    catalog.courses()
+
+    del tables.lessons["l1"]
+    catalog.refresh()
+
+    assert catalog.stats()["full_loads"] == 2
+    assert [lesson.lesson_id for lesson in catalog.course("c1").chapters[1].lessons] == ["l2"]
+
+
+def test_stale_catalog_refreshes_in_the_background() -> None:
+    tables = _Tables()
+    catalog = CourseCatalog(tables.load, tables.count, refresh_interval=0, full_refresh_interval=3600)
+    catalog.courses()
+    release = threading.Event()
+    load = tables.load
+
+    def slow_load(since):
+        release.wait(timeout=5)
+        return load(since)
+
+    tables.courses["c2"].update(course_title="Graphs", modified=_t(5))
+    catalog._loader = slow_load
+
+    # Served from the current snapshot while the refresh runs
+    assert catalog.course("c2").course_title == "Algorithms"
+    release.set()
+    catalog._background.join(timeout=5)
+    assert catalog._courses["c2"].course_title == "Graphs"
+    assert catalog.stats()["incremental_refreshes"] == 1
+
+
+def test_failed_refresh_keeps_the_previous_catalog() -> None:
+    tables = _Tables()
+    catalog = _catalog(tables)
+    catalog.courses()
+
+    def unavailable(since):
+        raise OSError("database unavailable")
+
+    catalog._loader = unavailable
+    with pytest.raises(OSError):
+        catalog.refresh()
+
+    assert catalog.stats()["refresh_errors"] == 1
+    assert [course.course_id for course in catalog.courses()] == ["c2", "c1"]
+
+
+def test_full_reload_is_due_after_the_full_refresh_interval() -> None:
+    tables = _Tables()
+    catalog = CourseCatalog(tables.load, tables.count, refresh_interval=3600, full_refresh_interval=0)
+    catalog.courses()
+
+    catalog.refresh()
+
+    assert tables.loads == [None, None]
+    assert catalog.stats()["full_loads"] == 2
+
+
+def test_module_helpers_read_the_catalog(monkeypatch) -> None:
+    monkeypatch.setattr(course_catalog, "_course_catalog", _catalog(_Tables()))
+    monkeypatch.setattr(course_catalog, "COURSE_CATALOG_ENABLED", True)
+    monkeypatch.setattr(course_catalog, "fetch_course_structure", None)
+
+    assert [structure["course_id"] for structure in course_catalog.course_structures()] == ["c2", "c1"]
+    assert course_catalog.course_structures("missing") == []
+    assert len(course_catalog.course_roadmaps(limit=1)) == 1
+    assert course_catalog.course_roadmaps("c1") == [
+        course_catalog.format_roadmap(course_catalog.course_structures("c1")[0])
+    ]
+    assert course_catalog.courses_slugs(["c1"]) == {"c1": "python"}
+
+
+def test_module_helpers_query_the_database_when_disabled(monkeypatch) -> None:
+    structure = _catalog(_Tables()).course("c1").to_structure()
+    monkeypatch.setattr(course_catalog, "COURSE_CATALOG_ENABLED", False)
+    monkeypatch.setattr(course_catalog, "fetch_course_structure", lambda course_id=None: [structure])
+    monkeypatch.setattr(course_catalog, "fetch_courses_slugs", lambda course_ids: {"c1": "python"})
+
+    assert course_catalog.course_roadmaps() == [course_catalog.format_roadmap(structure)]
+    assert course_catalog.courses_slugs(["c1"]) == {"c1": "python"}
+
+
+def test_fetch_catalog_rows_queries_each_table(monkeypatch) -> None:
+    executed = []
+
+    class Cursor:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            return False
+
+        def execute(self, query, params=None):
+            executed.append((query, params))
+
+        def fetchall(self):
+            return [{"id": len(executed)}]
+
+    class Connection:
+        def cursor(self, cursor_factory=None):
+            return Cursor()
+
+    @contextmanager
+    def get_connection():
+        yield Connection()
+
+    monkeypatch.setattr(database, "get_connection", get_connection)
+
+    courses, chapters, lessons = database.fetch_catalog_rows(_t(3))
+
+    assert (courses, chapters, lessons) == ([{"id": 1}], [{"id": 2}], [{"id": 3}])
+    assert [query.split("FROM ")[1].split()[0] for query, _ in executed] == ["courses", "chapters", "lessons"]
+    assert all("WHERE modified >= %s" in query and params == (_t(3),) for query, params in executed)
@@ -0,0 +1,74 @@
+from contextlib import contextmanager
+
+import pytest
+
+import database
+
+
+class _Cursor:
+    def __init__(self, log, rows, name):
+        self.log, self.rows, self.name = log, rows, name
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.log.append("cursor closed")
+        return False
+
+    def execute(self, query, params=None):
+        self.log.append(("execute", self.name, self.itersize, params))
+
+    def __iter__(self):
+        for row in self.rows:
+            self.log.append("row")
+            yield row
+
+
+@pytest.fixture
+def connection(monkeypatch):
+    log, rows = [], [{"id": 1}, {"id": 2}, {"id": 3}]
+
+    class Connection:
+        def cursor(self, name=None, cursor_factory=None):
+            return _Cursor(log, rows, name)
+
+    @contextmanager
+    def get_connection():
+        log.append("borrowed")
+        try:
+            yield Connection()
+        finally:
+            log.append("returned")
+
+    monkeypatch.setattr(database, "get_connection", get_connection)
+    return log
+
+
+def test_iter_query_streams_through_a_named_cursor(connection) -> None:
+    rows = database._iter_query("SELECT 1", ("x",), itersize=2)
+    assert connection == []  # Nothing runs until the rows are consumed
+
+    assert list(rows) == [{"id": 1}, {"id": 2}, {"id": 3}]
+    _, (_, name, itersize, params), *_ = connection
+    assert name.startswith("rag_stream_") and itersize == 2 and params == ("x",)
+    assert connection[-2:] == ["cursor closed", "returned"]
+
+
+def test_iter_query_returns_the_connection_when_abandoned(connection) -> None:
+    rows = database._iter_query("SELECT 1")
+    assert next(rows) == {"id": 1}
+    rows.close()
+
+    assert connection[-2:] == ["cursor closed", "returned"]
+    assert connection.count("row") == 1
+    assert connection[1][2] == database.DB_ITERSIZE
+
+
+def test_each_stream_gets_its_own_cursor_name(connection) -> None:
+    list(database.iter_courses())
+    list(database.iter_lessons_with_context())
+
+    names = [entry[1] for entry in connection if isinstance(entry, tuple)]
+    assert len(set(names)) == 2
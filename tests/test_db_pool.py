@@ -0,0 +1,194 @@
+import threading
+import time
+
+import pytest
+from psycopg2 import OperationalError, extensions
+
+from db_pool import ConnectionPool, DatabaseUnavailable, PoolTimeout
+
+
+class _Info:
+    transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query):
+        if self.conn.dead:
+            raise OperationalError("server closed the connection unexpectedly")
+        self.conn.queries.append(query)
+
+
+class _Connection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = 0
+        self.dead = False
+        self.info = _Info()
+        self.queries = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class _Database:
+    def __init__(self):
+        self.connections = []
+        self.down = False
+
+    def connect(self):
+        if self.down:
+            raise OperationalError("could not connect to server")
+        conn = _Connection(len(self.connections))
+        self.connections.append(conn)
+        return conn
+
+
+@pytest.fixture
+def database():
+    return _Database()
+
+
+def _pool(database, **options):
+    options = {"min_size": 1, "max_size": 2, "timeout": 1, "max_idle": 300, "healthcheck_after": 30,
+               "retry_backoff": 0.2, "max_backoff": 1, **options}
+    return ConnectionPool(database.connect, **options)
+
+
+def test_connections_are_reused(database) -> None:
+    pool = _pool(database)
+    pool.warm()
+
+    first = pool.getconn()
+    pool.putconn(first)
+    second = pool.getconn()
+    pool.putconn(second)
+
+    assert first is second
+    assert len(database.connections) == 1
+    assert pool.stats()["checkouts"] == 2
+    assert pool.stats()["idle"] == 1
+
+
+def test_callers_wait_for_a_free_connection(database) -> None:
+    pool = _pool(database, max_size=1)
+    conn = pool.getconn()
+    got = []
+
+    waiter = threading.Thread(target=lambda: got.append(pool.getconn()))
+    waiter.start()
+    time.sleep(0.1)
+    assert not got
+    pool.putconn(conn)
+    waiter.join(timeout=5)
+
+    assert got == [conn]
+    assert pool.stats()["waits"] == 1
+
+
+def test_checkout_times_out_when_all_connections_are_busy(database) -> None:
+    pool = _pool(database, max_size=1, timeout=0.1)
+    pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_broken_connections_are_replaced(database) -> None:
+    pool = _pool(database, healthcheck_after=0)
+    conn = pool.getconn()
+    pool.putconn(conn)
+    assert pool.getconn() is conn
+    assert conn.queries == ["SELECT 1"]
+    pool.putconn(conn)
+
+    conn.dead = True
+    replacement = pool.getconn()
+
+    assert replacement is not conn and conn.closed
+    assert pool.stats()["failed_health_checks"] == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_recently_used_connections_skip_the_health_check(database) -> None:
+    pool = _pool(database)
+    conn = pool.getconn()
+    pool.putconn(conn)
+
+    assert pool.getconn() is conn
+    assert conn.queries == []
+
+
+def test_returned_connections_are_rolled_back(database) -> None:
+    pool = _pool(database)
+    conn = pool.getconn()
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_INTRANS
+    pool.putconn(conn)
+
+    assert conn.rollbacks == 1
+    assert pool.getconn() is conn
+
+    conn.info.transaction_status = extensions.TRANSACTION_STATUS_UNKNOWN
+    pool.putconn(conn)
+    assert conn.closed
+    assert pool.stats()["size"] == 0
+
+
+def test_failed_connects_fail_fast_until_the_backoff_expires(database) -> None:
+    pool = _pool(database)
+    database.down = True
+
+    with pytest.raises(OperationalError) as failure:
+        pool.getconn()
+    assert not isinstance(failure.value, DatabaseUnavailable)
+    with pytest.raises(DatabaseUnavailable):
+        pool.getconn()
+
+    database.down = False
+    time.sleep(0.25)
+    pool.putconn(pool.getconn())
+    assert pool.stats()["connect_failures"] == 1
+    assert pool.stats()["size"] == 1
+
+
+def test_idle_connections_beyond_the_minimum_are_closed(database) -> None:
+    pool = _pool(database, min_size=1, max_size=3, max_idle=0.05)
+    connections = [pool.getconn() for _ in range(3)]
+    for conn in connections:
+        pool.putconn(conn)
+    time.sleep(0.1)
+
+    pool.putconn(pool.getconn())
+
+    assert pool.stats()["idle"] == 1
+    assert sum(conn.closed for conn in connections) == 2
+
+
+def test_closing_the_pool_closes_idle_connections(database) -> None:
+    pool = _pool(database)
+    busy, idle = pool.getconn(), pool.getconn()
+    pool.putconn(idle)
+    pool.close()
+
+    assert idle.closed and not busy.closed
+    with pytest.raises(OperationalError):
+        pool.getconn()
+    pool.putconn(busy)
+    assert busy.closed
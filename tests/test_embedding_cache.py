@@ -0,0 +1,56 @@
+import pytest
+
+from embedding_cache import EmbeddingCache, content_key
+
+
+def test_content_key_depends_on_model_and_text() -> None:
+    assert content_key("a", "text") == content_key("a", "text")
+    assert content_key("a", "text") != content_key("b", "text")
+    assert content_key("a", "text") != content_key("a", "text ")
+
+
+def test_vectors_persist_across_instances(tmp_path) -> None:
+    cache = EmbeddingCache(str(tmp_path), "BAAI/bge-small-en-v1.5")
+    cache.put_many(["a", "b"], [[1.0, 2.0], [3.0, 4.0]])
+    cache.put_many(["a"], [[9.0, 9.0]])  # Already cached: kept as is
+    cache.flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "BAAI/bge-small-en-v1.5")
+    assert len(reopened) == 2
+    assert reopened.get_many(["b", "missing", "a"]) == [[3.0, 4.0], None, [1.0, 2.0]]
+    assert (reopened.hits, reopened.misses) == (2, 1)
+
+
+def test_models_do_not_share_vectors(tmp_path) -> None:
+    EmbeddingCache(str(tmp_path), "model-a").put_many(["a"], [[1.0]])
+
+    assert EmbeddingCache(str(tmp_path), "model-b").get_many(["a"]) == [None]
+
+
+def test_unflushed_rows_are_dropped_on_load(tmp_path) -> None:
+    cache = EmbeddingCache(str(tmp_path), "m")
+    cache.put_many(["a"], [[1.0, 2.0]])
+    cache.flush()
+    cache.put_many(["b"], [[3.0, 4.0]])  # e.g. the run crashed before flush()
+
+    reopened = EmbeddingCache(str(tmp_path), "m")
+    assert reopened.get_many(["a", "b"]) == [[1.0, 2.0], None]
+    reopened.put_many(["c"], [[5.0, 6.0]])
+    assert reopened.get_many(["c"]) == [[5.0, 6.0]]
+
+
+def test_dimension_mismatch_is_rejected(tmp_path) -> None:
+    cache = EmbeddingCache(str(tmp_path), "m")
+    cache.put_many(["a"], [[1.0, 2.0]])
+
+    with pytest.raises(ValueError):
+        cache.put_many(["b"], [[1.0, 2.0, 3.0]])
+
+
+def test_evict_keeps_only_referenced_vectors(tmp_path) -> None:
+    cache = EmbeddingCache(str(tmp_path), "m")
+    cache.put_many(["a", "b", "c"], [[1.0], [2.0], [3.0]])
+
+    assert cache.evict([cache.key("a"), cache.key("c")]) == 1
+    assert cache.get_many(["a", "b", "c"]) == [[1.0], None, [3.0]]
+    assert EmbeddingCache(str(tmp_path), "m").get_many(["c", "a"]) == [[3.0], [1.0]]
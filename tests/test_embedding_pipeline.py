@@ -0,0 +1,75 @@
+from langchain_core.documents import Document
+
+from embedding_cache import EmbeddingCache
+from embedding_pipeline import EmbeddingPipeline, _batched
+
+
+class _Embeddings:
+    model_name = "fake"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class _Collection:
+    def __init__(self):
+        self.upserts = []
+
+    def upsert(self, ids, embeddings, metadatas, documents):
+        self.upserts.append(dict(ids=ids, embeddings=embeddings, metadatas=metadatas, documents=documents))
+
+
+class _VectorStore:
+    def __init__(self):
+        self._collection = _Collection()
+
+
+def _chunks(*texts):
+    return [(f"doc::{idx}", Document(page_content=text, metadata={"idx": idx})) for idx, text in enumerate(texts)]
+
+
+def test_batched_keeps_order_and_the_remainder() -> None:
+    batches = list(_batched(iter(range(5)), 2))
+
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_pipeline_streams_batches_into_the_collection() -> None:
+    vector_store, embeddings = _VectorStore(), _Embeddings()
+
+    stats = EmbeddingPipeline(vector_store, embeddings, batch_size=2, workers=1).run(iter(_chunks("a", "bb", "ccc")))
+
+    assert (stats.chunks, stats.batches, stats.cached) == (3, 2, 0)
+    assert embeddings.calls == [["a", "bb"], ["ccc"]]
+    upserts = vector_store._collection.upserts
+    assert [upsert["ids"] for upsert in upserts] == [["doc::0", "doc::1"], ["doc::2"]]
+    assert upserts[0]["embeddings"] == [[1.0, 1.0], [2.0, 1.0]]
+    assert upserts[1]["metadatas"] == [{"idx": 2}]
+
+
+def test_single_batch_is_embedded_in_process_even_with_workers() -> None:
+    embeddings = _Embeddings()
+
+    EmbeddingPipeline(_VectorStore(), embeddings, batch_size=10, workers=4).run(iter(_chunks("a", "bb")))
+
+    assert embeddings.calls == [["a", "bb"]]
+
+
+def test_cached_texts_are_not_embedded_again(tmp_path) -> None:
+    cache = EmbeddingCache(str(tmp_path), "fake")
+    cache.put_many(["bb"], [[9.0, 9.0]])
+    vector_store, embeddings = _VectorStore(), _Embeddings()
+
+    stats = EmbeddingPipeline(vector_store, embeddings, batch_size=10, workers=1, cache=cache).run(
+        iter(_chunks("a", "bb", "ccc"))
+    )
+
+    assert embeddings.calls == [["a", "ccc"]]
+    assert stats.cached == 1
+    assert vector_store._collection.upserts[0]["embeddings"] == [[1.0, 1.0], [9.0, 9.0], [3.0, 1.0]]
+    # New vectors were added to the cache and flushed
+    assert EmbeddingCache(str(tmp_path), "fake").get_many(["a", "ccc"]) == [[1.0, 1.0], [3.0, 1.0]]
@@ -0,0 +1,188 @@
+import socket
+import threading
+import time
+from collections import namedtuple
+
+import pytest
+from psycopg2 import OperationalError
+
+import enrollment_cache
+from enrollment_cache import EnrollmentCache, EnrollmentChangeListener
+
+
+class _Enrollments:
+    def __init__(self):
+        self.courses = {"u1": ["c1"], "u2": ["c2", "c3"]}
+        self.loads = []
+
+    def __call__(self, user_id):
+        self.loads.append(user_id)
+        return self.courses.get(user_id, [])
+
+
+@pytest.fixture
+def enrollments():
+    return _Enrollments()
+
+
+def test_enrollments_are_loaded_once_per_user(enrollments) -> None:
+    cache = EnrollmentCache(loader=enrollments, ttl=60)
+
+    assert cache.get("u1") == frozenset({"c1"})
+    assert cache.get("u1") == frozenset({"c1"})
+    assert cache.get("u2") == frozenset({"c2", "c3"})
+    assert enrollments.loads == ["u1", "u2"]
+    assert cache.stats() == {"hits": 1, "misses": 2, "invalidations": 0, "entries": 2}
+
+
+def test_entries_expire(enrollments) -> None:
+    cache = EnrollmentCache(loader=enrollments, ttl=0.05)
+    cache.get("u1")
+    enrollments.courses["u1"].append("c9")
+    time.sleep(0.06)
+
+    assert cache.get("u1") == frozenset({"c1", "c9"})
+
+
+def test_least_recently_used_users_are_evicted(enrollments) -> None:
+    cache = EnrollmentCache(loader=enrollments, ttl=60, max_entries=2)
+    for user_id in ("u1", "u2", "u1", "u3"):
+        cache.get(user_id)
+
+    cache.get("u1")
+    cache.get("u2")
+    assert enrollments.loads == ["u1", "u2", "u3", "u2"]
+
+
+def test_invalidation_drops_one_user_or_everyone(enrollments) -> None:
+    cache = EnrollmentCache(loader=enrollments, ttl=60)
+    cache.get("u1")
+    cache.get("u2")
+
+    enrollments.courses["u1"] = ["c4"]
+    cache.invalidate("u1")
+    assert cache.get("u1") == frozenset({"c4"})
+    assert cache.get("u2") == frozenset({"c2", "c3"})
+
+    cache.invalidate()
+    assert cache.stats()["entries"] == 0
+
+
+def test_a_load_racing_an_invalidation_is_not_stored(enrollments) -> None:
+    loading, invalidated = threading.Event(), threading.Event()
+
+    def slow_loader(user_id):
+        loading.set()
+        invalidated.wait(timeout=5)
+        return ["stale"]
+
+    cache = EnrollmentCache(loader=slow_loader, ttl=60)
+    reader = threading.Thread(target=cache.get, args=("u1",))
+    reader.start()
+    loading.wait(timeout=5)
+    cache.invalidate("u1")
+    invalidated.set()
+    reader.join(timeout=5)
+
+    assert cache.stats()["entries"] == 0
+
+
+Notify = namedtuple("Notify", "pid channel payload")
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, params=None):
+        self.conn.queries.append(query)
+
+
+class _ListenConnection:
+    """Readable through a socket pair when notifications are pending, like a psycopg2 connection."""
+
+    def __init__(self):
+        self._server, self._client = socket.socketpair()
+        self.autocommit = False
+        self.queries = []
+        self.notifies = []
+        self._pending = []
+        self.closed = False
+
+    def fileno(self):
+        return self._client.fileno()
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def send(self, payload):
+        self._pending.append(Notify(1, "enrollment_changed", payload))
+        self._server.send(b"x")
+
+    def poll(self):
+        self._client.recv(1024)
+        self.notifies.extend(self._pending)
+        self._pending.clear()
+
+    def close(self):
+        self.closed = True
+        self._server.close()
+        self._client.close()
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_listener_invalidates_on_notifications(enrollments, monkeypatch) -> None:
+    conn = _ListenConnection()
+    monkeypatch.setattr(enrollment_cache, "open_connection", lambda: conn)
+    cache = EnrollmentCache(loader=enrollments, ttl=60)
+    listener = EnrollmentChangeListener(cache=cache)
+    listener.start()
+    try:
+        _wait_for(lambda: cache.invalidations == 1)  # Cleared on connect
+        assert conn.autocommit
+        cache.get("u1")
+        cache.get("u2")
+
+        conn.send("u1")
+        _wait_for(lambda: cache.stats()["entries"] == 1)
+        conn.send("")
+        _wait_for(lambda: cache.stats()["entries"] == 0)
+    finally:
+        listener.stop()
+
+    assert cache.invalidations == 3
+    assert conn.closed
+
+
+def test_listener_reconnects_after_a_failure(enrollments, monkeypatch) -> None:
+    attempts = []
+    conn = _ListenConnection()
+
+    def open_connection():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise OperationalError("connection refused")
+        return conn
+
+    monkeypatch.setattr(enrollment_cache, "open_connection", open_connection)
+    cache = EnrollmentCache(loader=enrollments, ttl=60)
+    listener = EnrollmentChangeListener(cache=cache, reconnect_delay=0.05)
+    listener.start()
+    try:
+        _wait_for(lambda: cache.invalidations == 1)
+    finally:
+        listener.stop()
+
+    assert len(attempts) == 2
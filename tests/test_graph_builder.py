@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+from graph.builder import NODES, build_graph
+from graph.consts import GENERATE, GRADE_DOCUMENTS, GREETING, RETRIEVE, WEBSEARCH
+
+
+def _build(path, route=RETRIEVE, after_retrieval=GENERATE, to_generate=GENERATE, grades=("useful",)):
+    """Graph of stub nodes recording their names in `path`."""
+    grades = list(grades)
+
+    def node(name):
+        def run(state):
+            path.append(name)
+            return {"question": state["question"]}
+
+        async def arun(state):
+            path.append(f"async {name}")
+            return {"question": state["question"]}
+
+        return RunnableLambda(run, afunc=arun)
+
+    return build_graph(
+        nodes={name: node(name) for name in NODES},
+        route_question=lambda state: route,
+        decide_after_retrieval=lambda state: after_retrieval,
+        decide_to_generate=lambda state: to_generate,
+        grade_generation=lambda state: grades.pop(0),
+    )
+
+
+def test_confident_retrieval_goes_straight_to_generation() -> None:
+    path = []
+    _build(path).invoke({"question": "q"})
+
+    assert path == [RETRIEVE, GENERATE]
+
+
+def test_irrelevant_documents_fall_back_to_web_search_and_regenerate() -> None:
+    path = []
+    graph = _build(path, after_retrieval=GRADE_DOCUMENTS, to_generate=WEBSEARCH, grades=("not_supported", "useful"))
+    graph.invoke({"question": "q"})
+
+    assert path == [RETRIEVE, GRADE_DOCUMENTS, WEBSEARCH, GENERATE, GENERATE]
+
+
+def test_unhelpful_answer_goes_to_web_search() -> None:
+    path = []
+    _build(path, grades=("not_useful", "useful")).invoke({"question": "q"})
+
+    assert path == [RETRIEVE, GENERATE, WEBSEARCH, GENERATE]
+
+
+def test_greeting_ends_the_run() -> None:
+    path = []
+    _build(path, route=GREETING).invoke({"question": "hi"})
+
+    assert path == [GREETING]
+
+
+def test_async_run_follows_the_same_edges_with_async_nodes() -> None:
+    path = []
+    graph = _build(path, after_retrieval=GRADE_DOCUMENTS, to_generate=WEBSEARCH)
+    asyncio.run(graph.ainvoke({"question": "q"}))
+
+    assert path == [f"async {name}" for name in (RETRIEVE, GRADE_DOCUMENTS, WEBSEARCH, GENERATE)]
+
+
+def test_every_node_needs_an_implementation() -> None:
+    with pytest.raises(ValueError):
+        build_graph({RETRIEVE: lambda state: state}, None, None, None, None)
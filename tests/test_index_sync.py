@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+import ingestion
+
+
+@pytest.fixture
+def index_version_file(tmp_path, monkeypatch):
+    path = tmp_path / "index_version.json"
+    monkeypatch.setattr(ingestion, "INDEX_VERSION_PATH", str(path))
+    monkeypatch.setattr(ingestion, "_disk_version", None)
+    monkeypatch.setattr(ingestion, "_index_listeners", [])
+    monkeypatch.setattr(ingestion, "_vectorstore", None)
+    return path
+
+
+def _listen():
+    calls = []
+    ingestion.add_index_listener(calls.append)
+    return calls
+
+
+def _write_from_other_process(path, version, document_ids):
+    path.write_text(json.dumps({"version": version, "document_ids": document_ids}))
+
+
+def test_writes_publish_the_next_version(index_version_file) -> None:
+    calls = _listen()
+    _write_from_other_process(index_version_file, 4, None)
+
+    ingestion._notify_index_changed({"lesson:2", "lesson:1"})
+
+    assert json.loads(index_version_file.read_text()) == {"version": 5, "document_ids": ["lesson:1", "lesson:2"]}
+    assert calls == [{"lesson:1", "lesson:2"}]
+    # A process does not reload its own writes
+    assert not ingestion.sync_index_version()
+    assert len(calls) == 1
+
+
+def test_sync_applies_writes_of_other_processes(index_version_file) -> None:
+    calls = _listen()
+    assert not ingestion.sync_index_version()  # First read only records the version
+    version = ingestion.index_version()
+
+    _write_from_other_process(index_version_file, 1, ["course:1"])
+    assert ingestion.sync_index_version()
+    assert calls == [{"course:1"}]
+    assert ingestion.index_version() == version + 1
+
+    assert not ingestion.sync_index_version()
+    assert len(calls) == 1
+
+
+def test_sync_reloads_everything_after_missed_writes(index_version_file) -> None:
+    calls = _listen()
+    _write_from_other_process(index_version_file, 1, ["course:1"])
+    ingestion.sync_index_version()
+
+    _write_from_other_process(index_version_file, 3, ["course:2"])
+    assert ingestion.sync_index_version()
+    assert calls == [None]
+
+
+def test_sync_reopens_the_collection_written_by_another_process(index_version_file, tmp_path, monkeypatch) -> None:
+    import subprocess
+    import sys
+
+    from langchain_chroma import Chroma
+
+    persist_dir = str(tmp_path / "chroma")
+    monkeypatch.setattr(
+        ingestion,
+        "open_vectorstore",
+        lambda: Chroma(collection_name="rag-test", persist_directory=persist_dir, embedding_function=None),
+    )
+    vector_store = ingestion.get_vectorstore()
+    vector_store._collection.add(ids=["a"], embeddings=[[1.0, 0.0]], documents=["a"])
+
+    subprocess.run(
+        [sys.executable, "-c", (
+            "import chromadb, json, sys; "
+            f"chromadb.PersistentClient({persist_dir!r}).get_collection('rag-test')"
+            ".add(ids=['b'], embeddings=[[0.0, 1.0]], documents=['b']); "
+            f"json.dump({{'version': 1, 'document_ids': ['b']}}, open({str(index_version_file)!r}, 'w'))"
+        )],
+        check=True,
+    )
+
+    def nearest():
+        return ingestion.get_vectorstore()._collection.query(query_embeddings=[[0.0, 1.0]], n_results=1)["ids"]
+
+    # Chroma keeps the vector index it loaded; the other process's chunk is invisible
+    assert nearest() == [["a"]]
+    assert ingestion.sync_index_version()
+    assert ingestion.get_vectorstore() is not vector_store
+    assert nearest() == [["b"]]
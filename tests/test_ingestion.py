@@ -0,0 +1,250 @@
+import pytest
+
+import ingestion
+
+
+def _lesson(lesson_id, chapter_id, course_id="c1"):
+    return dict(lesson_id=lesson_id, chapter_id=chapter_id, course_id=course_id, course_title="Python",
+                chapter_title=f"Chapter {chapter_id}", lesson_title=f"Lesson {lesson_id}", lesson_content="Text")
+
+
+@pytest.fixture
+def content(monkeypatch):
+    """Lessons in the database and in the index, and the documents reindexed."""
+    state = {
+        "database": {"l1": _lesson("l1", "h1"), "l3": _lesson("l3", "h2", "c2")},
+        "indexed_under": {"h1": {"l1", "l2", "l3"}},
+        "reindexed": [],
+    }
+
+    def lessons_for(lesson_ids, chapter_ids, course_ids):
+        return [lesson for lesson in state["database"].values()
+                if lesson["lesson_id"] in lesson_ids or lesson["chapter_id"] in chapter_ids
+                or lesson["course_id"] in course_ids]
+
+    def indexed_under(chapter_ids, course_ids):
+        return set().union(*(state["indexed_under"].get(chapter_id, set()) for chapter_id in chapter_ids))
+
+    def reindex_documents(documents, removed_document_ids=()):
+        state["reindexed"].append(([doc.metadata for doc in documents], list(removed_document_ids)))
+        return ingestion.IngestSummary()
+
+    monkeypatch.setattr(ingestion, "fetch_courses_by_ids", lambda ids: [])
+    monkeypatch.setattr(ingestion, "fetch_lessons_with_context_for", lessons_for)
+    monkeypatch.setattr(ingestion, "fetch_content_ids", lambda: ({"c1", "c2"}, set(state["database"])))
+    monkeypatch.setattr(ingestion, "fetch_tags", lambda entity_ids=None: {})
+    monkeypatch.setattr(ingestion, "fetch_labels", lambda entity_ids=None: {})
+    monkeypatch.setattr(ingestion, "_indexed_lesson_ids_under", indexed_under)
+    monkeypatch.setattr(ingestion, "reindex_documents", reindex_documents)
+    return state
+
+
+def test_reindex_content_follows_lessons_that_left_a_chapter(content) -> None:
+    # l2 was deleted and l3 moved to chapter h2 of course c2, both without a trigger
+    ingestion.reindex_content(chapter_ids=["h1"])
+
+    [(documents, removed_ids)] = content["reindexed"]
+    assert {(doc["lesson_id"], doc["chapter_id"], doc["course_id"]) for doc in documents} == {
+        ("l1", "h1", "c1"),
+        ("l3", "h2", "c2"),
+    }
+    # Dropped unless rebuilt: l2 goes, l1 and l3 are replaced in place
+    assert set(removed_ids) == {"lesson:l1", "lesson:l2", "lesson:l3"}
+
+
+class _Collection:
+    def __init__(self):
+        self.queries = []
+
+    def get(self, where=None, include=None):
+        self.queries.append(where)
+        return {"ids": ["lesson:l1::0", "lesson:l1::1"], "metadatas": [{"lesson_id": "l1"}, {"lesson_id": "l1"}]}
+
+
+class _VectorStore:
+    def __init__(self):
+        self._collection = _Collection()
+
+
+def test_indexed_lessons_are_looked_up_by_chapter_and_course(monkeypatch) -> None:
+    vector_store = _VectorStore()
+    monkeypatch.setattr(ingestion, "get_vectorstore", lambda: vector_store)
+
+    assert ingestion._indexed_lesson_ids_under(["h1"], ["c1"]) == {"l1"}
+    assert ingestion._indexed_lesson_ids_under(["h1"], []) == {"l1"}
+    assert ingestion._indexed_lesson_ids_under([], []) == set()
+    assert vector_store._collection.queries == [
+        {"$and": [{"doc_type": "lesson"}, {"$or": [{"chapter_id": {"$in": ["h1"]}}, {"course_id": {"$in": ["c1"]}}]}]},
+        {"$and": [{"doc_type": "lesson"}, {"chapter_id": {"$in": ["h1"]}}]},
+    ]
+
+
+@pytest.fixture
+def manifest_path(tmp_path, monkeypatch):
+    path = tmp_path / "ingest_manifest.json"
+    monkeypatch.setattr(ingestion, "INGEST_MANIFEST_PATH", str(path))
+    return path
+
+
+def test_manifest_round_trip(manifest_path) -> None:
+    manifest = ingestion._empty_manifest()
+    manifest["documents"]["lesson:l1"] = {"hash": "abc", "chunk_ids": ["lesson:l1::0"]}
+    ingestion._save_manifest(manifest)
+
+    assert ingestion._load_manifest() == manifest
+    assert not manifest_path.with_suffix(".json.tmp").exists()
+
+
+@pytest.mark.parametrize(
+    "setting, value",
+    [
+        ("CHUNK_SIZE", 500),
+        ("CHUNK_OVERLAP", 0),
+        ("CHROMA_COLLECTION", "other"),
+        ("EMBEDDING_MODEL", "BAAI/bge-base-en-v1.5"),
+    ],
+)
+def test_manifest_of_other_settings_forces_a_full_rebuild(manifest_path, monkeypatch, setting, value) -> None:
+    manifest = ingestion._empty_manifest()
+    manifest["documents"]["lesson:l1"] = {"hash": "abc", "chunk_ids": ["lesson:l1::0"]}
+    ingestion._save_manifest(manifest)
+
+    monkeypatch.setattr(ingestion, setting, value)
+
+    assert ingestion._load_manifest()["documents"] == {}
+
+
+def test_unreadable_manifest_is_empty(manifest_path) -> None:
+    manifest_path.write_text("{not json")
+
+    assert ingestion._load_manifest() == ingestion._empty_manifest()
+
+
+def _listen():
+    calls = []
+    ingestion.add_index_listener(calls.append)
+    return calls
+
+
+class _Embeddings:
+    """Deterministic 2-d vectors: documents about Python point one way, the rest the other."""
+
+    model_name = "fake"
+
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0] if "Python" in text else [0.0, 1.0]
+
+
+@pytest.fixture
+def fake_index(tmp_path, monkeypatch):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    from process_lock import FileLock
+
+    monkeypatch.setattr(ingestion, "CHROMA_PERSIST_DIR", str(tmp_path / "chroma"))
+    monkeypatch.setattr(ingestion, "CHROMA_COLLECTION", "rag-test")
+    monkeypatch.setattr(ingestion, "INGEST_MANIFEST_PATH", str(tmp_path / "ingest_manifest.json"))
+    monkeypatch.setattr(ingestion, "INDEX_VERSION_PATH", str(tmp_path / "index_version.json"))
+    monkeypatch.setattr(ingestion, "EMBED_CACHE_ENABLED", False)
+    monkeypatch.setattr(ingestion, "_ingest_lock", FileLock(str(tmp_path / "ingest.lock")))
+    monkeypatch.setattr(ingestion, "_index_listeners", [])
+    monkeypatch.setattr(ingestion, "_vectorstore", None)
+    monkeypatch.setattr(ingestion, "_vectorstore_error", None)
+    monkeypatch.setattr(ingestion, "_disk_version", None)
+    embeddings = _Embeddings()
+    monkeypatch.setattr(ingestion, "get_embedding", lambda: embeddings)
+    monkeypatch.setattr(ingestion, "_text_splitter", lambda: RecursiveCharacterTextSplitter(chunk_size=200))
+    return embeddings
+
+
+def _ingest(monkeypatch, *texts, full_rebuild=True, ids=None):
+    from langchain_core.documents import Document
+
+    documents = [Document(page_content=text, metadata={"document_id": f"kb:{document_id}", "doc_type": "knowledge"})
+                 for document_id, text in zip(ids or range(len(texts)), texts)]
+    monkeypatch.setattr(ingestion, "iter_documents", lambda: iter(documents))
+    ingestion.build_vectorstore(full_rebuild=full_rebuild)
+
+
+def _search(vector_store, text):
+    return [doc.page_content for doc in vector_store.similarity_search(text, k=1)]
+
+
+def test_full_rebuild_swaps_in_a_new_collection(fake_index, monkeypatch) -> None:
+    _ingest(monkeypatch, "Python basics", "Sorting algorithms")
+    live = ingestion.get_vectorstore()
+    changes = _listen()
+
+    _ingest(monkeypatch, "Python generators", "Graph algorithms")
+
+    # The handle opened before the rebuild was replaced; the old one still answers
+    assert ingestion.get_vectorstore() is not live
+    assert _search(ingestion.get_vectorstore(), "Python") == ["Python generators"]
+    assert _search(live, "Python") == ["Python basics"]
+    assert changes == [None]
+    names = sorted(collection.name for collection in live._client.list_collections())
+    assert names == ["rag-test", "rag-test-previous"]
+
+
+def test_failed_rebuild_leaves_the_live_collection(fake_index, monkeypatch) -> None:
+    _ingest(monkeypatch, "Python basics")
+    live = ingestion.get_vectorstore()
+
+    def failing_documents():
+        from langchain_core.documents import Document
+
+        yield Document(page_content="Python generators", metadata={"document_id": "kb:0"})
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(ingestion, "iter_documents", failing_documents)
+    with pytest.raises(RuntimeError):
+        ingestion.build_vectorstore(full_rebuild=True)
+
+    assert ingestion.get_vectorstore() is live
+    assert _search(live, "Python") == ["Python basics"]
+
+
+def test_incremental_ingestion_only_rewrites_changed_documents(fake_index, monkeypatch) -> None:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    monkeypatch.setattr(ingestion, "_text_splitter", lambda: RecursiveCharacterTextSplitter(chunk_size=20, chunk_overlap=0))
+
+    def chunk_ids():
+        return sorted(ingestion.get_vectorstore()._collection.get()["ids"])
+
+    _ingest(monkeypatch, "Python basics and more Python syntax", "Sorting algorithms", ids="ab", full_rebuild=False)
+    assert chunk_ids() == ["kb:a::0", "kb:a::1", "kb:b::0"]
+
+    # a shrinks to one chunk, b is unchanged, c is new
+    fake_index.embedded.clear()
+    _ingest(monkeypatch, "Python generators", "Sorting algorithms", "Graph search", ids="abc", full_rebuild=False)
+    assert fake_index.embedded == ["Python generators", "Graph search"]
+    assert chunk_ids() == ["kb:a::0", "kb:b::0", "kb:c::0"]
+
+    # b's source disappeared
+    _ingest(monkeypatch, "Python generators", "Graph search", ids="ac", full_rebuild=False)
+    assert chunk_ids() == ["kb:a::0", "kb:c::0"]
+    manifest = ingestion._load_manifest()["documents"]
+    assert sorted(manifest) == ["kb:a", "kb:c"]
+    assert manifest["kb:a"]["chunk_ids"] == ["kb:a::0"]
+
+
+def test_index_is_opened_lazily_and_never_built_by_readers(fake_index, monkeypatch) -> None:
+    assert not ingestion.is_index_ready()
+    with pytest.raises(RuntimeError, match="Run the ingest entry point first"):
+        ingestion.get_vectorstore()
+    assert not ingestion.is_index_ready()
+    assert "rag-test" in ingestion.index_error()
+
+    # Opening did not create an empty collection behind the ingest step's back
+    _ingest(monkeypatch, "Python basics")
+    assert ingestion.get_vectorstore()._collection.count() == 1
+    assert ingestion.is_index_ready()
+    assert ingestion.index_error() is None
@@ -0,0 +1,106 @@
+import json
+
+import httpx
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.pydantic_v1 import BaseModel, Field
+
+from graph.chains import llm_cache as llm_cache_module
+from graph.chains import llm_config
+from graph.chains.llm_cache import LLMResponseCache, cache_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return LLMResponseCache(path=str(tmp_path / "llm-cache.sqlite"), ttl=60, max_entries=2)
+
+
+def test_cache_key_covers_model_prompt_and_schema() -> None:
+    key = cache_key("deepseek-chat", "Is this relevant?", {"title": "Grade"})
+
+    assert key == cache_key("deepseek-chat", "Is this relevant?", {"title": "Grade"})
+    assert key != cache_key("deepseek-reasoner", "Is this relevant?", {"title": "Grade"})
+    assert key != cache_key("deepseek-chat", "Is this relevant? ", {"title": "Grade"})
+    assert key != cache_key("deepseek-chat", "Is this relevant?", {"title": "Other"})
+
+
+def test_round_trip_and_stats(cache) -> None:
+    assert cache.get("router", "k1") is None
+    cache.put("router", "k1", {"datasource": "vectorstore"})
+
+    assert cache.get("router", "k1") == {"datasource": "vectorstore"}
+    assert cache.stats() == {"router": {"hits": 1, "misses": 1}}
+
+
+def test_expired_entries_are_misses(cache, monkeypatch) -> None:
+    cache.put("router", "k1", {"datasource": "vectorstore"})
+    later = llm_cache_module.time.time() + 61
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: later)
+
+    assert cache.get("router", "k1") is None
+
+
+def test_least_recently_used_entries_are_evicted(cache, monkeypatch) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache_module.time, "time", lambda: now[0])
+    for key in ("k1", "k2"):
+        now[0] += 1
+        cache.put("router", key, key)
+    now[0] += 1
+    cache.get("router", "k1")
+    now[0] += 1
+    cache.put("router", "k3", "k3")
+
+    assert [cache.get("router", key) for key in ("k1", "k2", "k3")] == ["k1", None, "k3"]
+
+
+def test_cache_is_shared_by_connections_to_one_file(cache) -> None:
+    cache.put("router", "k1", [1, 2])
+
+    assert LLMResponseCache(path=cache.path).get("router", "k1") == [1, 2]
+
+
+class Grade(BaseModel):
+    """Relevance of a document."""
+
+    binary_score: str = Field(description="'yes' or 'no'")
+
+
+@pytest.fixture
+def structured_llm(monkeypatch, cache):
+    """A shared LLM answering Grade tool calls locally, and the requests it got."""
+    requests = []
+
+    def handler(request):
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json={
+            "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": "deepseek-chat",
+            "choices": [{"index": 0, "finish_reason": "tool_calls", "message": {
+                "role": "assistant", "content": None, "tool_calls": [{
+                    "id": "call_1", "type": "function",
+                    "function": {"name": "Grade", "arguments": json.dumps({"binary_score": "yes"})},
+                }],
+            }}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(llm_config, "_http_client", httpx.Client(transport=transport))
+    monkeypatch.setattr(llm_config, "_http_async_client", httpx.AsyncClient(transport=transport))
+    monkeypatch.setattr(llm_config, "_llms", {})
+    monkeypatch.setattr(llm_config, "llm_cache", cache)
+    return llm_config.get_llm(), requests
+
+
+def test_structured_chain_answers_repeated_prompts_from_the_cache(structured_llm, cache) -> None:
+    llm, requests = structured_llm
+    prompt = ChatPromptTemplate.from_messages([("human", "Is {document} relevant to {question}?")])
+    chain = llm_config.cached_structured_chain("grader", prompt, llm, Grade)
+
+    first = chain.invoke({"question": "loops", "document": "for loops"})
+    second = chain.invoke({"question": "loops", "document": "for loops"})
+    other = chain.invoke({"question": "loops", "document": "while loops"})
+
+    assert first == second == other == Grade(binary_score="yes")
+    assert len(requests) == 2
+    assert cache.stats() == {"grader": {"hits": 1, "misses": 2}}
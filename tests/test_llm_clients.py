@@ -0,0 +1,73 @@
+import asyncio
+import importlib
+import json
+
+import httpx
+import pytest
+
+from graph.chains import llm_config
+
+
+def _completion(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    return httpx.Response(200, json={
+        "id": "chatcmpl-1",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body["model"],
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "Hello"}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+    })
+
+
+@pytest.fixture
+def transport(monkeypatch):
+    """Shared clients answering locally, recording the requests they carry."""
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        return _completion(request)
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(llm_config, "_http_client", httpx.Client(transport=transport))
+    monkeypatch.setattr(llm_config, "_http_async_client", httpx.AsyncClient(transport=transport))
+    monkeypatch.setattr(llm_config, "_llms", {})
+    return requests
+
+
+def test_llms_are_shared_per_settings(transport) -> None:
+    llm = llm_config.get_llm(temperature=0)
+
+    assert llm_config.get_llm(temperature=0.0) is llm
+    assert llm_config.get_llm(temperature=0.7) is not llm
+    assert llm_config.get_llm(max_retries=1) is not llm
+    assert len(llm_config._llms) == 3
+
+
+def test_every_llm_uses_the_shared_connection_pool(transport) -> None:
+    llm_config.get_llm(temperature=0).invoke("hi")
+    llm_config.get_llm(temperature=0.7).invoke("hi")
+    asyncio.run(llm_config.get_llm(temperature=0.7).ainvoke("hi"))
+
+    assert [request.url.path for request in transport] == ["/v1/chat/completions"] * 3
+    assert [json.loads(request.content)["temperature"] for request in transport] == [0.0, 0.7, 0.7]
+
+
+def test_http_clients_are_created_once(monkeypatch) -> None:
+    monkeypatch.setattr(llm_config, "_http_client", None)
+    monkeypatch.setattr(llm_config, "_http_async_client", None)
+
+    sync_client, async_client = llm_config.get_http_clients()
+
+    assert llm_config.get_http_clients() == (sync_client, async_client)
+    assert sync_client.timeout.connect == llm_config.LLM_CONNECT_TIMEOUT
+    sync_client.close()
+
+
+def test_chains_share_one_llm() -> None:
+    # graph.chains re-exports the chains under their modules' names
+    modules = [importlib.import_module(f"graph.chains.{name}")
+               for name in ("generation", "router", "retrieval_grader", "combined_grader")]
+
+    assert len({id(module.llm) for module in modules}) == 1
@@ -0,0 +1,124 @@
+import re
+
+import pytest
+
+import metrics
+import tracing
+from metrics import Counter, Histogram, render_metrics, track_request
+from tracing import span, traced
+
+_SAMPLE = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)*\})? (-?[0-9.e+-]+|\+Inf)$')
+
+
+def test_histogram_renders_cumulative_buckets() -> None:
+    histogram = Histogram("rag_test_seconds", "Test latency", ["node"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, node="retrieve")
+
+    assert histogram.render() == [
+        "# HELP rag_test_seconds Test latency",
+        "# TYPE rag_test_seconds histogram",
+        'rag_test_seconds_bucket{node="retrieve",le="0.1"} 1',
+        'rag_test_seconds_bucket{node="retrieve",le="1"} 3',
+        'rag_test_seconds_bucket{node="retrieve",le="+Inf"} 4',
+        'rag_test_seconds_sum{node="retrieve"} 4.25',
+        'rag_test_seconds_count{node="retrieve"} 4',
+    ]
+
+
+def test_counter_escapes_label_values() -> None:
+    counter = Counter("rag_test_total", "Test counter", ["name"])
+    counter.inc(name='say "hi"\n')
+    counter.inc(2, name='say "hi"\n')
+
+    assert counter.render()[-1] == 'rag_test_total{name="say \\"hi\\"\\n"} 3'
+
+
+@pytest.fixture
+def fresh_metrics(monkeypatch):
+    """Empty node, edge, LLM and request metrics, fed by the span listener only."""
+    replaced = {}
+    for name in ("NODE_DURATION", "EDGE_DURATION", "LLM_CALL_DURATION", "RATE_LIMIT_WAIT", "LLM_CALLS_PER_REQUEST"):
+        old = getattr(metrics, name)
+        replaced[old] = Histogram(old.name, old.help_text, old.labelnames, old.buckets)
+        monkeypatch.setattr(metrics, name, replaced[old])
+    for name in ("DECISIONS", "ERRORS"):
+        old = getattr(metrics, name)
+        replaced[old] = Counter(old.name, old.help_text, old.labelnames)
+        monkeypatch.setattr(metrics, name, replaced[old])
+    monkeypatch.setattr(metrics, "_METRICS", tuple(replaced.get(metric, metric) for metric in metrics._METRICS))
+    monkeypatch.setattr(tracing, "_span_listeners", [metrics._observe_span])
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+    return metrics
+
+
+def _counts(histogram):
+    return {key: count for key, (_, _, count) in histogram._values.items()}
+
+
+def test_spans_feed_the_metrics_without_a_trace(fresh_metrics) -> None:
+    @traced("node", "generate")
+    def generate():
+        for _ in range(2):
+            with span("llm", "generation") as llm_span:
+                llm_span.set(rate_limit_wait_s=0.2)
+
+    @traced("edge", result_attribute="decision")
+    def grade():
+        return "useful"
+
+    @traced("node", "retrieve")
+    def retrieve():
+        raise RuntimeError("index not ready")
+
+    with track_request("ask"):
+        generate()
+        grade()
+        with pytest.raises(RuntimeError):
+            retrieve()
+    generate()  # Outside a request: no per-request count
+
+    assert _counts(fresh_metrics.NODE_DURATION) == {("generate",): 2, ("retrieve",): 1}
+    assert _counts(fresh_metrics.LLM_CALL_DURATION) == {("generation",): 4}
+    assert _counts(fresh_metrics.RATE_LIMIT_WAIT) == {(): 4}
+    assert fresh_metrics.DECISIONS._values == {("grade", "useful"): 1.0}
+    assert fresh_metrics.ERRORS._values == {("node", "retrieve"): 1.0}
+    # One request, which made two LLM calls
+    [(_, total, count)] = fresh_metrics.LLM_CALLS_PER_REQUEST._values.values()
+    assert (total, count) == (2, 1)
+
+
+def test_render_metrics_is_valid_exposition_text(fresh_metrics) -> None:
+    with track_request("ask"):
+        with span("llm", "router"):
+            pass
+
+    text = render_metrics()
+
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        assert line.startswith("# HELP ") or line.startswith("# TYPE ") or _SAMPLE.match(line), line
+    assert 'rag_llm_call_duration_seconds_count{chain="router"} 1' in text
+    assert "rag_rate_limiter_acquired_total " in text
+    assert 'rag_db_pool_connections{state="idle"} ' in text
+
+
+def test_failing_collectors_do_not_break_the_scrape(fresh_metrics, monkeypatch) -> None:
+    def broken():
+        raise RuntimeError("stats unavailable")
+
+    monkeypatch.setattr(metrics, "_collectors", [broken, lambda: ["rag_custom 1"]])
+
+    assert render_metrics().rstrip().endswith("rag_custom 1")
+
+
+def test_metrics_endpoint(graph_module, fresh_metrics) -> None:
+    from fastapi.testclient import TestClient
+
+    import api
+
+    response = TestClient(api.api_app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE rag_node_duration_seconds histogram" in response.text
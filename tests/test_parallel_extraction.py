@@ -0,0 +1,119 @@
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import ingestion
+from ingestion import SourceTiming, _iter_sources_concurrently
+
+
+def _source(name, count, delay=0.0, fail_after=None):
+    def source():
+        for n in range(count):
+            if fail_after is not None and n == fail_after:
+                raise ValueError(f"{name} cursor closed")
+            time.sleep(delay)
+            yield Document(page_content=f"{name} {n}", metadata={"document_id": f"{name}:{n}"})
+
+    return source
+
+
+def _timings(*names):
+    return {name: SourceTiming() for name in names}
+
+
+def test_sources_are_extracted_concurrently() -> None:
+    sources = {"courses": _source("course", 5, 0.04), "lessons": _source("lesson", 5, 0.04),
+               "transcripts": _source("transcript", 5, 0.04)}
+    timings = _timings(*sources)
+
+    started = time.perf_counter()
+    documents = list(_iter_sources_concurrently(sources, timings))
+    elapsed = time.perf_counter() - started
+
+    assert sorted(doc.page_content for doc in documents) == sorted(
+        f"{name} {n}" for name in ("course", "lesson", "transcript") for n in range(5)
+    )
+    # About as long as the slowest source (0.2s), not their sum (0.6s)
+    assert elapsed < 0.45
+    assert {name: timing.documents for name, timing in timings.items()} == {
+        "courses": 5, "lessons": 5, "transcripts": 5,
+    }
+    # Documents of one source keep their order
+    assert [doc.page_content for doc in documents if doc.page_content.startswith("lesson")] == [
+        f"lesson {n}" for n in range(5)
+    ]
+
+
+def test_a_failing_source_fails_the_extraction() -> None:
+    sources = {"courses": _source("course", 100, 0.01), "lessons": _source("lesson", 5, fail_after=2)}
+
+    with pytest.raises(RuntimeError, match="Extracting lessons failed: lesson cursor closed"):
+        list(_iter_sources_concurrently(sources, _timings(*sources)))
+
+
+def test_extractors_stay_a_bounded_queue_ahead_and_stop_when_abandoned() -> None:
+    produced = []
+
+    def source():
+        for n in range(1000):
+            produced.append(n)
+            yield Document(page_content=str(n))
+
+    documents = _iter_sources_concurrently({"lessons": source}, _timings("lessons"), queue_size=4)
+    next(documents)
+    time.sleep(0.1)
+    # One taken, four queued and one waiting for room
+    assert len(produced) <= 6
+
+    documents.close()
+    time.sleep(0.7)
+    assert len(produced) <= 6
+    assert not any(thread.name == "ingest-lessons" for thread in threading.enumerate())
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    """Fake sources through the real iter_documents, recording taxonomy fetches and their threads."""
+    fetches = []
+
+    def fetch(name):
+        def fetch_taxonomy():
+            fetches.append((name, threading.current_thread().name))
+            time.sleep(0.02)
+            return {("course", "c1"): [name]}
+
+        return fetch_taxonomy
+
+    def document_sources(taxonomy):
+        def source(name):
+            def documents():
+                tags, labels = taxonomy()
+                for n in range(3):
+                    yield Document(page_content=f"{name} {n}", metadata={"tags": tags[("course", "c1")],
+                                                                        "labels": labels[("course", "c1")]})
+
+            return documents
+
+        return {name: source(name) for name in ("courses", "lessons", "transcripts", "knowledge_base")}
+
+    monkeypatch.setattr(ingestion, "fetch_tags", fetch("tag"))
+    monkeypatch.setattr(ingestion, "fetch_labels", fetch("label"))
+    monkeypatch.setattr(ingestion, "_document_sources", document_sources)
+    return fetches
+
+
+def test_parallel_and_sequential_extraction_yield_the_same_documents(sources) -> None:
+    parallel = list(ingestion.iter_documents(parallel=True))
+    sequential = list(ingestion.iter_documents(parallel=False))
+
+    def key(doc):
+        return doc.page_content, tuple(doc.metadata["tags"]), tuple(doc.metadata["labels"])
+
+    assert len(parallel) == 12
+    assert sorted(map(key, parallel)) == sorted(map(key, sequential))
+    # Tags and labels are fetched once per run, in the background when parallel
+    assert sorted(name for name, _ in sources) == ["label", "label", "tag", "tag"]
+    assert all(thread.startswith("ingest-taxonomy") for _, thread in sources[:2])
+    assert all(thread == "MainThread" for _, thread in sources[2:])
@@ -0,0 +1,73 @@
+import subprocess
+import sys
+import textwrap
+
+from process_lock import FileLock, LeaderElection
+
+
+def _hold_lock_in_child(path):
+    """Start a process that holds the lock at `path` until its stdin closes."""
+    child = subprocess.Popen(
+        [sys.executable, "-c", textwrap.dedent(f"""
+            import fcntl, os, sys
+            fd = os.open({str(path)!r}, os.O_RDWR | os.O_CREAT)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            print("locked", flush=True)
+            sys.stdin.read()
+        """)],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    assert child.stdout.readline().strip() == "locked"
+    return child
+
+
+def test_file_lock_excludes_other_processes(tmp_path) -> None:
+    path = tmp_path / "ingest.lock"
+    lock = FileLock(str(path))
+    child = _hold_lock_in_child(path)
+    try:
+        assert not lock.acquire(blocking=False)
+        assert not lock.locked()
+    finally:
+        child.communicate("")
+
+    with lock:
+        assert lock.locked()
+    assert not lock.locked()
+
+
+def test_file_lock_excludes_other_threads(tmp_path) -> None:
+    lock = FileLock(str(tmp_path / "ingest.lock"))
+    with lock:
+        assert not lock.acquire(blocking=False)
+
+
+class _Component:
+    def __init__(self):
+        self.events = []
+
+    def start(self):
+        self.events.append("start")
+
+    def stop(self):
+        self.events.append("stop")
+
+
+def test_leader_election_starts_components_only_in_the_leader(tmp_path) -> None:
+    path = str(tmp_path / "leader.lock")
+    leader_component, follower_component = _Component(), _Component()
+    leader = LeaderElection(path, [leader_component])
+    follower = LeaderElection(path, [follower_component])
+
+    assert leader.try_acquire()
+    assert not follower.try_acquire()
+    assert (leader_component.events, follower_component.events) == (["start"], [])
+
+    # The follower takes over once the leader is gone
+    leader.stop()
+    assert follower.try_acquire()
+    follower.stop()
+    assert leader_component.events == ["start", "stop"]
+    assert follower_component.events == ["start", "stop"]
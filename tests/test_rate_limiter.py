@@ -0,0 +1,152 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from graph.chains import rate_limiter
+from graph.chains.rate_limiter import InMemoryBucketBackend, TokenBucketRateLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(rate_limiter.time, "sleep", clock.sleep)
+    return clock
+
+
+def test_burst_passes_then_the_rate_applies(clock) -> None:
+    limiter = TokenBucketRateLimiter(rate_per_minute=60, burst=3)
+
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.acquire() == pytest.approx(1.0)
+
+    clock.now += 10
+    # Idle time refills the bucket up to the burst, not beyond
+    assert [limiter.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert limiter.acquire() == pytest.approx(1.0)
+    assert limiter.stats() == {"acquired": 9, "waited": 3, "total_wait_seconds": pytest.approx(3.0),
+                               "max_wait_seconds": pytest.approx(1.0)}
+
+
+def test_concurrent_callers_queue_up() -> None:
+    backend = InMemoryBucketBackend()
+    waits = []
+    lock = threading.Lock()
+
+    def reserve():
+        wait = backend.reserve("bucket", 1, rate_per_second=1.0, burst=2)
+        with lock:
+            waits.append(round(wait))
+
+    threads = [threading.Thread(target=reserve) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Each reservation waits for its own token: no two callers share a slot
+    assert sorted(waits) == [0, 0, 1, 2, 3, 4]
+
+
+def test_buckets_are_separate_per_name() -> None:
+    backend = InMemoryBucketBackend()
+
+    assert backend.reserve("a", 1, 1.0, 1) == 0.0
+    assert backend.reserve("b", 1, 1.0, 1) == 0.0
+    assert backend.reserve("a", 1, 1.0, 1) == pytest.approx(1.0, abs=0.01)
+
+
+def test_acquire_async_does_not_block_the_event_loop() -> None:
+    limiter = TokenBucketRateLimiter(rate_per_minute=60 * 20, burst=1)
+    ticks = []
+
+    async def ticker():
+        for _ in range(5):
+            ticks.append(asyncio.get_running_loop().time())
+            await asyncio.sleep(0.005)
+
+    async def main():
+        await limiter.acquire_async()
+        waited, _ = await asyncio.gather(limiter.acquire_async(), ticker())
+        return waited
+
+    waited = asyncio.run(main())
+
+    assert waited == pytest.approx(0.05, abs=0.02)
+    # The ticker kept running while the second acquire waited
+    assert len(ticks) == 5 and ticks[-1] - ticks[0] < waited
+
+
+def test_rate_must_be_positive() -> None:
+    with pytest.raises(ValueError):
+        TokenBucketRateLimiter(rate_per_minute=0, burst=1)
+
+
+def _reserve_from_another_process(path, count, results):
+    backend = rate_limiter.SQLiteBucketBackend(path)
+    results.put([backend.reserve("deepseek", 1, 0.01, 4) for _ in range(count)])
+
+
+def test_sqlite_bucket_is_shared_between_processes(tmp_path) -> None:
+    import multiprocessing
+
+    path = str(tmp_path / "rate-limit.sqlite")
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    processes = [context.Process(target=_reserve_from_another_process, args=(path, 3, results)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    waits = sorted(wait for _ in processes for wait in results.get(timeout=60))
+    for process in processes:
+        process.join(timeout=10)
+
+    # 9 requests against one bucket of 4 refilling every 100s: the burst passes,
+    # the rest queue behind each other whichever process made them
+    assert waits[:4] == [0.0] * 4
+    assert waits[4:] == pytest.approx([100, 200, 300, 400, 500], abs=1)
+
+
+def test_sqlite_backends_on_one_file_share_the_bucket(tmp_path) -> None:
+    path = str(tmp_path / "rate-limit.sqlite")
+    first, second = rate_limiter.SQLiteBucketBackend(path), rate_limiter.SQLiteBucketBackend(path)
+
+    assert first.reserve("deepseek", 1, 1.0, 2) == 0.0
+    assert second.reserve("deepseek", 1, 1.0, 2) == 0.0
+    assert first.reserve("deepseek", 1, 1.0, 2) == pytest.approx(1.0, abs=0.05)
+    assert second.reserve("deepseek", 1, 1.0, 2) == pytest.approx(2.0, abs=0.05)
+    assert second.reserve("other", 1, 1.0, 2) == 0.0
+
+
+def test_create_backend_falls_back_to_the_process(monkeypatch) -> None:
+    assert isinstance(rate_limiter.create_backend("memory"), InMemoryBucketBackend)
+    assert isinstance(rate_limiter.create_backend("redis"), InMemoryBucketBackend)
+
+    def unavailable():
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(rate_limiter, "SQLiteBucketBackend", unavailable)
+    assert isinstance(rate_limiter.create_backend("sqlite"), InMemoryBucketBackend)
+
+
+def test_backend_without_reserve_fails_on_construction() -> None:
+    class NoReserve(rate_limiter.RateLimiterBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        NoReserve()
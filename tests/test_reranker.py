@@ -0,0 +1,79 @@
+import pytest
+from langchain_core.documents import Document
+
+import reranker
+from reranker import calibrate_threshold
+
+
+class _CrossEncoder:
+    def __init__(self, logits):
+        self.logits = logits
+        self.calls = []
+
+    def rerank(self, question, documents):
+        self.calls.append((question, documents))
+        return iter(self.logits)
+
+
+def test_pinned_fastembed_ships_the_cross_encoder() -> None:
+    assert reranker.TextCrossEncoder is not None
+
+
+def test_rerank_orders_by_probability_and_records_scores(monkeypatch) -> None:
+    encoder = _CrossEncoder([-2.0, 3.0, 0.0])
+    monkeypatch.setattr(reranker, "_reranker", encoder)
+    monkeypatch.setattr(reranker, "RERANK_MAX_CHARS", 4)
+    documents = [Document(page_content=text) for text in ("aaaaaa", "bbbbbb", "cccccc")]
+
+    scored = reranker.rerank("question", documents)
+
+    assert encoder.calls == [("question", ["aaaa", "bbbb", "cccc"])]
+    assert [doc.page_content for doc, _ in scored] == ["bbbbbb", "cccccc", "aaaaaa"]
+    assert scored[1][1] == 0.5
+    assert documents[1].metadata["rerank_score"] == round(reranker._sigmoid(3.0), 4)
+
+
+def test_rerank_without_cross_encoder_returns_none(monkeypatch) -> None:
+    monkeypatch.setattr(reranker, "_reranker", None)
+    monkeypatch.setattr(reranker, "_reranker_failed", True)
+
+    assert reranker.rerank("question", [Document(page_content="text")]) is None
+
+
+def test_sigmoid_is_stable_for_large_logits() -> None:
+    assert reranker._sigmoid(-1000.0) == 0.0
+    assert reranker._sigmoid(1000.0) == 1.0
+    assert reranker._sigmoid(2.0) + reranker._sigmoid(-2.0) == pytest.approx(1.0)
+
+
+def test_calibrate_threshold_separates_labels() -> None:
+    labelled = [(0.9, True), (0.7, True), (0.4, False), (0.35, True), (0.1, False), (0.05, False)]
+
+    threshold, quality = calibrate_threshold(labelled)
+
+    assert threshold == 0.35
+    assert quality == pytest.approx({"precision": 0.75, "recall": 1.0, "f1": 6 / 7})
+
+
+def test_calibrate_threshold_respects_min_precision() -> None:
+    labelled = [(0.9, True), (0.7, True), (0.4, False), (0.35, True), (0.1, False)]
+
+    threshold, quality = calibrate_threshold(labelled, min_precision=1.0)
+
+    assert threshold == 0.7
+    assert quality["precision"] == 1.0
+
+
+def test_calibrate_threshold_treats_equal_scores_together() -> None:
+    threshold, quality = calibrate_threshold([(0.8, True), (0.6, True), (0.6, False), (0.2, False)])
+
+    # Both 0.6 documents count as predicted relevant, never just the relevant one
+    assert threshold == 0.6
+    assert quality == pytest.approx({"precision": 2 / 3, "recall": 1.0, "f1": 0.8})
+
+
+def test_calibrate_threshold_needs_relevant_examples() -> None:
+    with pytest.raises(ValueError):
+        calibrate_threshold([(0.9, False)])
+    with pytest.raises(ValueError):
+        calibrate_threshold([(0.9, False), (0.1, True)], min_precision=0.9)
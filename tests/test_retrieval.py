@@ -0,0 +1,132 @@
+import uuid
+
+import chromadb
+import pytest
+from langchain_chroma import Chroma
+
+import bm25_index
+import retrieval
+from bm25_index import matches_filter
+from retrieval import build_filter
+
+
+class _Embeddings:
+    """Documents about Python point one way, the rest the other."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0, 0.0] if "Python" in text else [0.0, 1.0]
+
+
+_CHUNKS = [
+    # Ten enrollment-only Python lessons of c1 outrank anything else for a Python question
+    *[(f"lesson:l{n}::0", f"Python lesson {n}",
+       {"document_id": f"lesson:l{n}", "doc_type": "lesson", "lesson_id": f"l{n}", "course_id": "c1",
+        "requires_enrollment": True}) for n in range(10)],
+    ("lesson:l20::0", "Python loops in course two",
+     {"document_id": "lesson:l20", "doc_type": "lesson", "lesson_id": "l20", "course_id": "c2",
+      "requires_enrollment": True}),
+    ("course:c3::0", "Public course overview",
+     {"document_id": "course:c3", "doc_type": "course", "course_id": "c3", "requires_enrollment": False}),
+    ("kb:faq::0", "How to reset a password",
+     {"document_id": "kb:faq", "doc_type": "knowledge", "requires_enrollment": False}),
+]
+
+
+@pytest.fixture
+def vector_store(monkeypatch):
+    store = Chroma(
+        client=chromadb.EphemeralClient(),
+        collection_name=f"retrieval-{uuid.uuid4().hex[:8]}",
+        embedding_function=_Embeddings(),
+    )
+    ids, texts, metadatas = zip(*_CHUNKS)
+    store.add_texts(list(texts), metadatas=list(metadatas), ids=list(ids))
+    monkeypatch.setattr(retrieval, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(bm25_index, "get_vectorstore", lambda: store)
+    monkeypatch.setattr(bm25_index, "_bm25_index", None)
+    yield store
+    store.delete_collection()
+
+
+def test_build_filter_combines_clauses() -> None:
+    assert build_filter() is None
+    assert build_filter(lesson_id="l1") == {"lesson_id": "l1"}
+    assert build_filter(doc_types=["lesson", "course", "lesson"]) == {"doc_type": {"$in": ["course", "lesson"]}}
+    assert build_filter(allowed_course_ids=[]) == {"requires_enrollment": False}
+    assert build_filter(exclude_doc_types=["knowledge"], allowed_course_ids=[2, "1"]) == {
+        "$and": [
+            {"doc_type": {"$nin": ["knowledge"]}},
+            {"$or": [{"requires_enrollment": False}, {"course_id": {"$in": ["1", "2"]}}]},
+        ]
+    }
+
+
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"lesson_id": "l20"},
+        {"doc_types": ["knowledge"]},
+        {"doc_types": ["course", "knowledge"]},
+        {"exclude_doc_types": ["lesson"]},
+        {"allowed_course_ids": []},
+        {"allowed_course_ids": ["c2"]},
+        {"doc_types": ["lesson"], "allowed_course_ids": ["c2", "c9"]},
+    ],
+)
+def test_bm25_filter_matches_chroma(vector_store, filters) -> None:
+    where = build_filter(**filters)
+    expected = set(vector_store._collection.get(where=where)["ids"])
+
+    assert {chunk_id for chunk_id, _, metadata in _CHUNKS if matches_filter(metadata, where)} == expected
+
+
+def test_filter_is_applied_inside_the_query(vector_store) -> None:
+    # Post-filtering the global top-7 would find no lesson of c2 here
+    documents = retrieval.dense_search("Python", k=1, where=build_filter(allowed_course_ids=["c2"]))
+
+    assert [document.id for document in documents] == ["lesson:l20::0"]
+    assert documents[0].metadata["course_id"] == "c2"
+
+
+def test_filtered_search_only_returns_permitted_documents(vector_store, monkeypatch) -> None:
+    monkeypatch.setattr(retrieval, "HYBRID_SEARCH", False)
+
+    documents = retrieval.filtered_search("Python", k=5, allowed_course_ids=[])
+
+    assert {document.id for document in documents} == {"course:c3::0", "kb:faq::0"}
+
+
+def test_reciprocal_rank_fusion_rewards_agreement() -> None:
+    fused = retrieval.reciprocal_rank_fusion([["a", "b", "c"], ["c", "a"]], rrf_k=60)
+
+    assert [chunk_id for chunk_id, _ in fused] == ["a", "c", "b"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 62)
+
+
+def test_hybrid_search_finds_exact_terms_the_vectors_miss(vector_store, monkeypatch) -> None:
+    monkeypatch.setattr(retrieval, "HYBRID_CANDIDATES", 1)
+
+    # Embedded like the Python lessons, while its only indexed word is in the FAQ
+    dense = retrieval.dense_search("Pythonic password", k=2)
+    hybrid = retrieval.hybrid_search("Pythonic password", k=2)
+
+    assert "kb:faq::0" not in [document.id for document in dense]
+    assert "kb:faq::0" in [document.id for document in hybrid]
+    # Chunks found by BM25 only carry the scores the dense query would have given them
+    faq = next(document for document in hybrid if document.id == "kb:faq::0")
+    scored = next(document for document in retrieval.dense_search("Pythonic password", k=len(_CHUNKS))
+                  if document.id == "kb:faq::0")
+    assert faq.page_content == scored.page_content
+    for key in ("distance", "relevance_score"):
+        assert faq.metadata[key] == pytest.approx(scored.metadata[key], abs=1e-4)
+
+
+def test_hybrid_search_keeps_the_filter(vector_store) -> None:
+    documents = retrieval.hybrid_search("Python password", k=5, where=build_filter(allowed_course_ids=["c2"]))
+
+    assert {document.id for document in documents} <= {"lesson:l20::0", "course:c3::0", "kb:faq::0"}
+    assert "lesson:l20::0" in {document.id for document in documents}
@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import ingestion
+import source_watcher
+from source_watcher import SourceWatcher
+
+
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    knowledge_dir, transcripts_dir = tmp_path / "kb", tmp_path / "transcripts"
+    knowledge_dir.mkdir()
+    transcripts_dir.mkdir()
+    (knowledge_dir / "guide.md").write_text("# Guide\n\nText")
+    (knowledge_dir / "README.md").write_text("not a guide")
+    (transcripts_dir / "t1.json").write_text(json.dumps({"lessonId": "l1", "text": "hello"}))
+    monkeypatch.setattr(ingestion, "KNOWLEDGE_BASE_DIR", str(knowledge_dir))
+    monkeypatch.setattr(ingestion, "TRANSCRIPTS_DIR", str(transcripts_dir))
+
+    calls = []
+    failures = []
+
+    def reindex_files(knowledge_files, transcript_files, removed_document_ids):
+        if failures:
+            raise failures.pop()
+        calls.append(([path.name for path in knowledge_files], [path.name for path in transcript_files],
+                      sorted(removed_document_ids)))
+
+    monkeypatch.setattr(source_watcher, "is_index_ready", lambda: True)
+    monkeypatch.setattr(source_watcher, "reindex_files", reindex_files)
+    watcher = SourceWatcher(interval=3600)
+    watcher.start()
+    yield watcher, knowledge_dir, transcripts_dir, calls, failures
+    watcher.stop()
+
+
+def test_changed_file_is_reindexed_once_it_stops_changing(sources) -> None:
+    watcher, knowledge_dir, _, calls, _ = sources
+    assert not watcher.poll()
+
+    (knowledge_dir / "guide.md").write_text("# Guide\n\nMore text")
+    (knowledge_dir / "new.md").write_text("# New")
+    assert not watcher.poll()  # Possibly still being written
+    assert watcher.poll()
+    assert calls == [(["guide.md", "new.md"], [], [])]
+    assert not watcher.poll()
+
+
+def test_deleted_files_are_removed_from_the_index(sources) -> None:
+    watcher, knowledge_dir, transcripts_dir, calls, _ = sources
+
+    (knowledge_dir / "guide.md").unlink()
+    (transcripts_dir / "t1.json").unlink()
+    assert watcher.poll()
+    assert calls == [([], [], ["knowledge_base:guide.md", "transcript:l1"])]
+
+
+def test_transcript_moved_to_another_lesson_drops_the_old_document(sources) -> None:
+    watcher, _, transcripts_dir, calls, _ = sources
+
+    (transcripts_dir / "t1.json").write_text(json.dumps({"lessonId": "l2", "text": "hello"}))
+    watcher.poll()
+    watcher.poll()
+    assert calls == [([], ["t1.json"], ["transcript:l1"])]
+
+    (transcripts_dir / "t1.json").unlink()
+    watcher.poll()
+    assert calls[-1] == ([], [], ["transcript:l2"])
+
+
+def test_failed_reindex_is_retried(sources) -> None:
+    watcher, knowledge_dir, _, calls, failures = sources
+    (knowledge_dir / "guide.md").unlink()
+    failures.append(RuntimeError("collection locked"))
+
+    with pytest.raises(RuntimeError):
+        watcher.poll()
+    assert watcher.poll()
+    assert calls == [([], [], ["knowledge_base:guide.md"])]
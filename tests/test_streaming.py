@@ -0,0 +1,173 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from graph.streaming import agenerate_text, astream_events, emit, generate_text, is_streaming, stream_events
+
+
+class _TextChain:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def invoke(self, inputs):
+        return "".join(self.chunks)
+
+    def stream(self, inputs):
+        yield from self.chunks
+
+    async def ainvoke(self, inputs):
+        return "".join(self.chunks)
+
+    async def astream(self, inputs):
+        for chunk in self.chunks:
+            yield chunk
+
+
+def _graph(answer_chunks):
+    """A graph run generating its answer through generate_text."""
+
+    def invoke(payload):
+        emit("generation_start", {"node": "generate", "attempt": 1})
+        answer = generate_text(_TextChain(answer_chunks), payload)
+        return {"question": payload["question"], "generation": answer}
+
+    return invoke
+
+
+def test_events_are_yielded_in_order_and_end_with_the_result() -> None:
+    events = list(stream_events(_graph(["Hel", "lo"]), {"question": "hi"}))
+
+    assert events == [
+        ("generation_start", {"node": "generate", "attempt": 1}),
+        ("token", {"text": "Hel"}),
+        ("token", {"text": "lo"}),
+        ("result", {"question": "hi", "generation": "Hello"}),
+    ]
+
+
+def test_emit_is_a_no_op_outside_a_stream() -> None:
+    assert not is_streaming()
+    emit("token", {"text": "lost"})
+
+    assert _graph(["Hel", "lo"])({"question": "hi"}) == {"question": "hi", "generation": "Hello"}
+
+
+def test_failures_end_the_stream_with_an_error() -> None:
+    def invoke(payload):
+        emit("token", {"text": "partial"})
+        raise RuntimeError("LLM unavailable")
+
+    assert list(stream_events(invoke, {"question": "hi"})) == [
+        ("token", {"text": "partial"}),
+        ("error", {"detail": "Error processing question: LLM unavailable"}),
+    ]
+
+
+def test_concurrent_streams_only_see_their_own_events() -> None:
+    barrier = threading.Barrier(2)
+
+    def invoke(payload):
+        for n in range(3):
+            emit("token", {"text": f"{payload['question']}{n}"})
+            if n == 0:
+                barrier.wait(timeout=5)
+        return {}
+
+    results = {}
+
+    def consume(question):
+        results[question] = [data["text"] for event, data in stream_events(invoke, {"question": question})
+                             if event == "token"]
+
+    threads = [threading.Thread(target=consume, args=(question,)) for question in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert results == {"a": ["a0", "a1", "a2"], "b": ["b0", "b1", "b2"]}
+
+
+def test_async_events_include_emits_from_worker_threads() -> None:
+    async def ainvoke(payload):
+        answer = await agenerate_text(_TextChain(["a", "b"]), payload)
+        await asyncio.to_thread(emit, "grade", {"grounded": True})
+        return {"generation": answer}
+
+    async def collect():
+        return [event async for event in astream_events(ainvoke, {"question": "hi"})]
+
+    assert asyncio.run(collect()) == [
+        ("token", {"text": "a"}),
+        ("token", {"text": "b"}),
+        ("grade", {"grounded": True}),
+        ("result", {"generation": "ab"}),
+    ]
+
+
+def test_closing_the_async_stream_cancels_the_run() -> None:
+    cancelled = []
+
+    async def ainvoke(payload):
+        emit("token", {"text": "first"})
+        try:
+            await asyncio.sleep(60)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def read_first():
+        events = astream_events(ainvoke, {"question": "hi"})
+        first = await events.__anext__()
+        await events.aclose()
+        await asyncio.sleep(0)
+        return first
+
+    assert asyncio.run(read_first()) == ("token", {"text": "first"})
+    assert cancelled == [True]
+
+
+@pytest.fixture
+def client(graph_module, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import answer_cache
+    import api
+
+    class _App:
+        async def ainvoke(self, input, config=None):
+            emit("generation_start", {"node": "generate", "attempt": 1})
+            answer = await agenerate_text(_TextChain(["Xin ", "chào"]), input)
+            return {"generation": answer, "chat_history": [(input["question"], answer)],
+                    "sources": [{"document_id": "kb:faq", "doc_type": "knowledge_base", "rank": 1}]}
+
+    monkeypatch.setattr(api, "app", _App())
+    monkeypatch.setattr(answer_cache, "ANSWER_CACHE_ENABLED", False)
+    return TestClient(api.api_app)
+
+
+def _parse_sse(body):
+    events = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n", 1)
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_stream_endpoint_sends_tokens_then_sources_and_done(client) -> None:
+    response = client.post("/api/v1/rag/ask/stream", json={"question": " hello "})
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = _parse_sse(response.text)
+    assert [event for event, _ in events] == ["generation_start", "token", "token", "sources", "done"]
+    assert "".join(data["text"] for event, data in events if event == "token") == "Xin chào"
+    assert events[3][1][0]["document_id"] == "kb:faq"
+    assert events[4][1]["answer"] == "Xin chào"
+    assert events[4][1]["chat_history"] == [{"question": "hello", "answer": "Xin chào"}]
+
+
+def test_stream_endpoint_rejects_blank_questions(client) -> None:
+    assert client.post("/api/v1/rag/ask/stream", json={"question": "   "}).status_code == 400
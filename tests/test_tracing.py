@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+
+import tracing
+from tracing import NOOP_SPAN, annotate, end_span, is_tracing, span, start_span, start_trace, traced
+
+
+@pytest.fixture(autouse=True)
+def no_listeners(monkeypatch):
+    # Modules such as metrics register listeners when imported by other tests
+    monkeypatch.setattr(tracing, "_span_listeners", [])
+
+
+def _shape(trace):
+    by_id = {span_.id: span_ for span_ in trace.spans}
+    return [(span_.kind, span_.name, by_id[span_.parent_id].name if span_.parent_id else None)
+            for span_ in trace.spans]
+
+
+@traced("edge", result_attribute="decision")
+def decide(state):
+    return "generate" if state["documents"] else "websearch"
+
+
+@traced("node", "retrieve")
+def retrieve(state):
+    with span("retrieval", "dense_search", k=7) as search_span:
+        search_span.set(documents=2)
+    annotate(filtered=True)
+    return {"documents": ["a", "b"]}
+
+
+def test_spans_nest_and_record_attributes() -> None:
+    with start_trace(enabled=True) as trace:
+        assert is_tracing()
+        decide(retrieve({}))
+
+    assert not is_tracing()
+    assert _shape(trace) == [
+        ("node", "retrieve", None),
+        ("retrieval", "dense_search", "retrieve"),
+        ("edge", "decide", None),
+    ]
+    node, search, edge = trace.spans
+    assert search.attributes == {"k": 7, "documents": 2}
+    assert node.attributes == {"filtered": True}
+    assert edge.attributes == {"decision": "generate"}
+    assert all(span_.duration_ms is not None and span_.error is None for span_ in trace.spans)
+    assert trace.to_dict()["spans"][1]["name"] == "dense_search"
+
+
+def test_errors_are_recorded_on_the_span() -> None:
+    with start_trace(enabled=True) as trace:
+        with pytest.raises(ValueError):
+            with span("llm", "router"):
+                raise ValueError("bad schema")
+
+    assert trace.spans[0].error == "ValueError: bad schema"
+
+
+def test_nothing_is_recorded_without_a_trace() -> None:
+    with start_trace(enabled=False) as trace:
+        assert trace is None
+        with span("llm", "router") as span_:
+            assert span_ is NOOP_SPAN
+        assert decide({"documents": []}) == "websearch"
+
+
+def test_listeners_see_spans_outside_traces() -> None:
+    finished = []
+    tracing.add_span_listener(finished.append)
+
+    decide({"documents": []})
+    llm_span = start_span("llm", "generation")
+    end_span(llm_span)
+
+    assert [(span_.kind, span_.name) for span_ in finished] == [("edge", "decide"), ("llm", "generation")]
+    assert finished[0].attributes == {"decision": "websearch"}
+
+
+def test_concurrent_requests_get_their_own_traces() -> None:
+    def query(question):
+        with span("db", question):
+            pass
+
+    @traced("node", "generate")
+    async def generate(question):
+        await asyncio.sleep(0.01)
+        # Blocking work handed to a thread stays in the request's trace
+        await asyncio.to_thread(query, question)
+        return question
+
+    async def request(question):
+        with start_trace(enabled=True) as trace:
+            await generate(question)
+        return trace
+
+    async def main():
+        return await asyncio.gather(request("first"), request("second"))
+
+    first, second = asyncio.run(main())
+
+    assert _shape(first) == [("node", "generate", None), ("db", "first", "generate")]
+    assert _shape(second) == [("node", "generate", None), ("db", "second", "generate")]